@@ -63,9 +63,9 @@ _quodlibet() {
     local opts=(--add-location --debug --enqueue --enqueue-files \
 		--filter --focus --force-previous --help --hide-window \
 		--list-browsers --next --no-plugins --open-browser --pause \
-		--play --play-file --play-pause --previous --print-playing \
-		--print-playlist --print-query --print-query-text --print-queue \
-		--query --queue --quit --random --refresh --repeat --repeat-type \
+		--perf-log --play --play-file --play-pause --previous \
+		--print-playing --print-playlist --print-query --print-query-text \
+		--print-queue --query --queue --quit --random --refresh --repeat --repeat-type \
 		--run --seek --set-browser --set-rating --show-window --shuffle \
 		--shuffle-type --start-hidden --start-playing --status --stop \
 		--stop-after --toggle-window --unfilter --unqueue --version \
@@ -74,6 +74,11 @@ _quodlibet() {
     # Completion per otion
     case "$prev" in
 
+        --perf-log)
+            _filedir
+            return 0
+            ;;
+
         --enqueue|--unqueue|--enqueue-files|--add-location|--play-file)
             # For these options we complete with audio files, even though
             # it's not necessarily what user wants.
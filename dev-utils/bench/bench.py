@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Benchmarks for library, query, sorting and browser hot paths.
+
+Generates synthetic libraries with a realistic-ish tag distribution and
+times the operations which matter for large collections. The results are
+written as JSON so runs of different commits can be compared:
+
+    ./bench.py --sizes 10000,100000 -o before.json
+    git checkout other-branch
+    ./bench.py --sizes 10000,100000 -o after.json
+    ./bench.py --compare before.json after.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+
+GENRES = ["Rock", "Pop", "Jazz", "Classical", "Electronic", "Hip-Hop",
+          "Metal", "Folk", "Blues", "Soundtrack", "Ambient", "Punk",
+          "Reggae", "Soul", "Country", "Latin", "World"]
+
+WORDS = ["love", "night", "blue", "day", "heart", "fire", "dream", "road",
+         "light", "time", "rain", "home", "sun", "dance", "world", "star",
+         "black", "river", "song", "ghost", "summer", "city", "girl", "moon",
+         "cœur", "nuit", "étoile", "Straße", "Mädchen", "こころ", "空", "Ñandú"]
+
+QUERIES = [
+    "love",
+    "artist=Band 1",
+    "&(genre=Rock, #(date > 1990))",
+    "|(title=night, album=blue)",
+    "#(rating > 0.5)",
+    "#(playcount > 10)",
+    "&(artist=/^Band 1/, !genre=Pop)",
+    "#(length > 5 minutes)",
+    "~people=band",
+    "\"Dream\"",
+]
+
+PATTERNS = [
+    "<artist> - <title>",
+    "<tracknumber|<tracknumber>. ><title>",
+    "<album|<album>[ (<date>)]|[no album]> - <~#length>",
+    "<~artist~title> <~filename>",
+]
+
+
+def generate_songs(count, seed=0):
+    """Returns `count` AudioFiles with a skewed distribution of artists,
+    albums of 8-15 tracks, some missing tags and some non-ASCII text.
+    """
+
+    from quodlibet.formats import AudioFile
+
+    rnd = random.Random(seed)
+
+    def words(n):
+        return " ".join(rnd.choice(WORDS) for i in range(n)).title()
+
+    songs = []
+    artists = max(1, count // 60)
+    now = int(time.time())
+    while len(songs) < count:
+        # Zipf-ish: a few artists have most of the albums
+        artist_index = int(rnd.paretovariate(1.2)) % artists
+        artist = "Band %d %s" % (artist_index, words(1))
+        album = words(rnd.randint(1, 4))
+        date = str(rnd.randint(1955, 2025))
+        genre = rnd.choice(GENRES)
+        tracks = rnd.randint(8, 15)
+        albumartist = artist if rnd.random() < 0.9 else "Various Artists"
+        for track in range(1, tracks + 1):
+            title = words(rnd.randint(1, 5))
+            filename = "/music/%s/%s/%02d %s.ogg" % (
+                artist, album, track, title)
+            song = AudioFile({
+                "~filename": filename,
+                "~mountpoint": "/music",
+                "title": title,
+                "artist": artist,
+                "album": album,
+                "tracknumber": "%d/%d" % (track, tracks),
+                "~#length": rnd.randint(90, 600),
+                "~#added": now - rnd.randint(0, 10 ** 8),
+                "~#mtime": now - rnd.randint(0, 10 ** 8),
+                "~#filesize": rnd.randint(2 * 10 ** 6, 5 * 10 ** 7),
+                "~#bitrate": rnd.choice([128, 192, 256, 320, 900]),
+                "~#playcount": int(rnd.expovariate(0.2)),
+            })
+            if rnd.random() < 0.9:
+                song["date"] = date
+            if rnd.random() < 0.8:
+                song["genre"] = genre
+            if albumartist != artist:
+                song["albumartist"] = albumartist
+            if rnd.random() < 0.3:
+                song["~#rating"] = rnd.randint(0, 4) / 4.0
+            if rnd.random() < 0.1:
+                song["performer"] = "Band %d" % rnd.randrange(artists)
+            if rnd.random() < 0.5:
+                song["musicbrainz_trackid"] = "%032x" % rnd.getrandbits(128)
+            songs.append(song)
+            if len(songs) >= count:
+                break
+    return songs
+
+
+def timeit(func, repeat):
+    """Returns the best and the median wall time of `repeat` runs"""
+
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"best": times[0], "median": times[len(times) // 2]}
+
+
+def bench_serialize(songs, repeat):
+    from quodlibet.formats import load_audio_files, dump_audio_files
+
+    data = dump_audio_files(songs)
+    return {
+        "dump_audio_files": timeit(lambda: dump_audio_files(songs), repeat),
+        "load_audio_files": timeit(lambda: load_audio_files(data), repeat),
+    }
+
+
+def bench_query(songs, repeat):
+    from quodlibet.library import SongLibrary
+    from quodlibet.query import Query
+
+    library = SongLibrary()
+    library.add(songs)
+
+    def parse():
+        for text in QUERIES:
+            Query(text).search
+
+    def search():
+        for text in QUERIES:
+            library.query(text)
+
+    result = {
+        "Query": timeit(parse, repeat * 10),
+        "SongLibrary.query": timeit(search, repeat),
+    }
+    library.destroy()
+    return result
+
+
+def bench_pattern(songs, repeat):
+    from quodlibet.pattern import Pattern
+
+    patterns = [Pattern(p) for p in PATTERNS]
+
+    def format_all():
+        for pattern in patterns:
+            for song in songs:
+                pattern.format(song)
+
+    return {"Pattern.format": timeit(format_all, repeat)}
+
+
+def bench_albums(songs, repeat):
+    from quodlibet.library import SongLibrary
+    from quodlibet.library.album import AlbumLibrary
+
+    library = SongLibrary("bench")
+    library.add(songs)
+
+    def populate():
+        AlbumLibrary(library).destroy()
+
+    albums = AlbumLibrary(library)
+
+    def aggregate():
+        for album in albums.values():
+            album.finalize()
+            for key in ["~#length", "~#rating", "~#playcount", "date",
+                        "~people", "~#filesize", "~#added"]:
+                album.get(key)
+
+    result = {
+        "AlbumLibrary": timeit(populate, repeat),
+        "Collection.get": timeit(aggregate, repeat),
+    }
+    albums.destroy()
+    library.destroy()
+    return result
+
+
+def bench_songlist(songs, repeat):
+    from quodlibet.library import SongLibrary
+    from quodlibet.qltk.songlist import SongList
+
+    library = SongLibrary()
+    songlist = SongList(library)
+    songlist.set_column_headers(["~#track", "title", "artist", "album",
+                                 "date", "~#length"])
+    songlist.set_sort_orders([("artist", False), ("date", True),
+                              ("album", False)])
+
+    def sort():
+        songlist._sort_songs(list(songs))
+
+    result = {"SongList._sort_songs": timeit(sort, repeat)}
+    songlist.destroy()
+    return result
+
+
+def bench_paned(songs, repeat):
+    from quodlibet.browsers.paned.models import PaneModel
+    from quodlibet.browsers.paned.util import PaneConfig
+
+    result = {}
+    for tag in ["genre", "artist", "~people", "<album|<album>|[no album]>"]:
+        config = PaneConfig(tag)
+        result["PaneModel.add_songs(%s)" % tag] = timeit(
+            lambda: PaneModel(config).add_songs(songs), repeat)
+    return result
+
+
+BENCHMARKS = {
+    "serialize": bench_serialize,
+    "query": bench_query,
+    "pattern": bench_pattern,
+    "albums": bench_albums,
+    "songlist": bench_songlist,
+    "paned": bench_paned,
+}
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def init_quodlibet(temp_dir):
+    os.environ["HOME"] = temp_dir
+    os.environ.pop("XDG_CONFIG_HOME", None)
+    os.environ.pop("XDG_DATA_HOME", None)
+
+    import quodlibet
+    quodlibet.init(no_translations=True, no_excepthook=True,
+                   config_file=os.path.join(temp_dir, "config"))
+
+
+def run(sizes, names, repeat, seed):
+    results = {
+        "revision": get_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeat": repeat,
+        "results": {},
+    }
+
+    for size in sizes:
+        print("Generating %d songs..." % size, file=sys.stderr)
+        songs = generate_songs(size, seed)
+        by_size = results["results"].setdefault(str(size), {})
+        for name in names:
+            print("  %s" % name, file=sys.stderr)
+            for key, value in BENCHMARKS[name](songs, repeat).items():
+                by_size[key] = value
+                print("    %-40s %8.3fs" % (key, value["best"]),
+                      file=sys.stderr)
+    return results
+
+
+def compare(old_path, new_path):
+    with open(old_path, "r", encoding="utf-8") as h:
+        old = json.load(h)
+    with open(new_path, "r", encoding="utf-8") as h:
+        new = json.load(h)
+
+    print("%s -> %s" % (old.get("revision"), new.get("revision")))
+    for size, entries in sorted(new["results"].items(), key=lambda i: int(i[0])):
+        print("%s songs" % size)
+        old_entries = old["results"].get(size, {})
+        for key, value in sorted(entries.items()):
+            if key not in old_entries:
+                continue
+            before = old_entries[key]["best"]
+            after = value["best"]
+            change = (after - before) / before * 100 if before else 0.0
+            print("  %-40s %8.3fs %8.3fs %+7.1f%%"
+                  % (key, before, after, change))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark Quod Libet hot paths")
+    parser.add_argument(
+        "--sizes", default="10000,100000",
+        help="comma separated library sizes (default: %(default)s)")
+    parser.add_argument(
+        "--only", default=",".join(BENCHMARKS),
+        help="comma separated benchmarks to run (default: %(default)s)")
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="runs per benchmark, the best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o", "--output", help="write the JSON results to a file")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"),
+        help="compare two result files and exit")
+    args = parser.parse_args(argv[1:])
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    names = [n.strip() for n in args.only.split(",") if n.strip()]
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark %r" % name)
+
+    temp_dir = tempfile.mkdtemp(prefix="ql-bench-")
+    try:
+        init_quodlibet(temp_dir)
+        results = run(sizes, names, args.repeat, args.seed)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    data = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as h:
+            h.write(data + "\n")
+    else:
+        print(data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -6,10 +6,14 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import hashlib
+import json
 import os
 import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
 from gi.repository import Gtk, GLib, Pango, Gdk
 import feedparser
@@ -33,10 +37,14 @@ from quodlibet.qltk.views import AllTreeView
 from quodlibet.qltk import Icons
 from quodlibet.util import connect_obj, print_w
 from quodlibet.qltk.x import ScrolledWindow, Align, Button, MenuItem
+from quodlibet.util.atomic import atomic_save
 from quodlibet.util.picklehelper import pickle_load, pickle_dump, PickleError
 
 
 FEEDS = os.path.join(quodlibet.get_user_dir(), "feeds")
+"""All feeds in one pickle, as saved by older versions"""
+FEEDS_DIR = os.path.join(quodlibet.get_user_dir(), "feeds.d")
+"""One pickle per feed and an index with their order"""
 DND_URI_LIST, DND_MOZ_URL = range(2)
 
 # Migration path for pickle
@@ -48,6 +56,10 @@ class InvalidFeed(ValueError):
 
 
 class Feed(list):
+    # HTTP cache validators of the last successful parse
+    etag = None
+    modified = None
+
     def __init__(self, uri):
         self.name = _("Unknown")
         self.uri = uri
@@ -135,12 +147,24 @@ class Feed(list):
                     af.add("genre", value)
 
     def parse(self):
+        """Fetches the feed and updates the entries.
+
+        Returns True if there are new entries. In case the server says the
+        feed didn't change since the last parse nothing gets downloaded.
+        """
+
+        etag, modified = (self.etag, self.modified) if len(self) else (None, None)
         try:
-            doc = feedparser.parse(self.uri)
+            doc = feedparser.parse(self.uri, etag=etag, modified=modified)
         except Exception as e:
             print_w("Couldn't parse feed: %s (%s)" % (self.uri, e))
             return False
 
+        if doc.get("status") == 304:
+            print_d("Feed not modified: %s" % self.uri)
+            self.__lastgot = time.time()
+            return False
+
         try:
             album = doc.channel.title
         except AttributeError:
@@ -205,9 +229,116 @@ class Feed(list):
                 else:
                     self.insert(0, song)
         self.__lastgot = time.time()
+        self.etag = doc.get("etag")
+        self.modified = doc.get("modified")
         return bool(uris)
 
 
+def _host(uri):
+    if isinstance(uri, bytes):
+        uri = uri.decode("utf-8", "replace")
+    return urlsplit(uri).netloc.lower()
+
+
+class FeedRefresher:
+    """Parses many feeds concurrently, with at most `max_workers` requests
+    in total and `per_host` requests to the same host at a time."""
+
+    MAX_WORKERS = 8
+    PER_HOST = 2
+
+    def __init__(self, max_workers=MAX_WORKERS, per_host=PER_HOST):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host_limit(self, uri):
+        host = _host(uri)
+        with self._lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.Semaphore(self.per_host)
+            return sem
+
+    def _parse(self, feed):
+        with self._host_limit(feed.uri):
+            try:
+                return feed.parse()
+            except Exception:
+                util.print_exc()
+                return False
+
+    def refresh(self, feeds):
+        """Parses all `feeds` and returns the ones with new entries.
+        Blocks until done, so call it from a thread."""
+
+        feeds = list(feeds)
+        if not feeds:
+            return []
+        # interleave hosts, so one slow host doesn't occupy all workers
+        by_host = {}
+        for feed in feeds:
+            by_host.setdefault(_host(feed.uri), []).append(feed)
+        order = []
+        queues = list(by_host.values())
+        while queues:
+            for queue in queues:
+                order.append(queue.pop(0))
+            queues = [q for q in queues if q]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self._parse, order))
+        return [feed for feed, new in zip(order, results) if new]
+
+
+def _feed_filename(uri):
+    if not isinstance(uri, bytes):
+        uri = uri.encode("utf-8")
+    return hashlib.sha1(uri).hexdigest()
+
+
+def save_feeds(feeds, changed=None, directory=FEEDS_DIR):
+    """Saves the order of `feeds` and each feed in `changed`
+    (all if None) to its own file."""
+
+    os.makedirs(directory, exist_ok=True)
+    names = [_feed_filename(feed.uri) for feed in feeds]
+    for feed in (feeds if changed is None else changed):
+        path = os.path.join(directory, _feed_filename(feed.uri))
+        with atomic_save(path, "wb") as h:
+            pickle_dump(feed, h, 2)
+    with atomic_save(os.path.join(directory, "index"), "wb") as h:
+        h.write(json.dumps(names).encode("utf-8"))
+
+    if changed is None:
+        for name in set(os.listdir(directory)) - set(names) - {"index"}:
+            try:
+                os.unlink(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def load_feeds(directory=FEEDS_DIR):
+    """Returns the feeds saved with save_feeds() or None if there are
+    none"""
+
+    try:
+        with open(os.path.join(directory, "index"), "rb") as h:
+            names = json.loads(h.read().decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+    feeds = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name), "rb") as h:
+                feeds.append(pickle_load(h))
+        except (PickleError, EnvironmentError) as e:
+            print_w("Couldn't load feed %s (%s)" % (name, e))
+    return feeds
+
+
 class AddFeedDialog(GetStringDialog):
     def __init__(self, parent):
         super().__init__(
@@ -298,28 +429,35 @@ class AudioFeeds(Browser):
             if row[0] in feeds:
                 row[0].changed = True
                 row[0] = row[0]
-        AudioFeeds.write()
+        AudioFeeds.write(feeds)
 
     @classmethod
-    def write(klass):
+    def write(klass, changed=None):
+        """Saves the list of feeds and the content of the `changed` ones
+        (all if None)"""
+
         feeds = [row[0] for row in klass.__feeds]
-        with open(FEEDS, "wb") as f:
-            pickle_dump(feeds, f, 2)
+        try:
+            save_feeds(feeds, changed)
+        except EnvironmentError as e:
+            print_w("Couldn't save feeds (%s)" % e)
 
     @classmethod
     def init(klass, library):
         uris = set()
-        feeds = []
+        feeds = load_feeds()
 
-        try:
-            with open(FEEDS, "rb") as fileobj:
-                feeds = pickle_load(fileobj)
-        except (PickleError, EnvironmentError):
+        if feeds is None:
+            feeds = []
             try:
                 with open(FEEDS, "rb") as fileobj:
-                    feeds = hacky_py2_unpickle_recover(fileobj)
-            except Exception:
-                pass
+                    feeds = pickle_load(fileobj)
+            except (PickleError, EnvironmentError):
+                try:
+                    with open(FEEDS, "rb") as fileobj:
+                        feeds = hacky_py2_unpickle_recover(fileobj)
+                except Exception:
+                    pass
 
         for feed in feeds:
             if feed.uri in uris:
@@ -327,6 +465,10 @@ class AudioFeeds(Browser):
             klass.__feeds.append(row=[feed])
             uris.add(feed.uri)
 
+        if feeds and not os.path.isdir(FEEDS_DIR):
+            print_d("Moving feeds to %r" % FEEDS_DIR)
+            klass.write()
+
         GLib.idle_add(klass.__do_check)
 
     @classmethod
@@ -342,14 +484,24 @@ class AudioFeeds(Browser):
 
     @classmethod
     def __check(klass):
-        for row in klass.__feeds:
-            feed = row[0]
-            if feed.get_age() < 2 * 60 * 60:
-                continue
-            elif feed.parse():
-                feed.changed = True
-                row[0] = feed
-        klass.write()
+        feeds = [row[0] for row in klass.__feeds
+                 if row[0].get_age() >= 2 * 60 * 60]
+        print_d("Refreshing %d feed(s)" % len(feeds))
+
+        def state(feed):
+            return (feed.etag, feed.modified, feed.name, len(feed))
+
+        before = [state(f) for f in feeds]
+        changed = FeedRefresher().refresh(feeds)
+        updated = [f for f, s in zip(feeds, before) if s != state(f)]
+        GLib.idle_add(klass.__check_done, changed, updated)
+
+    @classmethod
+    def __check_done(klass, changed, updated):
+        print_d("%d feed(s) with new episodes, %d updated" % (
+            len(changed), len(updated)))
+        klass.changed(changed)
+        klass.write([f for f in updated if f not in changed])
         GLib.timeout_add(60 * 60 * 1000, klass.__do_check)
 
     def __init__(self, library):
@@ -431,7 +583,7 @@ class AudioFeeds(Browser):
         feed.changed = feed.parse()
         if feed:
             self.__feeds.append(row=[feed])
-            AudioFeeds.write()
+            AudioFeeds.write([feed])
         else:
             self.feed_error(feed).run()
 
@@ -486,7 +638,7 @@ class AudioFeeds(Browser):
             feed.changed = feed.parse()
             if feed:
                 self.__feeds.append(row=[feed])
-                AudioFeeds.write()
+                AudioFeeds.write([feed])
             else:
                 self.feed_error(feed).run()
 
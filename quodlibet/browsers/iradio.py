@@ -10,15 +10,17 @@ import os
 import sys
 import bz2
 import itertools
+import json
 from functools import reduce
 from http.client import HTTPException
 from os.path import splitext
 from threading import Thread
 from typing import Dict, Collection, Callable, Iterable, Optional
-from urllib.request import urlopen
+from urllib.error import HTTPError
+from urllib.request import urlopen, Request
 
 import re
-from gi.repository import Gtk, GLib, Pango
+from gi.repository import Gtk, GLib, Pango, Gio
 from senf import text2fsn
 
 from quodlibet.util.dprint import print_d, print_e
@@ -38,10 +40,11 @@ from quodlibet.qltk.getstring import GetStringDialog
 from quodlibet.qltk.songsmenu import SongsMenu
 from quodlibet.qltk.notif import Task
 from quodlibet.qltk import Icons, ErrorMessage, WarningMessage
-from quodlibet.util import copool, connect_destroy, sanitize_tags, connect_obj
+from quodlibet.util import connect_destroy, sanitize_tags, connect_obj
 from quodlibet.util.i18n import numeric_phrase
 from quodlibet.util.path import uri_is_valid
 from quodlibet.util.string import decode, encode
+from quodlibet.util.thread import call_async_background, LANE_NETWORK
 from quodlibet.util import print_w
 from quodlibet.qltk.views import AllTreeView
 from quodlibet.qltk.searchbar import SearchBarBox
@@ -52,6 +55,10 @@ STATION_LIST_URL = \
     "https://quodlibet.github.io/radio/radiolist.bz2"
 STATIONS_FAV = os.path.join(quodlibet.get_user_dir(), "stations")
 STATIONS_ALL = os.path.join(quodlibet.get_user_dir(), "stations_all")
+STATIONS_ALL_HTTP = os.path.join(quodlibet.get_user_dir(), "stations_all_http")
+"""ETag and Last-Modified of the station list STATIONS_ALL is based on"""
+
+TAGLIST_BATCH_SIZE = 1000
 
 # TODO: - Ranking: reduce duplicate stations (max 3 URLs per station)
 #                  prefer stations that match a genre?
@@ -256,56 +263,165 @@ def _get_stations_from(uri: str,
     on_done(irfs, uri)
 
 
-def download_taglist(callback, cofuncid, step=1024 * 10):
-    """Generator for loading the bz2 compressed tag list.
+def load_validators(path=STATIONS_ALL_HTTP):
+    """Returns the HTTP cache validators saved by save_validators()"""
 
-    Calls callback with the decompressed data or None in case of
-    an error."""
+    try:
+        with open(path, "r", encoding="utf-8") as h:
+            validators = json.load(h)
+    except (OSError, ValueError):
+        return {}
+    return validators if isinstance(validators, dict) else {}
 
-    with Task(_("Internet Radio"), _("Downloading station list")) as task:
-        if cofuncid:
-            task.copool(cofuncid)
 
+def save_validators(validators, path=STATIONS_ALL_HTTP):
+    try:
+        with open(path, "w", encoding="utf-8") as h:
+            json.dump(validators, h)
+    except OSError as e:
+        print_w("Couldn't save %r (%s)" % (path, e))
+
+
+def iter_decompressed(fileobj, step=1024 * 64, progress=None):
+    """Yields the bz2 decompressed content of `fileobj` in chunks.
+
+    `progress` gets called with the number of compressed bytes read so far.
+
+    Raises:
+        OSError, EOFError: in case the data is invalid or incomplete
+    """
+
+    decomp = bz2.BZ2Decompressor()
+    read = 0
+    while not decomp.eof:
+        data = fileobj.read(step)
+        if not data:
+            raise EOFError("Compressed data ended before the "
+                           "end-of-stream marker was reached")
+        read += len(data)
+        if progress is not None:
+            progress(read)
+        chunk = decomp.decompress(data)
+        if chunk:
+            yield chunk
+
+
+def download_taglist(on_batch, cancellable=None, url=STATION_LIST_URL,
+                     validators=None, progress=None,
+                     batch_size=TAGLIST_BATCH_SIZE):
+    """Downloads and parses the bz2 compressed tag list, meant to be called
+    from a thread.
+
+    The stations get passed to `on_batch` as lists of IRFiles while
+    parsing. `progress` gets called with the download fraction or None
+    if the size isn't known. If the `validators` of an earlier download
+    are passed the server can answer that nothing has changed.
+
+    Returns:
+        The validators of the new list or None if not modified
+        (or cancelled)
+    Raises:
+        IRadioError
+    """
+
+    headers = {}
+    validators = validators or {}
+    if validators.get("url") == url:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last-modified"):
+            headers["If-Modified-Since"] = validators["last-modified"]
+
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=30)
+    except HTTPError as e:
+        if e.code == 304:
+            print_d("Station list not modified")
+            return None
+        raise IRadioError("Failed fetching from %s: %s" % (url, e))
+    except (EnvironmentError, HTTPException) as e:
+        raise IRadioError("Failed fetching from %s: %s" % (url, e))
+
+    with response:
+        info = response.info()
         try:
-            response = urlopen(STATION_LIST_URL)
-        except (EnvironmentError, HTTPException) as e:
-            print_e("Failed fetching from %s" % STATION_LIST_URL, e)
-            GLib.idle_add(callback, None)
-            return
-        try:
-            size = int(response.info().get("content-length", 0))
+            size = int(info.get("content-length", 0))
         except ValueError:
             size = 0
 
-        decomp = bz2.BZ2Decompressor()
+        def report(read):
+            if progress is not None:
+                progress(float(read) / size if size else None)
 
-        data = b""
-        temp = b""
-        read = 0
-        while temp or not data:
-            read += len(temp)
+        batch = []
+        count = 0
+        try:
+            chunks = iter_decompressed(response, progress=report)
+            for station in iter_taglist(chunks):
+                if cancellable is not None and cancellable.is_cancelled():
+                    return None
+                batch.append(station)
+                if len(batch) >= batch_size:
+                    on_batch(batch)
+                    count += len(batch)
+                    batch = []
+        except (EnvironmentError, EOFError, HTTPException) as e:
+            raise IRadioError("Failed reading from %s: %s" % (url, e))
+        if batch:
+            on_batch(batch)
+            count += len(batch)
+
+    print_d(f"Got {count} station(s)")
+    return {"url": url,
+            "etag": info.get("etag"),
+            "last-modified": info.get("last-modified")}
+
+
+def iter_taglist(chunks):
+    """Like parse_taglist() but takes an iterable of bytes and yields
+    each station as soon as it is complete"""
 
-            if size:
-                task.update(float(read) / size)
-            else:
-                task.pulse()
-            yield True
+    station = None
+    rest = b""
 
-            try:
-                data += decomp.decompress(temp)
-                temp = response.read(step)
-            except (IOError, EOFError):
-                data = None
-                break
-        response.close()
+    for chunk in itertools.chain(chunks, [b"\n"]):
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for l in lines:
+            if b"=" not in l:
+                continue
+            key, value = l.split(b"=", 1)
+            key = decode(key)
+            value = decode(value)
+            if key == "uri":
+                if station:
+                    yield station
+                station = IRFile(value)
+                continue
 
-        yield True
+            san = list(sanitize_tags({key: value}, stream=True).items())
+            if not san:
+                continue
 
-        stations = None
-        if data:
-            stations = parse_taglist(data)
-        print_d(f"Got {len(stations or [])} station(s)")
-        GLib.idle_add(callback, stations)
+            key, value = san[0]
+            if key == "~listenerpeak":
+                key = "~#listenerpeak"
+                try:
+                    value = int(value)
+                except ValueError:
+                    continue
+
+            if not station:
+                continue
+
+            if isinstance(value, str):
+                if value not in station.list(key):
+                    station.add(key, value)
+            else:
+                station[key] = value
+
+    if station:
+        yield station
 
 
 def parse_taglist(data):
@@ -320,44 +436,20 @@ def parse_taglist(data):
 
     """
 
-    stations = []
-    station = None
+    return list(iter_taglist([data]))
 
-    for l in data.split(b"\n"):
-        if not l:
-            continue
-        key = l.split(b"=")[0]
-        value = l.split(b"=", 1)[1]
-        key = decode(key)
-        value = decode(value)
-        if key == "uri":
-            if station:
-                stations.append(station)
-            station = IRFile(value)
-            continue
 
-        san = list(sanitize_tags({key: value}, stream=True).items())
-        if not san:
-            continue
+def _filter_station(station):
+    """Filters stations based on quality and listener count"""
 
-        key, value = san[0]
-        if key == "~listenerpeak":
-            key = "~#listenerpeak"
-            value = int(value)
-
-        if not station:
-            continue
-
-        if isinstance(value, str):
-            if value not in station.list(key):
-                station.add(key, value)
-        else:
-            station[key] = value
-
-    if station:
-        stations.append(station)
-
-    return stations
+    peak = station.get("~#listenerpeak", 0)
+    if peak < 10:
+        return False
+    aac = "AAC" in station("~format")
+    bitrate = station("~#bitrate", 50)
+    if (aac and bitrate < 40) or (not aac and bitrate < 60):
+        return False
+    return True
 
 
 class AddNewStation(GetStringDialog):
@@ -493,6 +585,8 @@ class InternetRadio(Browser, util.InstanceTracker):
     __librarian = None
 
     __filter = None
+    __cancellable = None
+    __stop_update = None
 
     name = _("Internet Radio")
     accelerated_name = _("_Internet Radio")
@@ -548,6 +642,8 @@ class InternetRadio(Browser, util.InstanceTracker):
         self.view.get_selection().handler_unblock(self.__changed_sig)
 
     def __destroy(self, *args):
+        if self.__stop_update is not None:
+            self.__stop_update()
         if not self.instances():
             self._destroy()
 
@@ -682,25 +778,55 @@ class InternetRadio(Browser, util.InstanceTracker):
 
     def __update(self, *args):
         self.qbar.hide()
-        copool.add(download_taglist, self.__update_done,
-                   cofuncid="radio-load", funcid="radio-load")
-
-    def __update_done(self, stations):
-        if not stations:
-            print_w("Loading remote station list failed.")
+        if self.__cancellable is not None and \
+                not self.__cancellable.is_cancelled():
             return
 
-        # filter stations based on quality, listenercount
-        def filter_stations(station):
-            peak = station.get("~#listenerpeak", 0)
-            if peak < 10:
-                return False
-            aac = "AAC" in station("~format")
-            bitrate = station("~#bitrate", 50)
-            if (aac and bitrate < 40) or (not aac and bitrate < 60):
+        self.__cancellable = cancellable = Gio.Cancellable()
+
+        def stop():
+            # done() isn't called once cancelled
+            cancellable.cancel()
+            task.finish()
+
+        self.__stop_update = stop
+        task = Task(_("Internet Radio"), _("Downloading station list"),
+                    stop=stop)
+        # only ask if the list changed in case we have one
+        validators = load_validators() if len(self.__stations) else None
+        received = []
+
+        def on_batch(stations):
+            GLib.idle_add(add_batch, stations)
+
+        def add_batch(stations):
+            if not cancellable.is_cancelled():
+                received.extend(filter(_filter_station, stations))
+
+        def progress(frac):
+            GLib.idle_add(task.update, frac)
+
+        def fetch():
+            try:
+                return download_taglist(
+                    on_batch, cancellable, validators=validators,
+                    progress=progress)
+            except IRadioError as e:
+                print_w(str(e))
                 return False
-            return True
-        stations = filter(filter_stations, stations)
+
+        def done(result):
+            task.finish()
+            self.__cancellable = self.__stop_update = None
+            if result is False:
+                print_w("Loading remote station list failed.")
+            elif result is not None:
+                self.__update_done(received)
+                save_validators(result)
+
+        call_async_background(fetch, cancellable, done, lane=LANE_NETWORK)
+
+    def __update_done(self, stations):
 
         # group them based on the title
         groups = {}
@@ -6,11 +6,12 @@
 # (at your option) any later version.
 
 import json
+import time
 from datetime import datetime
 from typing import Optional, Any
 from urllib.parse import urlencode
 
-from gi.repository import GObject, Gio, Soup
+from gi.repository import GObject, Gio, Soup, GLib
 
 from quodlibet import util, config
 from quodlibet.formats import AudioFile
@@ -38,7 +39,10 @@ class RestApi(GObject.Object):
     def _get(self, path, callback, data=None, **kwargs):
         args = self._default_params()
         args.update(kwargs)
-        msg = self._add_auth_to(Soup.Message.new('GET', self._url(path, args)))
+        self._get_url(self._url(path, args), callback, data)
+
+    def _get_url(self, url, callback, data=None):
+        msg = self._add_auth_to(Soup.Message.new('GET', url))
         download_json(msg, self._cancellable, callback, data, self._on_failure)
 
     def _add_auth_to(self, msg: Soup.Message) -> Soup.Message:
@@ -85,7 +89,16 @@ class SoundcloudApiClient(RestApi):
     API_ROOT = "https://api.soundcloud.com"
     REDIRECT_URI = 'https://quodlibet.github.io/callbacks/soundcloud.html'
     PAGE_SIZE = 100
+    MAX_PAGES = 5
+    """Number of result pages followed for a single query"""
     MIN_DURATION_SECS = 120
+    QUERY_TTL = 10 * 60
+    """Seconds query results are reused without asking again"""
+    MAX_CACHED_QUERIES = 50
+    TRACK_TTL = 60 * 60
+    """Seconds until parsed track metadata gets refreshed from a response"""
+    STREAM_URL_TTL = 10 * 60
+    """Seconds a fetched stream URL is considered valid"""
     COUNT_TAGS = {'%s_count' % t
                   for t in ('playback', 'download', 'likes', 'favoritings',
                             'download', 'comments')}
@@ -108,6 +121,10 @@ class SoundcloudApiClient(RestApi):
         if not self.user_id:
             self._get_me()
         self.username = None
+        self._generation = 0
+        self._queries = {}
+        self._tracks = {}
+        self._stream_urls = {}
 
     @property
     def online(self):
@@ -197,30 +214,96 @@ class SoundcloudApiClient(RestApi):
             delim = " " if k == 'q' else ","
             merged[k] = delim.join(list(v))
         print_d("Getting tracks: params=%s" % merged)
-        self._get('/tracks', self._on_track_data, **merged)
+        self._get_pages('/tracks', **merged)
+
+    def _get_pages(self, path, **params):
+        """Emits `songs-received` for each page of results as it arrives.
+
+        Follows the result cursor for up to MAX_PAGES pages and replaces
+        any query still in progress. Results are reused for QUERY_TTL.
+        """
+
+        self._generation += 1
+        generation = self._generation
+        key = (path, tuple(sorted(params.items())))
+        cached = self._queries.get(key)
+        if cached and time.time() - cached[0] < self.QUERY_TTL:
+            print_d("Using %d cached results for %s" % (len(cached[1]), path))
+
+            def idle():
+                if generation == self._generation:
+                    self._emit_tracks(cached[1])
+                return False
+
+            GLib.idle_add(idle)
+            return
+
+        state = _PagedQuery(key, generation)
+        self._get(path, self._on_track_page, state,
+                  linked_partitioning=1, **params)
+
+    @json_callback
+    def _on_track_page(self, json, state):
+        if state.generation != self._generation:
+            print_d("Ignoring results of an old query")
+            return
+        if isinstance(json, list):
+            tracks, next_href = json, None
+        else:
+            tracks = json.get("collection") or []
+            next_href = json.get("next_href")
+        state.tracks.extend(tracks)
+        state.pages += 1
+
+        if next_href and state.pages < self.MAX_PAGES:
+            # ask for the next page before handling this one
+            self._get_url(next_href, self._on_track_page, state)
+            self._emit_tracks(tracks)
+            return
+        self._emit_tracks(tracks)
+
+        print_d("Got %d results in %d page(s)" % (len(state.tracks),
+                                                  state.pages))
+        while len(self._queries) >= self.MAX_CACHED_QUERIES:
+            oldest = min(self._queries, key=lambda k: self._queries[k][0])
+            del self._queries[oldest]
+        self._queries[state.key] = (time.time(), state.tracks)
 
     def get_stream_url(self, song):
+        if self.has_stream_url(song):
+            return
         try:
             self._get(f"/tracks/{song['soundcloud_track_id']}/streams",
                       self._on_track_stream_urls_data, song)
         except Exception as e:
             print_w(f"Problem getting stream URL for {song} ({e})")
 
+    def has_stream_url(self, song):
+        """If a fetched stream URL for the song is still valid"""
+
+        fetched = self._stream_urls.get(song['soundcloud_track_id'])
+        return (fetched is not None and
+                time.time() - fetched < self.STREAM_URL_TTL)
+
     @json_callback
     def _on_track_stream_urls_data(self, json, song):
         uri = json['http_mp3_128_url']
+        self._stream_urls[song['soundcloud_track_id']] = time.time()
         self.emit("stream-uri-received", song, uri)
 
     @json_callback
     def _on_track_data(self, json, _data):
-        songs = list(filter(None, [self._audiofile_for(r) for r in json]))
+        self._emit_tracks(json)
+
+    def _emit_tracks(self, tracks):
+        songs = list(filter(None, [self._audiofile_for(r) for r in tracks]))
         self.emit('songs-received', songs)
 
     def get_favorites(self):
-        self._get("/me/likes/tracks", self._on_track_data, limit=self.PAGE_SIZE)
+        self._get_pages("/me/likes/tracks", limit=self.PAGE_SIZE)
 
     def get_my_tracks(self):
-        self._get('/me/tracks', self._on_track_data, limit=self.PAGE_SIZE)
+        self._get_pages('/me/tracks', limit=self.PAGE_SIZE)
 
     def get_comments(self, track_id):
         self._get(f"/tracks/{track_id}/comments", self._receive_comments, limit=100)
@@ -253,6 +336,30 @@ class SoundcloudApiClient(RestApi):
         print_d("Successfully updated favorite")
 
     def _audiofile_for(self, response) -> Optional[AudioFile]:
+        """Returns the song for a track response.
+
+        Songs are kept for TRACK_TTL and reused for later responses, so
+        they keep their stream URL and stay the same objects.
+        """
+
+        cached = self._tracks.get(response.get("id"))
+        if cached is not None:
+            fetched, song = cached
+            if time.time() - fetched < self.TRACK_TTL:
+                return song
+            new = self._parse_track(response)
+            if new is not None:
+                song.update({k: v for k, v in new.items() if k != "~uri"})
+                song.favorite = new.favorite
+                self._tracks[song.track_id] = (time.time(), song)
+            return song
+
+        song = self._parse_track(response)
+        if song is not None:
+            self._tracks[song.track_id] = (time.time(), song)
+        return song
+
+    def _parse_track(self, response) -> Optional[AudioFile]:
         r = Wrapper(response)
         d = r.data
         try:
@@ -331,3 +438,12 @@ class SoundcloudApiClient(RestApi):
 
         }
         return '%s?%s' % (url, urlencode(options))
+
+
+class _PagedQuery:
+
+    def __init__(self, key, generation):
+        self.key = key
+        self.generation = generation
+        self.tracks = []
+        self.pages = 0
@@ -7,13 +7,12 @@
 
 from gi.repository import GLib
 
-from quodlibet import config, _
+from quodlibet import config, app
 from quodlibet.browsers.soundcloud.query import SoundcloudQuery
 from quodlibet.formats import AudioFile
 from quodlibet.formats.remote import RemoteFile
 from quodlibet.library import SongLibrary
 from quodlibet.library.base import K
-from quodlibet.qltk.notif import Task
 from quodlibet.util import cached_property, print_exc, copool
 from quodlibet.util.dprint import print_d, print_w
 from senf import fsnative
@@ -21,6 +20,10 @@ from senf import fsnative
 
 class SoundcloudLibrary(SongLibrary[K, "SoundcloudFile"]):
     STAR = ["artist", "title", "genre", "tags"]
+    PREFETCH_COUNT = 3
+    """Number of upcoming songs to fetch stream URLs for"""
+    PREFETCH_INTERVAL = 100
+    """Milliseconds between stream URL requests for the other results"""
 
     def __init__(self, client, player=None):
         super().__init__("Soundcloud")
@@ -33,6 +36,7 @@ class SoundcloudLibrary(SongLibrary[K, "SoundcloudFile"]):
         self._psid = None
         # Keep track of async-changed songs for bulk signalling
         self._dirty = set()
+        self._prefetch_queue = []
         GLib.timeout_add(2000, self._on_tick)
         if player:
             self.player = player
@@ -40,6 +44,7 @@ class SoundcloudLibrary(SongLibrary[K, "SoundcloudFile"]):
 
     def destroy(self):
         super().destroy()
+        self._prefetch_queue.clear()
         for sid in self._sids:
             self.client.disconnect(sid)
         if self._psid:
@@ -66,25 +71,39 @@ class SoundcloudLibrary(SongLibrary[K, "SoundcloudFile"]):
     def rename(self, song, newname, changed=None):
         raise TypeError("Can't rename Soundcloud files")
 
-    def _get_stream_urls(self, songs):
-        # Pre-cache. It's horrible, but at least you can play things immediately
-        with Task(_("Soundcloud"), "Pre-fetching stream URLs") as task:
-            total = len(songs)
-            for i, song in enumerate(songs):
-                # Only update ones without streaming URLs
-                # TODO: But yes these will time out...
-                if "~uri" not in song or "api.soundcloud.com" in song["~uri"]:
-                    self.client.get_stream_url(song)
-                task.update(i / total)
+    def prefetch(self, songs):
+        """Fetches stream URLs for the songs which don't have a valid one,
+        so playing them doesn't have to wait for the API"""
+
+        for song in songs:
+            if isinstance(song, SoundcloudFile):
+                self.client.get_stream_url(song)
+
+    def _prefetch_queued(self):
+        while self._prefetch_queue:
+            song = self._prefetch_queue.pop(0)
+            if not self.client.has_stream_url(song):
+                self.client.get_stream_url(song)
                 yield
 
+    def prefetch_later(self, songs):
+        """Like prefetch(), but one song at a time to avoid hitting the
+        API rate limits"""
+
+        start = not self._prefetch_queue
+        self._prefetch_queue.extend(
+            s for s in songs if isinstance(s, SoundcloudFile))
+        if start and self._prefetch_queue:
+            copool.add(self._prefetch_queued, timeout=self.PREFETCH_INTERVAL,
+                       funcid=("soundcloud-prefetch", id(self)))
+
     def _on_songs_received(self, client, songs):
         print_d(f"Got {len(songs)} songs")
         self.add(songs)
-        # Can't have multiple requests cancel each other's copools
-        funcid = hash("".join(s["~uri"] for s in songs))
-        # Rate limit a little to avoid 429s
-        copool.add(self._get_stream_urls, songs, timeout=100, funcid=funcid)
+        # Results at the top are the most likely to get played first, the
+        # rest follow so any of them can be played directly
+        self.prefetch(songs[:self.PREFETCH_COUNT])
+        self.prefetch_later(songs[self.PREFETCH_COUNT:])
 
     def _on_stream_uri_received(self, client, song: AudioFile, uri: str):
         # URI isn't the key in this SoundcloudFile, so this is OK
@@ -127,6 +146,9 @@ class SoundcloudLibrary(SongLibrary[K, "SoundcloudFile"]):
         if isinstance(song, SoundcloudFile):
             print_d("Getting comments for %s (%s)" % (song("title"), song.key))
             self.client.get_comments(song.track_id)
+        playlist = getattr(app.window, "playlist", None)
+        if playlist is not None:
+            self.prefetch(playlist.get_upcoming(self.PREFETCH_COUNT))
 
 
 class SoundcloudFile(RemoteFile):
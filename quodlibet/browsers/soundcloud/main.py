@@ -111,6 +111,8 @@ class SoundcloudBrowser(Browser, util.InstanceTracker):
         self.connect('uri-received', self.__handle_incoming_uri)
         connect_destroy(self.api_client, 'authenticated', self.__on_authenticated)
         connect_destroy(self.library, 'changed', self.__changed)
+        # Results arrive page by page
+        connect_destroy(self.library, 'added', self.__changed)
         self.login_state = (State.LOGGED_IN if self.online
                             else State.LOGGED_OUT)
         self._create_searchbar(self.library)
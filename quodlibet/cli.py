@@ -6,12 +6,12 @@
 # (at your option) any later version.
 
 import os
+import stat
 
 from senf import fsn2text, uri2fsn
 
 from quodlibet import C_, _
 from quodlibet.util.dprint import print_, print_e
-from quodlibet.remote import Remote, RemoteError
 
 
 def exit_(status=None, notify_startup=False):
@@ -32,6 +32,8 @@ def exit_(status=None, notify_startup=False):
 def is_running():
     """If maybe is another instance running"""
 
+    from quodlibet.remote import Remote
+
     return Remote.remote_exists()
 
 
@@ -51,6 +53,8 @@ def control(command, arg=None, ignore_error=False):
               notify_startup=True)
         return
 
+    from quodlibet.remote import Remote, RemoteError
+
     message = command
     if arg is not None:
         message += " " + arg
@@ -67,6 +71,123 @@ def control(command, arg=None, ignore_error=False):
         exit_(notify_startup=True)
 
 
+def parse_headless(argv):
+    """Returns a (command, args) tuple if the command line consists of a
+    single query which can be answered without starting the GUI, or None.
+    """
+
+    args = list(argv[1:])
+    if not args or not args[0].startswith("--"):
+        return None
+    name, eq, value = args.pop(0)[2:].partition("=")
+    if eq:
+        args.insert(0, value)
+
+    if name == "status" and not args:
+        return "status", args
+    elif name == "print-playing" and len(args) <= 1:
+        return "print-playing", args
+    elif name == "print-query" and len(args) == 1:
+        return "print-query", args
+    return None
+
+
+def query_songs(filename, text):
+    """Returns the songs of the song database at `filename` matching the
+    query `text`, without loading a library.
+
+    Raises:
+        EnvironmentError
+        SerializationError
+    """
+
+    from quodlibet.formats import load_audio_files
+    from quodlibet.query import Query
+    from quodlibet.util.path import ismount
+
+    with open(filename, "rb") as h:
+        songs = load_audio_files(h.read())
+
+    search = Query(text).search if text else (lambda song: True)
+    mounts = {}
+    result = []
+    for song in songs:
+        mountpoint = song.mountpoint
+        if mountpoint not in mounts:
+            mounts[mountpoint] = ismount(mountpoint)
+        # skip songs the library would mask
+        if mounts[mountpoint] and search(song):
+            result.append(song)
+    return result
+
+
+def _headless_is_running(user_dir):
+    """Like is_running(), but without importing the remote/FIFO code (and
+    with it GLib)"""
+
+    try:
+        mode = os.stat(os.path.join(user_dir, "control")).st_mode
+    except OSError:
+        return False
+    return stat.S_ISFIFO(mode)
+
+
+def run_headless(argv, config_file):
+    """Handles --status, --print-playing and --print-query without
+    importing GTK or GStreamer.
+
+    A running instance gets asked through the control socket. If there is
+    none, queries get answered from the song database instead.
+
+    Exits if it handled the command line and returns otherwise.
+    """
+
+    parsed = parse_headless(argv)
+    if parsed is None or os.name == "nt":
+        return
+    command, args = parsed
+
+    from quodlibet import get_user_dir
+    from quodlibet.util import ctlsocket
+
+    # see QuodLibetUnixRemote for the paths
+    user_dir = get_user_dir()
+    try:
+        with ctlsocket.ControlSocketClient(
+                os.path.join(user_dir, "control.sock")) as client:
+            response = client.call(command, *args)
+    except ctlsocket.CommandFailed as e:
+        exit_(str(e))
+    except ctlsocket.ControlSocketError:
+        pass
+    else:
+        if response is not None:
+            print_(response, end="", flush=True)
+        exit_()
+
+    # Running, but without a socket: use the FIFO
+    if command != "print-query" or _headless_is_running(user_dir):
+        return
+
+    # Only the config is needed for queries. The format modules of the
+    # songs in the database get imported while loading it, so no
+    # init_cli() which would load all of them.
+    from quodlibet import config
+    from quodlibet.formats import SerializationError
+
+    config.init_defaults()
+    config.init(config_file)
+    filename = os.path.join(user_dir, "songs")
+    try:
+        songs = query_songs(filename, args[0])
+    except (EnvironmentError, SerializationError) as e:
+        exit_(_("Couldn't read the library: %s") % e)
+    else:
+        print_("\n".join(song("~filename") for song in songs) + "\n",
+               end="", flush=True)
+        exit_()
+
+
 def process_arguments(argv):
     from quodlibet.util.path import uri_is_valid
     from quodlibet import util
@@ -110,6 +231,8 @@ def process_arguments(argv):
         ("focus", _("Focus the running player")),
         ("unfilter", _("Remove active browser filters")),
         ("refresh", _("Refresh and rescan library")),
+        ("fetch-covers",
+            _("Download missing album covers from online sources")),
         ("list-browsers", _("List available browsers")),
         ("print-playlist", _("Print the current playlist")),
         ("print-queue", _("Print the contents of the queue")),
@@ -146,6 +269,8 @@ def process_arguments(argv):
             C_("command", "filename"), _("query"))),
         ("add-location", _("Add a file or directory to the library"),
             _("location")),
+        ("perf-log", _("Write performance measurements to a file"),
+            C_("command", "filename")),
             ]:
         options.add(opt, help=help, arg=arg)
 
@@ -194,6 +319,7 @@ def process_arguments(argv):
         }
 
     cmds_todo = []
+    perf_log = None
 
     def queue(*args):
         cmds_todo.append(args)
@@ -274,6 +400,16 @@ def process_arguments(argv):
             actions.append(command)
         elif command == "run":
             actions.append(command)
+        elif command == "fetch-covers":
+            actions.append(command)
+        elif command == "perf-log":
+            perf_log = os.path.abspath(util.path.expanduser(arg))
+
+    # Without a running instance (or one to start) covers get fetched
+    # standalone, see main()
+    if "fetch-covers" in actions and ("run" in actions or is_running()):
+        actions.remove("fetch-covers")
+        queue("fetch-covers")
 
     if cmds_todo:
         for cmd in cmds_todo:
@@ -282,4 +418,9 @@ def process_arguments(argv):
         # this will exit if it succeeds
         control('focus', ignore_error=True)
 
+    if perf_log is not None:
+        # only reached if we are the instance which is going to run
+        from quodlibet.util import perf
+        perf.enable(perf_log)
+
     return actions, cmds_todo
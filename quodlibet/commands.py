@@ -21,6 +21,7 @@ from quodlibet.util import print_d, print_e, copool
 from quodlibet.qltk.browser import LibraryBrowser
 from quodlibet.qltk.properties import SongProperties
 from quodlibet.util.library import scan_library
+from quodlibet.util.cover.backfill import backfill_covers
 
 from quodlibet.order.repeat import RepeatListForever, RepeatSongForever, OneSong
 from quodlibet.order.reorder import OrderWeighted, OrderShuffle
@@ -524,6 +525,11 @@ def _refresh(app):
     scan_library(app.library, False)
 
 
+@registry.register("fetch-covers")
+def _fetch_covers(app):
+    backfill_covers(app.library, app.cover_manager)
+
+
 @registry.register("print-query", args=1)
 def _print_query(app, query):
     """Queries library, dumping filenames of matches to stdout
@@ -25,7 +25,7 @@ from quodlibet import config
 from quodlibet.qltk.entry import UndoEntry
 from quodlibet.qltk import Icons
 from quodlibet.util import print_w, print_d
-from quodlibet.util.thread import call_async, Cancellable
+from quodlibet.util.thread import call_async, Cancellable, LANE_NETWORK
 
 from .main import MPDServer
 from .tcpserver import ServerError
@@ -60,8 +60,9 @@ class MPDServerPlugin(EventPlugin, PluginConfigMixin):
     PLUGIN_ID = "mpd_server"
     PLUGIN_NAME = _("MPD Server")
     PLUGIN_DESC = _("Allows remote control of Quod Libet using an MPD Client. "
-                    "Streaming, playlist and library management "
-                    "are not supported.")
+                    "The library and the song list can be browsed and songs "
+                    "added to the queue. Streaming, playlist and library "
+                    "management are not supported.")
     PLUGIN_ICON = Icons.NETWORK_WORKGROUP
 
     CONFIG_SECTION = "mpdserver"
@@ -143,7 +144,7 @@ class MPDServerPlugin(EventPlugin, PluginConfigMixin):
 
         cancel = Cancellable()
         label.connect("destroy", lambda *x: cancel.cancel())
-        call_async(fetch_local_ip, cancel, label.set_label)
+        call_async(fetch_local_ip, cancel, label.set_label, lane=LANE_NETWORK)
 
         box = Gtk.VBox(spacing=12)
 
@@ -0,0 +1,272 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+
+from quodlibet.util import print_d
+from quodlibet.util.library import get_scan_dirs
+
+
+def get_roots():
+    """Returns a list of (prefix, path) for all library directories.
+
+    With only one library directory its content is at the root of the
+    MPD database, otherwise each gets a top level directory.
+    """
+
+    dirs = [os.path.normpath(d) for d in get_scan_dirs()]
+    if len(dirs) == 1:
+        return [("", dirs[0])]
+
+    roots = []
+    used = set()
+    for path in dirs:
+        name = os.path.basename(path) or "root"
+        prefix = name
+        i = 2
+        while prefix in used:
+            prefix = "%s (%d)" % (name, i)
+            i += 1
+        used.add(prefix)
+        roots.append((prefix, path))
+    return roots
+
+
+def song_uri(song, roots):
+    """The MPD URI for a song, relative to the library directories"""
+
+    filename = song("~filename")
+    for prefix, path in roots:
+        if filename.startswith(path + os.sep):
+            rel = filename[len(path) + 1:]
+            return prefix + "/" + rel if prefix else rel
+    return filename.lstrip(os.sep)
+
+
+class LibraryIndex:
+    """Indexes the songs in a library by tag values and by directory.
+
+    The tag indexes get built when first needed and from then on get
+    updated with the library, so repeated queries don't have to look at
+    every song.
+    """
+
+    def __init__(self, library, roots=None):
+        self._library = library
+        self._roots = get_roots() if roots is None else roots
+        # tag -> {value: set(songs)}
+        self._tags = {}
+        # tag -> {song: values}
+        self._song_values = {}
+        # uri -> song / song -> uri
+        self._uris = None
+        self._song_uris = None
+        # directory uri -> [set(child dir uris), set(songs)]
+        self._dirs = None
+        self._length = None
+
+        self._sigs = [
+            library.connect("added", self.__added),
+            library.connect("changed", self.__changed),
+            library.connect("removed", self.__removed),
+        ]
+
+    def destroy(self):
+        for id_ in self._sigs:
+            self._library.disconnect(id_)
+        self._sigs = []
+        self._tags.clear()
+        self._song_values.clear()
+        self._uris = self._song_uris = self._dirs = None
+
+    def __len__(self):
+        return len(self._library)
+
+    @property
+    def total_length(self):
+        """Sum of the length of all songs in seconds"""
+
+        if self._length is None:
+            self._length = sum(
+                s("~#length", 0) for s in self._library.values())
+        return self._length
+
+    def values(self, tag):
+        """Returns a dict mapping all values of `tag` to sets of songs"""
+
+        index = self._tags.get(tag)
+        if index is None:
+            print_d("Building index for %r" % tag)
+            index = self._tags[tag] = {}
+            self._song_values[tag] = {}
+            self._add_to_tag(tag, self._library.values())
+        return index
+
+    def _add_to_tag(self, tag, songs):
+        index = self._tags[tag]
+        song_values = self._song_values[tag]
+        for song in songs:
+            values = tuple(song.list(tag))
+            song_values[song] = values
+            for value in values:
+                index.setdefault(value, set()).add(song)
+
+    def _remove_from_tag(self, tag, songs):
+        index = self._tags[tag]
+        song_values = self._song_values[tag]
+        for song in songs:
+            for value in song_values.pop(song, ()):
+                entries = index.get(value)
+                if entries is not None:
+                    entries.discard(song)
+                    if not entries:
+                        del index[value]
+
+    def find(self, tag, value, exact=True):
+        """Returns a set of songs where `tag` equals `value`, or if not
+        `exact` where one value of `tag` contains `value` ignoring case.
+        """
+
+        index = self.values(tag)
+        if exact:
+            return set(index.get(value, ()))
+
+        value = value.lower()
+        result = set()
+        for key, songs in index.items():
+            if value in key.lower():
+                result.update(songs)
+        return result
+
+    def find_uri(self, value, exact=True):
+        """Like find() but for the song URIs"""
+
+        self._ensure_dirs()
+        if exact:
+            song = self._uris.get(value)
+            return {song} if song is not None else set()
+        value = value.lower()
+        return {s for uri, s in self._uris.items() if value in uri.lower()}
+
+    def get_uri(self, song):
+        self._ensure_dirs()
+        uri = self._song_uris.get(song)
+        if uri is None:
+            uri = song_uri(song, self._roots)
+        return uri
+
+    def get_song(self, uri):
+        """Returns the song for a URI or None"""
+
+        self._ensure_dirs()
+        return self._uris.get(uri)
+
+    def is_dir(self, uri):
+        self._ensure_dirs()
+        return uri.strip("/") in self._dirs
+
+    def list_dir(self, uri):
+        """Returns a tuple of sorted lists of the child directory URIs and
+        songs of a directory or None if it doesn't exist"""
+
+        self._ensure_dirs()
+        entry = self._dirs.get(uri.strip("/"))
+        if entry is None:
+            return None
+        dirs, songs = entry
+        return sorted(dirs), sorted(songs, key=self._song_uris.__getitem__)
+
+    def walk(self, uri):
+        """Yields (directory_uri, None) and (None, song) for everything
+        below a directory, depth first. Lazy, so can be used for
+        streaming large results"""
+
+        entry = self.list_dir(uri)
+        if entry is None:
+            return
+        dirs, songs = entry
+        for song in songs:
+            yield None, song
+        for child in dirs:
+            yield child, None
+            yield from self.walk(child)
+
+    def _ensure_dirs(self):
+        if self._dirs is not None:
+            return
+        self._uris = {}
+        self._song_uris = {}
+        self._dirs = {"": [set(), set()]}
+        self._add_to_dirs(self._library.values())
+
+    def _add_to_dirs(self, songs):
+        dirs = self._dirs
+        roots = self._roots
+        for song in songs:
+            uri = song_uri(song, roots)
+            self._uris[uri] = song
+            self._song_uris[song] = uri
+            parent = uri.rpartition("/")[0]
+            entry = dirs.get(parent)
+            if entry is None:
+                entry = dirs[parent] = [set(), set()]
+                child = parent
+                while child:
+                    up = child.rpartition("/")[0]
+                    up_entry = dirs.get(up)
+                    if up_entry is None:
+                        up_entry = dirs[up] = [set(), set()]
+                        up_entry[0].add(child)
+                        child = up
+                    else:
+                        up_entry[0].add(child)
+                        break
+            entry[1].add(song)
+
+    def _remove_from_dirs(self, songs):
+        dirs = self._dirs
+        for song in songs:
+            uri = self._song_uris.pop(song, None)
+            if uri is None:
+                continue
+            if self._uris.get(uri) is song:
+                del self._uris[uri]
+            parent = uri.rpartition("/")[0]
+            entry = dirs.get(parent)
+            if entry is None:
+                continue
+            entry[1].discard(song)
+            # remove directories which are now empty
+            while parent and not entry[0] and not entry[1]:
+                del dirs[parent]
+                up = parent.rpartition("/")[0]
+                entry = dirs[up]
+                entry[0].discard(parent)
+                parent = up
+
+    def __added(self, library, songs):
+        self._length = None
+        for tag in self._tags:
+            self._add_to_tag(tag, songs)
+        if self._dirs is not None:
+            self._add_to_dirs(songs)
+
+    def __changed(self, library, songs):
+        self._length = None
+        songs = [s for s in songs if library.get(s.key) is s]
+        for tag in self._tags:
+            self._remove_from_tag(tag, songs)
+            self._add_to_tag(tag, songs)
+        if self._dirs is not None:
+            # the file could have been renamed
+            self._remove_from_dirs(songs)
+            self._add_to_dirs(songs)
+
+    def __removed(self, library, songs):
+        self._length = None
+        for tag in self._tags:
+            self._remove_from_tag(tag, songs)
+        if self._dirs is not None:
+            self._remove_from_dirs(songs)
@@ -5,14 +5,19 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import collections
+import os
 import re
 import shlex
+import time
 from typing import Dict, Tuple, Callable
 
+from gi.repository import GLib
 from senf import bytes2fsn, fsn2bytes
 
 from quodlibet import const
 from quodlibet.util import print_d, print_w
+from .index import LibraryIndex
 from .tcpserver import BaseTCPServer, BaseTCPConnection
 
 
@@ -66,6 +71,13 @@ TAG_MAPPING = [
 ]
 
 
+_TAGS = {mpd_key.lower(): (mpd_key, ql_key)
+         for mpd_key, ql_key in TAG_MAPPING}
+
+IDLE_DELAY = 50
+"""Milliseconds to collect changes before notifying idle clients"""
+
+
 def format_tags(song):
     """Gives a tag list message for a song"""
 
@@ -79,6 +91,25 @@ def format_tags(song):
     return u"\n".join(lines)
 
 
+def format_song(song, uri, pos=None, id_=None):
+    """Gives the full info message for a song"""
+
+    parts = [u"file: %s" % uri]
+    tags = format_tags(song)
+    if tags:
+        parts.append(tags)
+    parts.append(u"Time: %d" % int(song("~#length", 0)))
+    if pos is not None:
+        parts.append(u"Pos: %d" % pos)
+    if id_ is not None:
+        parts.append(u"Id: %d" % id_)
+    return u"\n".join(parts)
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
 class ParseError(Exception):
     pass
 
@@ -123,7 +154,11 @@ def parse_command(line):
 
 
 class MPDService:
-    """This is the actual shared MPD service which the clients talk to"""
+    """This is the actual shared MPD service which the clients talk to.
+
+    The MPD playlist is the main song list, the MPD database is the
+    song library. Songs added by clients go to the queue.
+    """
 
     version = (0, 17, 0)
 
@@ -132,10 +167,21 @@ class MPDService:
         self._connections = set()
         self._idle_subscriptions = {}
         self._idle_queue = {}
-        self._pl_ver = 0
+        self._idle_flush_id = None
+        self._start_time = int(time.time())
+
+        # the playlist version, a snapshot of the playlist and for each
+        # position the version in which it last changed
+        self._pl_ver = 1
+        self._pl_songs = None
+        self._pl_ids = []
+        self._pl_pos_ver = []
 
         self._config = config
         self._options = app.player_options
+        self._playlist = app.window.playlist
+        self._library = app.library
+        self._index = LibraryIndex(app.library)
 
         if not self._config.config_get("password"):
             self.default_permission = Permissions.PERMISSION_ALL
@@ -166,13 +212,30 @@ class MPDService:
         self._player_sigs.append(id_)
         id_ = app.player.connect("seek", player_changed)
         self._player_sigs.append(id_)
+        id_ = app.player.connect("song-started", player_changed)
+        self._player_sigs.append(id_)
 
-        def playlist_changed(*args):
-            self._pl_ver += 1
-            self.emit_changed("playlist")
+        pl = self._playlist.pl
+        self._pl_sigs = [
+            pl.connect(name, self._playlist_changed)
+            for name in ["row-inserted", "row-deleted", "rows-reordered"]]
 
-        id_ = app.player.connect("song-started", playlist_changed)
-        self._player_sigs.append(id_)
+        def database_changed(*args):
+            self.emit_changed("database")
+
+        self._lib_sigs = [
+            app.library.connect(name, database_changed)
+            for name in ["added", "removed"]]
+
+        def stored_playlist_changed(*args):
+            self.emit_changed("stored_playlist")
+
+        self._stored_sigs = []
+        playlists = self._get_playlists()
+        if playlists is not None:
+            self._stored_sigs = [
+                playlists.connect(name, stored_playlist_changed)
+                for name in ["added", "changed", "removed"]]
 
     def _get_id(self, info):
         # XXX: we need a unique 31 bit ID, but don't have one.
@@ -180,9 +243,23 @@ class MPDService:
         # this should work
         return (id(info) & 0xFFFFFFFF) >> 1
 
+    def _get_playlists(self):
+        return getattr(self._library, "playlists", None)
+
     def destroy(self):
         for id_ in self._player_sigs:
             self._app.player.disconnect(id_)
+        for id_ in self._pl_sigs:
+            self._playlist.pl.disconnect(id_)
+        for id_ in self._lib_sigs:
+            self._library.disconnect(id_)
+        playlists = self._get_playlists()
+        for id_ in self._stored_sigs:
+            playlists.disconnect(id_)
+        if self._idle_flush_id is not None:
+            GLib.source_remove(self._idle_flush_id)
+            self._idle_flush_id = None
+        self._index.destroy()
         del self._options
         del self._app
 
@@ -226,15 +303,80 @@ class MPDService:
         self._idle_subscriptions.pop(connection, None)
 
     def emit_changed(self, subsystem):
+        """Queues a change notification. Notifications get sent out
+        together after a short delay, so bursts of changes only wake up
+        the clients once."""
+
         for conn, subs in self._idle_queue.items():
             subs.add(subsystem)
+
+        if self._idle_flush_id is None:
+            self._idle_flush_id = GLib.timeout_add(
+                IDLE_DELAY, self._flush_idle_delayed)
+
+    def _flush_idle_delayed(self):
+        self._idle_flush_id = None
         self.flush_idle()
+        return False
+
+    def _playlist_changed(self, *args):
+        if self._pl_songs is not None:
+            self._pl_songs = None
+            self._pl_ver += 1
+        self.emit_changed("playlist")
+
+    def _get_playlist(self):
+        """Returns a snapshot of the playlist as a tuple of (songs, ids,
+        versions), updated if the playlist changed since the last call"""
+
+        if self._pl_songs is None:
+            songs = self._playlist.pl.get()
+            old_ids = self._pl_ids
+            old_versions = self._pl_pos_ver
+            ids = [self._get_id(s) for s in songs]
+            version = self._pl_ver
+            versions = [
+                old_versions[pos]
+                if pos < len(old_ids) and old_ids[pos] == id_ else version
+                for pos, id_ in enumerate(ids)]
+            self._pl_songs = songs
+            self._pl_ids = ids
+            self._pl_pos_ver = versions
+        return self._pl_songs, self._pl_ids, self._pl_pos_ver
+
+    def _get_position(self, song):
+        """The playlist position of the playing song or None"""
+
+        pl = self._playlist.pl
+        if song is None or pl.current is not song:
+            return None
+        return pl.current_path.get_indices()[0]
 
-    def play(self):
-        self._app.player.playpause()
+    def _format_song(self, song, pos=None):
+        return format_song(song, self._index.get_uri(song), pos,
+                           self._get_id(song))
+
+    def play(self, songpos=None):
+        player = self._app.player
+        if songpos is None:
+            if player.paused or player.song is None:
+                player.playpause()
+            return
+
+        songs = self._get_playlist()[0]
+        if not 0 <= songpos < len(songs):
+            raise MPDRequestError("Bad song index", AckError.ARG)
+        pl = self._playlist.pl
+        player.go_to(pl.iter_nth_child(None, songpos), True, pl)
+        player.paused = False
 
     def playid(self, songid):
-        self.play()
+        ids = self._get_playlist()[1]
+        try:
+            pos = ids.index(songid)
+        except ValueError:
+            raise MPDRequestError("No such song", AckError.NO_EXIST)
+        self.play(pos)
 
     def pause(self, value=None):
         if value is None:
@@ -283,15 +425,15 @@ class MPDService:
         self._options.single = value
 
     def stats(self):
-        has_song = int(bool(self._app.player.info))
+        index = self._index
         stats = [
-            ("artists", has_song),
-            ("albums", has_song),
-            ("songs", has_song),
-            ("uptime", 1),
-            ("playtime", 1),
-            ("db_playtime", 1),
-            ("db_update", 1252868674),
+            ("artists", len(index.values("artist"))),
+            ("albums", len(index.values("album"))),
+            ("songs", len(index)),
+            ("uptime", int(time.time()) - self._start_time),
+            ("playtime", 0),
+            ("db_playtime", int(index.total_length)),
+            ("db_update", self._start_time),
         ]
 
         return stats
@@ -299,6 +441,7 @@ class MPDService:
     def status(self):
         app = self._app
         info = app.player.info
+        songs, ids, versions = self._get_playlist()
 
         if info:
             if app.player.paused:
@@ -315,7 +458,7 @@ class MPDService:
             ("single", int(self._options.single)),
             ("consume", 0),
             ("playlist", self._pl_ver),
-            ("playlistlength", int(bool(app.player.info))),
+            ("playlistlength", len(songs)),
             ("mixrampdb", 0.0),
             ("state", state),
         ]
@@ -328,10 +471,10 @@ class MPDService:
             total_time = int(info("~#length"))
             elapsed_time = int(app.player.get_position() / 1000)
             elapsed_exact = "%1.3f" % (app.player.get_position() / 1000.0)
-            status.extend([
-                ("song", 0),
-                ("songid", self._get_id(info)),
-            ])
+            pos = self._get_position(app.player.song)
+            if pos is not None:
+                status.append(("song", pos))
+            status.append(("songid", self._get_id(info)))
 
             if state != "stop":
                 status.extend([
@@ -347,36 +490,200 @@ class MPDService:
         if info is None:
             return None
 
-        parts = []
-        parts.append(u"file: %s" % info("~filename"))
-        parts.append(format_tags(info))
-        parts.append(u"Time: %d" % int(info("~#length")))
-        parts.append(u"Pos: %d" % 0)
-        parts.append(u"Id: %d" % self._get_id(info))
-
-        return u"\n".join(parts)
+        return self._format_song(info, self._get_position(self._app.player.song))
 
     def playlistinfo(self, start=None, end=None):
-        if start is not None and start > 1:
-            return None
-
-        return self.currentsong()
+        """Returns an iterator of the info for the songs in the playlist
+        range"""
+
+        songs, ids, versions = self._get_playlist()
+        if start is None:
+            start, end = 0, len(songs)
+        elif start < 0 or start >= len(songs):
+            raise MPDRequestError("Bad song index", AckError.ARG)
+        end = len(songs) if end is None else min(end, len(songs))
+        return (self._format_song(songs[pos], pos)
+                for pos in range(start, end))
 
     def playlistid(self, songid=None):
-        return self.currentsong()
+        songs, ids, versions = self._get_playlist()
+        if songid is None:
+            return self.playlistinfo()
+        try:
+            pos = ids.index(songid)
+        except ValueError:
+            raise MPDRequestError("No such song", AckError.NO_EXIST)
+        return self.playlistinfo(pos, pos + 1)
 
-    def plchanges(self, version):
-        if version != self._pl_ver:
-            return self.currentsong()
+    def _changed_positions(self, version, start=None, end=None):
+        songs, ids, versions = self._get_playlist()
+        start = start or 0
+        end = len(songs) if end is None else min(end, len(songs))
+        for pos in range(start, end):
+            if versions[pos] > version:
+                yield pos, songs[pos], ids[pos]
+
+    def plchanges(self, version, start=None, end=None):
+        """Yields the info for all songs which changed position or got
+        added since `version`"""
+
+        for pos, song, id_ in self._changed_positions(version, start, end):
+            yield self._format_song(song, pos)
 
     def plchangesposid(self, version):
-        info = self._app.player.info
-        if version != self._pl_ver and info:
-            parts = []
-            parts.append(u"file: %s" % info("~filename"))
-            parts.append(u"Pos: %d" % 0)
-            parts.append(u"Id: %d" % self._get_id(info))
-            return u"\n".join(parts)
+        for pos, song, id_ in self._changed_positions(version):
+            yield u"cpos: %d\nId: %d" % (pos, id_)
+
+    def _get_tag(self, tag):
+        try:
+            return _TAGS[tag.lower()]
+        except KeyError:
+            raise MPDRequestError("Unknown tag type: %s" % tag, AckError.ARG)
+
+    def _filter(self, pairs, exact):
+        """Returns the set of songs matching all (tag, value) pairs or None
+        if there are no pairs"""
+
+        index = self._index
+        result = None
+        for tag, value in pairs:
+            tag = tag.lower()
+            if tag == "file":
+                songs = index.find_uri(value, exact)
+            elif tag == "base":
+                songs = {s for d, s in index.walk(value) if s is not None}
+            elif tag == "any":
+                songs = index.find_uri(value, exact)
+                for mpd_key, ql_key in TAG_MAPPING:
+                    songs |= index.find(ql_key, value, exact)
+            else:
+                songs = index.find(self._get_tag(tag)[1], value, exact)
+            result = songs if result is None else result & songs
+            if not result:
+                break
+        return result
+
+    def find(self, pairs, exact=True, start=None, end=None):
+        """Returns an iterator of the info for all songs matching the
+        filter"""
+
+        songs = self._filter(pairs, exact) or set()
+        songs = sorted(songs, key=self._index.get_uri)[start:end]
+        return (self._format_song(song) for song in songs)
+
+    def list(self, tag, pairs):
+        """Returns an iterator of all distinct values of a tag, for songs
+        matching the filter if given"""
+
+        mpd_key, ql_key = self._get_tag(tag)
+        if pairs:
+            values = set()
+            for song in self._filter(pairs, True):
+                values.update(song.list(ql_key))
+        else:
+            values = self._index.values(ql_key).keys()
+        return (u"%s: %s" % (mpd_key, value) for value in sorted(values))
+
+    def count(self, pairs):
+        if pairs:
+            songs = self._filter(pairs, True)
+        else:
+            songs = self._library.values()
+        num = 0
+        length = 0
+        for song in songs:
+            num += 1
+            length += song("~#length", 0)
+        return [("songs", num), ("playtime", int(length))]
+
+    def _get_song(self, uri):
+        song = self._index.get_song(uri)
+        if song is None:
+            raise MPDRequestError("No such directory", AckError.NO_EXIST)
+        return song
+
+    def lsinfo(self, uri):
+        """Returns an iterator of the directories and song infos in a
+        directory"""
+
+        entry = self._index.list_dir(uri)
+        if entry is None:
+            return iter([self._format_song(self._get_song(uri))])
+
+        def lines():
+            dirs, songs = entry
+            for path in dirs:
+                yield u"directory: %s" % path
+            for song in songs:
+                yield self._format_song(song)
+            if not uri.strip("/"):
+                yield from self.listplaylists()
+
+        return lines()
+
+    def listall(self, uri, info=False):
+        """Returns an iterator of everything below a directory, computed
+        while iterating"""
+
+        if not self._index.is_dir(uri):
+            song = self._get_song(uri)
+            return iter([self._format_song(song) if info else
+                         u"file: %s" % uri])
+
+        def lines():
+            get_uri = self._index.get_uri
+            for path, song in self._index.walk(uri):
+                if path is not None:
+                    yield u"directory: %s" % path
+                elif info:
+                    yield self._format_song(song)
+                else:
+                    yield u"file: %s" % get_uri(song)
+
+        return lines()
+
+    def _get_stored(self, name):
+        playlists = self._get_playlists()
+        playlist = playlists.get(name) if playlists is not None else None
+        if playlist is None:
+            raise MPDRequestError("No such playlist", AckError.NO_EXIST)
+        return playlist
+
+    def listplaylists(self):
+        playlists = self._get_playlists()
+        if playlists is None:
+            return
+        for playlist in sorted(playlists.values(), key=lambda p: p.name):
+            path = getattr(playlist, "path", None)
+            try:
+                mtime = int(os.path.getmtime(path)) if path else 0
+            except OSError:
+                mtime = 0
+            yield u"playlist: %s\nLast-Modified: %s" % (
+                playlist.name, format_time(mtime))
+
+    def listplaylist(self, name, info=False):
+        songs = list(self._get_stored(name).songs)
+        if info:
+            return (self._format_song(song) for song in songs)
+        get_uri = self._index.get_uri
+        return (u"file: %s" % get_uri(song) for song in songs)
+
+    def add(self, uri):
+        """Adds a song or all songs of a directory to the queue.
+
+        Returns the added songs.
+        """
+
+        song = self._index.get_song(uri)
+        if song is not None:
+            songs = [song]
+        else:
+            songs = [s for d, s in self._index.walk(uri) if s is not None]
+        if not songs:
+            raise MPDRequestError("No such song", AckError.NO_EXIST)
+        self._playlist.enqueue(songs)
+        return songs
 
 
 class MPDServer(BaseTCPServer):
@@ -409,6 +716,9 @@ class MPDRequestError(Exception):
 
 class MPDConnection(BaseTCPConnection):
 
+    WRITE_CHUNK = 65536
+    """Bytes of pending output to format per write"""
+
     #  ------------ connection interface  ------------
 
     def handle_init(self, server):
@@ -418,6 +728,8 @@ class MPDConnection(BaseTCPConnection):
 
         str_version = u".".join(map(str, service.version))
         self._buf = bytearray((u"OK MPD %s\n" % str_version).encode("utf-8"))
+        # iterators of lines which get written to _buf once it drains
+        self._pending = collections.deque()
         self._read_buf = bytearray()
 
         # begin - command processing state
@@ -457,12 +769,26 @@ class MPDConnection(BaseTCPConnection):
                 del self._command_list[:]
 
     def handle_write(self):
+        self._fill_buffer()
         data = self._buf[:]
         del self._buf[:]
         return data
 
     def can_write(self):
-        return bool(self._buf)
+        return bool(self._buf) or bool(self._pending)
+
+    def _fill_buffer(self):
+        """Formats pending output until there is enough for one write"""
+
+        pending = self._pending
+        buf = self._buf
+        while pending and len(buf) < self.WRITE_CHUNK:
+            try:
+                line = next(pending[0])
+            except StopIteration:
+                pending.popleft()
+                continue
+            buf.extend(line.encode("utf-8", errors="replace") + b"\n")
 
     def handle_close(self):
         self.log("connection closed")
@@ -505,7 +831,19 @@ class MPDConnection(BaseTCPConnection):
         assert isinstance(line, str)
         self.log(u"<- " + repr(line))
 
-        self._buf.extend(line.encode("utf-8", errors="replace") + b"\n")
+        if self._pending:
+            # keep the order with pending output
+            self._pending.append(iter([line]))
+        else:
+            self._buf.extend(line.encode("utf-8", errors="replace") + b"\n")
+
+    def write_lines(self, lines):
+        """Writes all lines of an iterable to the client. The lines get
+        consumed as the client reads them, so the iterable can compute
+        them lazily."""
+
+        self.log(u"<- (%s)" % type(lines).__name__)
+        self._pending.append(iter(lines))
 
     def ok(self):
         self.write_line(u"OK")
@@ -625,19 +963,47 @@ def _parse_bool(arg):
 
 
 def _parse_range(arg):
+    """Parses START, START:END or START: (open end, returned as None)"""
+
+    parts = arg.split(":")
+    if len(parts) == 2 and parts[1] == "":
+        parts = parts[:1]
+        open_end = True
+    else:
+        open_end = False
+
     try:
-        values = [int(v) for v in arg.split(":")]
+        values = [int(v) for v in parts]
     except ValueError:
         raise MPDRequestError("arg in range not a number")
 
     if len(values) == 1:
-        return (values[0], values[0] + 1)
+        return (values[0], None if open_end else values[0] + 1)
     elif len(values) == 2:
         return values
     else:
         raise MPDRequestError("invalid range")
 
 
+def _parse_filter(args):
+    """Parses TAG VALUE pairs, returns a list of (tag, value) pairs and a
+    (start, end) window"""
+
+    if len(args) % 2:
+        raise MPDRequestError("Wrong arg count")
+
+    pairs = []
+    window = (None, None)
+    for tag, value in zip(args[::2], args[1::2]):
+        if tag == "window":
+            window = _parse_range(value)
+        elif tag in ("sort", "group"):
+            continue
+        else:
+            pairs.append((tag, value))
+    return pairs, window
+
+
 @MPDConnection.Command("idle", ack=False)
 def _cmd_idle(conn, service, args):
     service.register_idle(conn, args)
@@ -667,17 +1033,68 @@ def _cmd_close(conn, service, args):
 
 @MPDConnection.Command("play")
 def _cmd_play(conn, service, args):
-    service.play()
+    if args:
+        service.play(_parse_int(args[0]))
+    else:
+        service.play()
 
 
 @MPDConnection.Command("listplaylists")
 def _cmd_listplaylists(conn, service, args):
-    pass
+    conn.write_lines(service.listplaylists())
+
+
+@MPDConnection.Command("listplaylist")
+def _cmd_listplaylist(conn, service, args):
+    _verify_length(args, 1)
+    conn.write_lines(service.listplaylist(args[0]))
+
+
+@MPDConnection.Command("listplaylistinfo")
+def _cmd_listplaylistinfo(conn, service, args):
+    _verify_length(args, 1)
+    conn.write_lines(service.listplaylist(args[0], info=True))
 
 
 @MPDConnection.Command("list")
 def _cmd_list(conn, service, args):
-    pass
+    _verify_length(args, 1)
+    tag = args[0]
+    if len(args) == 2:
+        # old syntax: "list album ARTIST"
+        if tag.lower() != "album":
+            raise MPDRequestError("should be \"Album\" for 3 arguments")
+        pairs = [("artist", args[1])]
+    else:
+        pairs, window = _parse_filter(args[1:])
+    conn.write_lines(service.list(tag, pairs))
+
+
+@MPDConnection.Command("find")
+def _cmd_find(conn, service, args):
+    pairs, (start, end) = _parse_filter(args)
+    _verify_length(pairs, 1)
+    conn.write_lines(service.find(pairs, True, start, end))
+
+
+@MPDConnection.Command("search")
+def _cmd_search(conn, service, args):
+    pairs, (start, end) = _parse_filter(args)
+    _verify_length(pairs, 1)
+    conn.write_lines(service.find(pairs, False, start, end))
+
+
+@MPDConnection.Command("add")
+def _cmd_add(conn, service, args):
+    _verify_length(args, 1)
+    service.add(args[0])
+
+
+@MPDConnection.Command("addid")
+def _cmd_addid(conn, service, args):
+    _verify_length(args, 1)
+    songs = service.add(args[0])
+    conn.write_line(u"Id: %d" % service._get_id(songs[0]))
 
 
 @MPDConnection.Command("playid")
@@ -762,31 +1179,38 @@ def _cmd_currentsong(conn, service, args):
 
 @MPDConnection.Command("count")
 def _cmd_count(conn, service, args):
-    conn.write_line(u"songs: 0")
-    conn.write_line(u"playtime: 0")
+    pairs, window = _parse_filter(args)
+    for k, v in service.count(pairs):
+        conn.write_line(u"%s: %s" % (k, v))
 
 
 @MPDConnection.Command("plchanges")
 def _cmd_plchanges(conn, service, args):
     _verify_length(args, 1)
     version = _parse_int(args[0])
-    changes = service.plchanges(version)
-    if changes is not None:
-        conn.write_line(changes)
+    start = end = None
+    if len(args) > 1:
+        start, end = _parse_range(args[1])
+    conn.write_lines(service.plchanges(version, start, end))
 
 
 @MPDConnection.Command("plchangesposid")
 def _cmd_plchangesposid(conn, service, args):
     _verify_length(args, 1)
     version = _parse_int(args[0])
-    changes = service.plchangesposid(version)
-    if changes is not None:
-        conn.write_line(changes)
+    conn.write_lines(service.plchangesposid(version))
+
+
+@MPDConnection.Command("listall")
+def _cmd_listall(conn, service, args):
+    uri = args[0] if args else u""
+    conn.write_lines(service.listall(uri))
 
 
 @MPDConnection.Command("listallinfo")
-def _cmd_listallinfo(*args):
-    _cmd_currentsong(*args)
+def _cmd_listallinfo(conn, service, args):
+    uri = args[0] if args else u""
+    conn.write_lines(service.listall(uri, info=True))
 
 
 @MPDConnection.Command("seek")
@@ -843,7 +1267,8 @@ def _cmd_tagtypes(conn, service, args):
 
 @MPDConnection.Command("lsinfo")
 def _cmd_lsinfo(conn, service, args):
-    _verify_length(args, 1)
+    uri = args[0] if args else u""
+    conn.write_lines(service.lsinfo(uri))
 
 
 @MPDConnection.Command("playlistinfo")
@@ -854,8 +1279,7 @@ def _cmd_playlistinfo(conn, service, args):
         result = service.playlistinfo(start, end)
     else:
         result = service.playlistinfo()
-    if result is not None:
-        conn.write_line(result)
+    conn.write_lines(result)
 
 
 @MPDConnection.Command("playlistid")
@@ -864,6 +1288,4 @@ def _cmd_playlistid(conn, service, args):
         songid = _parse_int(args[0])
     else:
         songid = None
-    result = service.playlistid(songid)
-    if result is not None:
-        conn.write_line(result)
+    conn.write_lines(service.playlistid(songid))
@@ -197,7 +197,9 @@ class BaseTCPConnection:
                 return False
 
             if flags & GLib.IOCondition.OUT:
-                if self.can_write():
+                # only ask for more once everything is sent, so
+                # implementations can produce big responses in parts
+                if not write_buffer and self.can_write():
                     write_buffer.extend(self.handle_write())
                 if not write_buffer:
                     self._out_id = None
@@ -10,12 +10,15 @@ import tempfile
 
 import dbus
 import dbus.service
+from gi.repository import Gio
 from senf import fsn2uri
 
 from quodlibet import app
 from quodlibet.order.repeat import RepeatListForever, RepeatSongForever
+from quodlibet.util import print_d
 from quodlibet.util.dbusutils import DBusIntrospectable, DBusProperty
 from quodlibet.util.dbusutils import dbus_unicode_validate as unival
+from quodlibet.util.thread import call_async, disk_lane
 
 from .util import MPRISObject
 
@@ -23,6 +26,103 @@ from .util import MPRISObject
 # Date parsing (util?)
 
 
+def get_track_id(song):
+    path = "/net/sacredchao/QuodLibet"
+    if not song:
+        return dbus.ObjectPath(path + "/" + "NoTrack")
+    return dbus.ObjectPath(path + "/" + str(id(song)))
+
+
+def _ignore_overflow(dbus_type, value):
+    try:
+        return dbus_type(value)
+    except OverflowError:
+        return 0
+
+
+def build_metadata(song, art_url=None):
+    """
+    https://www.freedesktop.org/wiki/Specifications/mpris-spec/metadata/
+    """
+
+    metadata = {}
+    metadata["mpris:trackid"] = get_track_id(song)
+
+    if not song:
+        return metadata
+
+    metadata["mpris:length"] = _ignore_overflow(
+        dbus.Int64, song("~#length") * 10 ** 6)
+
+    if art_url:
+        metadata["mpris:artUrl"] = art_url
+
+    # All list values
+    list_val = {"artist": "artist", "albumArtist": "albumartist",
+        "comment": "comment", "composer": "composer", "genre": "genre",
+        "lyricist": "lyricist"}
+    for xesam, tag in list_val.items():
+        vals = song.list(tag)
+        if vals:
+            metadata["xesam:" + xesam] = list(map(unival, vals))
+
+    # All single values
+    sing_val = {"album": "album", "title": "title", "asText": "~lyrics"}
+    for xesam, tag in sing_val.items():
+        vals = song.comma(tag)
+        if vals:
+            metadata["xesam:" + xesam] = unival(vals)
+
+    # URI
+    metadata["xesam:url"] = song("~uri")
+
+    # Integers
+    num_val = {"audioBPM": "bpm", "discNumber": "disc",
+               "trackNumber": "track", "useCount": "playcount"}
+
+    for xesam, tag in num_val.items():
+        val = song("~#" + tag, None)
+        if val is not None:
+            metadata["xesam:" + xesam] = _ignore_overflow(dbus.Int32, val)
+
+    # Rating
+    metadata["xesam:userRating"] = _ignore_overflow(
+        dbus.Double, song("~#rating"))
+
+    # Dates
+    ISO_8601_format = "%Y-%m-%dT%H:%M:%S"
+    tuple_time = time.gmtime(song("~#lastplayed"))
+    iso_time = time.strftime(ISO_8601_format, tuple_time)
+    metadata["xesam:lastUsed"] = iso_time
+
+    year = song("~year")
+    if year:
+        try:
+            tuple_time = time.strptime(year, "%Y")
+            iso_time = time.strftime(ISO_8601_format, tuple_time)
+        except ValueError:
+            pass
+        else:
+            metadata["xesam:contentCreated"] = iso_time
+
+    return metadata
+
+
+def _close_cover(cover):
+    if cover is not None:
+        cover.close()
+
+
+def _lookup_cover(song):
+    """Returns the cover file object or None. Temporary files (extracted
+    embedded images) are kept open, as closing deletes them."""
+
+    cover = app.cover_manager.get_cover(song)
+    if cover and not cover.name.startswith(tempfile.gettempdir()):
+        cover.close()
+    return cover
+
+
 # http://www.mpris.org/2.0/spec/
 class MPRIS2(DBusProperty, DBusIntrospectable, MPRISObject):
 
@@ -105,8 +205,13 @@ value="false"/>
         name = dbus.service.BusName(self.BUS_NAME, bus)
         MPRISObject.__init__(self, bus, self.PATH, name)
 
-        self.__metadata = None
-        self.__cover = None
+        # song -> metadata, for the current and the next song
+        self.__metadata = {}
+        # song -> cover file object
+        self.__covers = {}
+        # property name -> last emitted value
+        self.__emitted = {}
+        self.__cancellable = Gio.Cancellable()
         player_options = app.player_options
         self.__repeat_id = player_options.connect(
             "notify::repeat", self.__repeat_changed)
@@ -131,31 +236,44 @@ value="false"/>
         app.player.disconnect(self.__vsig)
         app.player.disconnect(self.__seek_sig)
 
-        if self.__cover is not None:
-            self.__cover.close()
-            self.__cover = None
-        self.__invalidate_metadata()
+        self.__cancellable.cancel()
+        for song in list(self.__metadata):
+            self.__forget(song)
+
+    def __emit_changed(self, properties):
+        """Emits PropertiesChanged only for the properties whose value
+        differs from the last emitted one"""
+
+        changed = []
+        for prop in properties:
+            value = self.get_property(self.PLAYER_IFACE, prop)
+            if prop not in self.__emitted or self.__emitted[prop] != value:
+                self.__emitted[prop] = value
+                changed.append(prop)
+        if changed:
+            self.emit_properties_changed(self.PLAYER_IFACE, changed)
 
     def __volume_changed(self, *args):
-        self.emit_properties_changed(self.PLAYER_IFACE, ["Volume"])
+        self.__emit_changed(["Volume"])
 
     def __repeat_changed(self, *args):
-        self.emit_properties_changed(self.PLAYER_IFACE, ["LoopStatus"])
+        self.__emit_changed(["LoopStatus"])
 
     def __shuffle_changed(self, *args):
-        self.emit_properties_changed(self.PLAYER_IFACE, ["Shuffle"])
+        self.__emit_changed(["Shuffle"])
 
     def __single_changed(self, *args):
-        self.emit_properties_changed(self.PLAYER_IFACE, ["LoopStatus"])
+        self.__emit_changed(["LoopStatus"])
 
     def __seeked(self, player, song, ms):
         self.Seeked(ms * 1000)
 
     def __library_changed(self, library, songs):
-        self.__invalidate_metadata()
-        if not songs or app.player.info not in songs:
-            return
-        self.emit_properties_changed(self.PLAYER_IFACE, ["Metadata"])
+        cached = [s for s in songs if s in self.__metadata]
+        for song in cached:
+            self.__update(song)
+        if app.player.info in cached:
+            self.__emit_changed(["Metadata"])
 
     @dbus.service.method(ROOT_IFACE)
     def Raise(self):
@@ -210,114 +328,72 @@ value="false"/>
             app.player.seek(position / 1000)
 
     def paused(self):
-        self.emit_properties_changed(self.PLAYER_IFACE, ["PlaybackStatus"])
+        self.__emit_changed(["PlaybackStatus"])
     unpaused = paused
 
     def song_started(self, song):
-        self.__invalidate_metadata()
-
         # so the position in clients gets updated faster
         self.Seeked(0)
 
-        self.emit_properties_changed(self.PLAYER_IFACE,
-                                    ["PlaybackStatus", "Metadata"])
+        next_song = None
+        if song is not None:
+            upcoming = app.window.playlist.get_upcoming(1)
+            next_song = upcoming[0] if upcoming else None
+        self.__prepare(song, next_song)
+        self.__emit_changed(["PlaybackStatus", "Metadata"])
 
     def __get_current_track_id(self):
-        path = "/net/sacredchao/QuodLibet"
-        if not app.player.info:
-            return dbus.ObjectPath(path + "/" + "NoTrack")
-        return dbus.ObjectPath(path + "/" + str(id(app.player.info)))
-
-    def __invalidate_metadata(self):
-        self.__metadata = None
+        return get_track_id(app.player.info)
+
+    def __prepare(self, song, next_song):
+        """Drops the cached metadata of all songs except the current and
+        the next one and starts the cover lookup for new ones"""
+
+        keep = [s for s in (song, next_song) if s is not None]
+        for cached in list(self.__metadata):
+            if cached not in keep:
+                self.__forget(cached)
+        for s in keep:
+            if s not in self.__metadata:
+                self.__update(s)
+                self.__fetch_cover(s)
+
+    def __forget(self, song):
+        del self.__metadata[song]
+        _close_cover(self.__covers.pop(song, None))
+
+    def __update(self, song):
+        cover = self.__covers.get(song)
+        art_url = fsn2uri(cover.name) if cover else None
+        self.__metadata[song] = build_metadata(song, art_url)
+
+    def __fetch_cover(self, song):
+        def done(cover):
+            if song not in self.__metadata:
+                _close_cover(cover)
+                return
+            print_d("Got cover for %r: %r" % (
+                song("~filename"), cover and cover.name))
+            _close_cover(self.__covers.pop(song, None))
+            if cover:
+                self.__covers[song] = cover
+            self.__update(song)
+            if song is app.player.info:
+                self.__emit_changed(["Metadata"])
+
+        call_async(_lookup_cover, self.__cancellable, done, args=(song,),
+                   lane=disk_lane(song("~filename"),
+                                  song.get("~mountpoint")))
 
     def __get_metadata(self):
-        if self.__metadata is None:
-            self.__metadata = self.__get_metadata_real()
-            assert self.__metadata is not None
-        return self.__metadata
-
-    def __get_metadata_real(self):
-        """
-        https://www.freedesktop.org/wiki/Specifications/mpris-spec/metadata/
-        """
-
-        metadata = {}
-        metadata["mpris:trackid"] = self.__get_current_track_id()
-
-        def ignore_overflow(dbus_type, value):
-            try:
-                return dbus_type(value)
-            except OverflowError:
-                return 0
-
         song = app.player.info
         if not song:
-            return metadata
-
-        metadata["mpris:length"] = ignore_overflow(
-            dbus.Int64, song("~#length") * 10 ** 6)
-
-        if self.__cover is not None:
-            self.__cover.close()
-            self.__cover = None
-
-        cover = app.cover_manager.get_cover(song)
-        if cover:
-            is_temp = cover.name.startswith(tempfile.gettempdir())
-            if is_temp:
-                self.__cover = cover
-            metadata["mpris:artUrl"] = fsn2uri(cover.name)
-
-        # All list values
-        list_val = {"artist": "artist", "albumArtist": "albumartist",
-            "comment": "comment", "composer": "composer", "genre": "genre",
-            "lyricist": "lyricist"}
-        for xesam, tag in list_val.items():
-            vals = song.list(tag)
-            if vals:
-                metadata["xesam:" + xesam] = list(map(unival, vals))
-
-        # All single values
-        sing_val = {"album": "album", "title": "title", "asText": "~lyrics"}
-        for xesam, tag in sing_val.items():
-            vals = song.comma(tag)
-            if vals:
-                metadata["xesam:" + xesam] = unival(vals)
-
-        # URI
-        metadata["xesam:url"] = song("~uri")
-
-        # Integers
-        num_val = {"audioBPM": "bpm", "discNumber": "disc",
-                   "trackNumber": "track", "useCount": "playcount"}
-
-        for xesam, tag in num_val.items():
-            val = song("~#" + tag, None)
-            if val is not None:
-                metadata["xesam:" + xesam] = ignore_overflow(dbus.Int32, val)
-
-        # Rating
-        metadata["xesam:userRating"] = ignore_overflow(
-            dbus.Double, song("~#rating"))
-
-        # Dates
-        ISO_8601_format = "%Y-%m-%dT%H:%M:%S"
-        tuple_time = time.gmtime(song("~#lastplayed"))
-        iso_time = time.strftime(ISO_8601_format, tuple_time)
-        metadata["xesam:lastUsed"] = iso_time
-
-        year = song("~year")
-        if year:
-            try:
-                tuple_time = time.strptime(year, "%Y")
-                iso_time = time.strftime(ISO_8601_format, tuple_time)
-            except ValueError:
-                pass
-            else:
-                metadata["xesam:contentCreated"] = iso_time
-
-        return metadata
+            return build_metadata(None)
+        if song not in self.__metadata:
+            # only the current song, this can be a D-Bus property read
+            self.__update(song)
+            self.__fetch_cover(song)
+        return self.__metadata[song]
 
     def set_property(self, interface, name, value):
         player = app.player
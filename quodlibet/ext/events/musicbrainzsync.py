@@ -6,7 +6,8 @@
 # (at your option) any later version.
 from quodlibet import plugins, qltk
 from quodlibet.qltk.entry import UndoEntry
-from quodlibet.util.thread import call_async_background, Cancellable
+from quodlibet.util.thread import call_async_background, Cancellable, \
+    LANE_NETWORK
 
 try:
     import musicbrainzngs
@@ -61,6 +62,7 @@ class MusicBrainzSyncPlugin(EventPlugin):
                 kwargs=dict(
                     recording_ratings=ratings_dict,
                 ),
+                lane=LANE_NETWORK,
             )
 
     def PluginPreferences(self, parent):
@@ -15,7 +15,7 @@
 import os
 import threading
 import time
-from typing import Dict, List
+from typing import Optional
 from hashlib import md5
 from urllib.parse import urlencode
 
@@ -32,7 +32,8 @@ from quodlibet.qltk.entry import ValidatingEntry, UndoEntry
 from quodlibet.qltk.msg import Message
 from quodlibet.qltk import Icons
 from quodlibet.util.dprint import print_d, print_w
-from quodlibet.util.picklehelper import pickle_load, pickle_dump, PickleError
+from quodlibet.util.picklehelper import pickle_load, PickleError
+from quodlibet.util.submitlog import SubmitLog, Backoff
 from quodlibet.util.urllib import urlopen, UrllibError
 from quodlibet.errorreport import errorhook
 
@@ -88,10 +89,15 @@ class QLSubmitQueue:
     CLIENT_VERSION = const.VERSION
     PROTOCOL_VERSION = "1.2"
     SCROBBLER_CACHE_FILE = os.path.join(quodlibet.get_user_dir(), "scrobbler_cache_v2")
+    """Pickled queue of older versions, gets moved to the log"""
+    SCROBBLER_LOG_FILE = os.path.join(quodlibet.get_user_dir(), "scrobbler_log")
+
+    MAX_SUBMISSIONS = 50
+    """Maximum number of songs per submission request (spec limit)"""
 
     # These objects are shared across instances, to allow other plugins to
     # queue scrobbles in future versions of QL
-    queue: List[Dict[str, str]] = []
+    queue: Optional[SubmitLog] = None
     changed_event = threading.Event()
 
     def set_nowplaying(self, song):
@@ -142,6 +148,10 @@ class QLSubmitQueue:
         self.handshake_event = None
         self.handshake_delay = 1.0
         self.failures = 0
+        self.backoff = Backoff(10, 30 * 60)
+        self.retry_time = 0
+        """When to retry the last failed submission"""
+        self.wake_event = threading.Event()
         self.handshake_sent = 0
         self.session_id, self.nowplaying_url, self.submit_url = None, None, None
 
@@ -156,23 +166,29 @@ class QLSubmitQueue:
         self._load_queue()
 
     def _load_queue(self):
+        klass = type(self)
+        if klass.queue is None:
+            klass.queue = SubmitLog(klass.SCROBBLER_LOG_FILE)
+
         try:
             with open(self.SCROBBLER_CACHE_FILE, 'rb') as disk_queue_file:
                 disk_queue = pickle_load(disk_queue_file)
-            os.unlink(self.SCROBBLER_CACHE_FILE)
-            self.queue += disk_queue
         except (EnvironmentError, PickleError):
+            return
+        print_d(f"Moving {len(disk_queue)} scrobble(s) to the log")
+        self.queue.extend(disk_queue)
+        try:
+            os.unlink(self.SCROBBLER_CACHE_FILE)
+        except EnvironmentError:
             pass
 
     @classmethod
     def dump_queue(klass):
-        if klass.queue:
-            print_d(f"Saving scrobble queue to {klass.SCROBBLER_CACHE_FILE}")
-            try:
-                with open(klass.SCROBBLER_CACHE_FILE, 'wb') as disk_queue_file:
-                    pickle_dump(klass.queue, disk_queue_file)
-            except (EnvironmentError, PickleError) as e:
-                print_w(f"Couldn't persist scrobble queue ({e})")
+        """Every submission is written to the log when queued, so this only
+        removes the already submitted ones from it."""
+
+        if klass.queue is not None:
+            klass.queue.compact()
 
     def _check_config(self):
         user = plugin_config.get('username')
@@ -188,6 +204,7 @@ class QLSubmitQueue:
             self.username, self.password, self.base_url = (user, passw, url)
             self.broken = False
             self.handshake_sent = False
+            self.retry_time = 0
         self.offline = plugin_config.getboolean('offline')
         self.titlepat = Pattern(config_get_title_pattern())
         self.artpat = Pattern(config_get_artist_pattern())
@@ -195,6 +212,7 @@ class QLSubmitQueue:
     def changed(self):
         """Signal that settings or queue contents were changed."""
         self._check_config()
+        self.wake_event.set()
         pending = self.queue or (self.nowplaying_song and not self.nowplaying_sent)
         if not self.broken and not self.offline and pending:
             self.changed_event.set()
@@ -227,16 +245,26 @@ class QLSubmitQueue:
                                      self.handshake_event.set)
                     continue
             self.changed_event.wait()
-            if self.queue:
+            now = time.time()
+            if self.queue and now >= self.retry_time:
                 if self.send_submission():
                     self.failures = 0
+                    self.backoff.reset()
                 else:
                     self.failures += 1
                     if self.failures >= 3:
                         self.handshake_sent = False
+                    delay = self.backoff.next_delay()
+                    print_d("Submission failed, retrying in %.1fs" % delay)
+                    self.retry_time = time.time() + delay
             elif self.nowplaying_song and not self.nowplaying_sent:
                 self.send_nowplaying()
                 self.nowplaying_sent = True
+            elif self.queue:
+                # Wait for the retry, but wake up for new songs
+                # or config changes
+                self.wake_event.wait(self.retry_time - now)
+                self.wake_event.clear()
             else:
                 # Nothing left to do; wait until something changes
                 self.changed_event.clear()
@@ -317,7 +345,8 @@ class QLSubmitQueue:
 
     def send_submission(self):
         data = {'s': self.session_id}
-        to_submit = self.queue[:min(len(self.queue), 50)]
+        pending = self.queue.peek(self.MAX_SUBMISSIONS)
+        to_submit = [song for seq, song in pending]
         for idx, song in enumerate(to_submit):
             for key, val in song.items():
                 data['%s[%d]' % (key, idx)] = val.encode('utf-8')
@@ -328,7 +357,7 @@ class QLSubmitQueue:
         print_d(f"Submitting song(s): {song_info}")
 
         if self._check_submit(self.submit_url, data):
-            del self.queue[:len(to_submit)]
+            self.queue.ack([seq for seq, song in pending])
             return True
         else:
             return False
@@ -358,13 +387,9 @@ class QLScrobbler(EventPlugin):
                     "Audioscrobbler services.")
     PLUGIN_ICON = Icons.NETWORK_WORKGROUP
 
-    AUTOSAVE_INTERVAL = 30
-    """How often, in seconds, to save the queue (if any) to disk"""
-
     def __init__(self):
         self.__enabled = False
         self.queue = QLSubmitQueue()
-        self._tid = None
 
         def queue_run():
             try:
@@ -442,18 +467,10 @@ class QLScrobbler(EventPlugin):
     def enabled(self):
         self.__enabled = True
         print_d("Plugin enabled - accepting new songs.")
-        if not self._tid:
-            print_d("Starting scrobble autosaver")
-            self._tid = GLib.timeout_add_seconds(
-                self.AUTOSAVE_INTERVAL, lambda: QLSubmitQueue.dump_queue() or True)
 
     def disabled(self):
         self.__enabled = False
         print_d("Plugin disabled - not accepting any new songs.")
-        if self._tid:
-            print_d("Stopping scrobble autosaver")
-            GLib.source_remove(self._tid)
-            self._tid = None
         QLSubmitQueue.dump_queue()
 
     def PluginPreferences(self, parent):
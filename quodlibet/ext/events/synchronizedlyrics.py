@@ -6,10 +6,6 @@
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
-import functools
-import os
-import re
-from os.path import splitext
 from typing import List, Tuple, Optional
 
 from gi.repository import Gtk, Gdk, GLib
@@ -22,6 +18,9 @@ from quodlibet.plugins import PluginConfigMixin
 from quodlibet.plugins.events import EventPlugin
 from quodlibet.qltk import Icons
 from quodlibet.util.dprint import print_d
+from quodlibet.util.lyricscache import get_cache, parse_lrc, \
+    PREFETCH_COUNT
+from quodlibet.util.thread import Cancellable
 
 
 class SynchronizedLyrics(EventPlugin, PluginConfigMixin):
@@ -41,14 +40,12 @@ class SynchronizedLyrics(EventPlugin, PluginConfigMixin):
     CFG_TXTCOLOR_KEY = "textColor"
     CFG_FONTSIZE_KEY = "fontSize"
 
-    # Note the trimming of whitespace, seems "most correct" behaviour
-    LINE_REGEX = re.compile(r"\s*\[([0-9]+:[0-9.]*)\]\s*(.+)\s*")
-
     def __init__(self) -> None:
         super().__init__()
         self._lines: List[Tuple[int, str]] = []
         self._timers: List[Tuple[int, int]] = []
         self._start_clearing_from = 0
+        self._cancellable = Cancellable()
         self.textview = None
         self.scrolled_window = None
 
@@ -149,10 +146,12 @@ class SynchronizedLyrics(EventPlugin, PluginConfigMixin):
         self.scrolled_window.show()
 
         self._sync_timer = GLib.timeout_add(self.SYNC_PERIOD, self._sync)
-        self._build_data(app.player.song)
+        self._cancellable.reset()
+        self._lines = self._build_data(app.player.song)
         self._timer_control()
 
     def disabled(self):
+        self._cancellable.cancel()
         self._clear_timers()
         GLib.source_remove(self._sync_timer)
         self.textview.destroy()
@@ -177,47 +176,18 @@ class SynchronizedLyrics(EventPlugin, PluginConfigMixin):
     def _cur_position(self):
         return app.player.get_position()
 
-    @functools.lru_cache()
     def _build_data(self, song: Optional[AudioFile]) -> List[Tuple[int, str]]:
         if self.textview:
             self.textview.get_buffer().set_text("")
         if song:
-            # check in same location as track
-            track_name = splitext(song("~basename") or "")[0]
-            dir_ = song("~dirname")
-            print_d(f"Looking for .lrc files in {dir_}")
-            for filename in [f"{s}.lrc"
-                             for s in {
-                                 track_name,
-                                 track_name.lower(),
-                                 track_name.upper(),
-                                 song("~artist~title"),
-                                 song("~artist~tracknumber~title"),
-                                 song("~tracknumber~title")
-                             }
-                             ]:
-                print_d(f"Looking for {filename!r}")
-                try:
-                    with open(os.path.join(dir_, filename), 'r', encoding="utf-8") as f:
-                        print_d(f"Found lyrics file: {filename}")
-                        contents = f.read()
-                except FileNotFoundError:
-                    continue
-                return self._parse_lrc(contents)
-            print_d(f"No lyrics found for {track_name!r}")
+            lines = get_cache().get_lrc(song)
+            if not lines:
+                print_d(f"No lyrics found for {song('~basename')!r}")
+            return lines
         return []
 
     def _parse_lrc(self, contents: str) -> List[Tuple[int, str]]:
-        data = []
-        for line in contents.splitlines():
-            match = self.LINE_REGEX.match(line)
-            if not match:
-                continue
-            timing, text = match.groups()
-            minutes, seconds = (float(p) for p in timing.split(":", 1))
-            timestamp = int(1000 * (minutes * 60 + seconds))
-            data.append((timestamp, text))
-        return sorted(data)
+        return parse_lrc(contents)
 
     def _set_timers(self):
         if not self._timers:
@@ -267,6 +237,8 @@ class SynchronizedLyrics(EventPlugin, PluginConfigMixin):
         self._lines = self._build_data(song)
         # delay so that current position is for current track, not previous one
         GLib.timeout_add(5, self._timer_control)
+        upcoming = app.window.playlist.get_upcoming(PREFETCH_COUNT)
+        get_cache().prefetch(upcoming, self._cancellable)
 
     def plugin_on_song_ended(self, song, stopped):
         self._clear_timers()
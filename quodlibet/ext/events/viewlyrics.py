@@ -15,7 +15,9 @@ from quodlibet.plugins.events import EventPlugin
 from quodlibet.plugins.gui import UserInterfacePlugin
 from quodlibet.qltk import Icons, add_css, Button
 from quodlibet.qltk.information import Information
+from quodlibet.util.lyricscache import get_cache, PREFETCH_COUNT
 from quodlibet.util.songwrapper import SongWrapper
+from quodlibet.util.thread import Cancellable
 
 
 class ViewLyrics(EventPlugin, UserInterfacePlugin):
@@ -54,6 +56,7 @@ class ViewLyrics(EventPlugin, UserInterfacePlugin):
 
         self.scrolled_window.show()
         self._sig = None
+        self._cancellable = Cancellable()
         cur = app.player.info
         if cur is not None:
             cur = SongWrapper(cur)
@@ -66,6 +69,7 @@ class ViewLyrics(EventPlugin, UserInterfacePlugin):
         return vbox
 
     def disabled(self):
+        self._cancellable.cancel()
         self.textview.destroy()
         self.scrolled_window.destroy()
 
@@ -78,7 +82,7 @@ class ViewLyrics(EventPlugin, UserInterfacePlugin):
         lyrics = None
         if song is not None:
             print_d("Looking for lyrics for %s" % song("~filename"))
-            lyrics = song("~lyrics")
+            lyrics = get_cache().get_lyrics(song)
             if lyrics:
                 self.textbuffer.set_text(lyrics)
                 self.adjustment.set_value(0)    # Scroll to the top.
@@ -97,6 +101,8 @@ class ViewLyrics(EventPlugin, UserInterfacePlugin):
             if self._sig:
                 self._edit_button.disconnect(self._sig)
             self._sig = self._edit_button.connect('clicked', edit)
+            upcoming = app.window.playlist.get_upcoming(PREFETCH_COUNT)
+            get_cache().prefetch(upcoming, self._cancellable)
 
     def _set_italicised(self, title):
         self.textbuffer.set_text(title)
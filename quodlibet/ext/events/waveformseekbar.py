@@ -12,12 +12,18 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
+import sys
+from array import array
+from hashlib import sha1
+from itertools import islice
 from math import ceil, floor
-from typing import List
+from typing import List, Optional
 
-from gi.repository import Gtk, Gdk, Gst
+from gi.repository import Gtk, Gdk, Gst, GLib
 import cairo
 
+import quodlibet
 from quodlibet import _, app
 from quodlibet import print_w
 from quodlibet import util
@@ -30,16 +36,354 @@ from quodlibet.qltk.seekbutton import TimeLabel
 from quodlibet.qltk.tracker import TimeTracker
 from quodlibet.qltk import get_fg_highlight_color
 from quodlibet.util import connect_destroy, print_d
-from quodlibet.util.path import uri2gsturi
+from quodlibet.util.path import uri2gsturi, mkdir
+
+
+def _create_level_pipeline(song, points):
+    """Returns a paused GStreamer pipeline posting `level` messages for
+    about `points` intervals of `song`, or None if the song can't be
+    analysed.
+    """
+
+    if not song.is_file:
+        return None
+
+    command_template = """
+    uridecodebin name=uridec
+    ! audioconvert
+    ! level name=audiolevel interval={} post-messages=true
+    ! fakesink sync=false"""
+    interval = int(song("~#length") * 1E9 / points)
+    if not interval:
+        return None
+    print_d("Computing data for each %.3f seconds" % (interval / 1E9))
+
+    command = command_template.format(interval)
+    pipeline = Gst.parse_launch(command)
+    pipeline.get_by_name("uridec").set_property("uri", uri2gsturi(song("~uri")))
+    return pipeline
+
+
+def _get_rms(message):
+    """Returns the normalised RMS value (0..1) of a `level` message,
+    or None if the message doesn't contain one.
+    """
+
+    structure = message.get_structure()
+    if structure.get_name() != "level":
+        return None
+    rms_db = structure.get_value("rms")
+    if not rms_db:
+        return None
+    # Calculate average of all channels (usually 2)
+    rms_db_avg = sum(rms_db) / len(rms_db)
+    # Normalize dB value to value between 0 and 1
+    return pow(10, (rms_db_avg / 20))
+
+
+def _downsample(values, points):
+    """Average `values` down to at most `points` values"""
+
+    count = len(values)
+    if count <= points:
+        return list(values)
+    ratio = count / points
+    result = []
+    for i in range(points):
+        start = int(i * ratio)
+        end = max(int((i + 1) * ratio), start + 1)
+        chunk = values[start:end]
+        result.append(sum(chunk) / len(chunk))
+    return result
+
+
+class WaveformCache:
+    """An on-disk cache of RMS envelopes, keyed by file name and mtime.
+
+    Every envelope is stored as a flat array of unsigned 16 bit values in
+    its own file, one per song and resolution (the number of data points
+    requested). Lookups fall back to downsampling a higher resolution
+    if the requested one isn't available. Once the files take up more
+    than `max_size` bytes, the least recently used ones get removed.
+    """
+
+    _SCALE = 0xFFFF
+
+    def __init__(self, path=None, max_size=16 * 1024 * 1024):
+        if path is None:
+            path = os.path.join(quodlibet.get_cache_dir(), "waveforms")
+        self._path = path
+        self._max_size = max_size
+        self._index = None
+        self._size = None
+
+    def _prefix(self, song):
+        filename = song("~filename")
+        if isinstance(filename, str):
+            filename = filename.encode("utf-8", "surrogateescape")
+        return sha1(filename).hexdigest()
+
+    def _filename(self, song, points):
+        mtime = int(song("~#mtime"))
+        name = "%s-%d-%d.rms" % (self._prefix(song), mtime, points)
+        return os.path.join(self._path, name)
+
+    @staticmethod
+    def _parse_name(name):
+        """Returns (prefix, mtime, points) for a cache file name or None"""
+
+        if not name.endswith(".rms"):
+            return None
+        try:
+            prefix, mtime, points = name[:-4].split("-")
+            return prefix, int(mtime), int(points)
+        except ValueError:
+            return None
+
+    def _get_index(self):
+        """Returns a dict mapping file name prefixes to sets of
+        (mtime, points) of the cached envelopes, read from the cache
+        directory once.
+        """
+
+        if self._index is None:
+            index = {}
+            try:
+                names = os.listdir(self._path)
+            except OSError:
+                names = []
+            for name in names:
+                parsed = self._parse_name(name)
+                if parsed is not None:
+                    prefix, mtime, points = parsed
+                    index.setdefault(prefix, set()).add((mtime, points))
+            self._index = index
+        return self._index
+
+    def resolutions(self, song):
+        """Returns a sorted list of cached resolutions valid for the song"""
+
+        mtime = int(song("~#mtime"))
+        entries = self._get_index().get(self._prefix(song), ())
+        return sorted(p for m, p in entries if m == mtime)
+
+    def has(self, song, points):
+        """Returns if lookup() would find something, without reading it"""
+
+        return song.is_file and \
+            any(p >= points for p in self.resolutions(song))
+
+    def _read(self, filename):
+        values = array("H")
+        try:
+            with open(filename, "rb") as h:
+                values.frombytes(h.read())
+            # the modification time orders entries for pruning
+            os.utime(filename)
+        except (OSError, ValueError) as e:
+            print_d("Couldn't read waveform cache %r: %s" % (filename, e))
+            return None
+        if sys.byteorder != "little":
+            values.byteswap()
+        return [v / self._SCALE for v in values]
+
+    def lookup(self, song, points) -> Optional[List[float]]:
+        """Returns the cached RMS values for the song at the given
+        resolution or None if there is no usable cache entry.
+        """
+
+        if not song.is_file:
+            return None
+
+        available = [p for p in self.resolutions(song) if p >= points]
+        if not available:
+            return None
+        values = self._read(self._filename(song, available[0]))
+        if values is None:
+            entries = self._get_index().get(self._prefix(song), set())
+            entries.discard((int(song("~#mtime")), available[0]))
+            return None
+        return _downsample(values, points)
+
+    def store(self, song, points, rms_vals):
+        """Saves the RMS values computed at the given resolution and
+        removes entries left over from older versions of the file.
+        """
+
+        if not song.is_file or not rms_vals:
+            return
+
+        mtime = int(song("~#mtime"))
+        prefix = self._prefix(song)
+        entries = self._get_index().setdefault(prefix, set())
+        for old_mtime, old_points in list(entries):
+            if old_mtime != mtime:
+                entries.discard((old_mtime, old_points))
+                name = "%s-%d-%d.rms" % (prefix, old_mtime, old_points)
+                old = os.path.join(self._path, name)
+                try:
+                    size = os.path.getsize(old)
+                    os.remove(old)
+                except OSError:
+                    continue
+                if self._size is not None:
+                    self._size -= size
+
+        values = array(
+            "H", (int(min(max(v, 0.0), 1.0) * self._SCALE) for v in rms_vals))
+        if sys.byteorder != "little":
+            values.byteswap()
+
+        filename = self._filename(song, points)
+        temp = filename + ".tmp"
+        data = values.tobytes()
+        try:
+            mkdir(self._path)
+            with open(temp, "wb") as h:
+                h.write(data)
+            os.replace(temp, filename)
+        except OSError as e:
+            print_w("Couldn't write waveform cache %r: %s" % (filename, e))
+        else:
+            entries.add((mtime, points))
+            if self._size is not None:
+                self._size += len(data)
+            self._prune()
+
+    def _entries(self):
+        try:
+            return [e for e in os.scandir(self._path)
+                    if e.is_file() and e.name.endswith(".rms")]
+        except OSError:
+            return []
+
+    def _prune(self):
+        """Removes the least recently used entries until the cache is
+        below its maximum size"""
+
+        if self._size is None:
+            self._size = sum(e.stat().st_size for e in self._entries())
+        if self._size <= self._max_size:
+            return
+
+        index = self._get_index()
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+        for entry in entries:
+            if self._size <= self._max_size * 3 // 4:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+            except OSError:
+                continue
+            self._size -= size
+            prefix, mtime, points = self._parse_name(entry.name)
+            index.get(prefix, set()).discard((mtime, points))
+        print_d("Pruned waveform cache to %d bytes" % self._size)
+
+
+class WaveformPrecomputer:
+    """Computes the RMS envelopes of songs one at a time in the background
+    and puts them into a WaveformCache.
+
+    Each computation is started from an idle callback, so it never delays
+    anything else pending in the main loop.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._pending = []
+        self._idle_id = None
+        self._pipeline = None
+        self._bus_id = None
+
+    @property
+    def busy(self):
+        return self._pipeline is not None
+
+    def queue(self, songs, points):
+        """Replaces the songs waiting to be computed.
+
+        A running computation is not interrupted.
+        """
+
+        self._pending = [(s, points) for s in songs
+                         if s.is_file and not self._cache.has(s, points)]
+        self._schedule()
+
+    def clear(self):
+        """Stops everything, including a running computation"""
+
+        self._pending = []
+        if self._idle_id is not None:
+            GLib.source_remove(self._idle_id)
+            self._idle_id = None
+        self._clean_pipeline()
+
+    def _schedule(self):
+        if self._pending and self._idle_id is None and not self.busy:
+            self._idle_id = GLib.idle_add(
+                self._start_next, priority=GLib.PRIORITY_LOW)
+
+    def _start_next(self):
+        self._idle_id = None
+        while self._pending:
+            song, points = self._pending.pop(0)
+            if self._cache.has(song, points):
+                continue
+            pipeline = _create_level_pipeline(song, points)
+            if pipeline is None:
+                continue
+            print_d("Precomputing waveform for %r" % song("~filename"))
+            bus = pipeline.get_bus()
+            self._bus_id = bus.connect(
+                "message", self._on_bus_message, song, points, [])
+            bus.add_signal_watch()
+            pipeline.set_state(Gst.State.PLAYING)
+            self._pipeline = pipeline
+            break
+        return False
+
+    def _on_bus_message(self, bus, message, song, points, rms_vals):
+        done = False
+        if message.type == Gst.MessageType.ERROR:
+            error, debug = message.parse_error()
+            print_d("Error precomputing waveform: %s" % error)
+            rms_vals.clear()
+            done = True
+        elif message.type == Gst.MessageType.ELEMENT:
+            rms = _get_rms(message)
+            if rms is not None:
+                rms_vals.append(rms)
+                done = len(rms_vals) >= points
+        elif message.type == Gst.MessageType.EOS:
+            done = True
+
+        if done:
+            self._clean_pipeline()
+            self._cache.store(song, points, rms_vals)
+            self._schedule()
+
+    def _clean_pipeline(self):
+        if self._pipeline:
+            self._pipeline.set_state(Gst.State.NULL)
+            bus = self._pipeline.get_bus()
+            bus.remove_signal_watch()
+            bus.disconnect(self._bus_id)
+            self._bus_id = None
+            self._pipeline = None
 
 
 class WaveformSeekBar(Gtk.Box):
     """A widget containing labels and the seekbar."""
 
-    def __init__(self, player, library):
+    def __init__(self, player, library, playlist=None, cache=None):
         super().__init__()
 
         self._player = player
+        self._playlist = playlist
+        self._cache = cache
+        self._precomputer = WaveformPrecomputer(cache) if cache else None
         self._rms_vals = []
         self._hovering = False
 
@@ -90,22 +434,21 @@ class WaveformSeekBar(Gtk.Box):
         # Close any existing pipeline to avoid leaks
         self._clean_pipeline()
 
-        if not song.is_file:
-            return
+        if self._cache is not None:
+            rms_vals = self._cache.lookup(song, points)
+            if rms_vals:
+                print_d("Using cached waveform for %r" % song("~filename"))
+                self._set_rms_vals(rms_vals)
+                self._precompute_upcoming(points)
+                return
 
-        command_template = """
-        uridecodebin name=uridec
-        ! audioconvert
-        ! level name=audiolevel interval={} post-messages=true
-        ! fakesink sync=false"""
-        interval = int(song("~#length") * 1E9 / points)
-        if not interval:
+        pipeline = _create_level_pipeline(song, points)
+        if pipeline is None:
             return
-        print_d("Computing data for each %.3f seconds" % (interval / 1E9))
 
-        command = command_template.format(interval)
-        pipeline = Gst.parse_launch(command)
-        pipeline.get_by_name("uridec").set_property("uri", uri2gsturi(song("~uri")))
+        # Don't compete with the background computation for the disk
+        if self._precomputer is not None:
+            self._precomputer.clear()
 
         bus = pipeline.get_bus()
         self._bus_id = bus.connect("message", self._on_bus_message, points)
@@ -114,6 +457,7 @@ class WaveformSeekBar(Gtk.Box):
         pipeline.set_state(Gst.State.PLAYING)
 
         self._pipeline = pipeline
+        self._pipeline_song = song
         self._new_rms_vals = []
 
     def _on_bus_message(self, bus, message, points):
@@ -124,14 +468,9 @@ class WaveformSeekBar(Gtk.Box):
                 name=message.src.get_name(), error=error))
             print_d("Debugging information: {}".format(debug))
         elif message.type == Gst.MessageType.ELEMENT:
-            structure = message.get_structure()
-            if structure.get_name() == "level":
-                rms_db = structure.get_value("rms")
-                if rms_db:
-                    # Calculate average of all channels (usually 2)
-                    rms_db_avg = sum(rms_db) / len(rms_db)
-                    # Normalize dB value to value between 0 and 1
-                    rms = pow(10, (rms_db_avg / 20))
+            if message.get_structure().get_name() == "level":
+                rms = _get_rms(message)
+                if rms is not None:
                     self._new_rms_vals.append(rms)
                     if len(self._new_rms_vals) >= points:
                         # The audio might be much longer than we anticipated
@@ -143,16 +482,49 @@ class WaveformSeekBar(Gtk.Box):
                         .format(message.type))
 
         if message.type == Gst.MessageType.EOS or force_stop:
+            song = getattr(self, "_pipeline_song", None)
             self._clean_pipeline()
 
+            if self._cache is not None and song is not None:
+                self._cache.store(song, points, self._new_rms_vals)
+
             # Update the waveform with the new data
-            self._rms_vals = self._new_rms_vals
-            self._waveform_scale.reset(self._rms_vals)
-            self._update_redraw_interval()
+            self._set_rms_vals(self._new_rms_vals)
 
             # Clear temporary reference to the waveform data
             del self._new_rms_vals
 
+            self._precompute_upcoming(points)
+
+    def _set_rms_vals(self, rms_vals):
+        self._rms_vals = rms_vals
+        self._waveform_scale.reset(self._rms_vals)
+        self._update_redraw_interval()
+
+    def _get_upcoming_songs(self, count):
+        """Returns up to `count` songs likely to be played next: the queued
+        ones, followed by the ones after the current song in the song list.
+        """
+
+        if self._playlist is None or count <= 0:
+            return []
+
+        songs = list(islice(self._playlist.q.itervalues(), count))
+        pl = self._playlist.pl
+        iter_ = pl.current_iter
+        if iter_ is not None:
+            iter_ = pl.iter_next(iter_)
+        while iter_ is not None and len(songs) < count:
+            songs.append(pl.get_value(iter_, 0))
+            iter_ = pl.iter_next(iter_)
+        return songs
+
+    def _precompute_upcoming(self, points):
+        if self._precomputer is None:
+            return
+        songs = self._get_upcoming_songs(CONFIG.precompute_count)
+        self._precomputer.queue(songs, points)
+
     def _clean_pipeline(self):
         if hasattr(self, "_pipeline") and self._pipeline:
             self._pipeline.set_state(Gst.State.NULL)
@@ -163,6 +535,7 @@ class WaveformSeekBar(Gtk.Box):
                 self._bus_id = None
             if self._pipeline:
                 self._pipeline = None
+        self._pipeline_song = None
 
     def _update_redraw_interval(self, *args):
         if self._player.info and self.is_visible():
@@ -172,6 +545,8 @@ class WaveformSeekBar(Gtk.Box):
 
     def _on_destroy(self, *args):
         self._clean_pipeline()
+        if self._precomputer is not None:
+            self._precomputer.clear()
         self._label_tracker.destroy()
         self._redraw_tracker.destroy()
 
@@ -590,6 +965,8 @@ class Config:
     seek_amount = IntConfProp(_config, "seek_amount", 5000)
     max_data_points = IntConfProp(_config, "max_data_points", 3000)
     show_time_labels = BoolConfProp(_config, "show_time_labels", True)
+    use_cache = BoolConfProp(_config, "use_cache", True)
+    precompute_count = IntConfProp(_config, "precompute_count", 2)
 
 
 CONFIG = Config()
@@ -608,7 +985,9 @@ class WaveformSeekBarPlugin(EventPlugin):
         self._bar = None
 
     def enabled(self):
-        self._bar = WaveformSeekBar(app.player, app.librarian)
+        cache = WaveformCache() if CONFIG.use_cache else None
+        self._bar = WaveformSeekBar(app.player, app.librarian,
+                                    app.window.playlist, cache)
         self._bar.show()
         app.window.set_seekbar_widget(self._bar)
 
@@ -693,6 +1072,17 @@ class WaveformSeekBarPlugin(EventPlugin):
         show_time_labels.connect("toggled", on_show_time_labels_toggled)
         vbox.pack_start(show_time_labels, True, True, 0)
 
+        def on_use_cache_toggled(button, *args):
+            CONFIG.use_cache = button.get_active()
+
+        use_cache = Gtk.CheckButton(
+            label=_("Cache waveforms and precompute them for upcoming songs"))
+        use_cache.set_tooltip_text(
+            _("Takes effect after re-enabling the plugin"))
+        use_cache.set_active(CONFIG.use_cache)
+        use_cache.connect("toggled", on_use_cache_toggled)
+        vbox.pack_start(use_cache, True, True, 0)
+
         hbox = Gtk.HBox(spacing=6)
         hbox.set_border_width(6)
         label = Gtk.Label(label=_("Seek amount when scrolling (milliseconds):"))
@@ -13,12 +13,11 @@
 # (at your option) any later version.
 
 import json
+from collections import OrderedDict
 import os
 import re
 import time
 import threading
-import gzip
-from io import BytesIO
 from urllib.parse import urlencode
 
 from xml.dom import minidom
@@ -41,7 +40,10 @@ from quodlibet.qltk.image import scale, add_border_widget, \
     get_surface_for_pixbuf
 from quodlibet.plugins.songsmenu import SongsMenuPlugin
 from quodlibet.util.path import iscommand
-from quodlibet.util.urllib import urlopen, Request
+from quodlibet.util import http
+from quodlibet.util.thread import call_async_background, Cancellable, \
+    LANE_NETWORK
+from quodlibet.util.urllib import UrllibError
 
 USER_AGENT = "Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.2.13) " \
     "Gecko/20101210 Iceweasel/3.6.13 (like Firefox/3.6.13)"
@@ -55,8 +57,8 @@ SEARCH_PATTERN = Pattern(
 REQUEST_LIMIT_MAX = 15
 
 
-def get_encoding_from_socket(socket):
-    content_type = socket.headers.get("Content-Type", "")
+def get_encoding_from_headers(headers):
+    content_type = headers.get("content-type", "")
     p = [s.lower().strip()
          for s in content_type.split(";")]
     enc = [t.split("=")[-1].strip()
@@ -72,36 +74,17 @@ def get_url(url, post=None, get=None):
 
     # add post, get data and headers
     url = '%s%s' % (url, get_params)
-    if post_params:
-        request = Request(url, post_params)
-    else:
-        request = Request(url)
-
-    # for discogs
-    request.add_header('Accept-Encoding', 'gzip')
-    request.add_header('User-Agent', USER_AGENT)
+    data = post_params.encode("ascii") if post_params else None
+    response = http.fetch(
+        url, method="POST" if data else "GET", data=data,
+        headers={'User-Agent': USER_AGENT})
+    enc = get_encoding_from_headers(response.headers)
 
-    url_sock = urlopen(request)
-    enc = get_encoding_from_socket(url_sock)
-
-    # unzip the response if needed
-    data = url_sock.read()
-    if url_sock.headers.get("content-encoding", "") == "gzip":
-        data = gzip.GzipFile(fileobj=BytesIO(data)).read()
-    url_sock.close()
-    content_type = url_sock.headers.get('Content-Type', '').split(';', 1)[0]
+    content_type = response.headers.get('content-type', '').split(';', 1)[0]
     domain = re.compile(r'\w+://([^/]+)/').search(url).groups(0)[0]
     print_d("Got %s data from %s" % (content_type, domain))
-    return (data if content_type.startswith('image')
-            else data.decode(enc))
-
-
-def get_encoding(url):
-    request = Request(url)
-    request.add_header('Accept-Encoding', 'gzip')
-    request.add_header('User-Agent', USER_AGENT)
-    url_sock = urlopen(request)
-    return get_encoding_from_socket(url_sock)
+    return (response.body if content_type.startswith('image')
+            else response.body.decode(enc))
 
 
 class AmazonParser:
@@ -182,9 +165,6 @@ class AmazonParser:
             url_tag = large[0].getElementsByTagName('URL')[0]
             cover['cover'] = url_tag.firstChild.data
 
-            #Since we don't know the size, use the one from the HTML header.
-            cover['size'] = get_size_of_url(cover['cover'])
-
             h_tag = large[0].getElementsByTagName('Height')[0]
             height = h_tag.firstChild.data
 
@@ -192,6 +172,7 @@ class AmazonParser:
             width = w_tag.firstChild.data
 
             cover['resolution'] = '%s x %s px' % (width, height)
+            cover['width'], cover['height'] = int(width), int(height)
 
             cover['source'] = 'https://www.amazon.com'
 
@@ -279,12 +260,12 @@ class DiscogsParser:
             cover = {'source': 'https://www.discogs.com',
                      'name': item.get('title', ''),
                      'thumbnail': image.get('uri150', thumbnail),
-                     'cover': uri,
-                     'size': get_size_of_url(uri)}
+                     'cover': uri}
 
             width = image.get('width', 0)
             height = image.get('height', 0)
             cover['resolution'] = '%s x %s px' % (width, height)
+            cover['width'], cover['height'] = width, height
 
             self.covers.append(cover)
             if len(self.covers) >= self.limit:
@@ -559,26 +540,21 @@ class CoverArea(Gtk.VBox, PluginConfigMixin):
         if not raw_data:
             pbloader.connect('area-updated', self.__update)
 
-            data_store = BytesIO()
-
+            # feed it in chunks while downloading, so it shows up
+            # progressively and switching covers stops the download
+            chunks = []
             try:
-                request = Request(url)
-                request.add_header('User-Agent', USER_AGENT)
-                url_sock = urlopen(request)
-            except EnvironmentError:
+                for chunk in http.fetch_stream(
+                        url, headers={'User-Agent': USER_AGENT}):
+                    if self.stop_loading:
+                        break
+                    pbloader.write(chunk)
+                    chunks.append(chunk)
+            except UrllibError:
                 print_w(_("[albumart] HTTP Error: %s") % url)
             else:
-                while not self.stop_loading:
-                    tmp = url_sock.read(1024 * 10)
-                    if not tmp:
-                        break
-                    pbloader.write(tmp)
-                    data_store.write(tmp)
-
-                url_sock.close()
-
                 if not self.stop_loading:
-                    raw_data = data_store.getvalue()
+                    raw_data = b"".join(chunks)
 
                     self.data_cache.insert(0, (url, raw_data))
 
@@ -589,8 +565,6 @@ class CoverArea(Gtk.VBox, PluginConfigMixin):
                             del self.data_cache[-1]
                         else:
                             break
-
-            data_store.close()
         else:
             # Sleep for fast switching of cached images
             time.sleep(0.05)
@@ -861,7 +835,7 @@ class AlbumArtWindow(qltk.Window, PluginConfigMixin):
     def __add_cover_to_list(self, cover):
         try:
             pbloader = GdkPixbuf.PixbufLoader()
-            pbloader.write(get_url(cover['thumbnail']))
+            pbloader.write(cover['thumbnail_data'])
             pbloader.close()
 
             scale_factor = self.get_scale_factor()
@@ -872,12 +846,17 @@ class AlbumArtWindow(qltk.Window, PluginConfigMixin):
             if not pixbuf:
                 return
             surface = get_surface_for_pixbuf(self, pixbuf)
-        except (GLib.GError, IOError):
-            pass
+        except GLib.GError:
+            return
+
+        # keep the list ranked while results come in
+        key = rank_key(cover)
+        for row in self.liststore:
+            if rank_key(row[1]) < key:
+                self.liststore.insert_before(row.iter, [surface, cover])
+                break
         else:
-            def append(data):
-                self.liststore.append(data)
-            GLib.idle_add(append, [surface, cover])
+            self.liststore.append([surface, cover])
 
     def __search_callback(self, covers, progress):
         for cover in covers:
@@ -893,19 +872,75 @@ class AlbumArtWindow(qltk.Window, PluginConfigMixin):
             self.search_lock = False
 
 
+def _run_engine(engine, query, limit):
+    print_d("[AlbumArt] running search %r on engine %s" %
+            (query, engine.__name__))
+    try:
+        return engine().start(query, limit)
+    except Exception as e:
+        print_w(f"[AlbumArt] {engine.__name__}: {query!r} ({e})")
+        print_exc()
+        return []
+
+
+def _probe_cover(cover):
+    """Gets the thumbnail, dimensions and file size of a search result.
+
+    Returns a new cover dict or None if there is no usable thumbnail.
+    """
+
+    try:
+        thumbnail = get_url(cover['thumbnail'])
+    except UrllibError as e:
+        print_d(f"[AlbumArt] no thumbnail for {cover['name']!r} ({e})")
+        return None
+    if not isinstance(thumbnail, bytes):
+        return None
+
+    cover = dict(cover, thumbnail_data=thumbnail)
+    try:
+        dimensions, size = probe_image(cover['cover'])
+    except UrllibError as e:
+        print_d(f"[AlbumArt] couldn't probe {cover['cover']!r} ({e})")
+        return cover
+    if dimensions is not None:
+        cover['width'], cover['height'] = dimensions
+        cover['resolution'] = '%d x %d px' % dimensions
+    if size is not None:
+        cover['bytes'] = size
+        cover['size'] = format_size(size)
+    return cover
+
+
+def rank_key(cover):
+    """Sort key for search results, larger is better"""
+
+    return (cover.get('width', 0) * cover.get('height', 0),
+            cover.get('bytes', 0))
+
+
 class CoverSearch:
-    """Class for glueing the search engines together. No UI stuff."""
+    """Class for glueing the search engines together. No UI stuff.
 
-    def __init__(self, callback):
-        self.engine_list = []
-        self._stop = False
+    All engines get queried at the same time and each result gets probed
+    for its thumbnail and size as soon as its engine is done. Results are
+    kept for a while, so searching for the same album again doesn't need
+    the network.
+    """
 
-        def wrap(*args, **kwargs):
-            if not self._stop:
-                return callback(*args, **kwargs)
+    CACHE_SIZE = 20
+    CACHE_TTL = 30 * 60
 
-        self.callback = wrap
-        self.finished = 0
+    _cache: OrderedDict = OrderedDict()
+
+    def __init__(self, callback):
+        self.engine_list = []
+        self.callback = callback
+        self._cancellable = Cancellable()
+        self._key = None
+        self._done = 0
+        self._total = 0
+        self._results = []
 
     def add_engine(self, engine, query_replace):
         """Adds a new search engine, query_replace is the string with which
@@ -916,41 +951,63 @@ class CoverSearch:
     def stop(self):
         """After stop the progress callback will no longer be called"""
 
-        self._stop = True
+        self._cancellable.cancel()
 
-    def start(self, query, raw, limit):
-        """Start search. The callback function will be called after each of
-        the search engines has finished."""
+    def __emit(self, covers, progress):
+        if not self._cancellable.is_cancelled():
+            self.callback(covers, progress)
 
-        for engine, replace in self.engine_list:
-            thr = threading.Thread(target=self.__search_thread,
-                                   args=(engine, query, replace, raw, limit))
-            thr.setDaemon(True)
-            thr.start()
+    def start(self, query, raw, limit):
+        """Start search. The callback function gets called in the main loop
+        with a list of new covers and the progress (0..1) until the progress
+        reaches 1."""
+
+        engines = tuple(sorted(e.__name__ for e, r in self.engine_list))
+        self._key = key = (engines, query, raw, limit)
+        cached = self._cache.get(key)
+        if cached is not None and time.time() - cached[0] < self.CACHE_TTL:
+            print_d("[AlbumArt] using cached results for %r" % query)
+            GLib.idle_add(self.__emit, list(cached[1]), 1)
+            return
 
         #tell the other side that we are finished if there is nothing to do.
-        if not len(self.engine_list):
-            GLib.idle_add(self.callback, [], 1)
-
-    def __search_thread(self, engine, query, replace, raw, limit):
-        """Creates searching threads which call the callback function after
-        they are finished"""
+        if not self.engine_list:
+            GLib.idle_add(self.__emit, [], 1)
+            return
 
-        search = query if raw else cleanup_query(query, replace)
+        self._total = len(self.engine_list)
+        for engine, replace in self.engine_list:
+            search = query if raw else cleanup_query(query, replace)
+            call_async_background(_run_engine, self._cancellable,
+                                  self.__engine_done,
+                                  args=(engine, search, limit),
+                                  lane=LANE_NETWORK)
+
+    def __engine_done(self, covers):
+        self._total += len(covers)
+        for cover in covers:
+            call_async_background(_probe_cover, self._cancellable,
+                                  self.__probe_done, args=(cover,),
+                                  lane=LANE_NETWORK)
+        self.__task_done(None)
 
-        print_d("[AlbumArt] running search %r on engine %s" %
-                (search, engine.__name__))
-        result = []
-        try:
-            result = engine().start(search, limit)
-        except Exception as e:
-            print_w(f"[AlbumArt] {engine.__name__}: {query!r} ({e})")
-            print_exc()
+    def __probe_done(self, cover):
+        self.__task_done(cover)
 
-        self.finished += 1
+    def __task_done(self, cover):
+        self._done += 1
         #progress is between 0..1
-        progress = float(self.finished) / len(self.engine_list)
-        GLib.idle_add(self.callback, result, progress)
+        progress = float(self._done) / self._total
+        covers = [] if cover is None else [cover]
+        self._results.extend(covers)
+        if progress >= 1:
+            self._results.sort(key=rank_key, reverse=True)
+            cache = self._cache
+            cache[self._key] = (time.time(), self._results)
+            cache.move_to_end(self._key)
+            while len(cache) > self.CACHE_SIZE:
+                cache.popitem(last=False)
+        self.__emit(covers, progress)
 
 
 def cleanup_query(query, replace):
@@ -979,14 +1036,50 @@ def cleanup_query(query, replace):
     return new_query.rstrip()
 
 
-def get_size_of_url(url):
-    request = Request(url)
-    request.add_header('Accept-Encoding', 'gzip')
-    request.add_header('User-Agent', USER_AGENT)
-    url_sock = urlopen(request)
-    size = url_sock.headers.get('content-length')
-    url_sock.close()
-    return format_size(int(size)) if size else ''
+PROBE_SIZE = 64 * 1024
+"""Bytes downloaded for finding the dimensions of an image"""
+
+
+def get_image_size(data):
+    """Returns (width, height) of a (possibly truncated) image or None"""
+
+    loader = GdkPixbuf.PixbufLoader()
+    size = []
+
+    def size_prepared(loader, width, height):
+        size[:] = [width, height]
+
+    loader.connect("size-prepared", size_prepared)
+    try:
+        loader.write(data)
+    except GLib.GError:
+        pass
+    try:
+        loader.close()
+    except GLib.GError:
+        pass
+    return tuple(size) or None
+
+
+def probe_image(url):
+    """Finds the dimensions and file size of an image by only downloading
+    its beginning, if the server supports range requests.
+
+    Returns:
+        Tuple[Optional[Tuple[int, int]], Optional[int]]
+    Raises:
+        UrllibError
+    """
+
+    response = http.fetch(url, headers={
+        'User-Agent': USER_AGENT,
+        'Range': 'bytes=0-%d' % (PROBE_SIZE - 1)})
+    if response.status == 206:
+        total = response.headers.get('content-range', '').rpartition('/')[2]
+        size = int(total) if total.isdigit() else None
+    else:
+        size = len(response.body)
+    return get_image_size(response.body), size
 
 
 ENGINES = [
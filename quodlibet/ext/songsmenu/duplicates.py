@@ -12,7 +12,7 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-from gi.repository import Gtk, Pango
+from gi.repository import Gtk, Pango, GObject
 
 from quodlibet import app
 from quodlibet import print_d, util, qltk, _
@@ -25,11 +25,164 @@ from quodlibet.qltk.entry import UndoEntry
 from quodlibet.qltk.songsmenu import SongsMenu
 from quodlibet.qltk.views import RCMHintedTreeView
 from quodlibet.qltk import Icons, Button
-from quodlibet.util import connect_obj, connect_destroy
+from quodlibet.util import connect_obj, connect_destroy, copool
 from quodlibet.util.i18n import numeric_phrase
 from quodlibet.util.string.filter import remove_diacritics, remove_punctuation
 
 
+class DuplicateKeyIndex(GObject.Object):
+    """Maps duplicate keys to songs of a library and back.
+
+    The index is built in the background and kept up to date from the
+    library signals. If the key expression or any of the matching options
+    change, it gets rebuilt the next time it's used.
+
+    Emits `changed` with a list of (song, old_key, new_key) for every song
+    added, removed or changed after the index was built, where a missing
+    key is None.
+    """
+
+    __gsignals__ = {
+        'changed': (GObject.SignalFlags.RUN_LAST, None, (object,)),
+    }
+
+    def __init__(self, library, get_config, get_key_func):
+        super().__init__()
+        self._library = library
+        self._get_config = get_config
+        self._get_key_func = get_key_func
+        self._config = None
+        self._key_func = None
+        self._keys = {}
+        self._groups = {}
+        self._built = False
+        self._sigs = [
+            library.connect('added', self.__added),
+            library.connect('changed', self.__changed),
+            library.connect('removed', self.__removed),
+        ]
+
+    def destroy(self):
+        self._stop_build()
+        for sig in self._sigs:
+            self._library.disconnect(sig)
+        self._sigs = []
+        self._keys.clear()
+        self._groups.clear()
+
+    @property
+    def is_built(self):
+        return self._built and self._config == self._get_config()
+
+    def _reset(self):
+        self._stop_build()
+        self._config = self._get_config()
+        self._key_func = self._get_key_func()
+        self._keys = {}
+        self._groups = {}
+        self._built = False
+
+    def _stop_build(self):
+        try:
+            copool.remove(self)
+        except ValueError:
+            pass
+
+    def _index(self, song):
+        """Updates the song's entry, returning (old_key, new_key)"""
+
+        old_key = self._keys.get(song)
+        new_key = self._key_func(song) or None
+        if old_key == new_key:
+            return old_key, new_key
+        if old_key is not None:
+            group = self._groups[old_key]
+            group.discard(song)
+            if not group:
+                del self._groups[old_key]
+        if new_key is None:
+            self._keys.pop(song, None)
+        else:
+            self._keys[song] = new_key
+            self._groups.setdefault(new_key, set()).add(song)
+        return old_key, new_key
+
+    def _unindex(self, song):
+        old_key = self._keys.pop(song, None)
+        if old_key is not None:
+            group = self._groups[old_key]
+            group.discard(song)
+            if not group:
+                del self._groups[old_key]
+        return old_key
+
+    def _build_iter(self, songs):
+        for i, song in enumerate(songs):
+            if song not in self._keys and song in self._library:
+                self._index(song)
+            if not i % 500:
+                yield True
+        self._built = True
+        print_d("Indexed %d duplicate key(s) for %d song(s)"
+                % (len(self._groups), len(self._keys)))
+
+    def start_build(self):
+        """Builds the index in the background if needed"""
+
+        if self.is_built:
+            return
+        self._reset()
+        copool.add(self._build_iter, list(self._library.values()),
+                   funcid=self)
+
+    def ensure_built(self):
+        """Makes sure the index is complete and valid"""
+
+        if self.is_built:
+            return
+        if self._config != self._get_config():
+            self._reset()
+        self._stop_build()
+        for x in self._build_iter(list(self._library.values())):
+            pass
+
+    def get_key(self, song):
+        """The duplicate key of the song (None if it hasn't got one)"""
+
+        self.ensure_built()
+        return self._keys.get(song)
+
+    def get_group(self, key):
+        """A set of all library songs with the given key"""
+
+        self.ensure_built()
+        return set(self._groups.get(key, ()))
+
+    def __update(self, songs, remove=False):
+        if self._key_func is None or self._config != self._get_config():
+            # Nothing built yet, or built for other settings
+            return
+        deltas = []
+        for song in songs:
+            if remove:
+                old_key, new_key = self._unindex(song), None
+            else:
+                old_key, new_key = self._index(song)
+            if old_key is not None or new_key is not None:
+                deltas.append((song, old_key, new_key))
+        if deltas and self._built:
+            self.emit('changed', deltas)
+
+    def __added(self, library, songs):
+        self.__update(songs)
+
+    def __changed(self, library, songs):
+        self.__update(songs)
+
+    def __removed(self, library, songs):
+        self.__update(songs, remove=True)
+
+
 class DuplicateSongsView(RCMHintedTreeView):
     """Allows full tree-like functionality on top of underlying features"""
 
@@ -88,22 +241,22 @@ class DuplicateSongsView(RCMHintedTreeView):
             else:
                 pass
 
-    def _added(self, library, songs):
+    def _added(self, library, songs, keys=None):
         model = self.get_model()
         if not model:
             return
         for song in songs:
-            key = Duplicates.get_key(song)
+            key = keys[song] if keys else Duplicates.get_key(song)
             model.add_to_existing_group(key, song)
             # TODO: handle creation of new groups based on songs that were
             #       in original list but not as a duplicate
 
-    def _changed(self, library, songs):
+    def _changed(self, library, songs, keys=None):
         model = self.get_model()
         if not model:  # Keeps happening on next song - bug / race condition?
             return
         for song in songs:
-            key = Duplicates.get_key(song)
+            key = keys[song] if keys else Duplicates.get_key(song)
             row = model.find_row(song)
             if row:
                 print_d("Changed duplicated file \"%s\" (Row=%s)" %
@@ -114,7 +267,7 @@ class DuplicateSongsView(RCMHintedTreeView):
                     print_d("Key changed from \"%s\" -> \"%s\"" %
                             (old_key, key))
                     self._removed(library, [song])
-                    self._added(library, [song])
+                    self._added(library, [song], keys)
                 else:
                     # Still might be a displayable change
                     print_d("Calling model.row_changed(%s, %s)..." %
@@ -123,13 +276,26 @@ class DuplicateSongsView(RCMHintedTreeView):
             else:
                 model.add_to_existing_group(key, song)
 
-    def __init__(self, model):
+    def _index_changed(self, index, deltas):
+        removed = [s for s, old, new in deltas if new is None]
+        if removed:
+            self._removed(app.library, removed)
+        changed = {s: new for s, old, new in deltas if new is not None}
+        if changed:
+            self._changed(app.library, list(changed), changed)
+
+    def __init__(self, model, index=None):
         super().__init__(model)
         connect_obj(self, 'row-activated',
                             self.__select_song, app.player)
         # Selecting multiple is a nice feature it turns out.
         self.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
 
+        if index is not None:
+            # The index already did the work of keying the changed songs
+            connect_destroy(index, 'changed', self._index_changed)
+            return
+
         # Handle signals propagated from the underlying library
         self.connected_library_sigs = []
         SIGNAL_MAP = {
@@ -281,7 +447,7 @@ class DuplicateDialog(Gtk.Window):
         if menu is not None:
             return songlist.popup_menu(menu, 0, Gtk.get_current_event_time())
 
-    def __init__(self, model):
+    def __init__(self, model, index=None):
         songs_text = numeric_phrase("%d duplicate group",
                                     "%d duplicate groups",
                                     len(model))
@@ -296,7 +462,7 @@ class DuplicateDialog(Gtk.Window):
         swin.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
         swin.set_shadow_type(Gtk.ShadowType.IN)
         # Set up the browser view
-        view = DuplicateSongsView(model)
+        view = DuplicateSongsView(model, index)
 
         def cell_text(column, cell, model, iter_, index):
             text = model[iter_][index]
@@ -372,6 +538,7 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
 
     # Cached values
     key_expression = None
+    _index = None
 
     @classmethod
     def get_key_expression(cls):
@@ -422,38 +589,83 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
         vb.show_all()
         return vb
 
+    @classmethod
+    def get_key_config(cls):
+        """Everything the duplicate keys depend on"""
+
+        return (cls.get_key_expression(),) + tuple(
+            cls.config_get_bool(option) for option in [
+                cls._CFG_REMOVE_DIACRITICS, cls._CFG_CASE_INSENSITIVE,
+                cls._CFG_REMOVE_PUNCTUATION, cls._CFG_REMOVE_WHITESPACE])
+
+    @classmethod
+    def get_key_func(cls):
+        """Returns a function computing the key of a song for the current
+        settings, avoiding config lookups per song.
+        """
+
+        expression, diacritics, case, punctuation, whitespace = \
+            cls.get_key_config()
+
+        def get_key(song):
+            key = song(expression)
+            if diacritics:
+                key = remove_diacritics(key)
+            if case:
+                key = key.lower()
+            if punctuation:
+                key = remove_punctuation(key)
+            if whitespace:
+                key = "_".join(key.split())
+            return key
+
+        return get_key
+
     @classmethod
     def get_key(cls, song):
-        key = song(cls.get_key_expression())
-        if cls.config_get_bool(cls._CFG_REMOVE_DIACRITICS):
-            key = remove_diacritics(key)
-        if cls.config_get_bool(cls._CFG_CASE_INSENSITIVE):
-            key = key.lower()
-        if cls.config_get_bool(cls._CFG_REMOVE_PUNCTUATION):
-            key = remove_punctuation(key)
-        if cls.config_get_bool(cls._CFG_REMOVE_WHITESPACE):
-            key = "_".join(key.split())
-        return key
+        return cls.get_key_func()(song)
+
+    @classmethod
+    def get_index(cls, library):
+        """The shared DuplicateKeyIndex for the library"""
+
+        index = cls._index
+        if index is None or index._library is not library:
+            if index is not None:
+                index.destroy()
+            index = DuplicateKeyIndex(
+                library, cls.get_key_config, cls.get_key_func)
+            cls._index = index
+        return index
+
+    @classmethod
+    def plugin_disabled(cls):
+        if cls._index is not None:
+            cls._index.destroy()
+            cls._index = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if app.library is not None:
+            # Get a head start while the user is still in the menu
+            self.get_index(app.library).start_build()
 
     def plugin_songs(self, songs):
         model = DuplicatesTreeModel()
+        index = self.get_index(app.library)
 
-        # Index all songs by our custom key
-        # TODO: make this cache-friendly
+        # Group all library songs sharing a key with a selected one
         print_d("Calculating duplicates for %d song(s)..." % len(songs))
         groups = {}
         for song in songs:
-            key = self.get_key(song)
-            if key and key in groups:
-                print_d("Found duplicate based on '%s'" % key)
-                groups[key].add(song._song)
-            elif key:
-                groups[key] = {song._song}
-
-        for song in app.library:
-            key = self.get_key(song)
-            if key in groups:
-                groups[key].add(song)
+            song = song._song
+            key = index.get_key(song)
+            if key is None and song not in app.library:
+                key = self.get_key(song) or None
+            if key is None or key in groups:
+                continue
+            groups[key] = index.get_group(key)
+            groups[key].add(song)
 
         # Now display the grouped duplicates
         for (key, children) in groups.items():
@@ -462,7 +674,7 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
             # The parent (group) label
             model.add_group(key, children)
 
-        dialog = DuplicateDialog(model)
+        dialog = DuplicateDialog(model, index)
         dialog.show()
         # Mainly for testing...
         return dialog
@@ -46,6 +46,23 @@ class AcoustidSearch(SongsMenuPlugin):
         self.plugin_finish()
 
 
+class AcoustidDuplicates(SongsMenuPlugin):
+    PLUGIN_ID = "AcoustidDuplicates"
+    PLUGIN_NAME = _("Find Acoustic Duplicates")
+    PLUGIN_DESC = _("Finds songs which sound the same, like re-encodes or "
+                    "copies with different tags, by comparing acoustic "
+                    "fingerprints. Fingerprints are stored, so only new or "
+                    "changed songs have to be analyzed again.")
+    PLUGIN_ICON = Icons.EDIT_FIND
+
+    plugin_handles = each_song(is_finite)
+
+    def plugin_songs(self, songs):
+        from .duplicates import DuplicatesWindow
+
+        DuplicatesWindow(songs).show()
+
+
 class AcoustidSubmit(SongsMenuPlugin):
     PLUGIN_ID = "AcoustidSubmit"
     PLUGIN_NAME = _("Submit Acoustic Fingerprints")
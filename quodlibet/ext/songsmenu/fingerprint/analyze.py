@@ -5,11 +5,17 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import collections
+import functools
 import multiprocessing
 
-from gi.repository import Gst, GObject
+from gi.repository import Gst, GObject, GLib
 
 from quodlibet.util import connect_obj
+from quodlibet.util.thread import call_async, call_async_background, \
+    Cancellable
+
+from .store import get_store
 
 
 class FingerPrintResult:
@@ -145,6 +151,13 @@ class FingerPrintPipeline:
 
 
 class FingerPrintPool(GObject.GObject):
+    """Fingerprints songs using multiple pipelines.
+
+    Fingerprints found in the store are emitted without decoding the song
+    again, new ones get added to it. Store lookups and writes happen in
+    threads, batched. In background mode fewer pipelines are used and
+    songs only get started when the main loop is idle.
+    """
 
     __gsignals__ = {
         # FingerPrintResult
@@ -158,16 +171,36 @@ class FingerPrintPool(GObject.GObject):
             GObject.SignalFlags.RUN_LAST, None, (object, object)),
         }
 
-    def __init__(self, max_workers=None):
+    CACHED_BATCH_SIZE = 50
+    """Stored fingerprints emitted per main loop iteration"""
+
+    LOOKUP_BATCH_SIZE = 500
+    """Songs looked up in the store per thread task"""
+
+    FLUSH_DELAY = 2000
+    """Milliseconds new fingerprints are collected before writing them"""
+
+    def __init__(self, max_workers=None, store=None, background=False):
         super().__init__()
 
         if max_workers is None:
-            max_workers = int(multiprocessing.cpu_count() * 1.5)
+            if background:
+                max_workers = max(1, multiprocessing.cpu_count() // 2)
+            else:
+                max_workers = int(multiprocessing.cpu_count() * 1.5)
         self._max_workers = max_workers
+        self._store = get_store() if store is None else store
+        self._background = background
 
         self._idle = set()
         self._workers = set()
         self._queue = []
+        self._cached = collections.deque()
+        self._cached_id = None
+        self._start_id = None
+        self._flush_id = None
+        self._lookups = 0
+        self._cancellable = Cancellable()
 
     def _get_worker(self):
         """An idle FingerPrintPipeline or None"""
@@ -192,9 +225,66 @@ class FingerPrintPool(GObject.GObject):
         worker.start(song, self._callback)
         self.emit("fingerprint-started", song)
 
+    def _start_queued(self):
+        self._start_id = None
+        while self._queue:
+            worker = self._get_worker()
+            if not worker:
+                break
+            self._start_song(worker, self._queue.pop(0))
+        return False
+
+    def _schedule_start(self):
+        if self._start_id is None:
+            self._start_id = GLib.idle_add(
+                self._start_queued, priority=GLib.PRIORITY_LOW)
+
+    def _emit_cached(self):
+        for i in range(self.CACHED_BATCH_SIZE):
+            if not self._cached:
+                break
+            result = self._cached.popleft()
+            self.emit("fingerprint-started", result.song)
+            self.emit("fingerprint-done", result)
+        if self._cached:
+            return True
+        self._cached_id = None
+        return False
+
     def push(self, song):
         """Add a new song to the queue"""
 
+        self.push_many([song])
+
+    def push_many(self, songs):
+        """Add new songs to the queue, after looking them up in the store"""
+
+        songs = list(songs)
+        for i in range(0, len(songs), self.LOOKUP_BATCH_SIZE):
+            batch = songs[i:i + self.LOOKUP_BATCH_SIZE]
+            self._lookups += 1
+            call_async(self._store.get_many, self._cancellable,
+                       functools.partial(self._looked_up, batch),
+                       args=([s("~filename") for s in batch],))
+
+    def _looked_up(self, songs, found):
+        self._lookups -= 1
+        for song in songs:
+            stored = found.get(song("~filename"))
+            if stored is None:
+                self._push_uncached(song)
+                continue
+            length, chromaprint = stored
+            self._cached.append(FingerPrintResult(song, chromaprint, length))
+        if self._cached and self._cached_id is None:
+            self._cached_id = GLib.idle_add(self._emit_cached)
+
+    def _push_uncached(self, song):
+        if self._background:
+            self._queue.append(song)
+            self._schedule_start()
+            return
+
         worker = self._get_worker()
         if worker:
             self._start_song(worker, song)
@@ -208,23 +298,53 @@ class FingerPrintPool(GObject.GObject):
         Can be called multiple times.
         """
 
+        self._cancellable.cancel()
+        self._cancellable = Cancellable()
+        self._lookups = 0
+        for id_ in (self._cached_id, self._start_id):
+            if id_ is not None:
+                GLib.source_remove(id_)
+        self._cached_id = self._start_id = None
+        self._cached.clear()
+        self._queue = []
+        if self._flush_id is not None:
+            GLib.source_remove(self._flush_id)
+            self._flush()
+
+        self._stop_workers()
+
+    def _stop_workers(self):
         for worker in self._workers:
             worker.stop()
         self._workers.clear()
         self._idle.clear()
 
+    def _flush(self):
+        self._flush_id = None
+        call_async_background(self._store.flush, Cancellable(),
+                              lambda result: None)
+        return False
+
     def _callback(self, worker, song, result, error):
         self._idle.add(worker)
         if result:
+            self._store.put_later(song("~filename"), result.length,
+                                  result.chromaprint)
+            if self._flush_id is None:
+                self._flush_id = GLib.timeout_add(
+                    self.FLUSH_DELAY, self._flush)
             self.emit("fingerprint-done", result)
         else:
             self.emit("fingerprint-error", song, error)
 
         if self._queue:
+            if self._background:
+                self._schedule_start()
+                return
             song = self._queue.pop(0)
             worker = self._get_worker()
             assert worker
             self._start_song(worker, song)
-        elif len(self._idle) == len(self._workers):
+        elif len(self._idle) == len(self._workers) and not self._lookups:
             # all done, all idle, kill em
-            self.stop()
+            self._stop_workers()
@@ -0,0 +1,151 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+from gi.repository import Gtk, Pango, GLib
+
+from quodlibet import _
+from quodlibet.qltk import Button, Window
+from quodlibet.qltk.views import AllTreeView
+from quodlibet.util import print_d, print_w
+from quodlibet.util.i18n import numeric_phrase
+from quodlibet.util.thread import call_async, Cancellable
+
+from .analyze import FingerPrintPool
+from .matching import find_duplicates
+from .store import get_store
+
+
+def _find(store, filenames, progress):
+    sketches = {}
+    for filename in filenames:
+        sketch = store.get_sketch(filename)
+        if sketch is not None:
+            sketches[filename] = sketch
+    print_d("Comparing %d fingerprints" % len(sketches))
+    return find_duplicates(sketches, store.get_values, progress=progress)
+
+
+class DuplicatesWindow(Window):
+    """Fingerprints the songs in the background, if not already stored,
+    and shows groups of songs which sound the same"""
+
+    COLUMNS = [
+        ("title", _("Title")),
+        ("artist", _("Artist")),
+        ("album", _("Album")),
+        ("~length", _("Length")),
+        ("~#bitrate", _("Bitrate")),
+        ("~filename", _("Path")),
+    ]
+
+    def __init__(self, songs):
+        super().__init__(default_width=800, default_height=400,
+                         border_width=12)
+        self.set_title(_("Acoustic Duplicates"))
+
+        self._songs = {song("~filename"): song for song in songs}
+        self._done = 0
+        self._cancellable = Cancellable()
+
+        self._bar = bar = Gtk.ProgressBar()
+        bar.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+        bar.set_show_text(True)
+
+        self._model = Gtk.TreeStore(object, str)
+        view = AllTreeView(model=self._model)
+        view.set_rules_hint(True)
+        for tag, title in self.COLUMNS:
+            render = Gtk.CellRendererText()
+            render.set_property("ellipsize", Pango.EllipsizeMode.END)
+            column = Gtk.TreeViewColumn(title, render)
+            column.set_resizable(True)
+            column.set_expand(tag in ("title", "~filename"))
+            column.set_cell_data_func(render, self.__cell_data, tag)
+            view.append_column(column)
+
+        sw = Gtk.ScrolledWindow()
+        sw.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        sw.set_shadow_type(Gtk.ShadowType.IN)
+        sw.add(view)
+
+        close = Button(_("_Close"))
+        close.connect("clicked", lambda *x: self.destroy())
+        bbox = Gtk.HButtonBox()
+        bbox.set_layout(Gtk.ButtonBoxStyle.END)
+        bbox.pack_start(close, True, True, 0)
+
+        box = Gtk.VBox(spacing=12)
+        box.pack_start(bar, False, True, 0)
+        box.pack_start(sw, True, True, 0)
+        box.pack_start(bbox, False, True, 0)
+        self.add(box)
+        box.show_all()
+
+        self._pool = pool = FingerPrintPool(background=True)
+        pool.connect("fingerprint-done", self.__fp_done)
+        pool.connect("fingerprint-error", self.__fp_error)
+        pool.connect("fingerprint-started", self.__fp_started)
+        pool.push_many(self._songs.values())
+        if not self._songs:
+            self.__compare()
+
+        self.connect("destroy", self.__destroy)
+
+    def __cell_data(self, column, cell, model, iter_, tag):
+        song, header = model[iter_]
+        if song is None:
+            text = header if tag == "title" else ""
+        else:
+            text = song.comma(tag)
+        cell.set_property("text", str(text))
+
+    def __destroy(self, *args):
+        self._cancellable.cancel()
+        self._pool.stop()
+        self._pool = None
+
+    def __fp_started(self, pool, song):
+        self._bar.set_text(song("~filename"))
+
+    def __fp_done(self, pool, result):
+        self.__inc_done()
+
+    def __fp_error(self, pool, song, error):
+        print_w("[fingerprint] %s" % error)
+        self.__inc_done()
+
+    def __inc_done(self):
+        self._done += 1
+        self._bar.set_fraction(self._done / float(len(self._songs)))
+        if self._done == len(self._songs):
+            self.__compare()
+
+    def __compare(self):
+        self._bar.set_fraction(0)
+        self._bar.set_text(_("Comparing fingerprints…"))
+
+        def progress(fraction):
+            def idle():
+                if not self._cancellable.is_cancelled():
+                    self._bar.set_fraction(fraction)
+            GLib.idle_add(idle)
+
+        call_async(_find, self._cancellable, self.__compared,
+                   args=(get_store(), list(self._songs), progress))
+
+    def __compared(self, groups):
+        self._bar.set_fraction(1)
+        self._bar.set_text(numeric_phrase(
+            "%d duplicate group", "%d duplicate groups", len(groups)))
+
+        for group in groups:
+            songs = sorted(self._songs[f] for f in group)
+            header = numeric_phrase("%d song", "%d songs", len(songs))
+            header = "%s — %s" % (songs[0].comma("title") or
+                                  songs[0]("~basename"), header)
+            parent = self._model.append(None, row=[None, header])
+            for song in songs:
+                self._model.append(parent, row=[song, ""])
+        print_d("Found %d acoustic duplicate groups" % len(groups))
@@ -0,0 +1,251 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Offline comparison of chromaprint fingerprints.
+
+A fingerprint is a list of 32 bit sub-fingerprints, about eight per second
+of audio. Re-encodes of the same recording share many of them exactly, so
+each fingerprint gets reduced to a small sketch (the sub-fingerprints with
+the smallest hashes) which is used in an inverted index to find candidate
+pairs. Only those get decoded and compared bit by bit.
+"""
+
+import base64
+import heapq
+from collections import Counter
+
+SHIFT = 4
+"""Lower bits of a sub-fingerprint ignored for indexing"""
+
+SKETCH_SIZE = 24
+"""Number of sub-fingerprint hashes kept per song"""
+
+MIN_SHARED = 2
+"""Sketch hashes two songs need to share to get compared"""
+
+MAX_POSTINGS = 64
+"""Hashes found in more songs than this (silence etc.) are ignored"""
+
+MAX_OFFSET = 80
+"""Maximum alignment difference in sub-fingerprints (~10 seconds)"""
+
+MIN_OVERLAP = 40
+"""Minimum number of aligned sub-fingerprints for a comparison"""
+
+MAX_LENGTH_DIFF = 15
+"""Songs with a larger difference in seconds are never duplicates"""
+
+THRESHOLD = 0.8
+"""Minimum similarity, unrelated songs are around 0.5"""
+
+
+def _read_bits(data, bit_pos, count):
+    byte = bit_pos >> 3
+    value = int.from_bytes(data[byte:byte + 2], "little")
+    return (value >> (bit_pos & 7)) & ((1 << count) - 1)
+
+
+def decode_fingerprint(encoded):
+    """Decodes a compressed, base64 encoded chromaprint as returned by
+    the GStreamer chromaprint element.
+
+    Returns:
+        Tuple[int, List[int]]: the algorithm and the sub-fingerprints
+    Raises:
+        ValueError
+    """
+
+    try:
+        data = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    except (TypeError, ValueError) as e:
+        raise ValueError(e)
+    if len(data) < 4:
+        raise ValueError("fingerprint too short")
+
+    algorithm = data[0]
+    count = int.from_bytes(data[1:4], "big")
+    data = data[4:]
+    total_bits = len(data) * 8
+
+    # the set bits of each sub-fingerprint XORed with the previous one,
+    # as 3 bit position deltas terminated by 0. Deltas >= 7 get the rest
+    # stored separately as 5 bit values.
+    deltas = []
+    pos = 0
+    found = 0
+    while found < count:
+        if pos + 3 > total_bits:
+            raise ValueError("fingerprint truncated")
+        delta = _read_bits(data, pos, 3)
+        pos += 3
+        deltas.append(delta)
+        if not delta:
+            found += 1
+
+    pos = (pos + 7) // 8 * 8
+    for i, delta in enumerate(deltas):
+        if delta == 7:
+            if pos + 5 > total_bits:
+                raise ValueError("fingerprint truncated")
+            deltas[i] += _read_bits(data, pos, 5)
+            pos += 5
+
+    values = []
+    value = last_bit = previous = 0
+    for delta in deltas:
+        if delta:
+            last_bit += delta
+            value |= 1 << (last_bit - 1)
+        else:
+            previous ^= value
+            values.append(previous)
+            value = last_bit = 0
+    return algorithm, values
+
+
+def encode_fingerprint(values, algorithm=1):
+    """The inverse of decode_fingerprint()"""
+
+    deltas = []
+    previous = 0
+    for value in values:
+        diff = value ^ previous
+        previous = value
+        last_bit = 0
+        bit = 1
+        while diff:
+            if diff & 1:
+                deltas.append(bit - last_bit)
+                last_bit = bit
+            diff >>= 1
+            bit += 1
+        deltas.append(0)
+
+    def pack(items, size):
+        bits = 0
+        for i, item in enumerate(items):
+            bits |= item << (i * size)
+        return bits.to_bytes((len(items) * size + 7) // 8, "little")
+
+    normal = [min(d, 7) for d in deltas]
+    exceptions = [d - 7 for d in deltas if d >= 7]
+    data = bytes([algorithm]) + len(values).to_bytes(3, "big")
+    data += pack(normal, 3) + pack(exceptions, 5)
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _hash(key):
+    return (key * 2654435761) & 0xffffffff
+
+
+def get_sketch(values, size=SKETCH_SIZE):
+    """Returns the hashes of up to `size` sub-fingerprints, chosen the
+    same way for every song, so that similar songs share many of them.
+
+    Returns:
+        List[int]
+    """
+
+    return sorted(heapq.nsmallest(size, {_hash(v >> SHIFT) for v in values}))
+
+
+def get_similarity(a, b, max_offset=MAX_OFFSET):
+    """Compares two lists of sub-fingerprints at their best alignment.
+
+    Returns:
+        float: the share of equal bits, between 0 and 1
+    """
+
+    positions = {}
+    for i, value in enumerate(a):
+        positions.setdefault(value >> SHIFT, []).append(i)
+
+    votes = Counter()
+    for j, value in enumerate(b):
+        for i in positions.get(value >> SHIFT, ())[:4]:
+            if abs(i - j) <= max_offset:
+                votes[i - j] += 1
+    offset = votes.most_common(1)[0][0] if votes else 0
+
+    pairs = list(zip(a[max(offset, 0):], b[max(-offset, 0):]))
+    if len(pairs) < MIN_OVERLAP:
+        return 0.0
+    errors = sum(bin(x ^ y).count("1") for x, y in pairs)
+    return 1.0 - errors / (32.0 * len(pairs))
+
+
+def get_candidates(sketches):
+    """Returns pairs of keys sharing enough sketch hashes.
+
+    Args:
+        sketches (Dict[Hashable, Tuple[float, List[int]]]): the length
+            and sketch for each key
+    Returns:
+        List[Tuple[Hashable, Hashable]]
+    """
+
+    postings = {}
+    for key, (length, sketch) in sketches.items():
+        for h in sketch:
+            postings.setdefault(h, []).append(key)
+
+    shared = Counter()
+    for keys in postings.values():
+        if len(keys) < 2 or len(keys) > MAX_POSTINGS:
+            continue
+        for i, first in enumerate(keys):
+            for second in keys[i + 1:]:
+                shared[(first, second)] += 1
+
+    return [pair for pair, count in shared.items()
+            if count >= MIN_SHARED and
+            abs(sketches[pair[0]][0] - sketches[pair[1]][0]) <=
+            MAX_LENGTH_DIFF]
+
+
+def find_duplicates(sketches, load, threshold=THRESHOLD, progress=None):
+    """Groups acoustically similar songs.
+
+    Args:
+        sketches (Dict[Hashable, Tuple[float, List[int]]]): see
+            get_candidates()
+        load (Callable[[Hashable], Optional[List[int]]]): returns the
+            sub-fingerprints for a key
+        threshold (float): minimum similarity
+        progress (Callable[[float], None])
+    Returns:
+        List[List[Hashable]]: groups of two or more keys
+    """
+
+    candidates = get_candidates(sketches)
+    decoded = {}
+
+    def get(key):
+        if key not in decoded:
+            decoded[key] = load(key)
+        return decoded[key]
+
+    parents = {}
+
+    def find(key):
+        while parents.get(key, key) != key:
+            key = parents[key]
+        return key
+
+    for i, (first, second) in enumerate(candidates):
+        if progress is not None and not i % 100:
+            progress(i / len(candidates))
+        if find(first) == find(second):
+            continue
+        a, b = get(first), get(second)
+        if a and b and get_similarity(a, b) >= threshold:
+            parents[find(second)] = find(first)
+
+    groups = {}
+    for key in parents:
+        groups.setdefault(find(key), set()).add(key)
+    for root, members in groups.items():
+        members.add(root)
+    return [list(members) for members in groups.values()]
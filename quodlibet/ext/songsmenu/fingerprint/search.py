@@ -267,8 +267,7 @@ class SearchWindow(Window):
         pool.connect('fingerprint-done', self.__fp_done_cb)
         pool.connect('fingerprint-error', self.__fp_error_cb)
         pool.connect('fingerprint-started', self.__fp_started_cb)
-        for song in songs:
-            pool.push(song)
+        pool.push_many(songs)
 
         outer_box = Gtk.VBox(spacing=12)
 
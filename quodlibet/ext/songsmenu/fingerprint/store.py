@@ -0,0 +1,188 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import sqlite3
+import threading
+
+import quodlibet
+from quodlibet.util.dprint import print_d, print_w
+
+from .matching import decode_fingerprint, get_sketch
+
+
+class FingerprintStore:
+    """A thread safe on-disk cache of chromaprints.
+
+    Entries are keyed by filename and only returned as long as the file
+    modification time and size haven't changed since. Entries added with
+    put_later() are written in one transaction on the next flush() or
+    read.
+    """
+
+    LOOKUP_CHUNK_SIZE = 500
+    """Filenames per SELECT in get_many(), below SQLite's variable limit"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "filename BLOB PRIMARY KEY, mtime REAL, size INTEGER, "
+                "length REAL, chromaprint TEXT, sketch TEXT)")
+
+    def close(self):
+        with self._lock:
+            self._write_pending()
+            self._db.close()
+
+    @staticmethod
+    def _identity(filename):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def _fetch(self, filename, columns):
+        identity = self._identity(filename)
+        if identity is None:
+            return None
+        with self._lock:
+            self._write_pending()
+            row = self._db.execute(
+                "SELECT mtime, size, %s FROM fingerprints WHERE filename = ?"
+                % columns, (os.fsencode(filename),)).fetchone()
+        if row is None or tuple(row[:2]) != identity:
+            return None
+        return row[2:]
+
+    def get(self, filename):
+        """Returns (length, chromaprint) or None"""
+
+        return self._fetch(filename, "length, chromaprint")
+
+    def get_many(self, filenames):
+        """Returns a dict mapping the filenames with a valid entry to
+        (length, chromaprint)"""
+
+        identities = {}
+        for filename in filenames:
+            identity = self._identity(filename)
+            if identity is not None:
+                identities[os.fsencode(filename)] = (filename, identity)
+
+        keys = list(identities)
+        found = {}
+        for i in range(0, len(keys), self.LOOKUP_CHUNK_SIZE):
+            chunk = keys[i:i + self.LOOKUP_CHUNK_SIZE]
+            with self._lock:
+                self._write_pending()
+                rows = self._db.execute(
+                    "SELECT filename, mtime, size, length, chromaprint "
+                    "FROM fingerprints WHERE filename IN (%s)"
+                    % ", ".join("?" * len(chunk)), chunk).fetchall()
+            for key, mtime, size, length, chromaprint in rows:
+                filename, identity = identities[bytes(key)]
+                if (mtime, size) == identity:
+                    found[filename] = (length, chromaprint)
+        return found
+
+    def get_sketch(self, filename):
+        """Returns (length, List[int]) or None, see matching.get_sketch()"""
+
+        row = self._fetch(filename, "length, sketch")
+        if row is None:
+            return None
+        length, sketch = row
+        return length, [int(h) for h in sketch.split()]
+
+    def get_values(self, filename):
+        """Returns the decoded sub-fingerprints or None"""
+
+        row = self.get(filename)
+        if row is None:
+            return None
+        try:
+            return decode_fingerprint(row[1])[1]
+        except ValueError:
+            return None
+
+    def put(self, filename, length, chromaprint):
+        self.put_later(filename, length, chromaprint)
+        self.flush()
+
+    def put_later(self, filename, length, chromaprint):
+        """Like put(), but only queues the entry until the next flush()"""
+
+        with self._lock:
+            self._pending.append((filename, length, chromaprint))
+
+    def flush(self):
+        """Writes all queued entries"""
+
+        with self._lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+
+        rows = []
+        for filename, length, chromaprint in pending:
+            identity = self._identity(filename)
+            if identity is None:
+                continue
+            try:
+                values = decode_fingerprint(chromaprint)[1]
+            except ValueError as e:
+                print_w("Not storing invalid fingerprint for %r (%s)"
+                        % (filename, e))
+                continue
+            sketch = " ".join(map(str, get_sketch(values)))
+            rows.append((os.fsencode(filename),) + identity +
+                        (length, chromaprint, sketch))
+
+        try:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO fingerprints "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            print_w("Couldn't store fingerprints (%s)" % e)
+
+    def remove(self, filename):
+        with self._lock, self._db:
+            self._write_pending()
+            self._db.execute("DELETE FROM fingerprints WHERE filename = ?",
+                             (os.fsencode(filename),))
+
+    def __len__(self):
+        with self._lock:
+            self._write_pending()
+            return self._db.execute(
+                "SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+
+_store = None
+
+
+def get_store():
+    """The FingerprintStore shared by everything in this plugin"""
+
+    global _store
+
+    if _store is None:
+        path = os.path.join(quodlibet.get_cache_dir(), "fingerprints.sqlite")
+        try:
+            _store = FingerprintStore(path)
+        except sqlite3.Error as e:
+            print_w("Couldn't open fingerprint store, using memory (%s)" % e)
+            _store = FingerprintStore(":memory:")
+        print_d("Opened fingerprint store at %r" % path)
+    return _store
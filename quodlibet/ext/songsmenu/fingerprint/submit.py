@@ -99,8 +99,7 @@ class FingerprintDialog(Window):
         pool.connect('fingerprint-error', self.__fp_error_cb)
         pool.connect('fingerprint-started', self.__fp_started_cb)
 
-        for song in songs:
-            pool.push(song)
+        pool.push_many(songs)
 
         connect_obj(self, 'delete-event', self.__cancel_cb, pool)
 
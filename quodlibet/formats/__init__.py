@@ -7,7 +7,7 @@
 # (at your option) any later version.
 
 from ._audio import PEOPLE, AudioFile, DUMMY_SONG, decode_value, \
-    FILESYSTEM_TAGS, TIME_TAGS
+    FILESYSTEM_TAGS, TIME_TAGS, current_generation
 from ._image import EmbeddedImage, APICType
 from ._misc import AudioFileError, init, MusicFile, types, loaders, filter, \
     mimes
@@ -15,4 +15,5 @@ from ._serialize import load_audio_files, dump_audio_files, SerializationError
 
 AudioFile, AudioFileError, EmbeddedImage, DUMMY_SONG, PEOPLE, decode_value,
 APICType, FILESYSTEM_TAGS, TIME_TAGS, init, MusicFile, types, loaders, filter,
-mimes, load_audio_files, dump_audio_files, SerializationError
+mimes, load_audio_files, dump_audio_files, SerializationError,
+current_generation
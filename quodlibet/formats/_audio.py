@@ -14,6 +14,7 @@
 import os
 import re
 import shutil
+import threading
 import time
 from typing import Any, List, Tuple, Generic, TypeVar, Optional
 from collections import OrderedDict
@@ -96,6 +97,20 @@ def decode_value(tag, value):
     return str(value)
 
 
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def current_generation():
+    """A counter which gets increased on every tag change of any song.
+
+    Compare with `AudioFile._generation` to find out if a song changed
+    since then, without having to copy or wrap it.
+    """
+
+    return _generation
+
+
 K = TypeVar("K")
 
 
@@ -148,6 +163,12 @@ class AudioFile(dict, ImageContainer, HasKey):
     mimes: List[str] = []
     """MIME types this class can represent"""
 
+    _generation = 0
+    """The value of current_generation() after the last tag change"""
+
+    _write_generation = 0
+    """Same as _generation, but only for tags stored in the file"""
+
     def __init__(self, default=tuple(), **kwargs):
         for key, value in dict(default).items():
             self[key] = value
@@ -213,17 +234,29 @@ class AudioFile(dict, ImageContainer, HasKey):
             value = str(value)
 
         dict.__setitem__(self, key, value)
-
-        pop = self.__dict__.pop
-        pop("album_key", None)
-        pop("sort_key", None)
+        self._mark_changed(key)
 
     def __delitem__(self, key):
         dict.__delitem__(self, key)
+        self._mark_changed(key)
+
+    def _mark_changed(self, key):
+        """Resets caches and bumps the generation after a change of `key`.
+        Pass an empty key if it's not known which tags changed.
+        """
 
-        pop = self.__dict__.pop
-        pop("album_key", None)
-        pop("sort_key", None)
+        global _generation
+
+        # songs also get changed from threads, e.g. when reloading them
+        with _generation_lock:
+            _generation += 1
+            generation = _generation
+        state = self.__dict__
+        state["_generation"] = generation
+        if not key.startswith("~"):
+            state["_write_generation"] = generation
+        state.pop("album_key", None)
+        state.pop("sort_key", None)
 
     @property
     def key(self) -> K:  # type: ignore
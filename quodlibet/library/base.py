@@ -24,6 +24,7 @@ from quodlibet.util.atomic import atomic_save
 from quodlibet.util.collections import DictMixin
 from quodlibet.util.dprint import print_d, print_w
 from quodlibet.util.path import (mkdir, is_hidden)
+from quodlibet.util import perf
 from senf import fsnative, path2fsn
 
 K = TypeVar("K", covariant=True)
@@ -249,11 +250,12 @@ class PicklingMixin:
         self.filename = filename
         print_d("Loading contents of %r." % filename, self)
 
-        items = _load_items(filename)
+        with perf.span("library.load", library=self._name):
+            items = _load_items(filename)
 
-        # this loads all items without checking their validity, but makes
-        # sure that non-mounted items are masked
-        self._load_init(items)
+            # this loads all items without checking their validity, but makes
+            # sure that non-mounted items are masked
+            self._load_init(items)
 
         print_d(f"Done loading contents of {filename!r}", self._name)
 
@@ -268,7 +270,8 @@ class PicklingMixin:
         try:
             dirname = os.path.dirname(filename)
             mkdir(dirname)
-            with atomic_save(filename, "wb") as fileobj:
+            with perf.span("library.save", library=self._name), \
+                    atomic_save(filename, "wb") as fileobj:
                 fileobj.write(dump_audio_files(self.get_content()))
         except SerializationError:
             # Can happen when we try to pickle while the library is being
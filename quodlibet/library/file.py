@@ -6,7 +6,8 @@
 import os
 import time
 from pathlib import Path
-from typing import Generator, Set, Iterable, Optional, Dict, Tuple, Union
+from typing import (Generator, Set, Iterable, Optional, Dict, Tuple, Union,
+                    List)
 
 from gi.repository import Gio, GLib, GObject
 
@@ -14,9 +15,11 @@ from quodlibet import print_d, print_w, _, formats
 from quodlibet.formats import AudioFileError, AudioFile
 from quodlibet.library.base import iter_paths, Library, PicklingMixin
 from quodlibet.qltk.notif import Task
-from quodlibet.util import copool, print_exc
+from quodlibet.util import copool, print_exc, perf
 from quodlibet.util.library import get_exclude_dirs
-from quodlibet.util.path import ismount, unexpand, normalize_path
+from quodlibet.util.mounts import MountProber
+from quodlibet.util.path import unexpand, normalize_path
+from quodlibet.util.thread import Cancellable, call_async, disk_lane
 from senf import fsn2text, fsnative
 
 
@@ -25,11 +28,64 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
 
     These must support the valid, exists, mounted, and reload methods,
     and have a mountpoint attribute.
+
+    Mount points which don't respond in time are treated as not mounted
+    and checked again every `RETRY_INTERVAL` seconds in the background,
+    until their items can be unmasked.
     """
 
+    RETRY_INTERVAL = 30
+
     def __init__(self, name=None):
         super().__init__(name)
         self._masked = {}
+        self._prober = MountProber()
+        self._retries = {}
+
+    def destroy(self):
+        for source_id in self._retries.values():
+            GLib.source_remove(source_id)
+        self._retries.clear()
+        super().destroy()
+
+    def _get_exists(self, point):
+        """A function checking the existence of an item on `point`,
+        used for triggering autofs"""
+
+        items = self._masked.get(point)
+        if items:
+            return next(iter(items.values())).exists
+        return None
+
+    def _retry_mount(self, point):
+        """Checks an unresponsive mount point again later"""
+
+        if point in self._retries:
+            return
+        print_w(f"{point!r} isn't responding, masking its items for now",
+                self._name)
+
+        def probed(is_mounted):
+            if is_mounted and point in self._masked:
+                print_d(f"{point!r} is responding again", self._name)
+                self.unmask(point)
+            if is_mounted is not None:
+                self._stop_retry(point)
+
+        def retry():
+            if point not in self._masked:
+                self._stop_retry(point)
+                return False
+            self._prober.start(point, self._get_exists(point), probed)
+            return True
+
+        self._retries[point] = GLib.timeout_add_seconds(
+            self.RETRY_INTERVAL, retry, priority=GLib.PRIORITY_LOW)
+
+    def _stop_retry(self, point):
+        source_id = self._retries.pop(point, None)
+        if source_id is not None:
+            GLib.source_remove(source_id)
 
     def _load_init(self, items):
         """Add many items to the library, check if the
@@ -38,32 +94,24 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
         Does not check if items are valid.
         """
 
-        mounts = {}
+        items = list(items)
         contents = self._contents
         masked = self._masked
 
+        exists = {}
         for item in items:
-            mountpoint = item.mountpoint
-
-            if mountpoint not in mounts:
-                is_mounted = ismount(mountpoint)
-
-                # In case mountpoint is mounted through autofs we need to
-                # access a sub path for it to mount
-                # https://github.com/quodlibet/quodlibet/issues/2146
-                if not is_mounted:
-                    item.exists()
-                    is_mounted = ismount(mountpoint)
-
-                mounts[mountpoint] = is_mounted
-                # at least one not mounted, make sure masked has an entry
-                if not is_mounted:
-                    masked.setdefault(mountpoint, {})
+            exists.setdefault(item.mountpoint, item.exists)
+        mounts = self._prober.probe_many(exists)
 
-            if mounts[mountpoint]:
+        for item in items:
+            if mounts[item.mountpoint]:
                 contents[item.key] = item
             else:
-                masked[mountpoint][item.key] = item
+                masked.setdefault(item.mountpoint, {})[item.key] = item
+
+        for mountpoint, is_mounted in mounts.items():
+            if is_mounted is None:
+                self._retry_mount(mountpoint)
 
     def _load_item(self, item, force=False):
         """Add an item, or refresh it if it's already in the library.
@@ -156,10 +204,19 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
         task = Task(_("Library"), _("Checking mount points"))
         if cofuncid:
             task.copool(cofuncid)
-        for i, (point, items) in task.list(enumerate(self._masked.items())):
-            if ismount(point):
+        # check all of them in parallel, without blocking the main loop
+        self._prober.forget()
+        probes = {point: self._prober.start(point, self._get_exists(point))
+                  for point in self._masked}
+        deadline = time.monotonic() + self._prober.timeout
+        for i, (point, probe) in task.list(enumerate(list(probes.items()))):
+            while not probe.wait(0.01) and time.monotonic() < deadline:
+                yield True
+            if not probe.done():
+                self._retry_mount(point)
+            elif probe.result and point in self._masked:
+                items = self._masked.pop(point)
                 self._contents.update(items)
-                del self._masked[point]
                 self.emit('added', list(items.values()))
                 yield True
 
@@ -223,6 +280,8 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
                 return True
             return False
 
+        start = time.perf_counter()
+
         # first scan each path for new files
         paths_to_load = []
         for scan_path in paths:
@@ -244,6 +303,7 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
                         continue
                     paths_to_load.append(real_path)
 
+        perf.count("library.scan.new-files", len(paths_to_load))
         yield
 
         # then (try to) load all new files
@@ -267,6 +327,8 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
                 added = []
                 yield True
 
+        perf.record("library.scan", time.perf_counter() - start)
+
     def get_content(self):
         """Return visible and masked items"""
 
@@ -432,11 +494,28 @@ Event = Gio.FileMonitorEvent
 
 class WatchedFileLibraryMixin(FileLibrary):
     """A File Library that sets up monitors on directories at refresh
-    and handles changes sensibly"""
+    and handles changes sensibly.
+
+    Events on files aren't handled right away, but once nothing happened
+    to a path for `MONITOR_DELAY` seconds, so a sequence of events (e.g.
+    created, changed several times, deleted) is handled once using the
+    state of the file at that point. New files get parsed and known ones
+    checked in a thread, and the results get applied in batches.
+    """
+
+    MONITOR_DELAY = 0.3
+    """Seconds without events on a path before it gets handled"""
 
     def __init__(self, name=None):
         super().__init__(name)
         self._monitors: Dict[Path, Tuple[GObject.GObject, int]] = {}
+        self._pending: Dict[str, float] = {}
+        self._pending_dirs: Dict[Path, float] = {}
+        self._pending_id: Optional[int] = None
+        self._handling = False
+        self._monitor_cancellable = Cancellable()
+        self._dir_index: Optional[Dict[str, Set[str]]] = None
+        self.connect("added", self.__index_added)
         print_d(f"Initialised {self!r}")
 
     def monitor_dir(self, path: Path) -> None:
@@ -476,15 +555,16 @@ class WatchedFileLibraryMixin(FileLibrary):
                           if other_file else None)
             if event in (Event.CREATED, Event.MOVED_IN):
                 if file_path.is_dir():
+                    self._pending_dirs.pop(file_path, None)
                     self.monitor_dir(file_path)
                     copool.add(self.scan, [str(file_path)])
-                elif not song:
-                    print_d(f"Auto-adding created file: {file_path}", self._name)
-                    self.add_filename(str(file_path))
+                else:
+                    self._queue_path(file_path)
             elif event == Event.RENAMED:
                 if not other_path:
                     print_w(f"No destination found for rename of {file_path}",
                             self._name)
+                self._pending.pop(str(file_path), None)
                 if song:
                     print_d(f"Moving {file_path} to {other_path}...", self._name)
                     if self.move_song(song, str(other_path)):  # type:ignore
@@ -500,43 +580,22 @@ class WatchedFileLibraryMixin(FileLibrary):
                     self.unmonitor_dir(file_path)
                     if other_path:
                         self.monitor_dir(other_path)
-                else:
-                    if other_path:
-                        print_w(f"Seems {file_path} is not a track (deleted?)",
-                                self._name)
-                        # On some (Windows?) systems CHANGED is called which can remove
-                        # before we get here, so let's try adding the new path back
-                        self.add_filename(other_path)
-
+                elif other_path:
+                    # Probably a temporary file replacing (or becoming) a track,
+                    # or on some (Windows?) systems CHANGED removed it already
+                    self._queue_path(other_path)
             elif event == Event.CHANGED:
-                if song:
-                    # QL created (or knew about) this one; still check if it changed
-                    if not song.valid():
-                        self.reload(song)
-                else:
-                    print_d(f"Auto-adding new file: {file_path}", self._name)
-                    self.add_filename(file_path)
+                self._queue_path(file_path)
             elif event in (Event.MOVED_OUT, Event.DELETED):
                 if song:
-                    print_d(f"...so deleting {file_path}", self._name)
-                    self.reload(song)
+                    self._queue_path(file_path)
                 else:
                     # either not a song, or a song that was renamed by QL
                     if self.is_monitored_dir(file_path):
                         self.unmonitor_dir(file_path)
-
-                    # And try to remove all songs under that dir. Slowly.
-                    gone = set()
-                    for key, song in self.iteritems():
-                        if file_path in Path(key).parents:
-                            gone.add(song)
-                    if gone:
-                        print_d(f"Removing {len(gone)} contained songs in {file_path}",
-                                self._name)
-                        actually_gone = self.remove(gone)
-                        if gone != actually_gone:
-                            print_w(f"Couldn't remove all: {gone - actually_gone}",
-                                    self._name)
+                    self._pending.pop(str(file_path), None)
+                    self._pending_dirs[file_path] = time.monotonic()
+                    self.__schedule()
             else:
                 print_d(f"Unhandled event {event} on {file_path} ({other_path})",
                         self._name)
@@ -544,7 +603,160 @@ class WatchedFileLibraryMixin(FileLibrary):
         except Exception:
             print_w("Failed to run file monitor callback", self._name)
             print_exc()
-        print_d(f"Finished handling {event}", self._name)
+
+    def _queue_path(self, path: Path) -> None:
+        """Handles `path` once there were no events for it for a while"""
+
+        key = str(path)
+        if key not in self._contents and not formats.filter(key):
+            return
+        perf.count("library.monitor_events")
+        self._pending[key] = time.monotonic()
+        self.__schedule()
+
+    def has_pending_events(self) -> bool:
+        """If there are file monitor events left to handle"""
+
+        return bool(self._pending or self._pending_dirs or self._handling)
+
+    def __schedule(self):
+        if self._pending_id is None:
+            self._pending_id = GLib.timeout_add(
+                int(self.MONITOR_DELAY * 1000), self.__handle_pending,
+                priority=GLib.PRIORITY_LOW)
+
+    def __handle_pending(self):
+        if self._handling:
+            return True
+        deadline = time.monotonic() - self.MONITOR_DELAY
+        paths = [k for k, t in self._pending.items() if t <= deadline]
+        dirs = [p for p, t in self._pending_dirs.items() if t <= deadline]
+        for key in paths:
+            del self._pending[key]
+        for path in dirs:
+            del self._pending_dirs[path]
+        if paths or dirs:
+            self.__handle_paths(paths, dirs)
+        if self._pending or self._pending_dirs:
+            return True
+        self._pending_id = None
+        return False
+
+    def __handle_paths(self, paths, dirs):
+        new_paths = [key for key in paths if key not in self._contents]
+        songs = {self._contents[key] for key in paths if key in self._contents}
+        for path in dirs:
+            songs.update(self._songs_below(path))
+        if not new_paths and not songs:
+            return
+        print_d(f"Checking {len(new_paths)} new and {len(songs)} known "
+                f"path(s) after file monitor events", self._name)
+        self._handling = True
+        first = new_paths[0] if new_paths else next(iter(songs))("~filename")
+        call_async(self._check_paths, self._monitor_cancellable,
+                   self.__apply_changes, args=(new_paths, songs),
+                   lane=disk_lane(first))
+
+    def _check_paths(self, paths: Iterable[str], songs: Iterable[AudioFile]
+                     ) -> Tuple[list, list]:
+        """Parses new files and finds known songs which changed on disk
+        or are gone. Runs in a thread.
+
+        :return: the new songs and the changed ones
+        """
+
+        new = []
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            try:
+                song = self.add_filename(path, add=False)
+            except Exception:
+                print_w(f"Couldn't load {path!r}", self._name)
+                print_exc()
+                continue
+            if song is not None:
+                new.append(song)
+        return new, [song for song in songs if not song.valid()]
+
+    def __apply_changes(self, result):
+        new, stale = result
+
+        def apply():
+            try:
+                added = self.add(new)
+                if added:
+                    print_d(f"Auto-added {len(added)} new file(s)", self._name)
+                changed, removed = set(), set()
+                for i, song in enumerate(stale):
+                    if song.key in self._contents:
+                        self.reload(song, changed, removed)
+                    if len(changed) + len(removed) >= 200:
+                        self.__emit_changes(changed, removed)
+                    if not i % 20:
+                        yield True
+                self.__emit_changes(changed, removed)
+            finally:
+                self._handling = False
+
+        copool.add(apply, funcid=self.__funcid, priority=GLib.PRIORITY_LOW)
+
+    @property
+    def __funcid(self):
+        return f"monitor_changes_{id(self)}"
+
+    def __emit_changes(self, changed, removed):
+        if removed:
+            self.emit('removed', set(removed))
+            removed.clear()
+        if changed:
+            self.emit('changed', set(changed))
+            changed.clear()
+
+    def _songs_below(self, path: Path) -> List[AudioFile]:
+        """All songs in directory `path` or any of its subdirectories"""
+
+        if self._dir_index is None:
+            self._dir_index = {}
+            self.__index_keys(self._contents.keys())
+        index = self._dir_index
+        root = str(path)
+        prefix = os.path.join(root, "")
+        songs = []
+        for dir_ in [d for d in index if d == root or d.startswith(prefix)]:
+            keys = index[dir_]
+            for key in list(keys):
+                song = self._contents.get(key)
+                if song is None:
+                    # the index only gets cleaned up when used
+                    keys.discard(key)
+                else:
+                    songs.append(song)
+            if not keys:
+                del index[dir_]
+        return songs
+
+    def __index_keys(self, keys):
+        if self._dir_index is not None:
+            for key in keys:
+                self._dir_index.setdefault(os.path.dirname(key), set()).add(key)
+
+    def __index_added(self, library, items):
+        self.__index_keys(item.key for item in items)
+
+    def _load_init(self, items):
+        self._dir_index = None
+        super()._load_init(items)
+
+    def _load_item(self, item, force=False):
+        result = super()._load_item(item, force)
+        self.__index_keys([item.key])
+        return result
+
+    def move_song(self, song: AudioFile, new_path: fsnative) -> bool:
+        existed = super().move_song(song, new_path)
+        self.__index_keys([song.key])
+        return existed
 
     def is_monitored_dir(self, path: Path) -> bool:
         return path in self._monitors
@@ -593,6 +805,19 @@ class WatchedFileLibraryMixin(FileLibrary):
             monitor.disconnect(handler_id)
         self._monitors.clear()
 
+        if self._pending_id is not None:
+            GLib.source_remove(self._pending_id)
+            self._pending_id = None
+        self._pending.clear()
+        self._pending_dirs.clear()
+        self._monitor_cancellable.cancel()
+        self._monitor_cancellable = Cancellable()
+        try:
+            copool.remove(self.__funcid)
+        except ValueError:
+            pass
+        self._handling = False
+
     def destroy(self):
         self.stop_watching()
         super().destroy()
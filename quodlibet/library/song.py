@@ -12,6 +12,7 @@ from quodlibet.library.base import Library, PicklingMixin, K
 from quodlibet.library.file import WatchedFileLibraryMixin
 from quodlibet.library.playlist import PlaylistLibrary
 from quodlibet.query import Query
+from quodlibet.util import perf
 from quodlibet.util.path import normalize_path
 from senf import fsnative
 
@@ -81,7 +82,9 @@ class SongLibrary(Library[K, V], PicklingMixin):
 
         songs = self.values()
         if text != "":
-            songs = [s for s in songs if Query(text, star).search(s)]
+            with perf.span("library.query"):
+                search = Query(text, star).search
+                songs = [s for s in songs if search(s)]
         return songs
 
 
@@ -11,7 +11,7 @@ import sys
 import os
 
 from quodlibet import _
-from quodlibet.cli import process_arguments, exit_
+from quodlibet.cli import process_arguments, run_headless, exit_
 from quodlibet.util.dprint import print_d, print_, print_exc
 
 
@@ -22,6 +22,8 @@ def main(argv=None):
     import quodlibet
 
     config_file = os.path.join(quodlibet.get_user_dir(), "config")
+    # exits in case it could answer without starting up
+    run_headless(argv, config_file)
     quodlibet.init_cli(config_file=config_file)
 
     try:
@@ -34,6 +36,10 @@ def main(argv=None):
 
     quodlibet.init()
 
+    if "fetch-covers" in startup_actions:
+        # exits when done
+        _fetch_covers("no-plugins" in startup_actions)
+
     from quodlibet import app
     from quodlibet.qltk import add_signal_watch
     add_signal_watch(app.quit)
@@ -43,6 +49,7 @@ def main(argv=None):
     from quodlibet import config
     from quodlibet import browsers
     from quodlibet import util
+    from quodlibet.util import perf
 
     app.name = "Quod Libet"
     app.description = _("Music player and music library manager")
@@ -212,8 +219,36 @@ def main(argv=None):
     config.save()
 
     session_client.close()
+    perf.disable()
 
     print_d("Finished shutdown.")
 
     if app.is_restarting:
         os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def _fetch_covers(no_plugins):
+    """Fetches missing covers using only the library and the cover
+    source plugins, without a player or windows"""
+
+    import quodlibet
+    import quodlibet.library
+    from quodlibet import app, config, plugins
+    from quodlibet.util.cover import CoverManager
+    from quodlibet.util.cover.backfill import fetch_covers
+
+    library = quodlibet.library.init(
+        os.path.join(quodlibet.get_user_dir(), "songs"))
+    app.library = library
+    quodlibet.init_plugins(no_plugins)
+    app.cover_manager = CoverManager()
+    app.cover_manager.init_plugins()
+
+    found, missing = fetch_covers(library, app.cover_manager)
+    print_(_("Found %(found)d covers, %(missing)d albums still without one")
+           % {"found": found, "missing": missing})
+
+    plugins.quit()
+    quodlibet.library.destroy()
+    config.save()
+    exit_()
@@ -5,10 +5,15 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
 import sys
+import copy
+import collections
+from concurrent.futures import ProcessPoolExecutor
 from typing import Type, List
 from optparse import OptionParser
 
+import quodlibet
 from quodlibet import _
 from quodlibet.formats import MusicFile, AudioFileError
 from quodlibet.util import print_
@@ -18,6 +23,53 @@ class CommandError(Exception):
     pass
 
 
+_pool = None
+_pool_jobs = 0
+
+
+def get_jobs(jobs):
+    """Returns the number of workers for a --jobs value"""
+
+    if not jobs:
+        return os.cpu_count() or 1
+    return max(jobs, 1)
+
+
+def get_pool(jobs):
+    """Returns a shared process pool with `jobs` workers, or None if
+    files should be handled in the current process"""
+
+    global _pool, _pool_jobs
+
+    jobs = get_jobs(jobs)
+    if jobs == 1:
+        return None
+    if _pool is None or _pool_jobs != jobs:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(jobs, initializer=quodlibet.init_cli)
+        _pool_jobs = jobs
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def _load_song(path):
+    return MusicFile(path)
+
+
+def _write_song(song):
+    try:
+        song.write()
+    except AudioFileError as e:
+        return str(e)
+
+
 class Command:
     """Base class for commands.
 
@@ -56,6 +108,12 @@ class Command:
     def verbose(self, value):
         self.__options.verbose = bool(value)
 
+    @property
+    def jobs(self):
+        """Number of worker processes to use, 0 for one per CPU"""
+
+        return getattr(self.__options, "jobs", 1)
+
     def log(self, text):
         """Print output if --verbose was passed"""
 
@@ -71,16 +129,77 @@ class Command:
             raise CommandError(_("Failed to load file: %r") % path)
         return song
 
+    def _map(self, func, items):
+        """Like map(), but uses the worker pool if --jobs was passed.
+        Results are yielded in order while later items get processed."""
+
+        pool = get_pool(self.jobs)
+        if pool is None:
+            yield from map(func, items)
+            return
+
+        pending = collections.deque()
+        # don't queue everything at once, results are kept until consumed
+        limit = get_jobs(self.jobs) * 4
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= limit:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def iter_songs(self, paths):
+        """Yields the songs for all paths in order, loading them in parallel
+        if --jobs was passed. Raises CommandError once a file that failed to
+        load is reached."""
+
+        if get_pool(self.jobs) is None:
+            for path in paths:
+                yield self.load_song(path)
+            return
+
+        for path, song in zip(paths, self.map_songs(paths)):
+            if song is None:
+                raise CommandError(_("Failed to load file: %r") % path)
+            yield song
+
+    def map_songs(self, paths):
+        """Yields the song or None for each path, in order"""
+
+        for path, song in zip(paths, self._map(_load_song, paths)):
+            self.log("Load file: %r" % path)
+            yield song or None
+
+    def load_songs(self, paths):
+        """Loads all songs, see iter_songs()"""
+
+        return list(self.iter_songs(paths))
+
     def save_songs(self, songs):
         """Save all passed songs"""
 
         self.log("Saving songs...")
 
-        for song in songs:
-            try:
-                song.write()
-            except AudioFileError as e:
-                raise CommandError(e)
+        for error in self._map(_write_song, songs):
+            if error is not None:
+                raise CommandError(error)
+
+    def run_command(self, args):
+        """Runs another command with a copy of the global options, so
+        changes made by it don't affect later commands.
+
+        Raises CommandError
+        """
+
+        if not args:
+            raise CommandError(_("Not enough arguments"))
+        for cmd_cls in self.COMMANDS:
+            if cmd_cls.NAME == args[0]:
+                break
+        else:
+            raise CommandError(_("Unknown command %r") % args[0])
+        options = copy.copy(self.__options)
+        cmd_cls(self._main_cmd, options).execute(args[1:])
 
     def _execute(self, options, args):
         """Override to execute something"""
@@ -11,8 +11,10 @@
 
 import os
 import re
+import shlex
 import shutil
 import subprocess
+import sys
 import tempfile
 
 from senf import fsn2text
@@ -297,9 +299,7 @@ class SetCommand(Command):
         paths = args[2:]
 
         songs = []
-        for path in paths:
-            song = self.load_song(path)
-
+        for song in self.iter_songs(paths):
             if not song.can_change(tag):
                 vars = dict(tag=tag, format=type(song).format, file=song("~filename"))
                 raise CommandError(
@@ -346,9 +346,7 @@ class ClearCommand(Command):
             self.verbose = True
 
         songs = []
-        for path in paths:
-            song = self.load_song(path)
-
+        for path, song in zip(paths, self.iter_songs(paths)):
             tags = []
             realkeys = song.realkeys()
             if options.all:
@@ -409,9 +407,7 @@ class RemoveCommand(Command):
             match = lambda v: v == value
 
         songs = []
-        for path in paths:
-            song = self.load_song(path)
-
+        for song in self.iter_songs(paths):
             if tag not in song:
                 continue
 
@@ -440,9 +436,7 @@ class AddCommand(Command):
         paths = args[2:]
 
         songs = []
-        for path in paths:
-            song = self.load_song(path)
-
+        for song in self.iter_songs(paths):
             if not song.can_change(tag):
                 raise CommandError(_("Can not set %r") % tag)
 
@@ -517,7 +511,7 @@ class ImageSetCommand(Command):
         if not image:
             raise CommandError(_("Failed to load image file: %r") % image_path)
 
-        songs = [self.load_song(p) for p in paths]
+        songs = self.load_songs(paths)
 
         for song in songs:
             if not song.can_change_images:
@@ -546,7 +540,7 @@ class ImageClearCommand(Command):
             raise CommandError(_("Not enough arguments"))
 
         paths = args
-        songs = [self.load_song(p) for p in paths]
+        songs = self.load_songs(paths)
 
         for song in songs:
             if not song.can_change_images:
@@ -592,9 +586,7 @@ class ImageExtractCommand(Command):
             self.verbose = True
 
         paths = args
-        for path in paths:
-            song = self.load_song(path)
-
+        for path, song in zip(paths, self.iter_songs(paths)):
             # get the primary one or all of them
             if options.primary:
                 image = song.get_primary_image()
@@ -672,8 +664,7 @@ class FillCommand(Command):
         pattern = TagsFromPattern(pattern_text)
 
         songs = []
-        for path in paths:
-            song = self.load_song(path)
+        for song in self.iter_songs(paths):
             for header in pattern.headers:
                 if not song.can_change(header):
                     raise CommandError(_("Can not set %r") % header)
@@ -755,16 +746,86 @@ class PrintCommand(Command):
 
         paths = args
         error = False
-        for path in paths:
-            try:
-                util.print_(pattern % self.load_song(path))
-            except CommandError:
+        for song in self.map_songs(paths):
+            if song is None:
                 error = True
+            else:
+                util.print_(pattern % song)
 
         if error:
             raise CommandError("One or more files failed to load.")
 
 
+@Command.register
+class BatchCommand(Command):
+    NAME = "batch"
+    DESCRIPTION = _("Run many commands without restarting")
+    USAGE = "[<command> [<args>]]"
+
+    CHUNK_SIZE = 500
+    """Number of files passed to one command"""
+
+    def _add_options(self, p):
+        p.add_option("-f", "--file", action="store", type="string",
+                     help=_("Read from a file instead of standard input"))
+        p.disable_interspersed_args()
+
+    def _read_lines(self, options):
+        if options.file is None:
+            yield from self._filter_lines(sys.stdin)
+            return
+
+        try:
+            h = open(options.file, "r", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(e)
+        with h:
+            yield from self._filter_lines(h)
+
+    def _filter_lines(self, lines):
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if line.strip() and not line.lstrip().startswith("#"):
+                yield line
+
+    def _run(self, args):
+        if args and args[0] == self.NAME:
+            raise CommandError(_("Can't nest '%s'") % self.NAME)
+        try:
+            self.run_command(args)
+        except CommandError as e:
+            name = args[0] if args else self.NAME
+            util.print_(u"%s: %s" % (name, e), file=sys.stderr)
+            return False
+        return True
+
+    def _execute(self, options, args):
+        failed = 0
+        if args:
+            # every line is a file, passed in chunks to the given command
+            chunk = []
+            for line in self._read_lines(options):
+                chunk.append(line)
+                if len(chunk) >= self.CHUNK_SIZE:
+                    failed += not self._run(args + chunk)
+                    chunk = []
+            if chunk:
+                failed += not self._run(args + chunk)
+        else:
+            # every line is a command
+            for line in self._read_lines(options):
+                try:
+                    line_args = shlex.split(line)
+                except ValueError as e:
+                    util.print_(u"%s: %s" % (self.NAME, e), file=sys.stderr)
+                    failed += 1
+                    continue
+                failed += not self._run(line_args)
+
+        if failed:
+            raise CommandError(_("%d command(s) failed") % failed)
+
+
 @Command.register
 class HelpCommand(Command):
     NAME = "help"
@@ -13,7 +13,7 @@ import quodlibet
 from quodlibet import const
 from quodlibet.util.dprint import print_
 
-from .base import Command, CommandError
+from .base import Command, CommandError, shutdown_pool
 from . import commands
 
 commands
@@ -46,7 +46,8 @@ def main(argv=None):
     main_cmd = os.path.basename(argv[0])
 
     # the main optparser
-    usage = "%s [--version] [--help] [--verbose] <command> [<args>]" % main_cmd
+    usage = ("%s [--version] [--help] [--verbose] [--jobs <n>] <command> "
+             "[<args>]" % main_cmd)
     parser = OptionParser(usage=usage)
 
     parser.remove_option("--help")
@@ -55,6 +56,8 @@ def main(argv=None):
                       help="print version")
     parser.add_option("-v", "--verbose", action="store_true",
                       help="verbose output")
+    parser.add_option("-j", "--jobs", type="int", default=1,
+                      help="process files in parallel (0 for one job per CPU)")
 
     # no args, print help (might change in the future)
     if len(argv) <= 1:
@@ -64,17 +67,22 @@ def main(argv=None):
     # collect options for the main command and get the command offset
     offset = -1
     pre_command = []
+    takes_value = False
     for i, a in enumerate(argv):
         if i == 0:
             continue
-        elif a.startswith("-"):
+        elif a.startswith("-") or takes_value:
             pre_command.append(a)
+            takes_value = a in ("-j", "--jobs")
         else:
             offset = i
             break
 
     # parse the global options
     options = parser.parse_args(pre_command)[0]
+    if options.jobs < 0:
+        print_("--jobs can't be negative", file=sys.stderr)
+        return 1
 
     # --help somewhere
     if options.help:
@@ -108,6 +116,8 @@ def main(argv=None):
             except CommandError as e:
                 print_(u"%s: %s" % (command.NAME, e), file=sys.stderr)
                 return 1
+            finally:
+                shutdown_pool()
             break
     else:
         print_(u"Unknown command '%s'. See '%s help'." % (arg, main_cmd),
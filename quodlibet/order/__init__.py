@@ -40,6 +40,9 @@ class Order:
     """The priority relative to other orders of its type.
     Larger numbers typically appear lower in lists."""
 
+    can_peek = False
+    """Whether `peek_next_implicit` can predict `next_implicit`"""
+
     def __init__(self):
         """Must have a zero-arg constructor"""
         pass
@@ -69,6 +72,12 @@ class Order:
         """Called when a song ends passively, e.g. it plays through."""
         return self.next(playlist, iter)
 
+    def peek_next_implicit(self, playlist, iter):
+        """Returns what the next `next_implicit` call will return, without
+        any side effects outside of the order.
+        Only called if `can_peek` is True."""
+        return None
+
     def previous_explicit(self, playlist, iter):
         """Called when the user presses a "Previous" button."""
         return self.previous(playlist, iter)
@@ -145,6 +154,7 @@ class OrderInOrder(Order):
     accelerated_name = _("_In Order")
     replaygain_profiles = ["album", "track"]
     priority = 0
+    can_peek = True
 
     def next(self, playlist, iter):
         if iter is None:
@@ -152,6 +162,9 @@ class OrderInOrder(Order):
         else:
             return playlist.iter_next(iter)
 
+    def peek_next_implicit(self, playlist, iter):
+        return OrderInOrder.next(self, playlist, iter)
+
     def previous(self, playlist, iter):
         if len(playlist) == 0:
             return None
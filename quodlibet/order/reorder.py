@@ -21,6 +21,10 @@ class OrderShuffle(Reorder, OrderRemembered):
     name = "random"
     display_name = _("Random")
     accelerated_name = _("_Random")
+    can_peek = True
+
+    _peeked = None
+    """The index picked by the last peek, used by the following next()"""
 
     def next(self, playlist, iter):
         super().next(playlist, iter)
@@ -29,11 +33,31 @@ class OrderShuffle(Reorder, OrderRemembered):
         remaining = songs.difference(played)
 
         if remaining:
-            return playlist.get_iter((random.choice(list(remaining)),))
+            index = self._peeked
+            if index not in remaining:
+                index = random.choice(list(remaining))
+            self._peeked = None
+            return playlist.get_iter((index,))
 
         self.reset(playlist)
         return None
 
+    def peek_next_implicit(self, playlist, iter):
+        played = set(self._played)
+        if iter is not None:
+            played.add(playlist.get_path(iter).get_indices()[0])
+        remaining = set(range(len(playlist))).difference(played)
+
+        if not remaining:
+            return None
+        if self._peeked not in remaining:
+            self._peeked = random.choice(list(remaining))
+        return playlist.get_iter((self._peeked,))
+
+    def reset(self, playlist):
+        super().reset(playlist)
+        self._peeked = None
+
 
 class OrderWeighted(Reorder, OrderRemembered):
     name = "weighted"
@@ -18,6 +18,10 @@ class Repeat(Order):
         assert isinstance(wrapped, Order)
         self.wrapped = wrapped
 
+    @property
+    def can_peek(self):
+        return self.wrapped.can_peek
+
     def next(self, playlist, iter):
         raise NotImplementedError
 
@@ -42,10 +46,14 @@ class RepeatSongForever(Repeat):
     name = "repeat_song"
     display_name = _("Repeat this track")
     accelerated_name = _("Repeat _this track")
+    can_peek = True
 
     def next(self, playlist, iter):
         return iter
 
+    def peek_next_implicit(self, playlist, iter):
+        return iter
+
     def next_explicit(self, playlist, iter):
         return self.wrapped.next_explicit(playlist, iter)
 
@@ -65,6 +73,10 @@ class RepeatListForever(Repeat):
         print_d("Restarting songlist")
         return playlist.get_iter_first()
 
+    def peek_next_implicit(self, playlist, iter):
+        next = self.wrapped.peek_next_implicit(playlist, iter)
+        return next or playlist.get_iter_first()
+
 
 class OneSong(Repeat):
     """Stops after the current song"""
@@ -73,7 +85,11 @@ class OneSong(Repeat):
     display_name = _("One song")
     accelerated_name = _("One _song")
     priority = 400
+    can_peek = True
 
     def next(self, playlist, iter):
         print_d("Ending songlist.")
         return None
+
+    def peek_next_implicit(self, playlist, iter):
+        return None
@@ -12,7 +12,7 @@ from typing import List
 from gi.repository import GObject
 
 from quodlibet.formats import AudioFile
-from quodlibet.util import print_d, format_time
+from quodlibet.util import print_d, format_time, perf
 from quodlibet import config
 
 
@@ -100,6 +100,11 @@ class BasePlayer(GObject.GObject, Equalizer):
     def __init__(self, *args, **kwargs):
         super().__init__()
 
+    def emit(self, signal, *args):
+        # times all handlers reacting to player state changes
+        with perf.span("player." + signal):
+            return super().emit(signal, *args)
+
     def destroy(self):
         """Free resources"""
 
@@ -24,7 +24,7 @@ from quodlibet import _
 
 from quodlibet.util import fver, sanitize_tags, MainRunner, MainRunnerError, \
     MainRunnerAbortedError, MainRunnerTimeoutError, print_w, print_d, \
-    print_e, print_
+    print_e, print_, perf
 from quodlibet.util.path import uri2gsturi
 from quodlibet.player import PlayerError
 from quodlibet.player._base import BasePlayer
@@ -347,6 +347,14 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
         self.__bus_id = None
         self._runner = MainRunner()
 
+        # The next song and its URI, resolved in the main loop ahead of
+        # about-to-finish: None if unknown, (None, None) if there shouldn't
+        # be a gapless transition.
+        self._preroll = None
+        self.__preroll_id = None
+        self.__preroll_sigs = []
+        self.__preroll_dropped = False
+
     def __songs_changed(self, librarian, songs):
         # replaygain values might have changed, recalc volume
         if self.song and self.song in songs:
@@ -355,8 +363,91 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
     def _destroy(self):
         self._librarian.disconnect(self._lib_id)
         self._runner.abort()
+        self.__disconnect_source()
         self.__destroy_pipeline()
 
+    def __disconnect_source(self):
+        if self.__preroll_id is not None:
+            GLib.source_remove(self.__preroll_id)
+            self.__preroll_id = None
+        for model, sig in self.__preroll_sigs:
+            model.disconnect(sig)
+        self.__preroll_sigs = []
+        self._preroll = None
+
+    def __connect_source(self):
+        """Tracks changes of the source which might change the next song"""
+
+        source = self._source
+        connected = {m for m, s in self.__preroll_sigs}
+        models = getattr(source, "models", [source])
+        if connected == set(models):
+            return
+
+        self.__disconnect_source()
+        for model in models:
+            for name in ["row-inserted", "row-deleted", "rows-reordered",
+                         "order-changed"]:
+                try:
+                    sig = model.connect(name, self.__source_changed)
+                except TypeError:
+                    # not a signal of this model
+                    continue
+                self.__preroll_sigs.append((model, sig))
+
+    def __source_changed(self, *args):
+        self._preroll = None
+        self._queue_preroll()
+
+    def _queue_preroll(self):
+        """Resolves the next song and URI for a gapless transition the next
+        time the main loop is idle.
+        """
+
+        self._preroll = None
+        if self._source is None:
+            return
+        self.__connect_source()
+        if self.__preroll_id is None:
+            self.__preroll_id = GLib.idle_add(self.__update_preroll)
+
+    def __update_preroll(self):
+        self.__preroll_id = None
+        if self._source is None or self._in_gapless_transition:
+            return False
+
+        if not self.__gapless_possible():
+            self._preroll = (None, None)
+            return False
+
+        peek = getattr(self._source, "peek_next_ended", None)
+        song = peek and peek()
+        if song is not None:
+            print_d("Prerolled next song %r" % song("~filename"))
+            self._preroll = (song, song("~uri"))
+        return False
+
+    def __gapless_possible(self):
+        # Chained oggs falsely trigger a gapless transition.
+        # At least for radio streams we can safely ignore it because
+        # transitions don't occur there.
+        # https://github.com/quodlibet/quodlibet/issues/1454
+        # https://bugzilla.gnome.org/show_bug.cgi?id=695474
+        if self.song and self.song.multisong:
+            print_d("This is a multisong - so ignoring 'about to finish' signal")
+            return False
+
+        # mod + gapless deadlocks
+        # https://github.com/quodlibet/quodlibet/issues/2780
+        if isinstance(self.song, ModFile):
+            return False
+
+        if config.getboolean("player", "gst_disable_gapless"):
+            print_d("Gapless disabled")
+            return False
+
+        return True
+
     @property
     def name(self):
         name = "GStreamer"
@@ -575,6 +666,7 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
             self.bin = None
 
         self._in_gapless_transition = False
+        self.__preroll_dropped = False
 
         self._ext_vol_element = None
         self._int_vol_element = None
@@ -626,6 +718,11 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
         elif message.type == Gst.MessageType.STREAM_START:
             if self._in_gapless_transition:
                 print_d("Stream changed")
+                if self.__preroll_dropped:
+                    # the pipeline plays the dropped song, start over
+                    # with the one the source switched to
+                    self.__preroll_dropped = False
+                    self._in_gapless_transition = False
                 self._end(False)
         elif message.type == Gst.MessageType.ELEMENT:
             message_name = message.get_structure().get_name()
@@ -705,22 +802,7 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
 
         print_d("About to finish (sync)")
 
-        # Chained oggs falsely trigger a gapless transition.
-        # At least for radio streams we can safely ignore it because
-        # transitions don't occur there.
-        # https://github.com/quodlibet/quodlibet/issues/1454
-        # https://bugzilla.gnome.org/show_bug.cgi?id=695474
-        if self.song and self.song.multisong:
-            print_d("This is a multisong - so ignoring 'about to finish' signal")
-            return
-
-        # mod + gapless deadlocks
-        # https://github.com/quodlibet/quodlibet/issues/2780
-        if isinstance(self.song, ModFile):
-            return
-
-        if config.getboolean("player", "gst_disable_gapless"):
-            print_d("Gapless disabled")
+        if not self.__gapless_possible():
             return
 
         # this can trigger twice, see issue 987
@@ -736,9 +818,44 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
         if song is not None:
             return song("~uri")
 
+    def __commit_preroll(self, song):
+        """Makes the source follow the prerolled song, which is already
+        queued in the pipeline.
+        """
+
+        print_d("Committing prerolled song")
+        self._source.next_ended()
+        if self._source.current is not song:
+            # e.g. the playlist changed since the preroll. Follow the
+            # source instead of overriding it and skip the gapless
+            # transition.
+            print_d("Next song differs from the prerolled one, dropping it")
+            perf.count("gapless.dropped")
+            self.__preroll_dropped = True
+        return False
+
     def __about_to_finish(self, playbin):
         print_d("About to finish (async)")
 
+        preroll = self._preroll
+        if preroll is not None:
+            song, uri = preroll
+            if song is None:
+                print_d("About to finish (async): no gapless transition")
+                return
+            # this can trigger twice, see issue 987
+            if self._in_gapless_transition:
+                return
+            self._in_gapless_transition = True
+            self._preroll = None
+            perf.count("gapless.prerolled")
+            GLib.idle_add(self.__commit_preroll, song,
+                          priority=GLib.PRIORITY_HIGH)
+            print_d("About to finish (async): setting prerolled uri")
+            self._set_uri(uri)
+            return
+
+        perf.count("gapless.fallback")
         try:
             uri = self._runner.call(self.__about_to_finish_sync,
                                     priority=GLib.PRIORITY_HIGH,
@@ -750,6 +867,7 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
             # In this case abort and do nothing, which results
             # in a non-gapless transition.
             print_e("About to finish (async): %s" % e)
+            perf.count("gapless.missed")
             return
         except MainRunnerAbortedError as e:
             print_e("About to finish (async): %s" % e)
@@ -930,8 +1048,9 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
                 # Due to extensive problems with playbin2, we destroy the
                 # entire pipeline and recreate it each time we're not in
                 # a gapless transition.
-                self.__destroy_pipeline()
-                self.__init_pipeline()
+                with perf.span("player.pipeline"):
+                    self.__destroy_pipeline()
+                    self.__init_pipeline()
             if self.bin:
                 if self.paused:
                     self.bin.set_state(Gst.State.PAUSED)
@@ -953,6 +1072,8 @@ class GStreamerPlayer(BasePlayer, GStreamerPluginHandler):
 
         if self.song is None:
             self.paused = True
+        else:
+            self._queue_preroll()
 
     def __tag(self, tags, librarian):
         if self.song and self.song.multisong:
@@ -6,18 +6,36 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-from gi.repository import GObject
+import threading
+import time
 
-from quodlibet.util.dprint import print_e
+from gi.repository import GObject, GLib
+
+from quodlibet.util.dprint import print_d, print_e, print_w
 
 from quodlibet.plugins import PluginHandler
 
+from quodlibet.formats import current_generation
 from quodlibet.util.songwrapper import SongWrapper, ListWrapper
 from quodlibet.util.songwrapper import check_wrapper_changed
 from quodlibet.util import connect_obj
+from quodlibet.util import perf
+from quodlibet.util.perf import Histogram
+from quodlibet.util.thread import call_async_background, set_lane_limit, \
+    Cancellable
 from quodlibet.errorreport import errorhook
 
 
+BATCH_DELAY = 50
+"""Time in ms library signals get collected before being passed on"""
+
+BATCHED_EVENTS = ("added", "changed", "removed")
+
+SLOW_HANDLER = 0.1
+"""Handlers taking longer than this (in seconds) get reported, with a
+warning the first time"""
+
+
 class EventPlugin:
     """Plugins that run in the background and receive events.
 
@@ -60,6 +78,13 @@ class EventPlugin:
 
     PLUGIN_INSTANCE = True
 
+    PLUGIN_THREAD_SAFE = False
+    """If True the `plugin_on_added`, `plugin_on_changed` and
+    `plugin_on_removed` handlers get called in a worker thread, one call
+    at a time and in order. They get the plain songs, which must not be
+    modified.
+    """
+
     def enabled(self):
         """Called when the plugin is enabled."""
         pass
@@ -94,14 +119,77 @@ def _map_signals(obj, prefix="plugin_on_", blacklist=None):
     return sigs
 
 
+_stats = {}
+_slow = set()
+_stats_lock = threading.Lock()
+
+
+def _record(plugin, method_name, duration):
+    key = (getattr(plugin, "PLUGIN_ID", type(plugin).__name__), method_name)
+    slow = duration > SLOW_HANDLER
+    with _stats_lock:
+        hist = _stats.get(key)
+        if hist is None:
+            hist = _stats[key] = Histogram()
+        hist.add(duration)
+        first_slow = slow and key not in _slow
+        if first_slow:
+            _slow.add(key)
+    perf.record("plugin." + key[0], duration, event=method_name)
+    if slow:
+        log = print_w if first_slow else print_d
+        log("%s.%s took %.0f ms" % (key[0], method_name, duration * 1000))
+
+
+def get_stats():
+    """Returns a list of dicts with the time spent in event plugin
+    handlers, slowest first"""
+
+    with _stats_lock:
+        stats = [dict(hist.to_dict(), plugin=plugin, event=event)
+                 for (plugin, event), hist in _stats.items()]
+    return sorted(stats, key=lambda s: s["total"], reverse=True)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+        _slow.clear()
+
+
+def _overridden(obj, name):
+    return name in type(obj).__dict__
+
+
+def _call_threaded(plugin, method_name, songs):
+    start = time.perf_counter()
+    try:
+        getattr(plugin, method_name)(songs)
+    except Exception:
+        print_e("Error during %s on %s" % (method_name, type(plugin)))
+        errorhook()
+    _record(plugin, method_name, time.perf_counter() - start)
+
+
 class EventPluginHandler(PluginHandler):
+    """Passes signals of the librarian, player and song list on to the
+    enabled event plugins.
+
+    Library signals get collected for BATCH_DELAY ms so a mass edit
+    results in one call per plugin instead of one per signal. Any other
+    event flushes them first, so plugins still see events in order.
+    """
 
     def __init__(self, librarian=None, player=None, songlist=None):
         if librarian:
             sigs = _map_signals(librarian, blacklist=("notify",))
             for event, handle in sigs:
                 def handler(librarian, *args):
-                    self.__invoke(librarian, args[-1], *args[:-1])
+                    event = args[-1]
+                    if event in BATCHED_EVENTS:
+                        self.__queue(librarian, event, args[0])
+                    else:
+                        self.__invoke(librarian, event, *args[:-1])
                 librarian.connect(event, handler, event)
 
         if librarian and player:
@@ -119,43 +207,110 @@ class EventPluginHandler(PluginHandler):
 
         self.librarian = librarian
         self.__plugins = {}
+        self.__cancellables = {}
         self.__sidebars = {}
+        # [librarian, event, {song: None}]
+        self.__pending = []
+        self.__timeout_id = None
+        self.__disabling = None
+
+    def __queue(self, librarian, event, songs):
+        if self.__pending and self.__pending[-1][:2] == [librarian, event]:
+            self.__pending[-1][2].update(dict.fromkeys(songs))
+        else:
+            self.__pending.append([librarian, event, dict.fromkeys(songs)])
+        if self.__timeout_id is None:
+            self.__timeout_id = GLib.timeout_add(
+                BATCH_DELAY, self.__flush_timeout)
+
+    def __flush_timeout(self):
+        self.__timeout_id = None
+        self.flush()
+        return False
+
+    def flush(self):
+        """Passes all collected library events on to the plugins"""
+
+        if self.__timeout_id is not None:
+            GLib.source_remove(self.__timeout_id)
+            self.__timeout_id = None
+        pending, self.__pending = self.__pending, []
+        for librarian, event, songs in pending:
+            with perf.span("plugins." + event, songs=len(songs)):
+                self.__invoke(librarian, event, list(songs))
 
     def __invoke(self, librarian, event, *args):
+        if event not in BATCHED_EVENTS:
+            self.flush()
+
+        method_name = 'plugin_on_' + event.replace('-', '_')
+        plugins = [p for p in self.__plugins.values()
+                   if _overridden(p, method_name)]
+
+        if event in BATCHED_EVENTS:
+            # the lane of a plugin getting disabled is about to be
+            # cancelled, so call it here instead
+            threaded = [p for p in plugins if p.PLUGIN_THREAD_SAFE
+                        and type(p) is not self.__disabling]
+            if threaded:
+                plugins = [p for p in plugins if not p.PLUGIN_THREAD_SAFE]
+                songs = list(args[0])
+                for plugin in threaded:
+                    call_async_background(
+                        _call_threaded, self.__cancellables[type(plugin)],
+                        lambda result: None,
+                        (plugin, method_name, songs),
+                        lane=self.__lane(plugin))
+
+        generation = current_generation()
         args = list(args)
         if args and args[0]:
             if isinstance(args[0], dict):
-                args[0] = SongWrapper(args[0])
+                args[0] = SongWrapper(args[0], generation)
             elif isinstance(args[0], (set, list)):
                 args[0] = ListWrapper(args[0])
-        for plugin in list(self.__plugins.values()):
-            method_name = 'plugin_on_' + event.replace('-', '_')
-            handler = getattr(plugin, method_name, None)
-
-            def overridden(obj, name):
-                return name in type(obj).__dict__
-
-            if overridden(plugin, method_name):
-                try:
-                    handler(*args)
-                except Exception:
-                    print_e("Error during %s on %s" %
-                            (method_name, type(plugin)))
-                    errorhook()
-
-        if event not in ["removed", "changed"] and args:
+        for plugin in plugins:
+            handler = getattr(plugin, method_name)
+            start = time.perf_counter()
+            try:
+                handler(*args)
+            except Exception:
+                print_e("Error during %s on %s" %
+                        (method_name, type(plugin)))
+                errorhook()
+            _record(plugin, method_name, time.perf_counter() - start)
+
+        # Only look at the songs if any song changed in the meantime
+        if event not in ["removed", "changed"] and args and \
+                current_generation() != generation:
             from quodlibet import app
             songs = args[0]
             if not isinstance(songs, (set, list)):
                 songs = [songs]
-            songs = filter(None, songs)
-            check_wrapper_changed(librarian, app.window, songs)
+            songs = [s for s in songs if s is not None and s._was_updated()]
+            if songs:
+                check_wrapper_changed(librarian, app.window, songs)
+
+    def __lane(self, plugin):
+        return "plugin:%s" % getattr(
+            plugin, "PLUGIN_ID", type(plugin).__name__)
 
     def plugin_handle(self, plugin):
         return issubclass(plugin.cls, EventPlugin)
 
     def plugin_enable(self, plugin):
-        self.__plugins[plugin.cls] = plugin.get_instance()
+        instance = plugin.get_instance()
+        if instance.PLUGIN_THREAD_SAFE:
+            set_lane_limit(self.__lane(instance), 1)
+        self.__cancellables[plugin.cls] = Cancellable()
+        self.__plugins[plugin.cls] = instance
 
     def plugin_disable(self, plugin):
+        # pass on the library events the plugin hasn't seen yet
+        self.__disabling = plugin.cls
+        try:
+            self.flush()
+        finally:
+            self.__disabling = None
+        self.__cancellables.pop(plugin.cls).cancel()
         self.__plugins.pop(plugin.cls)
@@ -22,7 +22,7 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-from typing import List, Tuple
+from typing import Optional
 import os
 import threading
 import time
@@ -40,7 +40,8 @@ from quodlibet.qltk.entry import ValidatingEntry, UndoEntry
 from quodlibet.qltk.msg import Message
 from quodlibet.qltk import Icons
 from quodlibet.util.dprint import print_d
-from quodlibet.util.picklehelper import pickle_load, pickle_dump, PickleError
+from quodlibet.util.picklehelper import pickle_load, PickleError
+from quodlibet.util.submitlog import SubmitLog, Backoff
 
 import csv
 from io import StringIO
@@ -88,10 +89,12 @@ class ListenBrainzSubmitQueue():
     submission.
     """
     DUMP = os.path.join(quodlibet.get_user_dir(), "listenbrainz_cache")
+    """Pickled queue of older versions, gets moved to the log"""
+    LOG = os.path.join(quodlibet.get_user_dir(), "listenbrainz_log")
 
     # These objects are shared across instances, to allow other plugins to
     # queue listens in future versions of QL.
-    queue: List[Tuple[int, listenbrainz.Track]] = []
+    queue: Optional[SubmitLog] = None
     condition = threading.Condition()
 
     def set_nowplaying(self, song):
@@ -117,7 +120,8 @@ class ListenBrainzSubmitQueue():
         if timestamp == 0:
             timestamp = int(time.time())
         print_d("Queueing: %s" % track)
-        self.queue.append((timestamp, track))
+        self.queue.append(
+            {"listened_at": timestamp, "track": track.to_dict()})
         self.changed()
         self.condition.release()
 
@@ -194,6 +198,7 @@ class ListenBrainzSubmitQueue():
         self.broken = False
         self.offline = False
         self.retries = 0
+        self.backoff = Backoff(10, 10 * 60)
 
         self.lb = listenbrainz.ListenBrainzClient() # XXX logger=xxx
 
@@ -202,22 +207,31 @@ class ListenBrainzSubmitQueue():
         self.artpat = Pattern(config_get_artist_pattern())
         self.tags = config_get_tags()
 
+        klass = type(self)
+        if klass.queue is None:
+            klass.queue = SubmitLog(klass.LOG)
+
         try:
             with open(self.DUMP, 'rb') as disk_queue_file:
                 disk_queue = pickle_load(disk_queue_file)
-            os.unlink(self.DUMP)
-            self.queue += disk_queue
         except (EnvironmentError, PickleError):
             pass
+        else:
+            for (listened_at, track) in disk_queue:
+                self.queue.append(
+                    {"listened_at": listened_at, "track": track.to_dict()})
+            try:
+                os.unlink(self.DUMP)
+            except EnvironmentError:
+                pass
 
     @classmethod
     def dump_queue(klass):
-        if klass.queue:
-            try:
-                with open(klass.DUMP, 'wb') as disk_queue_file:
-                    pickle_dump(klass.queue, disk_queue_file)
-            except (EnvironmentError, PickleError):
-                pass
+        """Every listen is written to the log when queued, so this only
+        removes the already submitted ones from it."""
+
+        if klass.queue is not None:
+            klass.queue.compact()
 
     # Must be called with self.condition acquired
     def _check_config(self):
@@ -271,9 +285,7 @@ class ListenBrainzSubmitQueue():
 
             # Poll inputs under the lock
 
-            submit = None
-            if self.queue:
-                submit = self.queue[0]
+            submit = self.queue.peek(listenbrainz.MAX_LISTENS_PER_REQUEST)
             nowplaying = None
             if self.nowplaying_track and not self.nowplaying_sent:
                 nowplaying = self.nowplaying_track
@@ -290,6 +302,7 @@ class ListenBrainzSubmitQueue():
 
                 if rsp and rsp.status == 200:
                     self.retries = 0
+                    self.backoff.reset()
                     return True
                 elif self.retries >= 6:
                     # Too many retries, put self offline
@@ -305,8 +318,8 @@ class ListenBrainzSubmitQueue():
                         "submitted." % self.retries), Gtk.MessageType.INFO)
                     return False
                 else:
-                    delay = 10
-                    print_d("Failure, waiting %ds" % delay)
+                    delay = self.backoff.next_delay()
+                    print_d("Failure, waiting %.1fs" % delay)
                     self.retries += 1
                     time.sleep(delay)
                     print_d("Done sleeping")
@@ -314,19 +327,22 @@ class ListenBrainzSubmitQueue():
                 return True
 
             if submit:
-                (listened_at, track) = submit
-                print_d("Submitting: %s" % track)
+                tracks = [(e["listened_at"], listenbrainz.Track.from_dict(e["track"]))
+                          for seq, e in submit]
+                print_d("Submitting %d listen(s)" % len(tracks))
+
+                if len(tracks) == 1:
+                    def send():
+                        return self.lb.listen(*tracks[0])
+                else:
+                    def send():
+                        return self.lb.import_tracks(tracks)
 
-                if not with_backoff(lambda: self.lb.listen(listened_at, track)):
+                if not with_backoff(send):
                     continue
 
                 print_d("Submission successful")
-
-                # Remove submitted entry under lock
-                self.condition.acquire()
-                if self.queue[0] == submit:
-                    self.queue.pop(0)
-                self.condition.release()
+                self.queue.ack([seq for seq, e in submit])
 
             if nowplaying:
                 print_d("Now playing: %s" % nowplaying)
@@ -436,7 +452,7 @@ class ListenbrainzSubmission(EventPlugin):
     def disabled(self):
         self.__enabled = False
         print_d("Plugin disabled - not accepting any new songs.")
-        #ListenBrainzSubmitQueue.dump_queue()
+        ListenBrainzSubmitQueue.dump_queue()
 
     def PluginPreferences(self, parent):
         def changed(entry, key):
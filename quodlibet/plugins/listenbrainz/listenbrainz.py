@@ -29,6 +29,7 @@ from http.client import HTTPConnection, HTTPSConnection
 
 HOST_NAME: Optional[str] = "api.listenbrainz.org"
 PATH_SUBMIT = "/1/submit-listens"
+MAX_LISTENS_PER_REQUEST = 1000
 SSL_CONTEXT: Optional[ssl.SSLContext] = ssl.create_default_context()
 
 # to run against a local dev server
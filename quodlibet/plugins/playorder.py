@@ -37,6 +37,10 @@ class PlayOrderPlugin(quodlibet.qltk.playorder.Order):
     priority = 200
     """Plugins default to lower priority than built-ins"""
 
+    can_peek = False
+    """Plugins can have side effects in `next`, so don't inherit
+    `peek_next_implicit` from built-in orders"""
+
 
 class RepeatPlugin(PlayOrderPlugin, quodlibet.qltk.playorder.Repeat):
     """Repeat plugins add new ways to repeat an existing,
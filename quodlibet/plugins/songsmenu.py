@@ -39,6 +39,11 @@ class SongsMenuPlugin(MenuItemPlugin):
     An album is a list of songs all with the same album, labelid,
     and/or musicbrainz_albumid tags (like in the Album List).
 
+    Plugins keeping class wide state, e.g. caches connected to the
+    library, can release it in the classmethod
+        cls.plugin_disabled()
+    which gets called when the plugin is disabled.
+
     To make your plugin insensitive if unsupported songs are selected,
     a method that takes a list of songs and returns True or False to set
     the sensitivity of the menu entry:
@@ -65,6 +70,10 @@ class SongsMenuPlugin(MenuItemPlugin):
     def plugin_handles(self, songs):
         return True
 
+    @classmethod
+    def plugin_disabled(cls):
+        pass
+
     @property
     def handles_albums(self):
         return any(map(callable, [self.plugin_single_album,
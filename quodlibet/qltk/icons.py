@@ -109,6 +109,7 @@ class Icons(str):
     USER_BOOKMARKS = "user-bookmarks" # Looks like a rating
     USER_DESKTOP = "user-desktop"
     USER_TRASH = "user-trash" # "Trash"
+    UTILITIES_SYSTEM_MONITOR = "utilities-system-monitor"
     UTILITIES_TERMINAL = "utilities-terminal"
     VIEW_LIST = "view-list"  #
     VIEW_REFRESH = "view-refresh"  # "_Refresh"
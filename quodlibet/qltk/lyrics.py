@@ -20,6 +20,7 @@ from quodlibet.errorreport import errorhook
 from quodlibet.formats import AudioFileError
 from quodlibet.qltk import Icons
 from quodlibet.util import connect_obj
+from quodlibet.util.lyricscache import get_cache
 
 
 class LyricsPane(Gtk.VBox):
@@ -53,7 +54,7 @@ class LyricsPane(Gtk.VBox):
         save.set_sensitive(False)
         view_online.set_sensitive(True)
 
-        lyrics = song("~lyrics")
+        lyrics = get_cache().get_lyrics(song)
 
         if lyrics:
             buffer.set_text(lyrics)
@@ -101,6 +102,7 @@ class LyricsPane(Gtk.VBox):
             fn = song.lyric_filename
             if fn:
                 self._delete_file(fn)
+        get_cache().invalidate([song])
 
     def _save_to_file(self, song, text):
         lyric_fn = song.lyric_filename
@@ -127,6 +129,7 @@ class LyricsPane(Gtk.VBox):
             util.print_exc()
 
         self._delete_file(song.lyric_filename)
+        get_cache().invalidate([song])
         delete.set_sensitive(False)
         save.set_sensitive(True)
 
@@ -0,0 +1,161 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+from gi.repository import Gtk, GLib
+
+from quodlibet import _
+from quodlibet.qltk import Icons
+from quodlibet.qltk.window import UniqueWindow
+from quodlibet.qltk.x import Button, ScrolledWindow
+from quodlibet.plugins import events
+from quodlibet.util import perf
+from quodlibet.util.thread import get_tasks
+
+
+def _format_ms(seconds):
+    return "%.2f" % (seconds * 1000)
+
+
+def _create_view(columns):
+    model = Gtk.ListStore(*([str] * len(columns)))
+    view = Gtk.TreeView(model=model)
+    for index, title in enumerate(columns):
+        render = Gtk.CellRendererText()
+        if index:
+            render.set_property("xalign", 1.0)
+        column = Gtk.TreeViewColumn(title, render, text=index)
+        column.set_sort_column_id(index)
+        column.set_resizable(True)
+        view.append_column(column)
+
+    sw = ScrolledWindow()
+    sw.set_shadow_type(Gtk.ShadowType.IN)
+    sw.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+    sw.add(view)
+    return model, sw
+
+
+class PerformanceWindow(UniqueWindow):
+    """Shows the timings and counters collected by `quodlibet.util.perf`,
+    the time spent in event plugins and the tasks queued in
+    `quodlibet.util.thread`, refreshed once a second while open."""
+
+    COLUMNS = [
+        (_("Name"), None),
+        (_("Count"), None),
+        (_("Mean (ms)"), "mean"),
+        (_("Median (ms)"), "p50"),
+        (_("95% (ms)"), "p95"),
+        (_("Max (ms)"), "max"),
+        (_("Total (ms)"), "total"),
+    ]
+
+    TASK_COLUMNS = [
+        (_("Name"), "name"),
+        (_("Lane"), "lane"),
+        (_("State"), "state"),
+        (_("Requests"), "requests"),
+        (_("Age (ms)"), "age"),
+    ]
+
+    PLUGIN_COLUMNS = [
+        (_("Plugin"), "plugin"),
+        (_("Event"), "event"),
+        (_("Count"), "count"),
+        (_("Mean (ms)"), "mean"),
+        (_("Max (ms)"), "max"),
+        (_("Total (ms)"), "total"),
+    ]
+
+    def __init__(self, parent):
+        if self.is_not_unique():
+            return
+        super().__init__()
+
+        self.set_title(_("Performance"))
+        self.set_border_width(12)
+        self.set_transient_for(parent)
+        self.set_default_size(640, 400)
+
+        self._model, timings = _create_view(
+            [title for title, key in self.COLUMNS])
+        self._tasks_model, tasks = _create_view(
+            [title for title, key in self.TASK_COLUMNS])
+        self._plugins_model, plugins = _create_view(
+            [title for title, key in self.PLUGIN_COLUMNS])
+
+        notebook = Gtk.Notebook()
+        notebook.append_page(timings, Gtk.Label(label=_("Timings")))
+        notebook.append_page(plugins, Gtk.Label(label=_("Plugins")))
+        notebook.append_page(tasks, Gtk.Label(label=_("Tasks")))
+
+        enabled = Gtk.CheckButton(label=_("_Collect measurements"),
+                                  use_underline=True)
+        enabled.set_active(perf.is_enabled())
+        enabled.connect("toggled", self.__toggled)
+
+        reset = Button(_("_Reset"), Icons.EDIT_CLEAR)
+        reset.connect("clicked", self.__reset)
+        close = Button(_("_Close"), Icons.WINDOW_CLOSE)
+        close.connect("clicked", lambda *x: self.destroy())
+
+        bbox = Gtk.HBox(spacing=6)
+        bbox.pack_start(enabled, False, True, 0)
+        bbox.pack_end(close, False, True, 0)
+        bbox.pack_end(reset, False, True, 0)
+
+        vbox = Gtk.VBox(spacing=12)
+        vbox.pack_start(notebook, True, True, 0)
+        vbox.pack_start(bbox, False, True, 0)
+        self.add(vbox)
+
+        self._refresh()
+        self._timeout_id = GLib.timeout_add_seconds(1, self._refresh)
+        self.connect("destroy", self.__destroy)
+        self.get_child().show_all()
+
+    def _refresh(self):
+        snapshot = perf.snapshot()
+        rows = []
+        for name, values in sorted(snapshot["histograms"].items()):
+            rows.append([name, str(values["count"])] +
+                        [_format_ms(values[key])
+                         for title, key in self.COLUMNS[2:]])
+        empty = [""] * (len(self.COLUMNS) - 2)
+        for name, value in sorted(snapshot["counters"].items()):
+            rows.append([name, str(value)] + empty)
+
+        self._model.clear()
+        for row in rows:
+            self._model.append(row=row)
+
+        self._plugins_model.clear()
+        for stat in events.get_stats():
+            row = [stat["plugin"], stat["event"], str(stat["count"])]
+            row.extend(_format_ms(stat[key])
+                       for title, key in self.PLUGIN_COLUMNS[3:])
+            self._plugins_model.append(row=row)
+
+        self._tasks_model.clear()
+        for task in get_tasks():
+            task["age"] = _format_ms(task["age"])
+            self._tasks_model.append(
+                row=[str(task[key]) for title, key in self.TASK_COLUMNS])
+        return True
+
+    def __toggled(self, button):
+        if button.get_active():
+            perf.enable()
+        else:
+            # keep a --perf-log open for when it gets ticked again
+            perf.pause()
+
+    def __reset(self, *args):
+        perf.reset()
+        events.reset_stats()
+        self._refresh()
+
+    def __destroy(self, *args):
+        GLib.source_remove(self._timeout_id)
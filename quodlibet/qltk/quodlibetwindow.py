@@ -53,10 +53,12 @@ from quodlibet.qltk.x import ToggleAction, RadioAction, HighlightToggleButton
 from quodlibet.qltk.x import SeparatorMenuItem, MenuItem
 from quodlibet.qltk import Icons
 from quodlibet.qltk.about import AboutDialog
+from quodlibet.qltk.perfwindow import PerformanceWindow
 from quodlibet.util import copool, connect_destroy, connect_after_destroy
 from quodlibet.util.library import get_scan_dirs
 from quodlibet.util import connect_obj, print_d
 from quodlibet.util.library import background_filter, scan_library
+from quodlibet.util.cover.backfill import backfill_covers
 from quodlibet.util.path import uri_is_valid
 from quodlibet.qltk.window import PersistentWindowMixin, Window, on_first_map
 from quodlibet.qltk.songlistcolumns import CurrentColumn
@@ -406,6 +408,7 @@ MENU = """
       <menuitem action='Plugins' always-show-image='true'/>
       <separator/>
       <menuitem action='RefreshLibrary' always-show-image='true'/>
+      <menuitem action='FetchCovers' always-show-image='true'/>
       <separator/>
       <menuitem action='Quit' always-show-image='true'/>
     </menu>
@@ -443,6 +446,7 @@ MENU = """
       <menuitem action='SearchHelp' always-show-image='true'/>
       <separator/>
       <menuitem action='CheckUpdates' always-show-image='true'/>
+      <menuitem action='Performance' always-show-image='true'/>
       <menuitem action='About' always-show-image='true'/>
     </menu>
 
@@ -986,12 +990,23 @@ class QuodLibetWindow(Window, PersistentWindowMixin, AppWindow):
         act.connect('activate', check_updates_handler)
         ag.add_action_with_accel(act, None)
 
+        act = Action(name="Performance", label=_("_Performance"),
+                     icon_name=Icons.UTILITIES_SYSTEM_MONITOR)
+        act.connect('activate', lambda *args: PerformanceWindow(self))
+        ag.add_action_with_accel(act, None)
+
         act = Action(
             name="RefreshLibrary", label=_("_Scan Library"),
             icon_name=Icons.VIEW_REFRESH)
         act.connect('activate', self.__rebuild, False)
         ag.add_action_with_accel(act, "<Primary>R")
 
+        act = Action(
+            name="FetchCovers", label=_("Fetch Missing _Covers"),
+            icon_name=Icons.EMBLEM_DOWNLOADS)
+        act.connect('activate', self.__fetch_covers)
+        ag.add_action_with_accel(act, None)
+
         current = config.get("memory", "browser")
         try:
             browsers.get(current)
@@ -1050,6 +1065,9 @@ class QuodLibetWindow(Window, PersistentWindowMixin, AppWindow):
         # attach them.
         ui.get_widget("/Menu/File/RefreshLibrary").set_tooltip_text(
             _("Check for changes in your library"))
+        ui.get_widget("/Menu/File/FetchCovers").set_tooltip_text(
+            _("Download covers for albums without one, using the enabled "
+              "cover source plugins"))
 
         return ui
 
@@ -1261,6 +1279,9 @@ class QuodLibetWindow(Window, PersistentWindowMixin, AppWindow):
     def __rebuild(self, activator, force):
         scan_library(self.__library, force)
 
+    def __fetch_covers(self, activator):
+        backfill_covers(self.__library, app.cover_manager)
+
     # Set up the preferences window.
     def __preferences(self, activator):
         window = PreferencesWindow(self)
@@ -34,7 +34,7 @@ from quodlibet.qltk.delete import trash_songs
 from quodlibet.formats._audio import TAG_TO_SORT, AudioFile
 from quodlibet.qltk.x import SeparatorMenuItem
 from quodlibet.qltk.songlistcolumns import create_songlist_column, SongListColumn
-from quodlibet.util import connect_destroy
+from quodlibet.util import connect_destroy, perf
 
 DND_QL, DND_URI_LIST = range(2)
 
@@ -836,8 +836,9 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll, util.InstanceTracker):
         if scroll_select:
             restore_song = self.get_first_selected_song()
 
-        with self.without_model() as model:
-            model.set(songs)
+        with perf.span("songlist.fill", songs=len(songs)):
+            with self.without_model() as model:
+                model.set(songs)
 
         # scroll to the first selected or current song and restore
         # selection for the first selected item if there was one
@@ -7,7 +7,9 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-from gi.repository import Gtk
+from itertools import islice
+
+from gi.repository import Gtk, GObject
 
 from quodlibet.qltk.playorder import OrderInOrder
 from quodlibet.qltk.models import ObjectStore
@@ -28,10 +30,22 @@ class PlaylistMux:
         self._id = player.connect('song-started', self.__song_started)
         self._player = player
 
+        self.__upcoming = None
+        self.__model_sigs = []
+        for model in (q, pl):
+            for sig in ['row-deleted', 'row-inserted', 'rows-reordered',
+                        'order-changed']:
+                s = model.connect(sig, self.__forget_upcoming)
+                self.__model_sigs.append((model, s))
+
     def destroy(self):
         self._player.disconnect(self._id)
+        for model, s in self.__model_sigs:
+            model.disconnect(s)
+        del self.__model_sigs[:]
 
     def __song_started(self, player, song):
+        self.__upcoming = None
         if song is not None and self.q.sourced:
             iter = self.q.find(song)
             keep_song = config.getboolean("memory", "queue_keep_songs", False)
@@ -40,6 +54,9 @@ class PlaylistMux:
                 # we don't call _check_sourced here since we want the queue
                 # to stay sourced even if no current song is left
 
+    def __forget_upcoming(self, *args):
+        self.__upcoming = None
+
     @property
     def current(self):
         """The current song or None"""
@@ -91,6 +108,49 @@ class PlaylistMux:
             self.q.next_ended()
         self._check_sourced()
 
+    def peek_next_ended(self):
+        """The song next_ended() will switch to, or None if there is none
+        or it can't be predicted.
+
+        Doesn't change the state of the models.
+        """
+
+        keep_songs = config.getboolean("memory", "queue_keep_songs", False)
+        q_disable = config.getboolean("memory", "queue_disable", False)
+
+        if (self.q.is_empty()
+                or q_disable
+                or (keep_songs and not self.q.sourced)):
+            if q_disable and self.q.sourced:
+                return None
+            return self.pl.peek_next_ended()
+        return self.q.peek_next_ended()
+
+    def get_upcoming(self, count):
+        """Up to `count` songs likely to be played next: the next one and
+        the start of the queue, without duplicates.
+
+        The result is kept until the next song starts or the models change,
+        so everything preparing for upcoming songs can share it.
+        """
+
+        cached = self.__upcoming
+        if cached is None or cached[0] < count:
+            songs = [self.peek_next_ended()]
+            songs.extend(islice(self.q.itervalues(), count))
+            upcoming = []
+            for song in songs:
+                if song is not None and song not in upcoming:
+                    upcoming.append(song)
+            cached = self.__upcoming = (count, upcoming)
+        return cached[1][:count]
+
+    @property
+    def models(self):
+        """The models which can affect which song is played next"""
+
+        return [self.q, self.pl]
+
     def previous(self):
         """Go to the previous song"""
 
@@ -244,8 +304,12 @@ class TrackCurrentModel(ObjectStore):
 class PlaylistModel(TrackCurrentModel):
     """A play list model for song lists"""
 
-    order = None
-    """The active `PlayOrder`"""
+    __gsignals__ = {
+        # emitted when a new play order gets set
+        'order-changed': (GObject.SignalFlags.RUN_LAST, None, ()),
+    }
+
+    _order = None
 
     sourced = False
     """True in case this model is the source of the currently playing song"""
@@ -261,6 +325,30 @@ class PlaylistModel(TrackCurrentModel):
             s = self.connect(sig, lambda pl, *x: self.order.reset(pl))
             self.__sigs.append(s)
 
+    @property
+    def order(self):
+        """The active `PlayOrder`"""
+
+        return self._order
+
+    @order.setter
+    def order(self, order):
+        if order is self._order:
+            return
+        self._order = order
+        self.emit("order-changed")
+
+    def peek_next_ended(self):
+        """The song next_ended() will switch to, or None if there is none
+        or the play order can't predict it.
+        """
+
+        order = self.order
+        if not order.can_peek:
+            return None
+        iter_ = order.peek_next_implicit(self, self.current_iter)
+        return iter_ and self.get_value(iter_, 0)
+
     def next(self):
         """Switch to the next song"""
 
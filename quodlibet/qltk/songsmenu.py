@@ -258,6 +258,10 @@ class SongsMenuPluginHandler(PluginHandler):
 
     def plugin_disable(self, plugin):
         self.__plugins.remove(plugin.cls)
+        try:
+            plugin.cls.plugin_disabled()
+        except Exception:
+            errorhook()
 
 
 class SongsMenu(Gtk.Menu):
@@ -19,7 +19,7 @@ from quodlibet.util.dprint import print_d
 
 from quodlibet import util
 from quodlibet.util import print_w
-from quodlibet.util.thread import call_async, Cancellable
+from quodlibet.util.thread import call_async, Cancellable, LANE_NETWORK
 from quodlibet.qltk import add_css, is_accel, gtk_version
 
 from .paned import Paned, RPaned, RHPaned, RVPaned, ConfigRPaned, \
@@ -445,7 +445,8 @@ class WebImage(Gtk.Image):
         super().__init__()
 
         self._cancel = Cancellable()
-        call_async(self._fetch_image, self._cancel, self._finished, (url,))
+        call_async(self._fetch_image, self._cancel, self._finished, (url,),
+                   lane=LANE_NETWORK)
         self.connect("destroy", self._on_destroy)
         self.set_size_request(width, height)
         self.set_from_icon_name("image-loading", Gtk.IconSize.BUTTON)
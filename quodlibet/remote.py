@@ -9,9 +9,9 @@
 import os
 from typing import Type
 
-from senf import path2fsn, fsn2bytes, bytes2fsn, fsnative
+from senf import path2fsn, fsn2bytes, bytes2fsn, fsnative, fsn2text
 
-from quodlibet.util import fifo, print_w
+from quodlibet.util import fifo, ctlsocket, print_w
 from quodlibet import get_user_dir
 try:
     from quodlibet.util import winpipe
@@ -115,11 +115,18 @@ class QuodLibetUnixRemote(RemoteBase):
 
     _FIFO_NAME = "control"
     _PATH = os.path.join(get_user_dir(), _FIFO_NAME)
+    _SOCKET_PATH = os.path.join(get_user_dir(), "control.sock")
+
+    EVENTS = ["song-started", "paused", "unpaused", "seek", "volume"]
+    """Events clients of the control socket can subscribe to"""
 
     def __init__(self, app, cmd_registry):
         self._app = app
         self._cmd_registry = cmd_registry
         self._fifo = fifo.FIFO(self._PATH, self._callback)
+        self._server = ctlsocket.ControlSocketServer(
+            self._SOCKET_PATH, self._run_command, self.EVENTS)
+        self._player_ids = []
 
     @classmethod
     def remote_exists(cls):
@@ -129,6 +136,25 @@ class QuodLibetUnixRemote(RemoteBase):
     def send_message(cls, message):
         assert isinstance(message, fsnative)
 
+        # Prefer the socket, it doesn't need a reply FIFO per message
+        command, *args = message.split(" ", 1)
+        try:
+            client = ctlsocket.ControlSocketClient(cls._SOCKET_PATH)
+        except ctlsocket.ControlSocketError:
+            # no socket, use the FIFO
+            pass
+        else:
+            # once sent, the command must not be sent again over the FIFO
+            with client:
+                try:
+                    response = client.call(command, *args)
+                except ctlsocket.CommandFailed as e:
+                    print_w(str(e))
+                    response = None
+                except ctlsocket.ControlSocketError as e:
+                    raise RemoteError(e)
+            return fsn2bytes(response, None) if response is not None else b""
+
         try:
             return fifo.write_fifo(cls._PATH, fsn2bytes(message, None))
         except fifo.FIFOError as e:
@@ -140,9 +166,49 @@ class QuodLibetUnixRemote(RemoteBase):
         except fifo.FIFOError as e:
             raise RemoteError(e)
 
+        try:
+            self._server.start()
+        except ctlsocket.ControlSocketError as e:
+            print_w("Couldn't create control socket: %s" % e)
+        else:
+            self._connect_player()
+
     def stop(self):
+        player = self._app and self._app.player
+        for id_ in self._player_ids:
+            player.disconnect(id_)
+        self._player_ids = []
+        self._server.stop()
         self._fifo.destroy()
 
+    def _run_command(self, command, args):
+        return self._cmd_registry.run(self._app, command, *args)
+
+    def _connect_player(self):
+        player = self._app and self._app.player
+        if player is None:
+            return
+
+        broadcast = self._server.broadcast
+
+        def song_started(player, song):
+            data = None
+            if song is not None:
+                data = {key: song.comma(key)
+                        for key in ["title", "artist", "album"]}
+                data["filename"] = fsn2text(song("~filename"))
+            broadcast("song-started", {"song": data})
+
+        self._player_ids = [
+            player.connect("song-started", song_started),
+            player.connect("paused", lambda p: broadcast("paused")),
+            player.connect("unpaused", lambda p: broadcast("unpaused")),
+            player.connect("seek", lambda p, song, ms:
+                           broadcast("seek", {"position": ms})),
+            player.connect("notify::volume", lambda p, param:
+                           broadcast("volume", {"volume": p.volume})),
+        ]
+
     def _callback(self, data):
         try:
             messages = list(fifo.split_message(data))
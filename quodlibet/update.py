@@ -27,7 +27,7 @@ from quodlibet.build import BUILD_TYPE
 from quodlibet.qltk.window import Dialog
 from quodlibet.util.dprint import print_exc
 from quodlibet.util import escape
-from quodlibet.util.thread import call_async, Cancellable
+from quodlibet.util.thread import call_async, Cancellable, LANE_NETWORK
 
 
 class UpdateError(Exception):
@@ -116,7 +116,8 @@ class UpdateDialog(Dialog):
 
         cancel = Cancellable()
         self.connect("response", self._on_response, cancel)
-        call_async(do_fetch_versions, cancel, self._on_result)
+        call_async(do_fetch_versions, cancel, self._on_result,
+                   lane=LANE_NETWORK)
 
         return super().run()
 
@@ -7,16 +7,36 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-"""Manage a pool of routines using Python iterators."""
+"""Manage a pool of routines using Python iterators.
+
+Routines without a timeout don't get an idle source each. Instead all
+routines of the same priority share one, which steps them round-robin,
+each for an equal share of a time budget per main loop iteration. Routines
+which yield often are no longer slowed down by main loop overhead, and
+routines which yield rarely can't starve the others.
+"""
+
+import collections
+import time
 
 from gi.repository import GLib
 
+from quodlibet.util import perf
+from quodlibet.util.dprint import print_exc
+
 
 class _Routine:
 
     def __init__(self, pool, func, funcid, priority, timeout, args, kwargs):
         self.priority = priority
         self.timeout = timeout
+        self.funcid = funcid
+        self.name = getattr(func, "__qualname__", None) or repr(func)
+        self.cpu_time = 0.0
+        """CPU time spent in the routine so far, in seconds"""
+        self.steps = 0
+        self._pool = pool
+        self._active = False
         self._source_id = None
 
         def wrap(func, funcid, args, kwargs):
@@ -32,12 +52,43 @@ class _Routine:
     def paused(self):
         """If the routine is currently running"""
 
-        return self._source_id is None
+        return not self._active
 
     def step(self):
         """Raises StopIteration if the routine has nothing more to do"""
 
-        return self.source_func()
+        return self.run(0)
+
+    def run(self, end):
+        """Steps until `end` (in time.perf_counter() time) has passed, but
+        at least once.
+
+        Returns False if the routine has finished.
+        """
+
+        clock = time.perf_counter
+        cpu_start = time.thread_time()
+        try:
+            while True:
+                if not self.source_func():
+                    return False
+                self.steps += 1
+                if not self._active or clock() >= end:
+                    return True
+        finally:
+            cpu = time.thread_time() - cpu_start
+            self.cpu_time += cpu
+            perf.record("copool." + self.name, cpu)
+
+    def _run_timeout(self):
+        source_id = self._source_id
+        try:
+            self.run(0)
+        except Exception:
+            self._pool._discard(self)
+            print_exc()
+        # in case the routine got paused, removed or restarted meanwhile
+        return self._source_id == source_id
 
     def resume(self):
         """Resume, if already running do nothing"""
@@ -45,12 +96,12 @@ class _Routine:
         if not self.paused:
             return
 
+        self._active = True
         if self.timeout:
             self._source_id = GLib.timeout_add(
-                self.timeout, self.source_func, priority=self.priority)
+                self.timeout, self._run_timeout, priority=self.priority)
         else:
-            self._source_id = GLib.idle_add(
-                self.source_func, priority=self.priority)
+            self._pool._get_scheduler(self.priority).add(self)
 
     def pause(self):
         """Pause, if already paused, do nothing"""
@@ -58,14 +109,71 @@ class _Routine:
         if self.paused:
             return
 
-        GLib.source_remove(self._source_id)
+        self._active = False
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+        else:
+            self._pool._get_scheduler(self.priority).remove(self)
+
+
+class _Scheduler:
+    """Steps all running idle routines of one priority"""
+
+    def __init__(self, pool, priority):
+        self._pool = pool
+        self._priority = priority
+        self._routines = collections.deque()
         self._source_id = None
 
+    def add(self, routine):
+        self._routines.append(routine)
+        if self._source_id is None:
+            self._source_id = GLib.idle_add(
+                self._dispatch, priority=self._priority)
+
+    def remove(self, routine):
+        # the idle source stops itself once there is nothing left to do
+        try:
+            self._routines.remove(routine)
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        routines = self._routines
+        clock = time.perf_counter
+        now = clock()
+        deadline = now + self._pool.budget
+        share = self._pool.budget / max(len(routines), 1)
+
+        while routines:
+            routine = routines[0]
+            routines.rotate(-1)
+            try:
+                routine.run(min(now + share, deadline))
+            except Exception:
+                self._pool._discard(routine)
+                print_exc()
+            now = clock()
+            if now >= deadline:
+                break
+
+        if routines:
+            return True
+        self._source_id = None
+        return False
+
 
 class CoPool:
 
-    def __init__(self):
+    DEFAULT_BUDGET = 0.008
+    """Time in seconds to spend on each main loop iteration, shared by all
+    routines of the same priority (half a frame at 60Hz)"""
+
+    def __init__(self, budget=DEFAULT_BUDGET):
         self.__routines = {}
+        self.__schedulers = {}
+        self.budget = budget
 
     def add(self, func, *args, **kwargs):
         """Register a routine to run in GLib main loop.
@@ -96,6 +204,20 @@ class CoPool:
         self.__routines[funcid] = routine
         routine.resume()
 
+    def _get_scheduler(self, priority):
+        scheduler = self.__schedulers.get(priority)
+        if scheduler is None:
+            scheduler = self.__schedulers[priority] = _Scheduler(
+                self, priority)
+        return scheduler
+
+    def _discard(self, routine):
+        """Removes a routine, if it is still registered"""
+
+        routine.pause()
+        if self.__routines.get(routine.funcid) is routine:
+            del self.__routines[routine.funcid]
+
     def _get(self, funcid):
         if funcid in self.__routines:
             return self.__routines[funcid]
@@ -138,6 +260,22 @@ class CoPool:
         routine = self._get(funcid)
         return routine.step()
 
+    def set_budget(self, budget):
+        """Set the time in seconds spent per main loop iteration"""
+
+        self.budget = budget
+
+    def get_stats(self):
+        """Returns a list of dicts, one for each registered routine,
+        containing its name, the CPU time spent in it in seconds, the
+        number of steps done and if it is paused."""
+
+        return [{"name": routine.name,
+                 "cpu_time": routine.cpu_time,
+                 "steps": routine.steps,
+                 "paused": routine.paused}
+                for routine in self.__routines.values()]
+
 
 # global instance
 
@@ -150,3 +288,5 @@ remove = _copool.remove
 remove_all = _copool.remove_all
 resume = _copool.resume
 step = _copool.step
+set_budget = _copool.set_budget
+get_stats = _copool.get_stats
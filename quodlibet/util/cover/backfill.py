@@ -0,0 +1,352 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Fetching covers for all albums in the library which don't have one,
+using the enabled online cover sources."""
+
+import json
+import os
+import time
+from hashlib import sha1
+
+from gi.repository import GObject, GLib, Gio
+
+import quodlibet
+from quodlibet import _
+from quodlibet.util import print_d, print_w
+from quodlibet.util.atomic import atomic_save
+from quodlibet.util.thread import call_async, disk_lane
+
+
+def get_album_id(song):
+    """A stable identifier for the album of `song`"""
+
+    return sha1(repr(song.album_key).encode("utf-8")).hexdigest()
+
+
+class CoverLedger:
+    """The persisted outcome of past backfill runs, so a stopped or
+    interrupted run can continue where it left off.
+
+    Albums are either "local" (had a cover already), "found" or "missing".
+    """
+
+    RETRY_AFTER = 30 * 24 * 60 * 60
+    """Seconds after which albums without a cover get tried again"""
+
+    def __init__(self, path):
+        self._path = path
+        self._albums = {}
+        try:
+            with open(path, "rb") as h:
+                self._albums = json.loads(h.read().decode("utf-8"))["albums"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print_w("Couldn't read cover ledger %r (%s)" % (path, e))
+
+    def get(self, album_id):
+        """Returns the status or None"""
+
+        entry = self._albums.get(album_id)
+        return entry["status"] if entry else None
+
+    def is_done(self, album_id, now=None):
+        entry = self._albums.get(album_id)
+        if entry is None:
+            return False
+        if entry["status"] != "missing":
+            return True
+        now = time.time() if now is None else now
+        return now - entry["time"] < self.RETRY_AFTER
+
+    def set(self, album_id, status, source=None, now=None):
+        self._albums[album_id] = {
+            "status": status,
+            "source": source,
+            "time": time.time() if now is None else now,
+        }
+
+    def clear(self):
+        self._albums.clear()
+
+    def __len__(self):
+        return len(self._albums)
+
+    def save(self):
+        data = json.dumps({"version": 1, "albums": self._albums})
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with atomic_save(self._path, "wb") as h:
+                h.write(data.encode("utf-8"))
+        except OSError as e:
+            print_w("Couldn't save cover ledger (%s)" % e)
+
+
+def get_ledger_path():
+    return os.path.join(quodlibet.get_cache_dir(), "cover_backfill.json")
+
+
+def _has_cover(manager, song):
+    fileobj = manager.acquire_cover_sync(song)
+    if fileobj is None:
+        return False
+    fileobj.close()
+    return True
+
+
+class CoverBackfill(GObject.Object):
+    """Fetches covers for all albums of `songs` which have neither a
+    local nor an already downloaded cover.
+
+    Up to `max_albums` albums are handled at the same time, each trying
+    the online sources by priority. A source gets started at most once
+    every `interval` seconds (on top of the per-host HTTP rate limits).
+    Covers get saved by the sources themselves, like when fetched
+    interactively.
+
+    With `show_progress` a stoppable task is shown in the main window,
+    without it nothing but a GLib main loop is needed.
+    """
+
+    __gsignals__ = {
+        # (done, total)
+        'progress': (GObject.SignalFlags.RUN_LAST, None, (int, int)),
+        # (found, missing)
+        'finished': (GObject.SignalFlags.RUN_LAST, None, (int, int)),
+    }
+
+    SAVE_EVERY = 20
+    """Albums after which the ledger gets saved"""
+
+    TIMEOUT = 60
+    """Seconds after which a source is considered to have failed"""
+
+    def __init__(self, manager, songs, ledger=None, max_albums=3,
+                 interval=1.0, show_progress=True):
+        super().__init__()
+        self._manager = manager
+        self._ledger = ledger if ledger is not None else \
+            CoverLedger(get_ledger_path())
+        self._max_albums = max_albums
+        self._interval = interval
+        self._show_progress = show_progress
+        self._cancellable = Gio.Cancellable()
+        self._next_start = {}
+        self._timeouts = set()
+        self._active = 0
+        self._done = 0
+        self._unsaved = 0
+        self._found = 0
+        self._missing = 0
+        self._task = None
+        self._running = False
+
+        albums = {}
+        for song in songs:
+            if song.is_file and song("album"):
+                albums.setdefault(get_album_id(song), []).append(song)
+        self._total = len(albums)
+        self._pending = []
+        for album_id, group in sorted(albums.items()):
+            if self._ledger.is_done(album_id):
+                self._done += 1
+            else:
+                song = sorted(group, key=lambda s: s.key)[0]
+                self._pending.append((album_id, song, group))
+        self._pending.reverse()
+
+    @property
+    def is_running(self):
+        return self._running
+
+    def get_sources(self):
+        """The enabled online sources, by priority"""
+
+        built_in = self._manager.plugin_handler.built_in
+        return [s for s in self._manager.sources
+                if not s.embedded and s not in built_in]
+
+    def start(self):
+        sources = self.get_sources()
+        print_d("Backfilling covers for %d of %d albums using %s"
+                % (len(self._pending), self._total,
+                   ", ".join(s.__name__ for s in sources) or "nothing"))
+        self._sources = sources
+        self._running = True
+        if self._show_progress:
+            from quodlibet.qltk.notif import Task
+            self._task = Task(_("Cover Art"), _("Fetching missing covers"),
+                              stop=self.stop)
+        if not sources:
+            print_w("No online cover sources enabled")
+            self._pending = []
+        self._fill()
+
+    def stop(self):
+        if not self._running:
+            return
+        print_d("Stopping cover backfill")
+        self._cancellable.cancel()
+        for source_id in self._timeouts:
+            GLib.source_remove(source_id)
+        self._timeouts.clear()
+        self._pending = []
+        self._active = 0
+        self._finish()
+
+    def _finish(self):
+        self._running = False
+        self._ledger.save()
+        if self._task is not None:
+            self._task.finish()
+            self._task = None
+        print_d("Cover backfill done: %d found, %d missing"
+                % (self._found, self._missing))
+        self.emit("finished", self._found, self._missing)
+
+    def _fill(self):
+        while self._pending and self._active < self._max_albums:
+            album_id, song, group = self._pending.pop()
+            self._active += 1
+
+            def checked(has_cover, album_id=album_id, song=song, group=group):
+                if has_cover:
+                    self._album_done(album_id, "local")
+                else:
+                    self._try_source(album_id, song, group, 0)
+
+            call_async(_has_cover, self._cancellable, checked,
+                       args=(self._manager, song),
+                       lane=disk_lane(song("~filename"),
+                                      song.get("~mountpoint")))
+        if not self._active and self._running:
+            self._finish()
+
+    def _add_timeout(self, seconds, func, *args):
+        def run():
+            self._timeouts.discard(source_id)
+            func(*args)
+            return False
+
+        source_id = GLib.timeout_add(int(seconds * 1000), run)
+        self._timeouts.add(source_id)
+        return source_id
+
+    def _reserve(self, source):
+        """Returns the seconds to wait before `source` can be used"""
+
+        now = time.monotonic()
+        start = max(now, self._next_start.get(source, now))
+        self._next_start[source] = start + self._interval
+        return start - now
+
+    def _try_source(self, album_id, song, group, index):
+        if not self._running:
+            return
+        if index >= len(self._sources):
+            self._album_done(album_id, "missing")
+            return
+        delay = self._reserve(self._sources[index])
+        if delay > 0:
+            self._add_timeout(delay, self._fetch, album_id, song, group, index)
+        else:
+            self._fetch(album_id, song, group, index)
+
+    def _fetch(self, album_id, song, group, index):
+        source = self._sources[index]
+        provider = source(song, self._cancellable)
+        done = []
+
+        def finish(provider, result, success):
+            if done:
+                return
+            done.append(True)
+            if timeout in self._timeouts:
+                GLib.source_remove(timeout)
+                self._timeouts.discard(timeout)
+            if self._cancellable.is_cancelled():
+                return
+            if success:
+                print_d("Got cover for %r from %s"
+                        % (song("album"), source.__name__))
+                self._manager.cover_changed(group)
+                self._album_done(album_id, "found", source.__name__)
+            else:
+                print_d("No cover for %r from %s (%s)"
+                        % (song("album"), source.__name__, result))
+                self._try_source(album_id, song, group, index + 1)
+
+        provider.connect("fetch-success", finish, True)
+        provider.connect("fetch-failure", finish, False)
+        timeout = self._add_timeout(
+            self.TIMEOUT, finish, provider, "timed out", False)
+        provider.fetch_cover()
+
+    def _album_done(self, album_id, status, source=None):
+        self._ledger.set(album_id, status, source)
+        if status == "found":
+            self._found += 1
+        elif status == "missing":
+            self._missing += 1
+        self._active -= 1
+        self._done += 1
+        self._unsaved += 1
+        if self._unsaved >= self.SAVE_EVERY:
+            self._ledger.save()
+            self._unsaved = 0
+        if self._task is not None:
+            self._task.update(self._done / self._total)
+        self.emit("progress", self._done, self._total)
+        self._fill()
+
+
+_backfill = None
+
+
+def backfill_covers(library, manager):
+    """Starts fetching missing covers for all songs in `library`,
+    unless already running.
+
+    Returns:
+        CoverBackfill: the running job
+    """
+
+    global _backfill
+
+    if _backfill is None or not _backfill.is_running:
+        _backfill = CoverBackfill(manager, library.values())
+        _backfill.start()
+    return _backfill
+
+
+def fetch_covers(library, manager, ledger=None):
+    """Fetches missing covers for all songs in `library` without a
+    running player, blocking until done or stopped by a signal.
+
+    Returns:
+        Tuple[int, int]: the number of albums found and still missing
+    """
+
+    loop = GLib.MainLoop()
+    job = CoverBackfill(manager, library.values(), ledger=ledger,
+                        show_progress=False)
+    result = [(0, 0)]
+
+    def finished(job, found, missing):
+        result[0] = (found, missing)
+        loop.quit()
+
+    def progress(job, done, total):
+        print_d("Fetched covers for %d/%d albums" % (done, total))
+
+    job.connect("finished", finished)
+    job.connect("progress", progress)
+    job.start()
+    if job.is_running:
+        from quodlibet.qltk import add_signal_watch
+        add_signal_watch(job.stop)
+        loop.run()
+    return result[0]
@@ -15,8 +15,8 @@ from quodlibet.formats import AudioFile
 from quodlibet.plugins import PluginManager, PluginHandler
 from quodlibet.qltk.notif import Task
 from quodlibet.util.cover import built_in
-from quodlibet.util import print_d
-from quodlibet.util.thread import call_async
+from quodlibet.util import print_d, perf
+from quodlibet.util.thread import call_async, disk_lane
 from quodlibet.util.thumbnails import get_thumbnail_from_file
 from quodlibet.plugins.cover import CoverSourcePlugin
 
@@ -185,7 +185,8 @@ class CoverManager(GObject.Object):
         It tries to return the same cover for the same set of songs.
         """
 
-        return self.acquire_cover_sync_many(songs)
+        with perf.span("cover.lookup"):
+            return self.acquire_cover_sync_many(songs)
 
     def get_pixbuf_many(self, songs, width, height):
         """Returns a Pixbuf which fits into the boundary defined by width
@@ -198,7 +199,8 @@ class CoverManager(GObject.Object):
         if fileobj is None:
             return
 
-        return get_thumbnail_from_file(fileobj, (width, height))
+        with perf.span("cover.load"):
+            return get_thumbnail_from_file(fileobj, (width, height))
 
     def get_pixbuf(self, song, width, height):
         """see get_pixbuf_many()"""
@@ -217,7 +219,9 @@ class CoverManager(GObject.Object):
             return
 
         call_async(get_thumbnail_from_file, cancel, callback,
-                   args=(fileobj, (width, height)))
+                   args=(fileobj, (width, height)),
+                   lane=disk_lane(fileobj.name),
+                   key=(fileobj.name, width, height))
 
     def search_cover(self, cancellable, songs):
         """Search for all the covers applicable to `songs` across all providers
@@ -0,0 +1,400 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""A Unix domain socket for controlling a running instance.
+
+Clients keep the connection open and send one JSON object per line,
+without having to wait for the previous response::
+
+    {"id": 1, "command": "status", "args": []}
+    {"id": 2, "subscribe": ["song-started", "paused"]}
+
+Each request gets answered in order, with the id of the request::
+
+    {"id": 1, "result": "playing ..."}
+    {"id": 2, "error": "Unknown event 'foo'"}
+
+After subscribing, events are sent as they happen::
+
+    {"event": "paused", "data": {}}
+
+The client side doesn't need a main loop, so it can be used without
+importing GTK.
+"""
+
+import errno
+import json
+import os
+import socket
+import stat
+
+from quodlibet.util.dprint import print_d, print_w
+
+SOCKET_TIMEOUT = 10
+"""time in seconds until the client gives up waiting for a response"""
+
+MAX_LINE = 1024 * 1024
+"""Connections sending longer lines get closed"""
+
+
+class ControlSocketError(Exception):
+    pass
+
+
+class CommandFailed(ControlSocketError):
+    """The instance returned an error for a command"""
+
+
+def _connect(path, timeout):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def socket_exists(path):
+    """Returns whether something is listening on the socket at `path`.
+
+    Args:
+        path (pathlike)
+    Returns:
+        bool
+    """
+
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return False
+        _connect(path, SOCKET_TIMEOUT).close()
+    except OSError:
+        return False
+    return True
+
+
+class ControlSocketClient:
+    """A connection to a running ControlSocketServer.
+
+    Raises:
+        ControlSocketError: in case there is nothing listening
+    """
+
+    def __init__(self, path, timeout=SOCKET_TIMEOUT):
+        try:
+            self._sock = _connect(path, timeout)
+        except OSError as e:
+            raise ControlSocketError(e)
+        self._file = self._sock.makefile("rb")
+        self._next_id = 0
+        self._events = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def _send(self, request):
+        self._next_id += 1
+        request["id"] = self._next_id
+        data = json.dumps(request).encode("utf-8") + b"\n"
+        try:
+            self._sock.sendall(data)
+        except OSError as e:
+            raise ControlSocketError(e)
+        return self._next_id
+
+    def send(self, command, *args):
+        """Queues a command without waiting for the response.
+
+        Returns:
+            int: the id of the response
+        """
+
+        return self._send({"command": command, "args": list(args)})
+
+    def subscribe(self, *events):
+        """Subscribes to events, see read() and events()
+
+        Returns:
+            int: the id of the response
+        """
+
+        return self._send({"subscribe": list(events)})
+
+    def read(self):
+        """Returns the next response or event.
+
+        Returns:
+            dict
+        Raises:
+            ControlSocketError
+        """
+
+        if self._events:
+            return self._events.pop(0)
+
+        try:
+            line = self._file.readline()
+        except OSError as e:
+            raise ControlSocketError(e)
+        if not line:
+            raise ControlSocketError("Connection closed")
+        try:
+            return json.loads(line.decode("utf-8"))
+        except ValueError as e:
+            raise ControlSocketError(e)
+
+    def wait(self, id_):
+        """Returns the result for the request `id_`, events received in
+        the meantime get returned by later read() calls.
+
+        Raises:
+            CommandFailed: in case the command failed
+            ControlSocketError
+        """
+
+        events = []
+        try:
+            while True:
+                message = self.read()
+                if "event" in message:
+                    events.append(message)
+                elif message.get("id") == id_:
+                    break
+        finally:
+            self._events.extend(events)
+
+        if "error" in message:
+            raise CommandFailed(message["error"])
+        return message.get("result")
+
+    def call(self, command, *args):
+        """Runs a command and returns its result (str or None)"""
+
+        return self.wait(self.send(command, *args))
+
+    def events(self):
+        """Yields (event, data) pairs forever"""
+
+        while True:
+            message = self.read()
+            if "event" in message:
+                yield message["event"], message.get("data", {})
+
+
+class _Connection:
+
+    def __init__(self, server, sock):
+        from gi.repository import GLib
+        from quodlibet import qltk
+
+        self._server = server
+        self._sock = sock
+        self._inbuf = b""
+        self._outbuf = b""
+        self._out_id = None
+        self.subscriptions = set()
+
+        sock.setblocking(False)
+        self._in_id = qltk.io_add_watch(
+            sock.fileno(), GLib.PRIORITY_DEFAULT,
+            GLib.IO_IN | GLib.IO_ERR | GLib.IO_HUP, self._on_read)
+
+    def close(self):
+        from gi.repository import GLib
+
+        for id_ in (self._in_id, self._out_id):
+            if id_ is not None:
+                GLib.source_remove(id_)
+        self._in_id = self._out_id = None
+        self._sock.close()
+        self._server._remove(self)
+
+    def _on_read(self, fd, condition):
+        try:
+            data = self._sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            data = b""
+
+        if not data:
+            self._in_id = None
+            self.close()
+            return False
+
+        self._inbuf += data
+        if len(self._inbuf) > MAX_LINE and b"\n" not in self._inbuf:
+            print_w("Control socket: line too long, closing connection")
+            self._in_id = None
+            self.close()
+            return False
+
+        *lines, self._inbuf = self._inbuf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                self.write(self._server._handle_line(self, line))
+        return True
+
+    def write(self, message):
+        from gi.repository import GLib
+        from quodlibet import qltk
+
+        if self._in_id is None:
+            return
+        data = json.dumps(message).encode("utf-8") + b"\n"
+        self._outbuf += data
+        if self._out_id is None:
+            self._out_id = qltk.io_add_watch(
+                self._sock.fileno(), GLib.PRIORITY_DEFAULT,
+                GLib.IO_OUT | GLib.IO_ERR | GLib.IO_HUP, self._on_write)
+
+    def _on_write(self, fd, condition):
+        try:
+            sent = self._sock.send(self._outbuf)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            self._out_id = None
+            self.close()
+            return False
+
+        self._outbuf = self._outbuf[sent:]
+        if not self._outbuf:
+            self._out_id = None
+            return False
+        return True
+
+
+class ControlSocketServer:
+    """Listens on a Unix domain socket and runs the received commands in
+    the main loop.
+
+    `handler` gets called with the command name and a list of arguments
+    and should return a str or None. Any exception gets returned to the
+    client as an error.
+    """
+
+    def __init__(self, path, handler, events=()):
+        """
+        Args:
+            path (pathlike)
+            handler (Callable[[str, List[str]], Optional[str]])
+            events (Iterable[str]): names of events clients can subscribe to
+        """
+
+        self._path = path
+        self._handler = handler
+        self._events = set(events)
+        self._sock = None
+        self._source_id = None
+        self._connections = []
+
+    def start(self):
+        """Raises ControlSocketError in case another process is
+        already listening."""
+
+        from gi.repository import GLib
+        from quodlibet import qltk
+
+        if socket_exists(self._path):
+            raise ControlSocketError("%r already in use" % self._path)
+        try:
+            os.unlink(self._path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise ControlSocketError(e)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            old_umask = os.umask(0o077)
+            try:
+                sock.bind(self._path)
+            finally:
+                os.umask(old_umask)
+            sock.listen(16)
+        except OSError as e:
+            sock.close()
+            raise ControlSocketError(e)
+        sock.setblocking(False)
+
+        self._sock = sock
+        self._source_id = qltk.io_add_watch(
+            sock.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN, self._on_accept)
+        print_d("Listening on %r" % self._path)
+
+    def stop(self):
+        """Closes all connections. Can be called multiple times."""
+
+        from gi.repository import GLib
+
+        for conn in list(self._connections):
+            conn.close()
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+
+    def _on_accept(self, fd, condition):
+        try:
+            sock, addr = self._sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError as e:
+            print_w("Control socket: %s" % e)
+            return True
+        self._connections.append(_Connection(self, sock))
+        return True
+
+    def _remove(self, conn):
+        if conn in self._connections:
+            self._connections.remove(conn)
+
+    def _handle_line(self, conn, line):
+        try:
+            request = json.loads(line.decode("utf-8"))
+            if not isinstance(request, dict):
+                raise ValueError("not an object")
+        except ValueError as e:
+            return {"id": None, "error": "Invalid request: %s" % e}
+
+        response = {"id": request.get("id")}
+        try:
+            if "subscribe" in request:
+                events = set(request["subscribe"])
+                unknown = events - self._events
+                if unknown:
+                    raise ValueError(
+                        "Unknown event %r" % sorted(unknown)[0])
+                conn.subscriptions |= events
+                response["result"] = None
+            else:
+                args = [str(a) for a in request.get("args", [])]
+                response["result"] = self._handler(
+                    str(request["command"]), args)
+        except Exception as e:
+            response["error"] = str(e) or type(e).__name__
+        return response
+
+    def broadcast(self, event, data=None):
+        """Sends an event to all clients which subscribed to it"""
+
+        message = {"event": event, "data": data or {}}
+        for conn in self._connections:
+            if event in conn.subscriptions:
+                conn.write(message)
@@ -6,14 +6,27 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import gzip
 import json
-from typing import Optional, Any, Callable
+import os
+import threading
+import time
+from http.client import HTTPException
+from typing import Optional, Any, Callable, Dict, Iterator, List, \
+    NamedTuple, Tuple
+from urllib.error import HTTPError
 
 from gi.repository import Soup, Gio, GLib, GObject
 from gi.repository.GObject import ParamFlags, SignalFlags
 
 from quodlibet.const import VERSION, WEBSITE
+import quodlibet
 from quodlibet.util import print_d, print_w
+from quodlibet.util.httpcache import HTTPCache, RateLimiter, ConnectionPool, \
+    count
+from quodlibet.util.thread import call_async, call_async_background, \
+    disk_lane, Cancellable
+from quodlibet.util.urllib import urlopen, Request, UrllibError
 
 PARAM_READWRITECONSTRUCT = \
     ParamFlags.CONSTRUCT_ONLY | ParamFlags.READABLE | ParamFlags.WRITABLE
@@ -158,20 +171,223 @@ class HTTPRequest(GObject.Object):
 
 FailureCallback = Callable[[HTTPRequest, Exception, Any], None]
 
+_cache: Optional[HTTPCache] = None
+_cache_disabled = False
+_limiter = RateLimiter()
+_pool = ConnectionPool()
+_inflight: Dict[str, "_Inflight"] = {}
+_sync_inflight: Dict[str, "_SyncRequest"] = {}
+_sync_lock = threading.Lock()
+
+
+def get_cache() -> Optional[HTTPCache]:
+    """The response cache shared by all requests, None if disabled"""
+
+    global _cache
+
+    if _cache is None and not _cache_disabled:
+        _cache = HTTPCache(os.path.join(quodlibet.get_cache_dir(), "http"))
+    return _cache
+
+
+def set_cache(cache: Optional[HTTPCache]):
+    """Replaces the shared response cache, None disables caching"""
+
+    global _cache, _cache_disabled
+
+    _cache = cache
+    _cache_disabled = cache is None
+
+
+def _get_headers(soup_headers) -> Dict[str, str]:
+    headers = {}
+    soup_headers.foreach(
+        lambda name, value, *x: headers.__setitem__(name.lower(), value),
+        None)
+    return headers
+
+
+def _set_response(message, status, headers, body):
+    message.set_status(status)
+    response_headers = message.get_property('response-headers')
+    for name, value in headers.items():
+        response_headers.replace(name, value)
+    # not stored in the cache or sent with a 304, and for compressed
+    # responses this is the decoded size
+    response_headers.replace("content-length", str(len(body)))
+
+
+def _throttled(uri, func):
+    """Calls `func` right away or once the host rate limit allows it"""
+
+    delay = _limiter.reserve(uri)
+    if delay > 0:
+        count("throttled")
+
+        def timeout():
+            func()
+            return False
+
+        GLib.timeout_add(int(delay * 1000), timeout)
+    else:
+        func()
+
+
+def close_connections():
+    """Closes the idle connections kept by fetch()"""
+
+    _pool.close()
+
+
+def _send(message, cancellable, done, failed):
+    """Sends a request and calls `done` with the body or `failed`
+    with the request and the error"""
+
+    def received(request, ostream):
+        ostream.close(None)
+        done(ostream.steal_as_bytes().get_data())
+
+    def send():
+        count("requests")
+        request = HTTPRequest(message, cancellable)
+        request.provide_target(Gio.MemoryOutputStream.new_resizable())
+        request.connect('received', received)
+        request.connect('sent', lambda r, m: r.receive())
+        request.connect('failure', failed)
+        request.send()
+
+    _throttled(message.get_uri().to_string(False), send)
+
+
+class _Inflight:
+    """A GET request shared by everyone asking for the same response.
+
+    It only gets cancelled once all of them cancelled; until then the
+    ones cancelling are dropped without getting notified.
+    """
+
+    def __init__(self):
+        self.cancellable = Gio.Cancellable()
+        self.waiters: List[Tuple[Soup.Message, Callable, Any, Any]] = []
+
+    def add(self, message, cancellable, callback, data, failure_callback):
+        waiter = (message, callback, data, failure_callback)
+        self.waiters.append(waiter)
+        if cancellable is not None:
+            cancellable.connect(lambda *x: self._cancelled(waiter), None)
+
+    def _cancelled(self, waiter):
+        if waiter not in self.waiters:
+            return
+        if len(self.waiters) > 1:
+            self.waiters.remove(waiter)
+        else:
+            self.cancellable.cancel()
+
+
+def _send_cached(message, cancellable, callback, data, failure_callback):
+    """Sends a GET request using the response cache and merges it with
+    identical requests in flight.
+
+    The cache gets read and written in a thread, entries can be large.
+    """
+
+    uri = message.get_uri().to_string(False)
+    request_headers = message.get_property('request-headers')
+    key = HTTPCache.get_key(uri, request_headers.get_one("Authorization"))
+
+    inflight = _inflight.get(key)
+    # a cancelled one is only waiting to get removed
+    if inflight is not None and not inflight.cancellable.is_cancelled():
+        count("coalesced")
+        inflight.add(message, cancellable, callback, data, failure_callback)
+        return
+    inflight = _inflight[key] = _Inflight()
+    inflight.add(message, cancellable, callback, data, failure_callback)
+
+    cache = get_cache()
+    if cache is None:
+        lane = None
+    else:
+        lane = disk_lane(os.path.join(cache.directory, key))
+
+    def remove():
+        if _inflight.get(key) is inflight:
+            del _inflight[key]
+
+    def finish(status, headers, body):
+        remove()
+        for other, cb, d, fcb in inflight.waiters:
+            _set_response(other, status, headers, body)
+            cb(other, body, d)
+
+    def failed(request, exception):
+        remove()
+        count("errors")
+        for other, cb, d, fcb in inflight.waiters:
+            if fcb:
+                fcb(request, exception, d)
+
+    def looked_up(cached):
+        if inflight.cancellable.is_cancelled():
+            remove()
+            return
+
+        if cached is not None and cached.is_fresh():
+            count("cache-hits")
+            print_d("Using cached response for %s" % uri)
+            finish(cached.status, cached.headers, cached.body)
+            return
+
+        if cached is not None:
+            for name, value in cached.get_validators().items():
+                request_headers.replace(name, value)
+
+        def done(body):
+            status = int(message.get_property('status-code'))
+            headers = _get_headers(message.get_property('response-headers'))
+            if status == Soup.Status.NOT_MODIFIED and cached is not None:
+                count("revalidated")
+                call_async_background(
+                    cache.refresh, Cancellable(), lambda r: None,
+                    args=(key, headers), lane=lane)
+                merged = dict(cached.headers)
+                merged.update(headers)
+                status, headers, body = cached.status, merged, cached.body
+            elif cache is not None:
+                call_async_background(
+                    cache.put, Cancellable(), lambda r: None,
+                    args=(key, status, headers, body), lane=lane)
+            finish(status, headers, body)
+
+        _send(message, inflight.cancellable, done, failed)
+
+    if cache is None:
+        looked_up(None)
+    else:
+        # not cancellable, so the entry in _inflight always gets removed
+        call_async(cache.get, Cancellable(), looked_up, args=(key,),
+                   lane=lane)
+
 
 def download(message: Soup.Message, cancellable: Gio.Cancellable, callback: Callable,
              data: Any, try_decode: bool = False,
              failure_callback: Optional[FailureCallback] = None):
-    def received(request, ostream):
-        ostream.close(None)
-        bs = ostream.steal_as_bytes().get_data()
+    """Downloads the response body into memory.
+
+    GET requests are answered from the response cache where possible and
+    only get sent once while an identical request is in flight.
+    """
+
+    def received(message, bs, data):
         if not try_decode:
             callback(message, bs, data)
             return
         # Otherwise try to decode data
         code = int(message.get_property('status-code'))
         if code >= 400:
-            print_w("HTTP %d error received on %s" % (code, request._uri))
+            print_w("HTTP %d error received on %s"
+                    % (code, message.get_uri().to_string(False)))
             return
         ctype = message.get_property('response-headers').get_content_type()
         encoding = ctype[1].get('charset', 'utf-8')
@@ -180,13 +396,16 @@ def download(message: Soup.Message, cancellable: Gio.Cancellable, callback: Call
         except UnicodeDecodeError:
             callback(message, bs, data)
 
-    request = HTTPRequest(message, cancellable)
-    request.provide_target(Gio.MemoryOutputStream.new_resizable())
-    request.connect('received', received)
-    request.connect('sent', lambda r, m: r.receive())
-    if failure_callback:
-        request.connect('send-failure', failure_callback, data)
-    request.send()
+    if message.method == 'GET':
+        _send_cached(message, cancellable, received, data, failure_callback)
+        return
+
+    def failed(request, exception):
+        count("errors")
+        if failure_callback:
+            failure_callback(request, exception, data)
+
+    _send(message, cancellable, lambda bs: received(message, bs, data), failed)
 
 
 def download_json(message: Soup.Message, cancellable: Gio.Cancellable,
@@ -201,6 +420,163 @@ def download_json(message: Soup.Message, cancellable: Gio.Cancellable,
     download(message, cancellable, cb, None, True, failure_callback=failure_callback)
 
 
+Response = NamedTuple(
+    "Response", [("status", int), ("headers", Dict[str, str]), ("body", bytes)])
+"""A response returned by fetch(), header names are lower case"""
+
+
+class _SyncRequest:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def _urlopen(url, method, data, headers, timeout):
+    headers = dict(headers)
+    headers.setdefault('User-Agent', ua_string)
+    headers['Accept-Encoding'] = 'gzip'
+    if _pool.can_handle(url):
+        status, reason, headers, body, url = _pool.request(
+            method, url, data, headers, timeout)
+        if status >= 400:
+            raise HTTPError(url, status, reason, headers, None)
+    else:
+        request = Request(url, data=data, headers=headers, method=method)
+        try:
+            sock = urlopen(request, timeout=timeout)
+        except HTTPError as e:
+            if e.code != 304:
+                raise
+            sock = e
+        try:
+            body = sock.read()
+            headers = {k.lower(): v for k, v in sock.headers.items()}
+            status = sock.getcode()
+        finally:
+            sock.close()
+    if headers.pop("content-encoding", "") == "gzip":
+        try:
+            body = gzip.decompress(body)
+        except EOFError as e:
+            raise UrllibError(e)
+        headers.pop("content-length", None)
+    return Response(status, headers, body)
+
+
+def fetch(url: str, method: str = 'GET', data: Optional[bytes] = None,
+          headers: Optional[Dict[str, str]] = None,
+          timeout: float = 15) -> Response:
+    """Blocking counterpart to download(), to be used in threads.
+
+    Shares the response cache, rate limits and counters with download().
+    Connections get reused and bodies are always returned decompressed.
+    Range requests bypass the cache.
+
+    Raises:
+        UrllibError
+    """
+
+    headers = dict(headers or {})
+    cacheable = (method == 'GET' and data is None and
+                 "Range" not in headers)
+    cache = get_cache() if cacheable else None
+    key = HTTPCache.get_key(url, headers.get("Authorization"))
+
+    if cacheable:
+        cached = cache.get(key) if cache else None
+        if cached is not None and cached.is_fresh():
+            count("cache-hits")
+            return Response(cached.status, cached.headers, cached.body)
+
+        with _sync_lock:
+            pending = _sync_inflight.get(key)
+            if pending is None:
+                pending = _sync_inflight[key] = _SyncRequest()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            count("coalesced")
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.response
+
+        if cached is not None:
+            headers.update(cached.get_validators())
+
+    try:
+        delay = _limiter.reserve(url)
+        if delay > 0:
+            count("throttled")
+            time.sleep(delay)
+        count("requests")
+        try:
+            response = _urlopen(url, method, data, headers, timeout)
+        except UrllibError:
+            count("errors")
+            raise
+        if cacheable:
+            if response.status == 304 and cached is not None:
+                count("revalidated")
+                refreshed = cache.refresh(key, response.headers) or cached
+                response = Response(
+                    refreshed.status, refreshed.headers, refreshed.body)
+            elif cache is not None:
+                cache.put(key, response.status, response.headers,
+                          response.body)
+            pending.response = response
+        return response
+    except Exception as e:
+        if cacheable:
+            pending.error = e
+        raise
+    finally:
+        if cacheable:
+            with _sync_lock:
+                del _sync_inflight[key]
+            pending.event.set()
+
+
+def fetch_stream(url: str, headers: Optional[Dict[str, str]] = None,
+                 timeout: float = 15,
+                 chunk_size: int = 10 * 1024) -> Iterator[bytes]:
+    """Like fetch(), but yields the body in chunks while it gets
+    downloaded, so large responses can be shown progressively and
+    dropped early by not iterating further. Bypasses the cache.
+
+    Raises:
+        UrllibError
+    """
+
+    headers = dict(headers or {})
+    headers.setdefault('User-Agent', ua_string)
+    delay = _limiter.reserve(url)
+    if delay > 0:
+        count("throttled")
+        time.sleep(delay)
+    count("requests")
+    try:
+        sock = urlopen(Request(url, headers=headers), timeout=timeout)
+    except UrllibError:
+        count("errors")
+        raise
+    try:
+        while True:
+            try:
+                chunk = sock.read(chunk_size)
+            except (HTTPException, UrllibError) as e:
+                count("errors")
+                raise UrllibError(e)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        sock.close()
+
 session = Soup.Session()
 ua_string = "Quodlibet/{0} (+{1})".format(VERSION, WEBSITE)
 session.set_properties(user_agent=ua_string, timeout=15)
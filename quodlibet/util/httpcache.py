@@ -0,0 +1,446 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""The parts of the shared HTTP client which don't depend on libsoup:
+an on-disk response cache following Cache-Control, per-host rate limits,
+keep-alive connections and request counters.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import ssl
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit, urljoin
+from urllib.request import getproxies, proxy_bypass
+
+from quodlibet.util import perf
+from quodlibet.util.atomic import atomic_save
+from quodlibet.util.dprint import print_d, print_w
+from quodlibet.util.misc import get_ca_file
+
+
+HOST_INTERVALS = {
+    "musicbrainz.org": 1.0,
+    "api.discogs.com": 2.5,
+    "itunes.apple.com": 3.0,
+    "ws.audioscrobbler.com": 0.2,
+}
+"""Minimum seconds between two requests to a host (or its subdomains)"""
+
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+def count(name, value=1):
+    """Increases the counter `name`, also passed on to `perf` as http.name"""
+
+    with _stats_lock:
+        _stats[name] += value
+    perf.count("http." + name, value)
+
+
+def get_stats() -> Dict[str, int]:
+    """Returns a copy of all request counters"""
+
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_host(url):
+    return (urlsplit(url).hostname or "").lower()
+
+
+def parse_cache_control(value):
+    """Parses a Cache-Control header value.
+
+    Returns:
+        dict: lower case directive names mapped to their value, or True
+            for directives without one
+    """
+
+    directives = {}
+    for part in (value or "").split(","):
+        name, sep, arg = part.strip().partition("=")
+        name = name.strip().lower()
+        if not name:
+            continue
+        directives[name] = arg.strip().strip('"') if sep else True
+    return directives
+
+
+def _parse_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def freshness_lifetime(headers):
+    """Returns how many seconds a response stays fresh, 0 if it has to be
+    revalidated before each use and None if it must not be stored.
+
+    Args:
+        headers (Dict[str, str]): response headers with lower case names
+    """
+
+    directives = parse_cache_control(headers.get("cache-control"))
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    if "max-age" in directives:
+        try:
+            return max(0, int(directives["max-age"]))
+        except ValueError:
+            return 0
+    if "expires" in headers:
+        expires = _parse_date(headers["expires"])
+        if expires is None:
+            return 0
+        date = _parse_date(headers.get("date", "")) or time.time()
+        return max(0, expires - date)
+    return 0
+
+
+class CachedResponse:
+    """A stored response; `body` is always decompressed"""
+
+    def __init__(self, status, headers, body, expires):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+
+    def is_fresh(self, now=None):
+        now = time.time() if now is None else now
+        return now < self.expires
+
+    def get_validators(self):
+        """Returns the request headers for revalidating the response"""
+
+        validators = {}
+        if "etag" in self.headers:
+            validators["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            validators["If-Modified-Since"] = self.headers["last-modified"]
+        return validators
+
+
+class HTTPCache:
+    """A thread safe on-disk cache for responses to GET requests.
+
+    Responses are stored if they are fresh for some time or can be
+    revalidated with an ETag or Last-Modified date.
+    """
+
+    MAX_BODY_SIZE = 4 * 1024 * 1024
+    """Larger responses (e.g. songs) are never stored"""
+
+    _HEADERS = ("content-type", "cache-control", "expires", "date",
+                "etag", "last-modified")
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        self._directory = directory
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._size = None
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @staticmethod
+    def get_key(url, auth=None):
+        """Returns the cache key for a URL, requests with different
+        credentials don't share responses"""
+
+        data = url if auth is None else url + "\0" + auth
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key)
+
+    def get(self, key) -> Optional[CachedResponse]:
+        try:
+            with open(self._path(key), "rb") as h:
+                meta, body = h.read().split(b"\n", 1)
+            meta = json.loads(meta.decode("utf-8"))
+            return CachedResponse(
+                meta["status"], meta["headers"], body, meta["expires"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print_d("Dropping broken cache entry %s (%s)" % (key, e))
+            self.remove(key)
+            return None
+
+    def put(self, key, status, headers, body, now=None):
+        """Stores a response if allowed by its headers.
+
+        Args:
+            headers (Dict[str, str]): response headers with lower case names
+        Returns:
+            bool: if it got stored
+        """
+
+        if status != 200 or len(body) > self.MAX_BODY_SIZE:
+            return False
+        lifetime = freshness_lifetime(headers)
+        if lifetime is None:
+            return False
+        if not lifetime and not ("etag" in headers or
+                                 "last-modified" in headers):
+            return False
+
+        now = time.time() if now is None else now
+        kept = {k: headers[k] for k in self._HEADERS if k in headers}
+        meta = {"status": status, "headers": kept, "expires": now + lifetime}
+        data = json.dumps(meta).encode("utf-8") + b"\n" + body
+
+        with self._lock:
+            try:
+                os.makedirs(self._directory, exist_ok=True)
+                with atomic_save(self._path(key), "wb") as h:
+                    h.write(data)
+            except OSError as e:
+                print_w("Couldn't write to HTTP cache (%s)" % e)
+                return False
+            if self._size is not None:
+                self._size += len(data)
+            self._prune()
+        return True
+
+    def refresh(self, key, headers, now=None):
+        """Updates a stored response after it got revalidated (HTTP 304)
+
+        Returns:
+            CachedResponse or None: the updated response
+        """
+
+        cached = self.get(key)
+        if cached is None:
+            return None
+        merged = dict(cached.headers)
+        merged.update(headers)
+        if not self.put(key, cached.status, merged, cached.body, now=now):
+            self.remove(key)
+        return CachedResponse(cached.status, merged, cached.body,
+                              cached.expires)
+
+    def remove(self, key):
+        with self._lock:
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+            self._size = None
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries():
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+            self._size = None
+
+    def _entries(self):
+        try:
+            return [e for e in os.scandir(self._directory) if e.is_file()]
+        except OSError:
+            return []
+
+    def _prune(self):
+        """Removes the least recently written entries until the cache
+        is below its maximum size"""
+
+        if self._size is None:
+            self._size = sum(e.stat().st_size for e in self._entries())
+        if self._size <= self._max_size:
+            return
+
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+        for entry in entries:
+            if self._size <= self._max_size * 3 // 4:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+            except OSError:
+                continue
+            self._size -= size
+        print_d("Pruned HTTP cache to %d bytes" % self._size)
+
+
+class RateLimiter:
+    """Spaces out requests to the same host, thread safe"""
+
+    def __init__(self, intervals=None):
+        self._intervals = HOST_INTERVALS if intervals is None else intervals
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def get_interval(self, host):
+        while host:
+            if host in self._intervals:
+                return host, self._intervals[host]
+            host = host.partition(".")[2]
+        return None, 0
+
+    def reserve(self, url, now=None):
+        """Reserves the next free slot for a request to the host of `url`.
+
+        Returns:
+            float: the seconds to wait before sending the request
+        """
+
+        name, interval = self.get_interval(get_host(url))
+        if not interval:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            start = max(now, self._next.get(name, now))
+            self._next[name] = start + interval
+        return start - now
+
+
+class ConnectionPool:
+    """Keeps idle HTTP connections around for reuse by later requests to
+    the same host, thread safe.
+
+    Requests going through a proxy aren't handled, see can_handle().
+    """
+
+    MAX_IDLE = 4
+    """Idle connections kept per host"""
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._context = None
+
+    @staticmethod
+    def can_handle(url):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return False
+        return (parts.scheme not in getproxies() or
+                bool(proxy_bypass(parts.hostname or "")))
+
+    def _get_context(self):
+        if self._context is None:
+            self._context = ssl.create_default_context(cafile=get_ca_file())
+        return self._context
+
+    def _connect(self, scheme, netloc, timeout):
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(
+                netloc, timeout=timeout, context=self._get_context())
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=timeout)
+        return conn, False
+
+    def _release(self, scheme, netloc, conn):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.MAX_IDLE:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Closes all idle connections"""
+
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _request(self, method, url, data, headers, timeout):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        conn, reused = self._connect(parts.scheme, parts.netloc, timeout)
+        try:
+            try:
+                conn.request(method, path, data, headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError):
+                conn.close()
+                if not reused:
+                    raise
+                # the server closed the idle connection in the meantime
+                conn, reused = self._connect(
+                    parts.scheme, parts.netloc, timeout)
+                conn.request(method, path, data, headers)
+                response = conn.getresponse()
+            body = response.read()
+        except BaseException:
+            conn.close()
+            raise
+
+        if reused:
+            count("reused")
+        result = (response.status, response.reason,
+                  {k.lower(): v for k, v in response.getheaders()}, body)
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(parts.scheme, parts.netloc, conn)
+        return result
+
+    def request(self, method, url, data=None, headers=None, timeout=15):
+        """Sends a request and follows redirects.
+
+        Returns:
+            Tuple[int, str, Dict[str, str], bytes, str]: status, reason,
+                headers with lower case names, body and the final URL
+        Raises:
+            OSError
+        """
+
+        headers = dict(headers or {})
+        for i in range(self.MAX_REDIRECTS + 1):
+            try:
+                status, reason, resp_headers, body = self._request(
+                    method, url, data, headers, timeout)
+            except http.client.HTTPException as e:
+                raise OSError(e)
+            location = resp_headers.get("location")
+            if status not in (301, 302, 303, 307, 308) or not location:
+                return status, reason, resp_headers, body, url
+            url = urljoin(url, location)
+            if not self.can_handle(url):
+                raise OSError("Can't follow redirect to %r" % url)
+            if status == 303 or (status in (301, 302) and method == "POST"):
+                method = "GET"
+                data = None
+                headers.pop("Content-Type", None)
+        raise OSError("Too many redirects for %r" % url)
@@ -0,0 +1,222 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Remembers where the lyrics of songs were found, so showing them on song
+change doesn't need to search the disk again, and finds them for upcoming
+songs in the background.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from os.path import splitext
+from typing import List, Optional, Tuple
+
+from quodlibet import app
+from quodlibet.util import perf
+from quodlibet.util.dprint import print_d
+from quodlibet.util.thread import call_async_background, disk_lane
+
+# Note the trimming of whitespace, seems "most correct" behaviour
+LRC_LINE = re.compile(r"\s*\[([0-9]+:[0-9.]*)\]\s*(.+)\s*")
+
+PREFETCH_COUNT = 3
+"""Number of upcoming songs to find lyrics for"""
+
+
+def parse_lrc(contents: str) -> List[Tuple[int, str]]:
+    """Returns the (milliseconds, text) lines of an LRC file, sorted"""
+
+    data = []
+    for line in contents.splitlines():
+        match = LRC_LINE.match(line)
+        if not match:
+            continue
+        timing, text = match.groups()
+        minutes, seconds = (float(p) for p in timing.split(":", 1))
+        timestamp = int(1000 * (minutes * 60 + seconds))
+        data.append((timestamp, text))
+    return sorted(data)
+
+
+def find_lyrics_file(song) -> Optional[str]:
+    filename = song.lyric_filename
+    if filename and os.path.isfile(filename):
+        return filename
+    return None
+
+
+def find_lrc_file(song) -> Optional[str]:
+    """Looks for an .lrc file next to the song"""
+
+    track_name = splitext(song("~basename") or "")[0]
+    dir_ = song("~dirname")
+    names = {track_name, track_name.lower(), track_name.upper(),
+             song("~artist~title"), song("~artist~tracknumber~title"),
+             song("~tracknumber~title")}
+    for name in names:
+        path = os.path.join(dir_, f"{name}.lrc")
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _read_lyrics(path) -> Optional[str]:
+    with open(path, "rb") as h:
+        text = h.read().decode("utf-8", "replace")
+    # try to skip binary files
+    return None if "\0" in text else text
+
+
+def _read_lrc(path):
+    with open(path, "r", encoding="utf-8") as h:
+        return parse_lrc(h.read())
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+class _Entry:
+
+    __slots__ = ("path", "identity", "value", "checked")
+
+    def __init__(self, path, identity, value, checked):
+        self.path = path
+        self.identity = identity
+        self.value = value
+        self.checked = checked
+
+
+class LyricsCache:
+    """Thread safe cache of lyrics files found for songs and their content.
+
+    Entries for found files are valid as long as the file's modification
+    time and size don't change, songs without lyrics get searched again
+    after `MISSING_TTL` seconds.
+    """
+
+    MISSING_TTL = 5 * 60
+
+    MAX_ENTRIES = 500
+
+    _KINDS = {
+        "lyrics": (find_lyrics_file, _read_lyrics),
+        "lrc": (find_lrc_file, _read_lrc),
+    }
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._librarian = None
+
+    def watch(self, librarian):
+        """Forgets songs whenever `librarian` reports them as changed,
+        e.g. after tag edits moving their lyrics file"""
+
+        if self._librarian is not None:
+            return
+        self._librarian = librarian
+        librarian.connect("changed", self.__changed)
+
+    def __changed(self, librarian, songs):
+        self.invalidate(songs)
+
+    def _get(self, song, kind):
+        key = (kind, song("~filename"))
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            if entry.path is None:
+                valid = time.time() - entry.checked < self.MISSING_TTL
+            else:
+                valid = _stat(entry.path) == entry.identity
+            if valid:
+                perf.count("lyrics.hits")
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                return entry.value
+
+        perf.count("lyrics.misses")
+        find, read = self._KINDS[kind]
+        path = find(song)
+        value = identity = None
+        if path is not None:
+            identity = _stat(path)
+            try:
+                value = read(path)
+            except (OSError, UnicodeDecodeError) as e:
+                print_d(f"Couldn't read lyrics from {path!r} ({e})")
+                path = identity = None
+        entry = _Entry(path, identity, value, time.time())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return value
+
+    def get_lyrics(self, song) -> Optional[str]:
+        """Returns the same as song("~lyrics"): embedded lyrics or the
+        content of the lyrics file"""
+
+        for key in ("lyrics", "unsyncedlyrics"):
+            if key in song:
+                return song[key]
+        return self._get(song, "lyrics")
+
+    def get_lrc(self, song) -> List[Tuple[int, str]]:
+        """Returns the parsed lines of the song's .lrc file, see
+        parse_lrc()"""
+
+        return self._get(song, "lrc") or []
+
+    def invalidate(self, songs):
+        """Forgets everything about `songs`, e.g. after lyrics got saved"""
+
+        filenames = {song("~filename") for song in songs}
+        with self._lock:
+            for key in list(self._entries):
+                if key[1] in filenames:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _warm(self, song):
+        self.get_lyrics(song)
+        self.get_lrc(song)
+
+    def prefetch(self, songs, cancellable):
+        """Looks up the lyrics of `songs` in background threads"""
+
+        for song in songs:
+            if song is None or not song.is_file:
+                continue
+            filename = song("~filename")
+            call_async_background(self._warm, cancellable, lambda r: None,
+                                  args=(song,),
+                                  lane=disk_lane(
+                                      filename, song.get("~mountpoint")),
+                                  key=("lyrics", filename))
+
+
+_cache = LyricsCache()
+
+
+def get_cache() -> LyricsCache:
+    """The lyrics cache shared by everything showing lyrics"""
+
+    if app.librarian is not None:
+        _cache.watch(app.librarian)
+    return _cache
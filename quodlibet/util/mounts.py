@@ -0,0 +1,170 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Checking if mount points are available without blocking on dead
+network mounts.
+
+Each check runs in its own thread, since a hanging stat() on an
+unresponsive NFS/SMB mount can't be interrupted and would otherwise
+occupy a shared worker for the full kernel timeout.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from gi.repository import GLib
+
+from quodlibet.util import perf
+from quodlibet.util.dprint import print_d
+from quodlibet.util.path import ismount
+
+PROBE_TIMEOUT = 2.0
+"""Seconds to wait for a mount point before considering it unresponsive"""
+
+CACHE_TTL = 10.0
+"""Seconds a result is reused for"""
+
+
+def check_mounted(mountpoint, exists=None):
+    """Returns if `mountpoint` is mounted. `exists` gets called for
+    accessing a path below the mount point first if it isn't."""
+
+    if ismount(mountpoint):
+        return True
+    if exists is None:
+        return False
+    # In case mountpoint is mounted through autofs we need to
+    # access a sub path for it to mount
+    # https://github.com/quodlibet/quodlibet/issues/2146
+    exists()
+    return ismount(mountpoint)
+
+
+class MountProbe:
+    """A running or finished check of one mount point"""
+
+    def __init__(self, result=None, done=False):
+        self.result = result
+        self.callbacks = []
+        self._event = threading.Event()
+        if done:
+            self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Returns if the check is done"""
+
+        return self._event.wait(timeout)
+
+    def _finish(self, result):
+        self.result = result
+        self._event.set()
+
+
+class MountProber:
+    """Checks mount points in threads, with a timeout and cached results.
+
+    There is at most one check running per mount point. As long as one is
+    stuck, the mount point is considered unresponsive and new requests
+    wait for the same check.
+    """
+
+    def __init__(self, timeout=PROBE_TIMEOUT, ttl=CACHE_TTL,
+                 check: Callable = check_mounted):
+        self.timeout = timeout
+        self._ttl = ttl
+        self._check = check
+        self._lock = threading.Lock()
+        self._results: Dict[str, tuple] = {}
+        self._running: Dict[str, MountProbe] = {}
+
+    def _get_cached(self, mountpoint):
+        entry = self._results.get(mountpoint)
+        if entry is not None and time.monotonic() - entry[0] < self._ttl:
+            return entry[1]
+        return None
+
+    def _run(self, probe, mountpoint, exists):
+        try:
+            result = bool(self._check(mountpoint, exists))
+        except Exception as e:
+            print_d(f"Checking {mountpoint!r} failed ({e!r})")
+            result = False
+        with self._lock:
+            self._results[mountpoint] = (time.monotonic(), result)
+            del self._running[mountpoint]
+            callbacks = probe.callbacks
+            probe.callbacks = []
+            probe._finish(result)
+        for callback in callbacks:
+            GLib.idle_add(callback, result, priority=GLib.PRIORITY_LOW)
+
+    def start(self, mountpoint, exists=None, callback=None) -> MountProbe:
+        """Starts checking `mountpoint` unless there is a recent result.
+
+        `callback` gets called with the result in the main loop, which
+        never happens if the mount point doesn't respond at all.
+        """
+
+        with self._lock:
+            probe = self._running.get(mountpoint)
+            if probe is None:
+                result = self._get_cached(mountpoint)
+                if result is not None:
+                    if callback is not None:
+                        GLib.idle_add(callback, result,
+                                      priority=GLib.PRIORITY_LOW)
+                    return MountProbe(result, done=True)
+                probe = self._running[mountpoint] = MountProbe()
+                thread = threading.Thread(
+                    target=self._run, args=(probe, mountpoint, exists),
+                    name="mount-probe", daemon=True)
+                thread.start()
+            if callback is not None:
+                probe.callbacks.append(callback)
+            return probe
+
+    def probe_many(self, points: Dict[str, Optional[Callable]],
+                   timeout=None) -> Dict[str, Optional[bool]]:
+        """Checks all mount points in parallel, waiting at most `timeout`
+        seconds in total.
+
+        Args:
+            points: mount points mapped to an `exists` function or None
+        Returns:
+            the mount points mapped to True/False, or None if they didn't
+            respond in time
+        """
+
+        timeout = self.timeout if timeout is None else timeout
+        probes = {point: self.start(point, exists)
+                  for point, exists in points.items()}
+        deadline = time.monotonic() + timeout
+        results = {}
+        for point, probe in probes.items():
+            if probe.wait(max(0, deadline - time.monotonic())):
+                results[point] = probe.result
+            else:
+                print_d(f"{point!r} didn't respond in {timeout}s")
+                perf.count("mounts.unresponsive")
+                results[point] = None
+        return results
+
+    def probe(self, mountpoint, exists=None, timeout=None) -> Optional[bool]:
+        """Same as probe_many() for one mount point"""
+
+        return self.probe_many({mountpoint: exists}, timeout)[mountpoint]
+
+    def forget(self, mountpoint=None):
+        """Drops cached results for `mountpoint`, or all of them"""
+
+        with self._lock:
+            if mountpoint is None:
+                self._results.clear()
+            else:
+                self._results.pop(mountpoint, None)
@@ -0,0 +1,259 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""A lightweight registry of timings and counters for hot paths.
+
+Everything is disabled by default, in which case spans, counters and
+records are close to free (one global lookup and a branch). Once enabled,
+timings are aggregated into histograms and can optionally be written to a
+JSON-lines file, one object per finished span::
+
+    with perf.span("library.load"):
+        ...
+
+    @perf.timed("songlist.fill")
+    def set_songs(...):
+        ...
+
+    perf.count("player.song-started")
+"""
+
+import functools
+import json
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from quodlibet.util.dprint import print_d, print_w
+
+
+class Histogram:
+    """Aggregates durations (in seconds) into power-of-two millisecond
+    buckets, which is enough to tell a 1ms from a 100ms problem."""
+
+    BUCKETS = 16
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        ms = value * 1000
+        index = 0 if ms < 1 else min(int(math.log2(ms)) + 1, self.BUCKETS - 1)
+        self.buckets[index] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Returns an upper bound in seconds for the p-th percentile"""
+
+        if not self.count:
+            return 0.0
+        wanted = self.count * p / 100.0
+        seen = 0
+        for index, num in enumerate(self.buckets):
+            seen += num
+            if seen >= wanted:
+                return min((2 ** index) / 1000.0, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+        }
+
+
+class Registry:
+    """Holds all counters and histograms. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._log = None
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name, duration, data=None):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.add(duration)
+            if self._log is not None:
+                entry = {"time": time.time(), "name": name, "dur": duration}
+                if data:
+                    entry.update(data)
+                try:
+                    self._log.write(json.dumps(entry, default=str) + "\n")
+                except (OSError, ValueError) as e:
+                    print_w("Disabling performance log: %s" % e)
+                    self._log = None
+
+    def set_log(self, fileobj):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            self._log = fileobj
+
+    def snapshot(self):
+        """A JSON serializable copy of the current state"""
+
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {k: h.to_dict()
+                               for k, h in self.histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class _Span:
+
+    __slots__ = ("name", "data", "start")
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _registry.record(self.name, time.perf_counter() - self.start,
+                         self.data)
+
+
+class _NullSpan:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_registry = Registry()
+_enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(log_path: Optional[str] = None):
+    """Starts collecting. If `log_path` is given every finished span gets
+    appended to it as a JSON object per line."""
+
+    global _enabled
+
+    if log_path is not None:
+        try:
+            fileobj = open(log_path, "a", encoding="utf-8", buffering=1)
+        except OSError as e:
+            print_w("Can't open performance log %r: %s" % (log_path, e))
+        else:
+            print_d("Writing performance log to %r" % log_path)
+            _registry.set_log(fileobj)
+    _enabled = True
+
+
+def pause():
+    """Stops collecting but keeps the log open, enable() without a path
+    continues writing to it"""
+
+    global _enabled
+
+    _enabled = False
+
+
+def disable():
+    """Stops collecting and closes the log, if any, after writing a final
+    snapshot to it."""
+
+    global _enabled
+
+    _enabled = False
+    log = _registry._log
+    if log is not None:
+        try:
+            log.write(json.dumps(
+                {"time": time.time(), "snapshot": snapshot()}) + "\n")
+        except (OSError, ValueError):
+            pass
+        _registry.set_log(None)
+
+
+def span(name, **data):
+    """A context manager timing its body"""
+
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, data)
+
+
+def timed(name):
+    """A decorator timing every call of the decorated function"""
+
+    def wrap(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _registry.record(name, time.perf_counter() - start)
+        return wrapper
+    return wrap
+
+
+def count(name, value=1):
+    """Increases a counter"""
+
+    if _enabled:
+        _registry.count(name, value)
+
+
+def record(name, duration, **data):
+    """Adds a duration (in seconds) measured elsewhere"""
+
+    if _enabled:
+        _registry.record(name, duration, data)
+
+
+def snapshot():
+    return _registry.snapshot()
+
+
+def reset():
+    _registry.reset()
@@ -8,7 +8,7 @@
 
 from quodlibet import _
 from quodlibet.util.dprint import print_w
-from quodlibet.formats import AudioFileError
+from quodlibet.formats import AudioFileError, current_generation
 from quodlibet import util
 from quodlibet import qltk
 from quodlibet.qltk.wlw import WritingWindow
@@ -18,12 +18,37 @@ from quodlibet.util.misc import total_ordering, hashable
 @hashable
 @total_ordering
 class SongWrapper:
-    __slots__ = ['_song', '_updated', '_needs_write']
+    """A view on a song which knows if the song got changed since the
+    view was created.
 
-    def __init__(self, song):
+    Changes are detected by comparing the generation of the song with the
+    one at creation, so changes done directly on the song are noticed as
+    well and nothing needs to be copied.
+    """
+
+    __slots__ = ['_song', '_since', '_write_since']
+
+    def __init__(self, song, since=None):
         self._song = song
-        self._updated = False
-        self._needs_write = False
+        if since is None:
+            since = current_generation()
+        self._since = self._write_since = since
+
+    @property
+    def _updated(self):
+        return self._song._generation > self._since
+
+    @_updated.setter
+    def _updated(self, value):
+        self._since = -1 if value else current_generation()
+
+    @property
+    def _needs_write(self):
+        return self._song._write_generation > self._write_since
+
+    @_needs_write.setter
+    def _needs_write(self, value):
+        self._write_since = -1 if value else current_generation()
 
     def _was_updated(self):
         return self._updated
@@ -31,15 +56,10 @@ class SongWrapper:
     def __setitem__(self, key, value):
         if key in self and self[key] == value:
             return
-        self._updated = True
-        self._needs_write = (self._needs_write or not key.startswith("~"))
         return self._song.__setitem__(key, value)
 
     def __delitem__(self, key):
-        retval = self._song.__delitem__(key)
-        self._updated = True
-        self._needs_write = (self._needs_write or not key.startswith("~"))
-        return retval
+        return self._song.__delitem__(key)
 
     def __getattr__(self, attr):
         return getattr(self._song, attr)
@@ -78,31 +98,31 @@ class SongWrapper:
     def __call__(self, *args):
         return self._song(*args)
 
-    def pop(self, *args):
-        self._updated = True
-        self._needs_write = True
-        return self._song.pop(*args)
+    def pop(self, key, *args):
+        if key not in self._song:
+            return self._song.pop(key, *args)
+        value = self._song.pop(key)
+        self._song._mark_changed(key)
+        return value
 
     def update(self, other):
-        self._updated = True
-        self._needs_write = True
-        return self._song.update(other)
+        self._song.update(other)
+        self._song._mark_changed("")
 
     def rename(self, newname):
-        self._updated = True
-        return self._song.rename(newname)
+        try:
+            return self._song.rename(newname)
+        finally:
+            self._song._mark_changed("~filename")
 
 
 def ListWrapper(songs):
-    def wrap(song):
-        if song is None:
-            return None
-        else:
-            return SongWrapper(song)
-    return [wrap(s) for s in songs]
+    since = current_generation()
+    return [None if s is None else SongWrapper(s, since) for s in songs]
 
 
 def check_wrapper_changed(library, parent, songs):
+    songs = list(songs)
     need_write = [s for s in songs if s._needs_write]
 
     if need_write:
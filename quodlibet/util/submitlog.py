@@ -0,0 +1,193 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""A durable queue for submissions to web services (scrobbles, listens).
+
+Entries get appended to a log file as soon as they are queued, so nothing
+gets lost if Quod Libet doesn't exit cleanly. Each line is one JSON
+object, either a new entry or an acknowledgement of earlier ones::
+
+    {"seq": 1, "entry": {...}}
+    {"ack": [1]}
+
+Once enough entries are acknowledged the log gets rewritten with only
+the pending ones.
+"""
+
+import json
+import os
+import random
+import threading
+
+from quodlibet.util.atomic import atomic_save
+from quodlibet.util.dprint import print_d, print_w
+
+
+class SubmitLog:
+    """A thread safe, file backed FIFO of JSON serializable entries.
+
+    peek() returns pending entries with their sequence numbers, which can
+    be passed to ack() once they are submitted.
+    """
+
+    COMPACT_AFTER = 200
+    """Rewrite the log once this many acknowledged entries are in it"""
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._next_seq = 1
+        self._acked = 0
+        self._file = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self._path, "rb") as h:
+                lines = h.read().split(b"\n")
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print_w("Couldn't read %r (%s)" % (self._path, e))
+            return
+
+        broken = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line.decode("utf-8"))
+                if "ack" in record:
+                    for seq in record["ack"]:
+                        if self._pending.pop(seq, None) is not None:
+                            self._acked += 1
+                else:
+                    seq = record["seq"]
+                    self._pending[seq] = record["entry"]
+                    self._next_seq = max(self._next_seq, seq + 1)
+            except (ValueError, KeyError, TypeError):
+                # most likely the last line got cut off by a crash
+                broken += 1
+
+        print_d("Loaded %d pending entries from %r" % (
+            len(self._pending), self._path))
+        if broken:
+            print_w("Skipped %d broken line(s) in %r" % (broken, self._path))
+            self.compact()
+
+    def _write(self, record):
+        if self._file is None:
+            self._file = open(self._path, "ab")
+        self._file.write(json.dumps(record).encode("utf-8") + b"\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def __iter__(self):
+        return iter(self.peek(len(self)))
+
+    def append(self, entry):
+        """Queues and persists an entry.
+
+        Returns:
+            int: the sequence number of the entry
+        """
+
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending[seq] = entry
+            try:
+                self._write({"seq": seq, "entry": entry})
+            except OSError as e:
+                print_w("Couldn't write to %r (%s)" % (self._path, e))
+            return seq
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def peek(self, count):
+        """Returns up to `count` of the oldest entries as a list of
+        (seq, entry) tuples"""
+
+        with self._lock:
+            result = []
+            for item in self._pending.items():
+                if len(result) >= count:
+                    break
+                result.append(item)
+            return result
+
+    def ack(self, seqs):
+        """Removes the entries with the given sequence numbers"""
+
+        with self._lock:
+            seqs = [s for s in seqs if self._pending.pop(s, None) is not None]
+            if not seqs:
+                return
+            self._acked += len(seqs)
+            if not self._pending or self._acked >= self.COMPACT_AFTER:
+                self.compact()
+                return
+            try:
+                self._write({"ack": seqs})
+            except OSError as e:
+                print_w("Couldn't write to %r (%s)" % (self._path, e))
+
+    def clear(self):
+        with self._lock:
+            self.ack(list(self._pending))
+
+    def compact(self):
+        """Rewrites the log to only contain the pending entries"""
+
+        with self._lock:
+            self.close()
+            self._acked = 0
+            try:
+                if not self._pending:
+                    if os.path.exists(self._path):
+                        os.unlink(self._path)
+                    return
+                with atomic_save(self._path, "wb") as h:
+                    for seq, entry in self._pending.items():
+                        record = {"seq": seq, "entry": entry}
+                        h.write(json.dumps(record).encode("utf-8") + b"\n")
+            except OSError as e:
+                print_w("Couldn't compact %r (%s)" % (self._path, e))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Backoff:
+    """Exponential backoff with full jitter.
+
+    The n-th consecutive failure waits a random time between 0 and
+    min(`maximum`, `base` * 2 ** n) seconds.
+    """
+
+    def __init__(self, base, maximum):
+        self.base = base
+        self.maximum = maximum
+        self.failures = 0
+
+    def reset(self):
+        self.failures = 0
+
+    def next_delay(self):
+        """Records a failure and returns the seconds to wait"""
+
+        limit = min(self.maximum, self.base * 2 ** min(self.failures, 32))
+        self.failures += 1
+        return random.uniform(0, limit)
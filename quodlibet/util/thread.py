@@ -5,17 +5,27 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-"""Utils for executing things in a thread controlled from the main loop"""
-
+"""Utils for executing things in a thread controlled from the main loop.
+
+Work is split into named lanes ("cpu", "network", one "disk:<mountpoint>"
+lane per mount point, ...), each with its own limit of concurrent
+threads, so for example a slow network share can't block thumbnail
+loading from the local disk. High priority (UI visible) tasks are run
+newest first, background tasks in order. Tasks passing the same `key` to
+the same lane while one is still queued or running get coalesced and all
+their callbacks get the shared result.
+"""
+
+import collections
+import os
+import threading
+import time
 from multiprocessing import cpu_count
-try:
-    from concurrent.futures import ThreadPoolExecutor
-except ImportError as e:
-    raise ImportError("python-futures is missing: %r" % e)
 
 from gi.repository import GLib
 
 from quodlibet import util
+from quodlibet.util.path import find_mount_point
 
 
 @util.enum
@@ -40,65 +50,258 @@ class Cancellable:
         self._cancelled = True
 
 
-_pools = {}
 _prio_mapping = {
     Priority.HIGH: GLib.PRIORITY_DEFAULT,
     Priority.BACKGROUND: GLib.PRIORITY_LOW,
 }
 
 
-def _get_pool(priority):
-    """Return a (shared) pool for a given priority"""
+def _get_cpu_count():
+    try:
+        return cpu_count()
+    except NotImplementedError:
+        return 2
 
-    global _pools
 
-    if not priority in _pools:
-        try:
-            cpus = cpu_count()
-        except NotImplementedError:
-            cpus = 2
-        max_workers = int(cpus * 1.5)
-        _pools[priority] = ThreadPoolExecutor(max_workers)
-    return _pools[priority]
+LANE_CPU = "cpu"
+LANE_NETWORK = "network"
 
+_lane_limits = {
+    LANE_CPU: max(int(_get_cpu_count() * 1.5), 1),
+    LANE_NETWORK: 6,
+}
 
-def _wrap_function(function, cancellable, args, kwargs):
+DISK_LANE_LIMIT = 2
+"""Concurrent tasks per mount point"""
 
-    def wrap():
-        # check once we are scheduled
-        if not cancellable.is_cancelled():
-            try:
-                return function(*args, **kwargs)
-            except:
-                # ThreadPool catches the exception for the async result
-                # which we don't use. Print instead as if it was not caught.
-                util.print_exc()
-                raise
+DEFAULT_LANE_LIMIT = 2
 
-    return wrap
 
+MOUNT_POINTS_MAX = 4096
+"""Directories to remember the mount point of"""
 
-def _wrap_callback(priority, cancellable, callback):
+_mount_points = collections.OrderedDict()
+_mount_points_lock = threading.Lock()
 
-    def callback_main(cancellable, callback, result):
-        if not cancellable.is_cancelled():
-            callback(result)
-        return False
 
-    def callback_thread(future):
-        global _prio_mapping
+def _find_dir_mount_point(dirname):
+    try:
+        mount_point = find_mount_point(dirname)
+    except (OSError, ValueError, TypeError):
+        mount_point = ""
+    with _mount_points_lock:
+        _mount_points[dirname] = mount_point
+        while len(_mount_points) > MOUNT_POINTS_MAX:
+            _mount_points.popitem(last=False)
 
-        result = future.result()
 
-        if not cancellable.is_cancelled():
-            glib_priority = _prio_mapping[priority]
-            GLib.idle_add(callback_main, cancellable, callback, result,
-                          priority=glib_priority)
+def disk_lane(path, mount_point=None):
+    """The name of the lane for accessing the file at `path`.
 
-    return callback_thread
+    Pass `mount_point` if it's known, like song("~mountpoint"). Otherwise
+    it gets looked up in a thread the first time a directory is seen, so
+    a slow or dead mount never blocks the caller. Until then the shared
+    "disk:" lane is used.
+    """
+
+    if mount_point is not None:
+        return "disk:%s" % mount_point
+
+    try:
+        dirname = os.path.dirname(os.path.abspath(path))
+    except (ValueError, TypeError):
+        return "disk:"
+    with _mount_points_lock:
+        mount_point = _mount_points.get(dirname)
+    if mount_point is None:
+        call_async_background(_find_dir_mount_point, Cancellable(),
+                              lambda result: None, args=(dirname,),
+                              lane="mounts", key=dirname)
+        mount_point = ""
+    return "disk:%s" % mount_point
+
+
+def set_lane_limit(name, limit):
+    """Sets the number of threads for lane `name`. Only affects lanes
+    created afterwards"""
+
+    _lane_limits[name] = limit
+
+
+def _get_lane_limit(name):
+    if name in _lane_limits:
+        return _lane_limits[name]
+    if name.startswith("disk:"):
+        return DISK_LANE_LIMIT
+    return DEFAULT_LANE_LIMIT
+
+
+class _Task:
+
+    def __init__(self, lane, priority, function, args, kwargs, key):
+        self.lane = lane
+        self.priority = priority
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.name = getattr(function, "__qualname__", None) or repr(function)
+        self.waiters = []
+        self.running = False
+        self.done = False
+        self.created = time.monotonic()
+        self.started = None
+
+    def is_cancelled(self):
+        """If all requests for this task got cancelled"""
 
+        return all(c.is_cancelled() for c, callback in self.waiters)
 
-def _call_async(priority, function, cancellable, callback, args, kwargs):
+    def run(self):
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception:
+            util.print_exc()
+            return False, None
+        return True, result
+
+    def finish(self, result):
+        glib_priority = _prio_mapping[self.priority]
+        for cancellable, callback in self.waiters:
+            if not cancellable.is_cancelled():
+                GLib.idle_add(_callback_main, cancellable, callback, result,
+                              priority=glib_priority)
+
+
+def _callback_main(cancellable, callback, result):
+    if not cancellable.is_cancelled():
+        callback(result)
+    return False
+
+
+class _Lane:
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._high = []
+        self._low = collections.deque()
+        self._running = []
+        self._keys = {}
+        self._workers = 0
+        self._terminated = False
+
+    def submit(self, task, cancellable, callback):
+        with self._lock:
+            if self._terminated:
+                return
+            if task.key is not None:
+                existing = self._keys.get(task.key)
+                if existing is not None:
+                    existing.waiters.append((cancellable, callback))
+                    if task.priority == Priority.HIGH and \
+                            existing.priority != Priority.HIGH:
+                        existing.priority = Priority.HIGH
+                        if not existing.running:
+                            self._low.remove(existing)
+                            self._high.append(existing)
+                    return
+                self._keys[task.key] = task
+
+            task.waiters.append((cancellable, callback))
+            if task.priority == Priority.HIGH:
+                self._high.append(task)
+            else:
+                self._low.append(task)
+
+            if self._workers >= self.limit:
+                return
+            self._workers += 1
+
+        thread = threading.Thread(
+            target=self._work, name="ql-%s" % self.name, daemon=True)
+        thread.start()
+
+    def _next(self):
+        while self._high or self._low:
+            if self._high:
+                task = self._high.pop()
+            else:
+                task = self._low.popleft()
+            if not task.is_cancelled():
+                return task
+            self._done(task)
+
+    def _done(self, task):
+        task.done = True
+        if task.key is not None and self._keys.get(task.key) is task:
+            del self._keys[task.key]
+
+    def _work(self):
+        while True:
+            with self._lock:
+                task = None if self._terminated else self._next()
+                if task is None:
+                    self._workers -= 1
+                    return
+                task.running = True
+                task.started = time.monotonic()
+                self._running.append(task)
+
+            ok, result = task.run()
+
+            with self._lock:
+                self._running.remove(task)
+                self._done(task)
+
+            if ok:
+                task.finish(result)
+
+    def terminate(self):
+        """Drops all queued tasks, running ones will finish"""
+
+        with self._lock:
+            self._terminated = True
+            for task in list(self._high) + list(self._low):
+                self._done(task)
+            del self._high[:]
+            self._low.clear()
+
+    def get_tasks(self):
+        now = time.monotonic()
+        with self._lock:
+            tasks = []
+            for task in self._running:
+                tasks.append((task, "running", now - task.started))
+            for task in reversed(self._high):
+                tasks.append((task, "queued", now - task.created))
+            for task in self._low:
+                tasks.append((task, "queued", now - task.created))
+            return [{
+                "lane": self.name,
+                "name": task.name,
+                "state": state,
+                "priority": int(task.priority),
+                "requests": len(task.waiters),
+                "age": age,
+            } for task, state, age in tasks]
+
+
+_lanes = {}
+_lanes_lock = threading.Lock()
+
+
+def _get_lane(name):
+    with _lanes_lock:
+        lane = _lanes.get(name)
+        if lane is None:
+            lane = _lanes[name] = _Lane(name, _get_lane_limit(name))
+        return lane
+
+
+def _call_async(priority, function, cancellable, callback, args, kwargs,
+                lane, key):
     assert cancellable is not None
     assert function is not None
     assert callback is not None
@@ -108,42 +311,60 @@ def _call_async(priority, function, cancellable, callback, args, kwargs):
     if kwargs is None:
         kwargs = {}
 
-    pool = _get_pool(priority)
-    wrapped_func = _wrap_function(function, cancellable, args, kwargs)
-    wrapped_callback = _wrap_callback(priority, cancellable, callback)
-    future = pool.submit(wrapped_func)
-    future.add_done_callback(wrapped_callback)
+    if cancellable.is_cancelled():
+        return
+
+    task = _Task(lane, priority, function, args, kwargs, key)
+    _get_lane(lane).submit(task, cancellable, callback)
+
+
+def get_tasks():
+    """Returns a list of dicts describing all queued and running tasks"""
+
+    with _lanes_lock:
+        lanes = list(_lanes.values())
+    tasks = []
+    for lane in sorted(lanes, key=lambda lane: lane.name):
+        tasks.extend(lane.get_tasks())
+    return tasks
 
 
 def terminate_all():
-    """Terminate all pools, doesn't wait for task completion.
+    """Drops all queued tasks, doesn't wait for running ones.
 
     Can be called multiple times and call_async() etc. can still be used.
     """
 
-    global _pools
-
-    for key, pool in list(_pools.items()):
-        del _pools[key]
-        pool.shutdown(wait=False)
+    with _lanes_lock:
+        lanes = list(_lanes.values())
+        _lanes.clear()
+    for lane in lanes:
+        lane.terminate()
 
 
-def call_async(function, cancellable, callback, args=None, kwargs=None):
-    """Call `function` in a thread that gets passed the `cancellable`
-    and the passed args/kwargs.
+def call_async(function, cancellable, callback, args=None, kwargs=None,
+               lane=LANE_CPU, key=None):
+    """Call `function` in a thread with the passed args/kwargs.
 
     The return value will get passed to `callback` which will be called
     in the main thread. It will not be called if the `cancellable` gets
     cancelled and is not guaranteed to be called at all (on event loop
     shutdown for example)
+
+    `lane` selects the thread group to run in, see disk_lane() for
+    file access. If `key` is not None and a task with the same key is
+    already queued or running in the lane, no new task gets started
+    and `callback` gets the result of the existing one.
     """
 
-    _call_async(Priority.HIGH, function, cancellable, callback, args, kwargs)
+    _call_async(Priority.HIGH, function, cancellable, callback, args, kwargs,
+                lane, key)
 
 
 def call_async_background(function, cancellable, callback, args=None,
-                          kwargs=None):
-    """Same as call_async but for background tasks (network etc.)"""
+                          kwargs=None, lane=LANE_CPU, key=None):
+    """Same as call_async but for background tasks, pass
+    `lane=LANE_NETWORK` for network access"""
 
     _call_async(Priority.BACKGROUND, function, cancellable, callback,
-                args, kwargs)
+                args, kwargs, lane, key)
@@ -5,6 +5,10 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import time
+
+from gi.repository import Gtk, GdkPixbuf
+
 from quodlibet.formats import AudioFile
 from quodlibet.qltk.cover import ALBUM_ART_PLUGIN_ID
 from tests.plugin import PluginTestCase
@@ -16,7 +20,16 @@ A_SONG = AudioFile({'~filename': '/dev/null', 'artist': 'Mr Man',
                     'album': 'Bars of Foo'})
 
 # Keep IDEs happy
-DownloadAlbumArt = AlbumArtWindow = CoverArea = None
+DownloadAlbumArt = AlbumArtWindow = CoverArea = CoverSearch = None
+get_image_size = rank_key = None
+
+
+class FakeEngine:
+    calls = 0
+
+    def start(self, query, limit):
+        FakeEngine.calls += 1
+        return []
 
 
 # TODO: Some real tests.
@@ -43,3 +56,43 @@ class TAlbumArt(PluginTestCase):
     def testCoverArea(self):
         win = CoverArea(None, self.songs[0])
         win.destroy()
+
+    def test_image_size(self):
+        pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8,
+                                      40, 30)
+        pixbuf.fill(0)
+        data = pixbuf.save_to_bufferv("png", [], [])[1]
+        self.assertEqual(get_image_size(data), (40, 30))
+        self.assertEqual(get_image_size(data[:40]), (40, 30))
+        self.assertIs(get_image_size(b"nope"), None)
+
+    def test_rank_key(self):
+        covers = [{}, {"width": 10, "height": 10, "bytes": 5},
+                  {"width": 10, "height": 10, "bytes": 9},
+                  {"width": 500, "height": 500}]
+        self.assertEqual(sorted(covers, key=rank_key, reverse=True),
+                         [covers[3], covers[2], covers[1], covers[0]])
+
+    def _search(self, query):
+        results = []
+
+        def callback(covers, progress):
+            results.append((covers, progress))
+
+        search = CoverSearch(callback)
+        search.add_engine(FakeEngine, " ")
+        search.start(query, False, 3)
+        start = time.time()
+        while not results or results[-1][1] < 1:
+            Gtk.main_iteration_do(False)
+            self.assertTrue(time.time() - start < 5)
+        return results
+
+    def test_search_cached(self):
+        CoverSearch._cache.clear()
+        FakeEngine.calls = 0
+        self.assertEqual(self._search("Artist - Album"), [([], 1)])
+        self.assertEqual(self._search("Artist - Album"), [([], 1)])
+        self.assertEqual(FakeEngine.calls, 1)
+        self._search("Artist - Other")
+        self.assertEqual(FakeEngine.calls, 2)
@@ -8,9 +8,10 @@
 from quodlibet import app
 from quodlibet import config
 from quodlibet.formats import AudioFile
+from quodlibet.library import SongLibrary
 from quodlibet.plugins import PM
 from quodlibet.util.songwrapper import SongWrapper
-from tests import init_fake_app, destroy_fake_app
+from tests import init_fake_app, destroy_fake_app, run_gtk_loop
 from tests.plugin import PluginTestCase
 
 
@@ -52,8 +53,80 @@ class TDuplicates(PluginTestCase):
     def tearDown(self):
         self.plugin.destroy()
         del self.plugin
+        self.kind.plugin_disabled()
         destroy_fake_app()
 
     def test_starts_up(self):
         sws = [SongWrapper(s) for s in app.library.songs]
         self.plugin.plugin_songs(sws).destroy()
+
+    def test_disabled_destroys_index(self):
+        index = self.kind.get_index(app.library)
+        self.kind.plugin_disabled()
+        self.assertIs(self.kind._index, None)
+        self.assertEqual(index._sigs, [])
+
+
+class TDuplicateKeyIndex(PluginTestCase):
+
+    def setUp(self):
+        self.mod = self.modules["Duplicates"]
+        self.library = SongLibrary()
+        self.config = ("~artist~title", False)
+
+        def get_key_func():
+            expression, lower = self.config
+
+            def get_key(song):
+                key = song(expression)
+                return key.lower() if lower else key
+            return get_key
+
+        self.index = self.mod.DuplicateKeyIndex(
+            self.library, lambda: self.config, get_key_func)
+        self.a = AudioFile({"~filename": "/a", "artist": "A", "title": "t"})
+        self.b = AudioFile({"~filename": "/b", "artist": "a", "title": "t"})
+        self.c = AudioFile({"~filename": "/c", "artist": "A", "title": "t"})
+        self.library.add([self.a, self.b])
+
+    def tearDown(self):
+        self.index.destroy()
+        self.library.destroy()
+        del self.mod
+
+    def test_groups(self):
+        self.assertEqual(self.index.get_key(self.a), "A - t")
+        self.assertEqual(self.index.get_group("A - t"), {self.a})
+        self.assertEqual(self.index.get_group("nope"), set())
+
+    def test_background_build(self):
+        self.index.start_build()
+        self.assertFalse(self.index.is_built)
+        run_gtk_loop()
+        self.assertTrue(self.index.is_built)
+        self.assertEqual(self.index.get_group("a - t"), {self.b})
+
+    def test_updates_from_library(self):
+        self.index.ensure_built()
+        deltas = []
+        self.index.connect("changed", lambda i, d: deltas.extend(d))
+        self.library.add([self.c])
+        self.assertEqual(deltas, [(self.c, None, "A - t")])
+        self.assertEqual(self.index.get_group("A - t"), {self.a, self.c})
+
+        del deltas[:]
+        self.b["artist"] = "A"
+        self.library.changed([self.b])
+        self.assertEqual(deltas, [(self.b, "a - t", "A - t")])
+        self.assertEqual(self.index.get_group("a - t"), set())
+
+        del deltas[:]
+        self.library.remove([self.a])
+        self.assertEqual(deltas, [(self.a, "A - t", None)])
+        self.assertEqual(self.index.get_group("A - t"), {self.b, self.c})
+
+    def test_config_change_rebuilds(self):
+        self.index.ensure_built()
+        self.config = ("~artist~title", True)
+        self.assertFalse(self.index.is_built)
+        self.assertEqual(self.index.get_group("a - t"), {self.a, self.b})
@@ -5,6 +5,10 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import base64
+import os
+import random
+import shutil
 import time
 
 from gi.repository import Gtk
@@ -20,7 +24,7 @@ else:
 
 
 from tests.plugin import PluginTestCase
-from tests import skipUnless, get_data_path
+from tests import skipUnless, get_data_path, mkdtemp
 from quodlibet import config
 from quodlibet.formats import MusicFile
 
@@ -127,6 +131,154 @@ class TAcoustidLookup(PluginTestCase):
             "bc970841-b7d9-415a-b7e2-645b1d263cc3")
 
 
+def _noisy(values, seed):
+    """Flips about 2% of the bits, like a lossy re-encode would"""
+
+    r = random.Random(seed)
+    return [v ^ sum(1 << b for b in range(32) if r.random() < 0.02)
+            for v in values]
+
+
+@skipUnless(Gst and chromaprint, "gstreamer plugins missing")
+class TFingerprintMatching(PluginTestCase):
+
+    def setUp(self):
+        config.init()
+        self.mod = self.modules["AcoustidSearch"].matching
+        r = random.Random(42)
+        self.values = [r.getrandbits(32) for i in range(600)]
+        self.other = [r.getrandbits(32) for i in range(600)]
+
+    def tearDown(self):
+        config.quit()
+
+    def test_decode(self):
+        decode = self.mod.decode_fingerprint
+
+        def enc(data):
+            return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+        # test vectors from chromaprint
+        self.assertEqual(decode(enc(b"\0\0\0\1\1")), (0, [1]))
+        self.assertEqual(decode(enc(b"\0\0\0\1\x49\0")), (0, [7]))
+        self.assertEqual(decode(enc(b"\0\0\0\1\x07\0")), (0, [1 << 6]))
+        self.assertEqual(decode(enc(b"\0\0\0\1\x07\x02")), (0, [1 << 8]))
+        self.assertRaises(ValueError, decode, "AQAA")
+        self.assertRaises(ValueError, decode, enc(b"\0\0\0\2\1"))
+
+    def test_roundtrip(self):
+        encoded = self.mod.encode_fingerprint(self.values, algorithm=2)
+        self.assertEqual(
+            self.mod.decode_fingerprint(encoded), (2, self.values))
+
+    def test_similarity(self):
+        similarity = self.mod.get_similarity
+        self.assertEqual(similarity(self.values, self.values), 1.0)
+        # shifted by a second and slightly different
+        self.assertTrue(
+            similarity(self.values, _noisy(self.values[8:], 0)) > 0.9)
+        self.assertTrue(similarity(self.values, self.other) < 0.6)
+        self.assertEqual(similarity(self.values[:10], self.values[:10]), 0)
+
+    def test_find_duplicates(self):
+        m = self.mod
+        fingerprints = {
+            "a": self.values,
+            "b": _noisy(self.values, 1),
+            "c": _noisy(self.values[4:], 2),
+            "d": self.other,
+        }
+        sketches = {k: (75, m.get_sketch(v)) for k, v in fingerprints.items()}
+        sketches["c"] = (70, sketches["c"][1])
+        groups = m.find_duplicates(sketches, fingerprints.get)
+        self.assertEqual([sorted(g) for g in groups], [["a", "b", "c"]])
+
+        # too different in length
+        sketches["b"] = (200, sketches["b"][1])
+        sketches["c"] = (300, sketches["c"][1])
+        self.assertEqual(m.find_duplicates(sketches, fingerprints.get), [])
+
+
+@skipUnless(Gst and chromaprint, "gstreamer plugins missing")
+class TFingerprintStore(PluginTestCase):
+
+    def setUp(self):
+        config.init()
+        self.mod = self.modules["AcoustidSearch"]
+        self.temp = mkdtemp()
+        self.store = self.mod.store.FingerprintStore(
+            os.path.join(self.temp, "fp.sqlite"))
+        self.filename = os.path.join(self.temp, "song.ogg")
+        with open(self.filename, "wb") as h:
+            h.write(b"foo")
+        self.values = list(range(1, 200))
+        self.chromaprint = self.mod.matching.encode_fingerprint(self.values)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.temp)
+        config.quit()
+
+    def test_put_get(self):
+        self.assertIs(self.store.get(self.filename), None)
+        self.store.put(self.filename, 12.5, self.chromaprint)
+        self.assertEqual(
+            self.store.get(self.filename), (12.5, self.chromaprint))
+        self.assertEqual(self.store.get_values(self.filename), self.values)
+        length, sketch = self.store.get_sketch(self.filename)
+        self.assertEqual(sketch, self.mod.matching.get_sketch(self.values))
+        self.assertEqual(len(self.store), 1)
+
+    def test_changed(self):
+        self.store.put(self.filename, 12.5, self.chromaprint)
+        with open(self.filename, "ab") as h:
+            h.write(b"bar")
+        self.assertIs(self.store.get(self.filename), None)
+        os.unlink(self.filename)
+        self.assertIs(self.store.get_sketch(self.filename), None)
+
+    def test_invalid(self):
+        self.store.put(self.filename, 1, "AQAA")
+        self.assertEqual(len(self.store), 0)
+
+    def test_get_many(self):
+        missing = os.path.join(self.temp, "missing.ogg")
+        self.assertEqual(self.store.get_many([self.filename, missing]), {})
+        self.store.put(self.filename, 12.5, self.chromaprint)
+        self.assertEqual(self.store.get_many([self.filename, missing]),
+                         {self.filename: (12.5, self.chromaprint)})
+
+    def test_put_later(self):
+        self.store.put_later(self.filename, 12.5, self.chromaprint)
+        self.assertEqual(self.store._pending, [
+            (self.filename, 12.5, self.chromaprint)])
+        # reads see queued entries
+        self.assertEqual(
+            self.store.get(self.filename), (12.5, self.chromaprint))
+        self.assertEqual(self.store._pending, [])
+
+    def test_remove(self):
+        self.store.put(self.filename, 12.5, self.chromaprint)
+        self.store.remove(self.filename)
+        self.assertIs(self.store.get(self.filename), None)
+
+    def test_pool_uses_store(self):
+        song = MusicFile(get_data_path("silence-44-s.ogg"))
+        self.store.put(song("~filename"), 3.0, self.chromaprint)
+        pool = self.mod.analyze.FingerPrintPool(store=self.store)
+        events = []
+        pool.connect("fingerprint-started", lambda *x: events.append("start"))
+        pool.connect("fingerprint-done",
+                     lambda p, r: events.append(r.chromaprint))
+        pool.push(song)
+
+        t = time.time()
+        while len(events) < 2 and time.time() - t < 5:
+            Gtk.main_iteration_do(False)
+        self.assertEqual(events, ["start", self.chromaprint])
+        pool.stop()
+
+
 ACOUSTID_RESPONSE = {
 u'status': u'ok', u'results': [{u'recordings': [{u'releases':
 [{u'track_count': 15, u'title': u'Spex CD #15', u'country': u'DE', u'artists':
@@ -63,6 +63,72 @@ class TMPDServer(PluginTestCase):
         self.assertEqual(getline("date", "2009-03-04"), "Date: 2009")
 
 
+def _song(path, **kwargs):
+    song = AudioFile({"~filename": fsnative(path), "~#length": 10})
+    song.update(kwargs)
+    return song
+
+
+@skipIf(os.name == "nt", "mpd server not supported under Windows")
+class TLibraryIndex(PluginTestCase):
+
+    def setUp(self):
+        self.mod = self.modules["mpd_server"]
+        from quodlibet.library import SongLibrary
+        self.library = SongLibrary()
+        self.songs = [
+            _song("/music/a/1.ogg", artist="foo", album="x"),
+            _song("/music/a/2.ogg", artist="foo\nbar", album="x"),
+            _song("/music/b/c/3.ogg", artist="Bar", album="y"),
+            _song("/elsewhere/4.ogg"),
+        ]
+        self.library.add(self.songs)
+        self.index = self.mod.index.LibraryIndex(
+            self.library, [("", "/music")])
+
+    def tearDown(self):
+        self.index.destroy()
+        self.library.destroy()
+
+    def test_find(self):
+        self.assertEqual(self.index.find("artist", "foo"),
+                         set(self.songs[:2]))
+        self.assertEqual(self.index.find("artist", "BAR", exact=False),
+                         set(self.songs[1:3]))
+        self.assertEqual(self.index.find("artist", "nope"), set())
+
+    def test_update(self):
+        self.index.find("artist", "foo")
+        self.songs[0]["artist"] = "quux"
+        self.library.changed([self.songs[0]])
+        self.assertEqual(self.index.find("artist", "foo"), {self.songs[1]})
+        self.assertEqual(self.index.find("artist", "quux"), {self.songs[0]})
+        self.library.remove([self.songs[1]])
+        self.assertEqual(self.index.find("artist", "foo"), set())
+        self.assertFalse("foo" in self.index.values("artist"))
+        new = _song("/music/d/5.ogg", artist="foo")
+        self.library.add([new])
+        self.assertEqual(self.index.find("artist", "foo"), {new})
+        self.assertTrue(self.index.is_dir("d"))
+
+    def test_dirs(self):
+        index = self.index
+        self.assertEqual(index.get_uri(self.songs[2]), "b/c/3.ogg")
+        self.assertEqual(index.get_uri(self.songs[3]), "elsewhere/4.ogg")
+        self.assertIs(index.get_song("a/1.ogg"), self.songs[0])
+        self.assertEqual(index.list_dir("")[0], ["a", "b", "elsewhere"])
+        self.assertEqual(index.list_dir("a"), ([], self.songs[:2]))
+        self.assertEqual(index.list_dir("b"), (["b/c"], []))
+        self.assertEqual(index.list_dir("nope"), None)
+        walked = list(index.walk("b"))
+        self.assertEqual(walked, [("b/c", None), (None, self.songs[2])])
+
+        self.library.remove([self.songs[2]])
+        self.assertFalse(index.is_dir("b/c"))
+        self.assertFalse(index.is_dir("b"))
+        self.assertEqual(index.list_dir("")[0], ["a", "elsewhere"])
+
+
 @skipIf(os.name == "nt", "mpd server not supported under Windows")
 class TMPDCommands(PluginTestCase):
 
@@ -126,3 +192,62 @@ class TMPDCommands(PluginTestCase):
     def test_idle_close(self):
         for cmd in ["idle", "noidle", "close"]:
             self._cmd(cmd.encode("ascii") + b"\n")
+
+    def _cmd_all(self, data):
+        self.s.send(data)
+        response = b""
+        while not response.endswith(b"OK\n") and b"ACK" not in response:
+            while Gtk.events_pending():
+                Gtk.main_iteration_do(True)
+            response += self.s.recv(99999)
+        return response
+
+    def _add_songs(self, count):
+        songs = [
+            _song("/music/%d/%d.ogg" % (i % 10, i), artist="a%d" % (i % 3),
+                  album="b%d" % (i % 5), title="t%d" % i)
+            for i in range(count)]
+        app.library.add(songs)
+        return songs
+
+    def test_list_find_search(self):
+        self._add_songs(30)
+        response = self._cmd_all(b"list artist\n")
+        self.assertEqual(
+            response, b"Artist: a0\nArtist: a1\nArtist: a2\nOK\n")
+        response = self._cmd_all(b"list album artist a1\n")
+        self.assertEqual(response.count(b"Album: "), 5)
+        response = self._cmd_all(b"find artist a1 album b1\n")
+        self.assertEqual(response.count(b"file: "), 2)
+        response = self._cmd_all(b"search title T1\n")
+        self.assertEqual(response.count(b"file: "), 11)
+        response = self._cmd_all(b"find nope a1\n")
+        assert response.startswith(b"ACK")
+        response = self._cmd_all(b"count artist a1\n")
+        self.assertEqual(response, b"songs: 10\nplaytime: 100\nOK\n")
+
+    def test_listallinfo_streaming(self):
+        self._add_songs(2000)
+        response = self._cmd_all(b"listallinfo\n")
+        self.assertEqual(response.count(b"file: "), 2000)
+        self.assertEqual(response.count(b"OK\n"), 1)
+        response = self._cmd_all(b"ping\n")
+        self.assertEqual(response, b"OK\n")
+
+    def test_playlist(self):
+        songs = self._add_songs(5)
+        app.window.playlist.pl.set(songs)
+        response = self._cmd_all(b"playlistinfo 1:3\n")
+        self.assertEqual(response.count(b"file: "), 2)
+        self.assertTrue(b"Pos: 1\n" in response)
+        response = self._cmd_all(b"playlistinfo 9\n")
+        assert response.startswith(b"ACK")
+
+        status = self._cmd_all(b"status\n")
+        version = int(status.split(b"playlist: ")[1].split(b"\n")[0])
+        self.assertEqual(self._cmd_all(b"plchanges %d\n" % version), b"OK\n")
+
+        app.window.playlist.pl.set(songs[:3] + songs[4:])
+        response = self._cmd_all(b"plchangesposid %d\n" % version)
+        self.assertEqual(response.count(b"cpos: "), 1)
+        self.assertTrue(b"cpos: 3\n" in response)
@@ -252,3 +252,28 @@ class TMPRIS(PluginTestCase):
         self.failUnlessEqual(resp["xesam:artist"], [u'fooman\ufffd'])
         # overflow
         assert resp["xesam:discNumber"] == 0
+
+    def test_emit_deltas(self):
+        obj = self.m.objects[0]
+        emitted = []
+        obj.emit_properties_changed = lambda iface, props: emitted.extend(props)
+
+        app.player.next()
+        obj.song_started(app.player.info)
+        self.failUnlessEqual(emitted, ["PlaybackStatus", "Metadata"])
+        del emitted[:]
+
+        # nothing changed
+        obj.song_started(app.player.info)
+        obj.paused()
+        self.failIf(emitted)
+
+        # only the current song is relevant
+        app.librarian.emit("changed", [A2])
+        self.failIf(emitted)
+        A1["title"] = "other"
+        try:
+            app.librarian.emit("changed", [A1])
+        finally:
+            A1["title"] = "excellent"
+        self.failUnlessEqual(emitted, ["Metadata"])
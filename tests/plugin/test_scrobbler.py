@@ -7,15 +7,17 @@
 
 import os
 import threading
-from time import sleep, time
+from http.server import HTTPServer, BaseHTTPRequestHandler
 from typing import List, Dict
+from urllib.parse import parse_qs
 
 from quodlibet import config
 from quodlibet.ext.events.qlscrobbler import QLSubmitQueue
 from quodlibet.formats import AudioFile
-from quodlibet.util.picklehelper import pickle_load
+from quodlibet.util.picklehelper import pickle_dump
+from quodlibet.util.submitlog import SubmitLog
 from senf import fsnative
-from tests import run_gtk_loop, init_fake_app, destroy_fake_app
+from tests import init_fake_app, destroy_fake_app
 from tests.plugin import PluginTestCase
 
 A_SONG = AudioFile({"~filename": fsnative("fake.mp3"),
@@ -23,6 +25,22 @@ A_SONG = AudioFile({"~filename": fsnative("fake.mp3"),
                     "title": "The Title"})
 
 
+class _SubmitHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        data = parse_qs(self.rfile.read(length).decode("utf-8"))
+        self.server.requests.append(data)
+        body = self.server.status.encode("utf-8") + b"\n"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
 class TScrobbler(PluginTestCase):
 
     @classmethod
@@ -41,6 +59,7 @@ class TScrobbler(PluginTestCase):
         # It's a class instance, so make sure :(
         self.plugin.queue.queue.clear()
         self.SCROBBLER_CACHE_FILE = self.mod.QLSubmitQueue.SCROBBLER_CACHE_FILE
+        self.SCROBBLER_LOG_FILE = self.mod.QLSubmitQueue.SCROBBLER_LOG_FILE
         try:
             os.unlink(self.SCROBBLER_CACHE_FILE)
         except FileNotFoundError:
@@ -57,47 +76,72 @@ class TScrobbler(PluginTestCase):
         for song in songs:
             queue.submit(song)
         assert len(queue.queue) == 1
-        queue.dump_queue()
 
+        # persisted right away, no need to dump
         loaded = self.load_queue()
+        assert len(loaded) == 1
         assert all(actual['a'] == expected["artist"]
                    and actual['t'] == expected["title"]
                    for actual, expected in zip(loaded, songs))
 
     def load_queue(self) -> List[Dict]:
+        log = SubmitLog(self.SCROBBLER_LOG_FILE)
         try:
-            with open(self.SCROBBLER_CACHE_FILE, 'rb') as f:
-                return pickle_load(f)
-        except FileNotFoundError:
-            return []
+            return [entry for seq, entry in log]
+        finally:
+            log.close()
 
     def test_enabled_disabled(self):
         self.plugin.enabled()
-        assert self.plugin._tid
-        # Disable
-        self.plugin.disabled()
-        assert not self.plugin._tid
-
-    def test_autosave(self):
-        self.plugin.AUTOSAVE_INTERVAL = 0.1
-        self.plugin.enabled()
-        assert not self.load_queue()
-        assert not self.plugin.queue.queue, "Queue not empty in test"
         self.plugin.queue.submit(A_SONG)
-        assert len(self.plugin.queue.queue) == 1, "Song wasn't queued"
-
-        queue = self.retry_queue()
-        assert len(queue) == 1, "Queued song didn't get persisted"
         self.plugin.disabled()
-
-    def retry_queue(self):
-        """Allows GTK looks, flushing of disk buffers etc"""
-        queue = None
-        start = time()
-        while time() - start < 2:
-            run_gtk_loop()
-            queue = self.load_queue()
-            if queue:
-                break
-            sleep(0.1)
-        return queue
+        assert len(self.load_queue()) == 1
+
+    def test_migrate_cache(self):
+        with open(self.SCROBBLER_CACHE_FILE, "wb") as h:
+            pickle_dump([{"a": "Old", "t": "Entry"}], h)
+        queue = self.mod.QLSubmitQueue()
+        assert not os.path.exists(self.SCROBBLER_CACHE_FILE)
+        assert [e["a"] for seq, e in queue.queue] == ["Old"]
+        assert len(self.load_queue()) == 1
+
+    def _serve(self, status):
+        server = HTTPServer(("127.0.0.1", 0), _SubmitHandler)
+        server.requests = []
+        server.status = status
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, "http://127.0.0.1:%d/" % server.server_address[1]
+
+    def test_submit_batches(self):
+        server, url = self._serve("OK")
+        queue = self.mod.QLSubmitQueue()
+        queue.session_id = "session"
+        queue.submit_url = url
+        for i in range(queue.MAX_SUBMISSIONS + 5):
+            queue.submit(A_SONG, timestamp=i + 1)
+
+        assert queue.send_submission()
+        assert len(queue.queue) == 5
+        assert queue.send_submission()
+        assert not queue.queue
+        assert not os.path.exists(self.SCROBBLER_LOG_FILE)
+
+        first, second = server.requests
+        assert first["s"] == ["session"]
+        assert len(first["a[49]"]) == 1 and "a[50]" not in first
+        assert first["i[0]"] == ["1"]
+        assert second["i[4]"] == [str(queue.MAX_SUBMISSIONS + 5)]
+
+    def test_submit_failed(self):
+        server, url = self._serve("FAILED")
+        queue = self.mod.QLSubmitQueue()
+        queue.session_id = "session"
+        queue.submit_url = url
+        queue.submit(A_SONG)
+        assert not queue.send_submission()
+        assert len(server.requests) == 1
+        assert len(queue.queue) == 1
+        assert len(self.load_queue()) == 1
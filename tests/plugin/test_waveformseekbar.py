@@ -6,9 +6,13 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
+import shutil
+
 from gi.repository import Gst
 
 from quodlibet.library.base import Library
+from tests import mkdtemp
 from tests.plugin import PluginTestCase
 from tests.helper import visible
 
@@ -65,3 +69,88 @@ class TWaveformSeekBar(PluginTestCase):
 
         message = FakeRMSMessage()
         bar._on_bus_message(None, message, 1234)
+
+
+class TWaveformCache(PluginTestCase):
+
+    def setUp(self):
+        self.mod = self.modules["WaveformSeekBar"]
+        self.dir = mkdtemp()
+        self.cache = self.mod.WaveformCache(os.path.join(self.dir, "cache"))
+        self.song = AudioFile({
+            "~filename": os.path.join(self.dir, "foo.ogg"), "~#mtime": 42})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        del self.mod
+
+    def test_missing(self):
+        self.assertEqual(self.cache.lookup(self.song, 100), None)
+        self.assertEqual(self.cache.resolutions(self.song), [])
+
+    def test_store_lookup(self):
+        values = [0.0, 0.25, 0.5, 1.0]
+        self.cache.store(self.song, 4, values)
+        self.assertEqual(self.cache.resolutions(self.song), [4])
+        cached = self.cache.lookup(self.song, 4)
+        self.assertEqual(len(cached), 4)
+        for a, b in zip(cached, values):
+            self.assertAlmostEqual(a, b, places=3)
+
+    def test_downsample_from_higher_resolution(self):
+        self.cache.store(self.song, 4, [0.0, 0.5, 1.0, 0.5])
+        cached = self.cache.lookup(self.song, 2)
+        self.assertEqual(len(cached), 2)
+        self.assertAlmostEqual(cached[0], 0.25, places=3)
+        self.assertAlmostEqual(cached[1], 0.75, places=3)
+        # a higher resolution can't be made up
+        self.assertEqual(self.cache.lookup(self.song, 8), None)
+
+    def test_mtime_invalidates(self):
+        self.cache.store(self.song, 4, [0.5] * 4)
+        self.song["~#mtime"] = 43
+        self.assertEqual(self.cache.lookup(self.song, 4), None)
+        self.cache.store(self.song, 4, [0.5] * 4)
+        self.assertEqual(len(os.listdir(os.path.join(self.dir, "cache"))), 1)
+
+    def test_index_read_once(self):
+        self.cache.store(self.song, 4, [0.5] * 4)
+        other = self.mod.WaveformCache(os.path.join(self.dir, "cache"))
+        self.assertEqual(other.resolutions(self.song), [4])
+        self.cache.store(self.song, 8, [0.5] * 8)
+        self.assertEqual(other.resolutions(self.song), [4])
+        self.assertEqual(self.cache.resolutions(self.song), [4, 8])
+
+    def test_removed_file(self):
+        self.cache.store(self.song, 4, [0.5] * 4)
+        shutil.rmtree(os.path.join(self.dir, "cache"))
+        self.assertEqual(self.cache.lookup(self.song, 4), None)
+        self.assertEqual(self.cache.resolutions(self.song), [])
+
+    def test_not_a_file(self):
+        song = AudioFile({"~filename": "", "~#mtime": 0})
+        song.is_file = False
+        self.cache.store(song, 4, [0.5] * 4)
+        self.assertEqual(self.cache.lookup(song, 4), None)
+
+    def test_has(self):
+        self.assertFalse(self.cache.has(self.song, 4))
+        self.cache.store(self.song, 4, [0.5] * 4)
+        self.assertTrue(self.cache.has(self.song, 4))
+        self.assertTrue(self.cache.has(self.song, 2))
+        self.assertFalse(self.cache.has(self.song, 8))
+
+    def test_prune(self):
+        path = os.path.join(self.dir, "cache")
+        cache = self.mod.WaveformCache(path, max_size=22)
+        songs = [AudioFile({"~filename": os.path.join(self.dir, "%d.ogg" % i),
+                            "~#mtime": 42}) for i in range(3)]
+        cache.store(songs[0], 4, [0.5] * 4)
+        for name in os.listdir(path):
+            os.utime(os.path.join(path, name), (1, 1))
+        cache.store(songs[1], 4, [0.5] * 4)
+        cache.store(songs[2], 4, [0.5] * 4)
+        self.assertEqual(len(os.listdir(path)), 2)
+        self.assertFalse(cache.has(songs[0], 4))
+        self.assertTrue(cache.has(songs[1], 4))
+        self.assertTrue(cache.has(songs[2], 4))
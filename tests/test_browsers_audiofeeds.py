@@ -3,13 +3,20 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
+import shutil
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
 from gi.repository import Gtk
 
 import quodlibet.config
-from quodlibet.browsers.audiofeeds import AudioFeeds, AddFeedDialog, Feed
+from quodlibet.browsers.audiofeeds import AudioFeeds, AddFeedDialog, Feed, \
+    FeedRefresher, save_feeds, load_feeds
 from quodlibet.library import SongLibrary
 from senf import fsn2uri
-from tests import TestCase, get_data_path
+from tests import TestCase, get_data_path, mkdtemp
 
 TEST_URL = u"https://a@b:foo.example.com?bar=baz&quxx#anchor"
 
@@ -62,3 +69,116 @@ class TFeed(TestCase):
 
     def tearDown(self):
         quodlibet.config.quit()
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            server.requests.append(self.headers.get("If-None-Match"))
+        try:
+            time.sleep(server.delay)
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            with open(get_data_path("valid_feed.xml"), "rb") as h:
+                data = h.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/rss+xml")
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TFeedRefresher(TestCase):
+
+    def setUp(self):
+        quodlibet.config.init()
+        self.server = server = ThreadingHTTPServer(("127.0.0.1", 0), _FeedHandler)
+        server.daemon_threads = True
+        server.lock = threading.Lock()
+        server.active = server.max_active = 0
+        server.requests = []
+        server.delay = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/" % server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        quodlibet.config.quit()
+
+    def test_conditional(self):
+        feed = Feed(self.url + "feed")
+        self.assertTrue(feed.parse())
+        self.assertEqual(feed.etag, '"v1"')
+        self.assertEqual(len(feed), 2)
+
+        self.assertFalse(feed.parse())
+        self.assertEqual(len(feed), 2)
+        self.assertEqual(self.server.requests, [None, '"v1"'])
+
+    def test_refresh(self):
+        self.server.delay = 0.05
+        feeds = [Feed(self.url + "feed%d" % i) for i in range(6)]
+        changed = FeedRefresher(max_workers=4, per_host=2).refresh(feeds)
+        self.assertEqual(len(changed), 6)
+        self.assertTrue(all(len(f) == 2 for f in feeds))
+        self.assertTrue(self.server.max_active <= 2)
+
+        # nothing changed, one 304 each
+        self.assertEqual(FeedRefresher().refresh(feeds), [])
+        self.assertEqual(self.server.requests[6:], ['"v1"'] * 6)
+
+
+class TFeedStorage(TestCase):
+
+    def setUp(self):
+        quodlibet.config.init()
+        self.temp = mkdtemp()
+        self.dir = os.path.join(self.temp, "feeds")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+        quodlibet.config.quit()
+
+    def test_empty(self):
+        self.assertTrue(load_feeds(self.dir) is None)
+
+    def test_save_load(self):
+        feeds = [Feed("http://example.com/%d" % i) for i in range(3)]
+        feeds[1].name = "foo"
+        save_feeds(feeds, directory=self.dir)
+        loaded = load_feeds(self.dir)
+        self.assertEqual([f.uri for f in loaded], [f.uri for f in feeds])
+        self.assertEqual(loaded[1].name, "foo")
+
+    def test_incremental(self):
+        feeds = [Feed("http://example.com/%d" % i) for i in range(3)]
+        save_feeds(feeds, directory=self.dir)
+        for feed in feeds:
+            feed.name = "changed"
+        save_feeds(feeds[::-1], changed=[feeds[0]], directory=self.dir)
+        loaded = load_feeds(self.dir)
+        self.assertEqual([f.uri for f in loaded],
+                         [f.uri for f in feeds[::-1]])
+        self.assertEqual([f.name for f in loaded],
+                         ["Unknown", "Unknown", "changed"])
+
+    def test_removed(self):
+        feeds = [Feed("http://example.com/%d" % i) for i in range(3)]
+        save_feeds(feeds, directory=self.dir)
+        save_feeds(feeds[:1], directory=self.dir)
+        self.assertEqual(len(load_feeds(self.dir)), 1)
+        self.assertEqual(len(os.listdir(self.dir)), 2)
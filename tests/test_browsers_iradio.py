@@ -3,16 +3,19 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import bz2
 import io
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
 
-from quodlibet.util import is_windows, is_osx
-from tests import TestCase, skipIf, run_gtk_loop
+from tests import TestCase
 
 from quodlibet.library import SongLibrary
 from quodlibet.formats import AudioFile
 from quodlibet.browsers.iradio import (InternetRadio, IRFile, QuestionBar,
                                        parse_taglist, parse_pls, parse_m3u,
-                                       download_taglist, STATION_LIST_URL)
+                                       download_taglist, iter_taglist,
+                                       iter_decompressed, IRadioError)
 import quodlibet.config
 
 quodlibet.config.RATINGS = quodlibet.config.HardCodedRatingsPrefs()
@@ -32,6 +35,96 @@ artist=bar
     assert stations[0].list("artist") == ["foo", "bar"]
 
 
+def test_iter_taglist_chunks():
+    data = b"uri=http://foo.bar\nartist=foo\nuri=http://b.az\ntitle=x\n"
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    stations = list(iter_taglist(chunks))
+    assert [s("~uri") for s in stations] == ["http://foo.bar", "http://b.az"]
+    assert stations[0]("artist") == "foo"
+    assert stations[1]("title") == "x"
+
+
+def test_iter_decompressed():
+    data = b"uri=http://foo.bar\n" * 1000
+    fileobj = io.BytesIO(bz2.compress(data))
+    assert b"".join(iter_decompressed(fileobj, step=16)) == data
+
+    truncated = io.BytesIO(bz2.compress(data)[:-10])
+    try:
+        list(iter_decompressed(truncated))
+    except EOFError:
+        pass
+    else:
+        assert False
+
+
+TAGLIST = bz2.compress(b"".join(
+    b"uri=http://example.com/%d\ntitle=Station %d\n" % (i, i)
+    for i in range(25)))
+
+
+class _TaglistHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(TAGLIST)))
+        self.end_headers()
+        self.wfile.write(TAGLIST)
+
+    def log_message(self, *args):
+        pass
+
+
+class TDownloadTaglist(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), _TaglistHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/radiolist.bz2" % \
+            self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_download(self):
+        batches = []
+        progress = []
+        validators = download_taglist(
+            batches.append, url=self.url, progress=progress.append,
+            batch_size=10)
+        self.assertEqual([len(b) for b in batches], [10, 10, 5])
+        self.assertEqual(batches[2][-1]("title"), "Station 24")
+        self.assertEqual(progress[-1], 1.0)
+        self.assertEqual(validators["etag"], '"v1"')
+        self.assertEqual(validators["url"], self.url)
+
+        # conditional request, nothing changed
+        batches = []
+        self.assertEqual(download_taglist(
+            batches.append, url=self.url, validators=validators), None)
+        self.assertFalse(batches)
+        self.assertEqual(self.server.requests, [None, '"v1"'])
+
+        # validators for a different URL are ignored
+        validators["url"] = "http://example.com"
+        self.assertTrue(download_taglist(
+            batches.append, url=self.url, validators=validators))
+        self.assertEqual(len(batches), 1)
+
+    def test_error(self):
+        self.assertRaises(
+            IRadioError, download_taglist, lambda b: None,
+            url="http://127.0.0.1:1/")
+
+
 class FakeTask:
     def __init__(self):
         self.pulsed = 0
@@ -153,20 +246,3 @@ class TIRFile(TestCase):
         new.from_dump(dump)
         self.assertTrue("title" not in new)
         self.assertTrue("artist" not in new)
-
-    @skipIf(is_windows() or is_osx(), "Don't need to test all the time")
-    def test_download_tags(self):
-        self.received = []
-        # TODO: parameterise this, spin up a local HTTP server, inject this.
-        url = STATION_LIST_URL
-
-        def cb(data):
-            assert data
-            self.received += data
-
-        ret = list(download_taglist(cb, None))
-        run_gtk_loop()
-        assert all(ret)
-        assert self.received, "No stations received from %s" % url
-        assert len(self.received) > 100
-        # TODO: some more targeted tests
@@ -5,8 +5,15 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-from .helper import capture_output
+import os
+import subprocess
+import sys
+
+from senf import fsnative
+
+from .helper import capture_output, temp_filename
 from quodlibet import cli
+from quodlibet.formats import AudioFile, dump_audio_files
 from tests import TestCase
 
 
@@ -22,3 +29,53 @@ class Tcli(TestCase):
         with self.assertRaises(SystemExit):
             with capture_output():
                 cli.process_arguments(["myprog", "--wrong-thing"])
+
+    def test_parse_headless(self):
+        parse = cli.parse_headless
+        self.assertEqual(parse(["myprog"]), None)
+        self.assertEqual(parse(["myprog", "--status"]), ("status", []))
+        self.assertEqual(parse(["myprog", "--status", "--run"]), None)
+        self.assertEqual(
+            parse(["myprog", "--print-playing"]), ("print-playing", []))
+        self.assertEqual(
+            parse(["myprog", "--print-playing", "<title>"]),
+            ("print-playing", ["<title>"]))
+        self.assertEqual(
+            parse(["myprog", "--print-query", "foo"]),
+            ("print-query", ["foo"]))
+        self.assertEqual(
+            parse(["myprog", "--print-query=foo"]), ("print-query", ["foo"]))
+        self.assertEqual(parse(["myprog", "--print-query"]), None)
+        self.assertEqual(parse(["myprog", "--next"]), None)
+
+    def test_query_songs(self):
+        root = os.path.abspath(os.sep)
+        songs = [AudioFile({
+            "~filename": fsnative(os.path.join(root, "%d.ogg" % i)),
+            "~mountpoint": fsnative(root),
+            "artist": artist,
+        }) for i, artist in enumerate(["foo", "bar", "foo"])]
+        masked = AudioFile({
+            "~filename": fsnative(u"/nope/nope.ogg"),
+            "~mountpoint": fsnative(u"/nope"),
+            "artist": "foo",
+        })
+
+        with temp_filename() as filename:
+            with open(filename, "wb") as h:
+                h.write(dump_audio_files(songs + [masked]))
+            result = cli.query_songs(filename, "artist=foo")
+            self.assertEqual(
+                [s("~filename") for s in result],
+                [songs[0]("~filename"), songs[2]("~filename")])
+            self.assertEqual(len(cli.query_songs(filename, "")), 3)
+
+    def test_no_remote_import(self):
+        # the headless path must not import the FIFO code (and GLib)
+        code = ("import sys, quodlibet.cli; "
+                "print('quodlibet.remote' in sys.modules, "
+                "'quodlibet.util.fifo' in sys.modules)")
+        root = os.path.dirname(os.path.dirname(cli.__file__))
+        out = subprocess.check_output(
+            [sys.executable, "-c", code], cwd=root)
+        self.assertEqual(out.split(), [b"False", b"False"])
@@ -86,6 +86,7 @@ class TCommands(TestCase):
         self.__send("quit")
         self.__send("random album")
         self.__send("refresh")
+        self.__send("fetch-covers")
         self.__send("repeat 0")
         self.__send("rating 0.5")
         self.__send("rating +0.01")
@@ -13,6 +13,7 @@ from tempfile import mkstemp, mkdtemp
 from quodlibet import config, app
 from quodlibet.formats import AudioFile, types as format_types, AudioFileError
 from quodlibet.formats import decode_value, MusicFile, FILESYSTEM_TAGS
+from quodlibet.formats import current_generation
 from quodlibet.formats._audio import NUMERIC_ZERO_DEFAULT
 from quodlibet.util.environment import is_windows
 from quodlibet.util.path import (normalize_path, mkdir, get_home_dir, unquote,
@@ -150,6 +151,20 @@ class TAudioFile(TestCase):
         with self.assertRaises(TypeError):
             af[b"foo"] = u"bar"
 
+    def test_generation(self):
+        af = AudioFile()
+        start = current_generation()
+        self.assertFalse(af._generation > start)
+        af["~#playcount"] = 1
+        self.assertTrue(af._generation > start)
+        self.assertFalse(af._write_generation > start)
+        af["title"] = "foo"
+        self.assertTrue(af._write_generation > start)
+        self.assertEqual(af._generation, current_generation())
+        start = current_generation()
+        del af["title"]
+        self.assertTrue(af._write_generation > start)
+
     def test_call(self):
         # real keys should lookup the same
         for key in bar_1_1.realkeys():
@@ -5,6 +5,8 @@
 
 import os
 import shutil
+import threading
+import time
 from pathlib import Path
 from time import sleep
 
@@ -14,6 +16,7 @@ from quodlibet import config, app, print_d
 from quodlibet.library import SongFileLibrary
 from quodlibet.library.file import FileLibrary
 from quodlibet.util.library import get_exclude_dirs
+from quodlibet.util.mounts import MountProber
 from quodlibet.util.path import normalize_path
 from senf import text2fsn
 from tests import (mkdtemp, get_data_path, run_gtk_loop, _TEMP_DIR,
@@ -80,6 +83,26 @@ class TFileLibrary(TLibrary):
         self.library._load_init([new])
         self.failUnlessEqual(list(self.library.values()), [new])
 
+    def test_load_init_unresponsive(self):
+        release = threading.Event()
+
+        def check(mountpoint, exists):
+            release.wait()
+            return True
+
+        self.library._prober = MountProber(timeout=0.05, check=check)
+        self.library.RETRY_INTERVAL = 0
+        new = self.Fake(300)
+        self.library._load_init([new])
+        self.failUnless(self.library.masked(new))
+
+        release.set()
+        start = time.time()
+        while self.library.masked(new) and time.time() - start < 5:
+            run_gtk_loop()
+        self.failUnlessEqual(list(self.library.values()), [new])
+        self.failIf(self.library._retries)
+
     def test_reload(self):
         new = self.Fake(200)
         self.library.add([new])
@@ -190,13 +213,13 @@ class TWatchedFileLibrary(TLibrary):
         with temp_filename(dir=self.temp_path, suffix=".mp3", as_path=True) as path:
             shutil.copy(Path(get_data_path("silence-44-s.mp3")), path)
             sleep(0.5)
-            run_gtk_loop()
+            self._wait_for_events()
             assert path.exists()
             assert str(path) in self.library, f"{path} should be in [{self.fns}] now"
         assert not path.exists(), "Failed to delete test file"
         sleep(0.5)
         # Deletion now
-        run_gtk_loop()
+        self._wait_for_events()
         assert self.removed, "Nothing was automatically removed"
         assert self.added, "Nothing was automatically added"
         assert {Path(af("~filename")) for af in self.added} == {path}
@@ -209,7 +232,7 @@ class TWatchedFileLibrary(TLibrary):
             assert self.temp_path in path.parents, "Copied test file incorrectly"
             watch_dirs = self.library._monitors.keys()
             assert path.parent in watch_dirs, "Not monitoring directory of new file"
-            run_gtk_loop()
+            self._wait_for_events()
             assert self.library, f"Nothing in library despite watches on {watch_dirs}"
             assert str(path) in self.library, (f"{path!s} should have been added to "
                                                f"library [{self.fns}]")
@@ -220,7 +243,7 @@ class TWatchedFileLibrary(TLibrary):
             shutil.copy(Path(get_data_path("silence-44-s.flac")), path)
             sleep(0.2)
             assert path.exists()
-            run_gtk_loop()
+            self._wait_for_events()
             assert str(path) in self.library, f"New path {path!s} didn't get added"
             assert len(self.added) == 1
             assert self.added[0]("~basename") == path.name
@@ -233,7 +256,7 @@ class TWatchedFileLibrary(TLibrary):
             assert not path.exists(), "test should have removed old file"
             assert new_path.exists(), "test should have renamed file"
             print_d(f"New test file at {new_path}")
-            run_gtk_loop()
+            self._wait_for_events()
             p = normalize_path(str(new_path), True)
             assert p in self.library, f"New path {new_path} not in library [{self.fns}]"
             msg = "Inconsistent events: should be (added and removed) or nothing at all"
@@ -249,7 +272,7 @@ class TWatchedFileLibrary(TLibrary):
             shutil.copy(Path(get_data_path("silence-44-s.flac")), path)
             sleep(0.2)
             assert path.exists()
-            run_gtk_loop()
+            self._wait_for_events()
             assert str(path) in self.library, f"New path {path!s} didn't get added"
             assert len(self.added) == 1
             self.added.clear()
@@ -260,7 +283,7 @@ class TWatchedFileLibrary(TLibrary):
             temp_dir.rename(new_dir)
             assert new_dir.is_dir(), "test should have moved to new dir"
             sleep(0.2)
-            run_gtk_loop()
+            self._wait_for_events()
 
             new_path = new_dir / path.name
             assert new_path.is_file()
@@ -268,6 +291,41 @@ class TWatchedFileLibrary(TLibrary):
             assert str(new_path) in self.library, msg
             assert not self.removed, "A file was removed"
 
+    def test_watched_created_deleted(self):
+        with temp_filename(dir=self.temp_path, suffix=".mp3", as_path=True) as path:
+            shutil.copy(Path(get_data_path("silence-44-s.mp3")), path)
+            sleep(0.1)
+            run_gtk_loop()
+        # Gone before the events got handled, so nothing should happen
+        sleep(0.1)
+        self._wait_for_events()
+        assert str(path) not in self.library
+        assert not self.added, "Added a file which is gone"
+        assert not self.removed
+
+    def test_songs_below(self):
+        root = self.temp_path / "below"
+        songs = [FakeAudioFile(str(root / "a.mp3")),
+                 FakeAudioFile(str(root / "sub" / "b.mp3")),
+                 FakeAudioFile(str(self.temp_path / "below-not" / "c.mp3"))]
+        self.library.add(songs[:2])
+        assert set(self.library._songs_below(root)) == set(songs[:2])
+        # the index is kept up to date afterwards
+        self.library.add(songs[2:])
+        self.library.remove(songs[:1])
+        assert self.library._songs_below(root) == [songs[1]]
+        assert self.library._songs_below(root / "sub") == [songs[1]]
+        assert self.library._songs_below(root / "other") == []
+
+    def _wait_for_events(self, timeout=5):
+        """Runs the main loop until file monitor events got handled"""
+
+        run_gtk_loop()
+        start = time.time()
+        while self.library.has_pending_events() and time.time() - start < timeout:
+            sleep(0.05)
+            run_gtk_loop()
+
     @property
     def fns(self) -> str:
         return ", ".join(s("~filename") for s in self.library)
@@ -6,6 +6,7 @@
 # (at your option) any later version.
 
 import os
+import shlex
 import sys
 
 from quodlibet.util import is_osx, is_windows
@@ -665,3 +666,83 @@ class TOperonFill(TOperonBase):
 
         self.assertTrue("title" in o)
         self.assertTrue(self.s("~basename") in o)
+
+
+class TOperonJobs(TOperonBase):
+    # -j <n> <command> [<args>]
+
+    def test_invalid(self):
+        self.check_false(["-j", "-1", "print", self.f], False, True)
+
+    def test_set(self):
+        self.check_true(
+            ["-j", "2", "set", "foo", "bar", self.f, self.f2], False, False)
+        self.s.reload()
+        self.s2.reload()
+        self.failUnlessEqual(self.s["foo"], "bar")
+        self.failUnlessEqual(self.s2["foo"], "bar")
+
+    def test_print_order(self):
+        o, e = self.check_true(
+            ["--jobs=2", "print", "-p", "<~basename>",
+             self.f, self.f2, self.f], True, False)
+        names = [os.path.basename(p) for p in [self.f, self.f2, self.f]]
+        self.failUnlessEqual(o.splitlines(), names)
+
+    def test_load_error(self):
+        self.check_false(
+            ["-j", "2", "set", "foo", "bar", self.f, self.f3], False, True)
+
+
+class TOperonBatch(TOperonBase):
+    # batch [-f <file>] [<command> [<args>]]
+
+    def setUp(self):
+        super().setUp()
+        fd, self.batch = mkstemp(".txt")
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.batch)
+        super().tearDown()
+
+    def _write(self, lines):
+        with open(self.batch, "w", encoding="utf-8") as h:
+            h.write("\n".join(lines) + "\n")
+
+    def test_commands(self):
+        self._write([
+            "# a comment",
+            "set foo bar %s" % shlex.quote(self.f),
+            "",
+            "add foo baz %s" % shlex.quote(self.f2),
+        ])
+        self.check_true(["batch", "-f", self.batch], False, False)
+        self.s.reload()
+        self.s2.reload()
+        self.failUnlessEqual(self.s["foo"], "bar")
+        self.failUnlessEqual(self.s2["foo"], "baz")
+
+    def test_files(self):
+        self._write([self.f, self.f2])
+        self.check_true(
+            ["batch", "-f", self.batch, "set", "foo", "x"], False, False)
+        self.s.reload()
+        self.s2.reload()
+        self.failUnlessEqual(self.s["foo"], "x")
+        self.failUnlessEqual(self.s2["foo"], "x")
+
+    def test_options_per_command(self):
+        dry_run = "add --dry-run foo x %s" % shlex.quote(self.f)
+        self._write([dry_run])
+        o, e = call(["batch", "-f", self.batch])[1:]
+        # --dry-run makes add verbose, but not the following commands
+        self._write([dry_run, "set foo bar %s" % shlex.quote(self.f2)])
+        self.failUnlessEqual(call(["batch", "-f", self.batch])[1:], (o, e))
+
+    def test_errors(self):
+        self._write(["nope", "set foo bar %s" % shlex.quote(self.f), "batch"])
+        self.check_false(["batch", "-f", self.batch], False, True)
+        self.s.reload()
+        self.failUnlessEqual(self.s["foo"], "bar")
+        self.check_false(["batch", "-f", self.batch + "nope"], False, True)
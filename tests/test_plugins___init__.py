@@ -58,9 +58,15 @@ class TSongWrapper(TestCase):
 
     def test_pop(self):
         self.failIf(self.wrap._needs_write)
-        self.wrap.pop("artist", None)
+        self.wrap.pop("title", None)
         self.failUnless(self.wrap._needs_write)
 
+    def test_pop_missing(self):
+        self.assertEqual(self.wrap.pop("artist", None), None)
+        self.assertRaises(KeyError, self.wrap.pop, "artist")
+        self.failIf(self.wrap._was_updated())
+        self.failIf(self.wrap._needs_write)
+
     def test_getitem(self):
         self.failUnlessEqual(self.wrap["title"], "woo")
 
@@ -122,6 +128,28 @@ class TSongWrapper(TestCase):
         self.wrap["version"] = "bar"
         self.failUnless(self.wrap._was_updated())
 
+    def test_direct_change(self):
+        self.wrap._song["title"] = "bar"
+        self.failUnless(self.wrap._was_updated())
+        self.failUnless(self.wrap._needs_write)
+
+    def test_direct_change_internal(self):
+        self.wrap._song.add("~foo", "bar")
+        self.failUnless(self.wrap._was_updated())
+        self.failIf(self.wrap._needs_write)
+
+    def test_force_write(self):
+        self.wrap._needs_write = True
+        self.failUnless(self.wrap._needs_write)
+        self.wrap._needs_write = False
+        self.failIf(self.wrap._needs_write)
+        self.failIf(self.wrap._was_updated())
+
+    def test_update(self):
+        self.wrap.update({"foo": "bar"})
+        self.failUnless(self.wrap._was_updated())
+        self.failUnless(self.wrap._needs_write)
+
     def test_bookmark(self):
         self.failUnlessEqual(self.psong.bookmarks, self.pwrap.bookmarks)
         self.pwrap.bookmarks = [(43, "another mark")]
@@ -144,6 +172,13 @@ class TListWrapper(TestCase):
         self.failUnless(len(wrapped) == 2)
         self.failUnlessEqual(wrapped, [None, None])
 
+    def test_changed(self):
+        songs = [AudioFile({"title": str(i)}) for i in range(3)]
+        wrapped = ListWrapper(songs)
+        songs[1]["title"] = "changed"
+        self.failUnlessEqual(
+            [w._was_updated() for w in wrapped], [False, True, False])
+
 
 class TPluginConfig(TestCase):
 
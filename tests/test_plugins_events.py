@@ -12,7 +12,9 @@ import shutil
 from quodlibet import player
 from quodlibet.library import SongLibrarian, SongLibrary
 from quodlibet.plugins import PluginManager
-from quodlibet.plugins.events import EventPluginHandler
+from quodlibet.formats import AudioFile
+from quodlibet.plugins.events import EventPluginHandler, get_stats, \
+    reset_stats
 from quodlibet.qltk.songlist import SongList
 
 
@@ -33,6 +35,7 @@ class TEventPlugins(TestCase):
         self.assertEquals(self.pm.plugins, [])
 
     def tearDown(self):
+        reset_stats()
         self.pm.quit()
         shutil.rmtree(self.tempdir)
 
@@ -82,6 +85,7 @@ class TEventPlugins(TestCase):
         plugin = self.pm.plugins[0]
         self.pm.enable(plugin, True)
         self.lib.emit("changed", [None])
+        self.handler.flush()
         self.failUnlessEqual([("plugin_on_changed", ([None],))],
                              self._get_calls(plugin))
 
@@ -94,3 +98,46 @@ class TEventPlugins(TestCase):
         self.songlist.emit("selection-changed", self.songlist.get_selection())
         self.failUnlessEqual(self._get_calls(plugin),
                              [("plugin_on_songs_selected", ([], ))])
+
+    def test_lib_batched(self):
+        self.create_plugin(
+            name='Name', funcs=["plugin_on_changed", "plugin_on_paused"])
+        self.pm.rescan()
+        plugin = self.pm.plugins[0]
+        self.pm.enable(plugin, True)
+        a = AudioFile({"~filename": "/a"})
+        b = AudioFile({"~filename": "/b"})
+        self.lib.emit("changed", [a])
+        self.lib.emit("changed", [b, a])
+        self.assertEqual(self._get_calls(plugin), [])
+        self.player.emit("paused")
+        calls = self._get_calls(plugin)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0][0], "plugin_on_changed")
+        self.assertEqual(
+            [s("~filename") for s in calls[0][1][0]], ["/a", "/b"])
+        self.assertEqual(calls[1], ("plugin_on_paused", tuple()))
+
+    def test_lib_flushed_on_disable(self):
+        self.create_plugin(name='Name', funcs=["plugin_on_changed"])
+        self.pm.rescan()
+        plugin = self.pm.plugins[0]
+        self.pm.enable(plugin, True)
+        self.lib.emit("changed", [AudioFile({"~filename": "/a"})])
+        self.assertEqual(self._get_calls(plugin), [])
+        self.pm.enable(plugin, False)
+        calls = self._get_calls(plugin)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0][0], "plugin_on_changed")
+
+    def test_stats(self):
+        self.create_plugin(name='Name', funcs=["plugin_on_paused"])
+        self.pm.rescan()
+        self.pm.enable(self.pm.plugins[0], True)
+        self.player.emit("paused")
+        self.player.emit("paused")
+        stats = get_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["plugin"], "Name")
+        self.assertEqual(stats[0]["event"], "plugin_on_paused")
+        self.assertEqual(stats[0]["count"], 2)
@@ -245,6 +245,48 @@ class TPlaylistModel(TestCase):
         self.pl.clear()
         self.pl.go_to(None)
 
+    def test_peek_next_ended(self):
+        self.assertEqual(self.pl.peek_next_ended(), 0)
+        self.pl.go_to(3)
+        self.assertEqual(self.pl.peek_next_ended(), 4)
+        self.assertEqual(self.pl.current, 3)
+        self.pl.go_to(9)
+        self.assertEqual(self.pl.peek_next_ended(), None)
+
+    def test_peek_next_ended_shuffle(self):
+        self.pl.order = RepeatSongForever(OrderShuffle())
+        self.pl.go_to(3)
+        self.assertEqual(self.pl.peek_next_ended(), 3)
+        self.pl.order = OrderShuffle()
+        self.pl.go_to(3)
+        played = list(self.pl.order._played)
+        peeked = self.pl.peek_next_ended()
+        self.assertNotEqual(peeked, 3)
+        self.assertEqual(self.pl.peek_next_ended(), peeked)
+        self.assertEqual(self.pl.order._played, played)
+        self.pl.next_ended()
+        self.assertEqual(self.pl.current, peeked)
+
+    def test_peek_next_ended_unpredictable(self):
+        class SideEffectOrder(Order):
+            def next(self, playlist, iter):
+                raise AssertionError
+
+        self.pl.order = SideEffectOrder()
+        self.pl.go_to(3)
+        self.assertEqual(self.pl.peek_next_ended(), None)
+        self.pl.order = RepeatListForever(SideEffectOrder())
+        self.assertEqual(self.pl.peek_next_ended(), None)
+
+    def test_order_changed(self):
+        changed = []
+        self.pl.connect("order-changed", lambda *x: changed.append(True))
+        order = OrderShuffle()
+        self.pl.order = order
+        self.pl.order = order
+        self.assertEqual(len(changed), 1)
+        self.assertIs(self.pl.order, order)
+
     def shutDown(self):
         self.pl.destroy()
 
@@ -488,6 +530,33 @@ class TPlaylistMux(TestCase):
         self.next()
         self.assertTrue(self.pl.sourced)
 
+    def test_peek_next_ended(self):
+        self.q.set(range(5))
+        self.pl.set(range(5, 10))
+        do_events()
+        self.assertEqual(self.mux.peek_next_ended(), 0)
+        self.assertEqual(self.mux.current, None)
+        for i in range(5):
+            self.next()
+        self.assertEqual(self.mux.peek_next_ended(), 5)
+        self.assertEqual(self.next(), 5)
+
+    def test_get_upcoming(self):
+        self.pl.set(range(5, 10))
+        do_events()
+        self.assertEqual(self.mux.get_upcoming(3), [5])
+        self.q.set([5, 1, 2, 3])
+        do_events()
+        self.assertEqual(self.mux.get_upcoming(3), [5, 1, 2])
+        self.assertEqual(self.mux.get_upcoming(1), [5])
+        self.assertEqual(self.mux.get_upcoming(10), [5, 1, 2, 3])
+        self.q.clear()
+        self.assertEqual(self.next(), 5)
+        self.assertEqual(self.mux.get_upcoming(3), [6])
+
+    def test_models(self):
+        self.assertEqual(self.mux.models, [self.q, self.pl])
+
     def test_queue_preserved_when_setexplicit_rejected(self):
         class TestOrder(Order):
             def set_explicit(self, playlist, iter):
@@ -10,14 +10,14 @@ from unittest import mock
 
 import pytest
 from gi.repository import GLib, Gio
-from senf import fsn2bytes, bytes2fsn
+from senf import fsn2bytes, bytes2fsn, fsnative
 
 from . import TestCase, skipIf
 from .helper import temp_filename
 
 import quodlibet
-from quodlibet.remote import QuodLibetUnixRemote
-from quodlibet.util import is_windows
+from quodlibet.remote import QuodLibetUnixRemote, RemoteError
+from quodlibet.util import is_windows, ctlsocket, fifo
 
 
 QLPATH = str(Path(quodlibet.__file__).resolve().parent.parent)
@@ -32,6 +32,10 @@ class Mock:
         self.lines.append(line)
         return self.resp
 
+    def run(self, app, name, *args):
+        self.lines.append(" ".join((name,) + args))
+        return self.resp
+
 
 @skipIf(is_windows(), "unix only")
 class TUnixRemote(TestCase):
@@ -53,6 +57,32 @@ class TUnixRemote(TestCase):
             with open(fn, "rb") as h:
                 self.assertEqual(h.read(), b"resp")
 
+    def test_socket_command(self):
+        mock = Mock(resp="resp")
+        remote = QuodLibetUnixRemote(None, mock)
+        self.assertEqual(remote._run_command("foo", ["bar"]), "resp")
+        self.assertEqual(mock.lines, ["foo bar"])
+
+    def test_socket_no_fifo_resend(self):
+        class Client:
+            def __init__(self, path):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def call(self, command, *args):
+                raise ctlsocket.ControlSocketError("timed out")
+
+        with mock.patch.object(ctlsocket, "ControlSocketClient", Client), \
+                mock.patch.object(fifo, "write_fifo") as write_fifo:
+            with self.assertRaises(RemoteError):
+                QuodLibetUnixRemote.send_message(fsnative("next"))
+            write_fifo.assert_not_called()
+
 
 @skipIf(is_windows(), "unix only")
 class TUnixRemoteFifoFullCycle(TestCase):
@@ -60,7 +90,10 @@ class TUnixRemoteFifoFullCycle(TestCase):
     def tmp_fifo_path(self, tmp_path):
         self.registry = Mock(resp=bytes2fsn(b"response", None))
         self.tmp_path = tmp_path
-        with mock.patch.object(QuodLibetUnixRemote, "_PATH", str(tmp_path / "control")):
+        with mock.patch.object(QuodLibetUnixRemote, "_PATH",
+                               str(tmp_path / "control")), \
+                mock.patch.object(QuodLibetUnixRemote, "_SOCKET_PATH",
+                                  str(tmp_path / "control.sock")):
             yield
 
     def _send_message_remote_proc(self, msg, callback):
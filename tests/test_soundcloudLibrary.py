@@ -6,7 +6,13 @@
 # (at your option) any later version.
 
 import json
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+from gi.repository import Gtk
 
 from quodlibet import config
 from quodlibet.browsers.soundcloud.api import SoundcloudApiClient
@@ -69,3 +75,110 @@ class TSoundcloudLibrary(TestCase):
         s = list(lib._contents.values())[0]
         url = s("artwork_url")
         assert url == "https://i1.sndcdn.com/artworks-000121689963-0b0pdr-t500x500.jpg"
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    """Answers with the recorded API responses"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        key = url.path
+        cursor = parse_qs(url.query).get("cursor")
+        if cursor:
+            key += "?cursor=" + cursor[0]
+        self.server.requests.append(key)
+        if key not in self.server.fixture:
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.fixture[key])
+        body = body.replace("{root}", self.server.root).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TSoundcloudPaging(TestCase):
+
+    def setUp(self):
+        config.init()
+        config.RATINGS = config.HardCodedRatingsPrefs()
+        config.set("browsers", "soundcloud_user_id", "1")
+        self.server = HTTPServer(("127.0.0.1", 0), _FixtureHandler)
+        self.server.root = "http://127.0.0.1:%d" % self.server.server_port
+        self.server.requests = []
+        with open(TEST_DATA_PATH / "soundcloud_api_fixture.json") as f:
+            self.server.fixture = json.load(f)
+        threading.Thread(target=self.server.serve_forever).start()
+
+        SoundcloudLibrary.librarian = None
+        self.client = SoundcloudApiClient()
+        self.client.root = self.server.root
+        self.lib = SoundcloudLibrary(self.client)
+
+    def tearDown(self):
+        self.lib.destroy()
+        self.server.shutdown()
+        self.server.server_close()
+        config.quit()
+
+    def _wait(self, condition):
+        start = time.time()
+        while not condition() and time.time() - start < 5:
+            Gtk.main_iteration_do(False)
+        self.assertTrue(condition())
+
+    def _has_stream_urls(self):
+        return all(s("~uri").startswith("https://cf-media.sndcdn.com/")
+                   for s in self.lib.values())
+
+    def test_pages(self):
+        received = []
+        self.client.connect("songs-received", lambda c, s: received.append(s))
+        self.lib.query_with_refresh(SoundcloudQuery("foo"))
+        self._wait(lambda: len(self.lib) == 3)
+        self.assertEqual([len(songs) for songs in received], [2, 1])
+        self.assertEqual(self.server.requests[0], "/tracks")
+        self.assertTrue("/tracks?cursor=2" in self.server.requests)
+        self.assertEqual(self.lib.song_by_track_id(1003)("title"), "Third")
+
+        # stream URLs of the first results get fetched right away
+        self._wait(self._has_stream_urls)
+        self.assertEqual(self.lib.song_by_track_id(1001)("~uri"),
+                         "https://cf-media.sndcdn.com/1001.128.mp3")
+
+    def test_prefetch_all(self):
+        self.lib.PREFETCH_COUNT = 1
+        self.lib.query_with_refresh(SoundcloudQuery("foo"))
+        self._wait(lambda: len(self.lib) == 3)
+        # the other results follow, one at a time
+        self._wait(self._has_stream_urls)
+
+    def test_cached(self):
+        self.lib.query_with_refresh(SoundcloudQuery("foo"))
+        self._wait(lambda: len(self.lib) == 3 and self._has_stream_urls())
+        songs = set(self.lib.values())
+        requests = len(self.server.requests)
+
+        received = []
+        self.client.connect("songs-received", lambda c, s: received.append(s))
+        self.lib.query_with_refresh(SoundcloudQuery("foo"))
+        self._wait(lambda: received)
+        self.assertEqual(len(self.server.requests), requests)
+        # same song objects, so they keep their stream URLs
+        self.assertEqual(set(received[0]), songs)
+        self.assertTrue(self._has_stream_urls())
+
+    def test_stale_query(self):
+        self.lib.query_with_refresh(SoundcloudQuery("foo"))
+        self.client.get_favorites()
+        self._wait(lambda: len(self.server.requests) >= 2)
+        start = time.time()
+        while time.time() - start < 0.5:
+            Gtk.main_iteration_do(False)
+        # the search got replaced before its first page arrived
+        self.assertFalse("/tracks?cursor=2" in self.server.requests)
@@ -6,8 +6,9 @@
 import pytest
 
 from tests import TestCase, run_gtk_loop
+from tests.helper import capture_output
 
-from gi.repository import Gtk
+from gi.repository import Gtk, GLib
 
 from quodlibet.util import copool
 
@@ -114,3 +115,61 @@ class Tcopool(TestCase):
         copool.remove("test")
         with pytest.raises(ValueError):
             copool.step("test")
+
+    def test_multiple_steps_per_iteration(self):
+        steps = []
+
+        def counter():
+            while True:
+                steps.append(None)
+                yield
+
+        copool.add(counter, funcid="test")
+        context = GLib.MainContext.default()
+        while not steps:
+            context.iteration(False)
+        assert len(steps) > 1
+
+    def test_fair_share(self):
+        counts = {"a": 0, "b": 0}
+
+        def counter(key):
+            while True:
+                counts[key] += 1
+                yield
+
+        copool.add(counter, "a", funcid="a")
+        copool.add(counter, "b", funcid="b")
+        context = GLib.MainContext.default()
+        for i in range(3):
+            context.iteration(False)
+        assert counts["a"] and counts["b"]
+
+    def test_exception(self):
+        def broken():
+            yield
+            raise KeyError
+
+        copool.add(broken, funcid="test")
+        copool.pause("test")
+        assert copool.step("test")
+        with pytest.raises(KeyError):
+            copool.step("test")
+
+        copool.add(broken, funcid="test")
+        with capture_output():
+            run_gtk_loop()
+        with pytest.raises(ValueError):
+            copool.step("test")
+
+    def test_stats(self):
+        copool.add(self.__set_buffer, funcid="test")
+        copool.pause("test")
+        copool.step("test")
+        copool.step("test")
+        stats = copool.get_stats()
+        assert len(stats) == 1
+        assert stats[0]["steps"] == 2
+        assert stats[0]["paused"]
+        assert stats[0]["cpu_time"] >= 0
+        assert stats[0]["name"].endswith("set_buffer")
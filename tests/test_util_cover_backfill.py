@@ -0,0 +1,145 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import io
+import os
+import shutil
+import time
+
+from gi.repository import Gtk
+from senf import fsnative
+
+from quodlibet.formats import AudioFile
+from quodlibet.plugins.cover import CoverSourcePlugin
+from quodlibet.util.cover.backfill import CoverLedger, CoverBackfill, \
+    get_album_id, fetch_covers
+from tests import TestCase, mkdtemp
+
+
+class FakeSource(CoverSourcePlugin):
+    fetched = []
+
+    def fetch_cover(self):
+        FakeSource.fetched.append(self.song("album"))
+        if self.song("album") == "found":
+            self.emit("fetch-success", None)
+        else:
+            self.fail("nope")
+
+
+class FakeHandler:
+    built_in = set()
+
+
+class FakeManager:
+
+    def __init__(self):
+        self.plugin_handler = FakeHandler()
+        self.sources = [FakeSource]
+        self.changed = []
+
+    def acquire_cover_sync(self, song):
+        if song("album") == "local":
+            return io.BytesIO()
+
+    def cover_changed(self, songs):
+        self.changed.append(songs)
+
+
+def get_songs(*albums):
+    return [AudioFile({"~filename": fsnative("/dev/null/%s%d" % (album, i)),
+                       "album": album, "artist": "foo"})
+            for album in albums for i in range(2)]
+
+
+class TCoverLedger(TestCase):
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        self.path = os.path.join(self.temp, "ledger.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+
+    def test_persist(self):
+        ledger = CoverLedger(self.path)
+        ledger.set("a", "found", "FakeSource")
+        ledger.set("b", "missing", now=0)
+        ledger.save()
+
+        ledger = CoverLedger(self.path)
+        self.assertEqual(len(ledger), 2)
+        self.assertEqual(ledger.get("a"), "found")
+        self.assertIs(ledger.get("c"), None)
+        self.assertTrue(ledger.is_done("a"))
+        self.assertTrue(ledger.is_done("b", now=1))
+        self.assertFalse(ledger.is_done("b", now=ledger.RETRY_AFTER + 1))
+        self.assertFalse(ledger.is_done("c"))
+
+    def test_broken(self):
+        with open(self.path, "wb") as h:
+            h.write(b"{")
+        self.assertEqual(len(CoverLedger(self.path)), 0)
+
+    def test_album_id(self):
+        a, b, c, d = get_songs("a", "b")
+        self.assertEqual(get_album_id(a), get_album_id(b))
+        self.assertNotEqual(get_album_id(a), get_album_id(c))
+
+
+class TCoverBackfill(TestCase):
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        self.ledger = CoverLedger(os.path.join(self.temp, "ledger.json"))
+        self.manager = FakeManager()
+        FakeSource.fetched = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+
+    def _run(self, songs, **kwargs):
+        job = CoverBackfill(self.manager, songs, ledger=self.ledger,
+                            interval=0, show_progress=False, **kwargs)
+        result = []
+        job.connect("finished", lambda job, *args: result.append(args))
+        job.start()
+        start = time.time()
+        while not result:
+            Gtk.main_iteration_do(False)
+            self.assertTrue(time.time() - start < 5)
+        return result[0]
+
+    def test_run(self):
+        songs = get_songs("local", "found", "missing")
+        self.assertEqual(self._run(songs, max_albums=2), (1, 1))
+        self.assertEqual(sorted(FakeSource.fetched), ["found", "missing"])
+        self.assertEqual(self.manager.changed, [songs[2:4]])
+        self.assertEqual(self.ledger.get(get_album_id(songs[0])), "local")
+        self.assertEqual(self.ledger.get(get_album_id(songs[2])), "found")
+        self.assertEqual(self.ledger.get(get_album_id(songs[4])), "missing")
+
+        # everything is in the ledger, so nothing left to do
+        FakeSource.fetched = []
+        self.assertEqual(self._run(songs), (0, 0))
+        self.assertEqual(FakeSource.fetched, [])
+
+    def test_no_sources(self):
+        self.manager.sources = []
+        self.assertEqual(self._run(get_songs("found")), (0, 0))
+        self.assertEqual(len(self.ledger), 0)
+
+    def test_skip_non_album(self):
+        song = AudioFile({"~filename": fsnative("/dev/null"), "title": "x"})
+        self.assertEqual(self._run([song]), (0, 0))
+        self.assertEqual(FakeSource.fetched, [])
+
+    def test_fetch_covers(self):
+        songs = get_songs("local", "found", "missing")
+        library = {s("~filename"): s for s in songs}
+        self.assertEqual(
+            fetch_covers(library, self.manager, ledger=self.ledger), (1, 1))
+        self.assertEqual(
+            fetch_covers(library, self.manager, ledger=self.ledger), (0, 0))
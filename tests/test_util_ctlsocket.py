@@ -0,0 +1,96 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import shutil
+
+from gi.repository import GLib
+
+from quodlibet.util import is_windows
+from quodlibet.util.ctlsocket import ControlSocketServer, \
+    ControlSocketClient, ControlSocketError, CommandFailed, socket_exists
+from tests import TestCase, skipIf, mkdtemp
+
+
+def _handler(command, args):
+    if command == "fail":
+        raise ValueError("nope")
+    elif command == "nothing":
+        return None
+    return " ".join([command] + args)
+
+
+@skipIf(is_windows(), "unix only")
+class TControlSocket(TestCase):
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        self.path = os.path.join(self.temp, "control.sock")
+        self.server = ControlSocketServer(
+            self.path, _handler, events=["paused"])
+        self.server.start()
+        self.client = ControlSocketClient(self.path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.temp)
+
+    def _pump(self):
+        context = GLib.MainContext.default()
+        while context.pending():
+            context.iteration(False)
+
+    def _read(self):
+        self._pump()
+        return self.client.read()
+
+    def test_exists(self):
+        self.assertTrue(socket_exists(self.path))
+        self.assertFalse(socket_exists(self.path + "nope"))
+        other = ControlSocketServer(self.path, _handler)
+        self.assertRaises(ControlSocketError, other.start)
+
+    def test_stop(self):
+        self.server.stop()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertRaises(
+            ControlSocketError, ControlSocketClient, self.path)
+
+    def test_pipelining(self):
+        first = self.client.send("foo", "bar")
+        second = self.client.send("nothing")
+        third = self.client.send("fail")
+        self.assertEqual(self._read(), {"id": first, "result": "foo bar"})
+        self.assertEqual(self._read(), {"id": second, "result": None})
+        self.assertEqual(self._read(), {"id": third, "error": "nope"})
+
+    def test_invalid(self):
+        self.client._sock.sendall(b"[]\n{\n")
+        self.assertTrue("error" in self._read())
+        self.assertTrue("error" in self._read())
+
+    def test_subscribe(self):
+        id_ = self.client.subscribe("paused")
+        self.assertEqual(self._read(), {"id": id_, "result": None})
+        self.server.broadcast("other")
+        self.server.broadcast("paused", {"foo": 1})
+        self.assertEqual(
+            self._read(), {"event": "paused", "data": {"foo": 1}})
+
+    def test_subscribe_unknown(self):
+        self.client.subscribe("foo")
+        self.assertTrue("error" in self._read())
+
+    def test_wait(self):
+        self.client.subscribe("paused")
+        id_ = self.client.send("foo")
+        self._pump()
+        self.server.broadcast("paused")
+        failed = self.client.send("fail")
+        self._pump()
+        self.assertEqual(self.client.wait(id_), "foo")
+        self.assertRaises(CommandFailed, self.client.wait, failed)
+        self.assertEqual(self.client.read()["event"], "paused")
@@ -0,0 +1,328 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import gzip
+import os
+import shutil
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from gi.repository import Gio, GLib, Soup
+
+from quodlibet.util import http
+from quodlibet.util.httpcache import HTTPCache, RateLimiter, \
+    parse_cache_control, freshness_lifetime, get_stats, reset_stats
+from quodlibet.util.urllib import UrllibError
+from tests import TestCase, mkdtemp
+
+
+class TCacheControl(TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_cache_control(None), {})
+        self.assertEqual(
+            parse_cache_control('Public, max-age=60, foo="bar",,'),
+            {"public": True, "max-age": "60", "foo": "bar"})
+
+    def test_lifetime(self):
+        self.assertEqual(freshness_lifetime({}), 0)
+        self.assertEqual(
+            freshness_lifetime({"cache-control": "max-age=60"}), 60)
+        self.assertEqual(
+            freshness_lifetime({"cache-control": "max-age=x"}), 0)
+        self.assertEqual(
+            freshness_lifetime({"cache-control": "no-cache, max-age=6"}), 0)
+        self.assertIs(
+            freshness_lifetime({"cache-control": "no-store"}), None)
+        self.assertEqual(freshness_lifetime({
+            "date": "Mon, 19 Oct 2026 10:00:00 GMT",
+            "expires": "Mon, 19 Oct 2026 10:01:00 GMT"}), 60)
+        self.assertEqual(freshness_lifetime({"expires": "0"}), 0)
+
+
+class THTTPCache(TestCase):
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        self.cache = HTTPCache(os.path.join(self.temp, "http"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+
+    def test_key(self):
+        get_key = HTTPCache.get_key
+        self.assertEqual(get_key("http://a"), get_key("http://a"))
+        self.assertNotEqual(get_key("http://a"), get_key("http://b"))
+        self.assertNotEqual(get_key("http://a"), get_key("http://a", "x"))
+
+    def test_fresh(self):
+        headers = {"cache-control": "max-age=10", "server": "foo"}
+        self.assertTrue(self.cache.put("k", 200, headers, b"data", now=100))
+        cached = self.cache.get("k")
+        self.assertEqual(cached.body, b"data")
+        self.assertEqual(cached.headers, {"cache-control": "max-age=10"})
+        self.assertTrue(cached.is_fresh(now=105))
+        self.assertFalse(cached.is_fresh(now=111))
+        self.assertEqual(cached.get_validators(), {})
+
+    def test_not_stored(self):
+        put = self.cache.put
+        self.assertFalse(put("k", 200, {}, b""))
+        self.assertFalse(put("k", 404, {"cache-control": "max-age=9"}, b""))
+        self.assertFalse(put("k", 200, {"cache-control": "no-store",
+                                        "etag": "x"}, b""))
+        self.cache.MAX_BODY_SIZE = 2
+        self.assertFalse(put("k", 200, {"cache-control": "max-age=9"}, b"foo"))
+        self.assertIs(self.cache.get("k"), None)
+
+    def test_revalidate(self):
+        self.assertTrue(self.cache.put("k", 200, {"etag": '"1"'}, b"x"))
+        cached = self.cache.get("k")
+        self.assertFalse(cached.is_fresh())
+        self.assertEqual(cached.get_validators(), {"If-None-Match": '"1"'})
+        refreshed = self.cache.refresh(
+            "k", {"cache-control": "max-age=60"}, now=0)
+        self.assertEqual(refreshed.body, b"x")
+        self.assertTrue(self.cache.get("k").is_fresh(now=30))
+        self.assertIs(self.cache.refresh("nope", {}), None)
+
+    def test_broken(self):
+        os.makedirs(os.path.join(self.temp, "http"))
+        with open(os.path.join(self.temp, "http", "k"), "wb") as h:
+            h.write(b"{")
+        self.assertIs(self.cache.get("k"), None)
+
+    def test_prune(self):
+        cache = HTTPCache(os.path.join(self.temp, "http"), max_size=1000)
+        headers = {"cache-control": "max-age=60"}
+        for i in range(10):
+            cache.put(str(i), 200, headers, b"x" * 200)
+        size = sum(e.stat().st_size
+                   for e in os.scandir(os.path.join(self.temp, "http")))
+        self.assertTrue(size <= 1000)
+
+    def test_clear(self):
+        self.cache.put("k", 200, {"etag": "x"}, b"")
+        self.cache.clear()
+        self.assertIs(self.cache.get("k"), None)
+
+
+class TRateLimiter(TestCase):
+
+    def test_reserve(self):
+        limiter = RateLimiter({"example.com": 1.0})
+        self.assertEqual(limiter.reserve("http://other.com/", now=0), 0)
+        self.assertEqual(limiter.reserve("http://example.com/", now=0), 0)
+        self.assertEqual(
+            limiter.reserve("http://www.example.com/a", now=0.5), 0.5)
+        self.assertEqual(limiter.reserve("http://example.com/", now=0.5), 1.5)
+        self.assertEqual(limiter.reserve("http://example.com/", now=10), 0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(
+            (self.path, self.headers.get("If-None-Match")))
+        self.server.ports.add(self.client_address[1])
+        time.sleep(0.1)
+        if self.path == "/etag" and self.headers.get("If-None-Match"):
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/other")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/missing":
+            self.send_error(404)
+            return
+        body = ("hello " + self.path).encode("ascii")
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = gzip.compress(body)
+        self.send_response(200)
+        if self.path == "/fresh":
+            self.send_header("Cache-Control", "max-age=60")
+        elif self.path == "/etag":
+            self.send_header("ETag", '"1"')
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ServerTestCase(TestCase):
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        self.old_cache = http.get_cache()
+        http.set_cache(HTTPCache(self.temp))
+        reset_stats()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.requests = []
+        self.server.ports = set()
+        threading.Thread(target=self.server.serve_forever).start()
+        self.url = "http://127.0.0.1:%d" % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        http.close_connections()
+        http.set_cache(self.old_cache)
+        shutil.rmtree(self.temp)
+
+
+class TFetch(_ServerTestCase):
+
+    def test_cached(self):
+        for i in range(2):
+            response = http.fetch(self.url + "/fresh")
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.body, b"hello /fresh")
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(get_stats()["cache-hits"], 1)
+
+    def test_revalidated(self):
+        self.assertEqual(http.fetch(self.url + "/etag").body, b"hello /etag")
+        response = http.fetch(self.url + "/etag")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, b"hello /etag")
+        self.assertEqual(self.server.requests,
+                         [("/etag", None), ("/etag", '"1"')])
+        self.assertEqual(get_stats()["revalidated"], 1)
+
+    def test_coalesced(self):
+        bodies = []
+
+        def fetch():
+            bodies.append(http.fetch(self.url + "/other").body)
+
+        threads = [threading.Thread(target=fetch) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(bodies, [b"hello /other"] * 4)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(get_stats()["coalesced"], 3)
+
+    def test_reused(self):
+        for i in range(3):
+            self.assertEqual(http.fetch(self.url + "/other").body,
+                             b"hello /other")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.ports), 1)
+        self.assertEqual(get_stats()["reused"], 2)
+
+    def test_redirect(self):
+        self.assertEqual(http.fetch(self.url + "/redirect").body,
+                         b"hello /other")
+        self.assertEqual([r[0] for r in self.server.requests],
+                         ["/redirect", "/other"])
+
+    def test_range(self):
+        http.fetch(self.url + "/fresh")
+        http.fetch(self.url + "/fresh", headers={"Range": "bytes=0-1"})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_error(self):
+        self.assertRaises(UrllibError, http.fetch, self.url + "/missing")
+        self.assertEqual(get_stats()["errors"], 1)
+
+    def test_stream(self):
+        for i in range(2):
+            body = b"".join(http.fetch_stream(self.url + "/fresh"))
+            self.assertEqual(body, b"hello /fresh")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertRaises(UrllibError, list,
+                          http.fetch_stream(self.url + "/missing"))
+
+
+class TDownload(_ServerTestCase):
+
+    def _download(self, path, cancellable=None):
+        """Returns a list which gets the (message, body) or (None, error)
+        once done"""
+
+        message = Soup.Message.new("GET", self.url + path)
+        result = []
+        http.download(
+            message, cancellable, lambda m, b, d: result.append((m, b)),
+            None, failure_callback=lambda r, e, d: result.append((None, e)))
+        return result
+
+    def _wait(self, condition):
+        start = time.time()
+        context = GLib.MainContext.default()
+        while not condition():
+            if not context.iteration(False):
+                time.sleep(0.005)
+            self.assertTrue(time.time() - start < 5)
+
+    def _content_length(self, message):
+        headers = message.get_property('response-headers')
+        return int(headers.get_one("content-length"))
+
+    def test_cached(self):
+        for i in range(2):
+            result = self._download("/fresh")
+            self._wait(lambda: result)
+            message, body = result[0]
+            self.assertEqual(body, b"hello /fresh")
+            self.assertEqual(message.get_property("status-code"), 200)
+            self.assertEqual(self._content_length(message), len(body))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(get_stats()["cache-hits"], 1)
+
+    def test_revalidated(self):
+        for i in range(2):
+            result = self._download("/etag")
+            self._wait(lambda: result)
+            message, body = result[0]
+            self.assertEqual(body, b"hello /etag")
+            self.assertEqual(message.get_property("status-code"), 200)
+            self.assertEqual(self._content_length(message), len(body))
+        self.assertEqual(self.server.requests,
+                         [("/etag", None), ("/etag", '"1"')])
+        self.assertEqual(get_stats()["revalidated"], 1)
+
+    def test_coalesced(self):
+        results = [self._download("/other") for i in range(3)]
+        self._wait(lambda: all(results))
+        for result in results:
+            message, body = result[0]
+            self.assertEqual(body, b"hello /other")
+            self.assertEqual(self._content_length(message), len(body))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(get_stats()["coalesced"], 2)
+
+    def test_cancel_one(self):
+        cancellable = Gio.Cancellable()
+        dropped = self._download("/other", cancellable)
+        result = self._download("/other")
+        cancellable.cancel()
+        self._wait(lambda: result)
+        self.assertEqual(result[0][1], b"hello /other")
+        self.assertEqual(dropped, [])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_cancel_all(self):
+        cancellable = Gio.Cancellable()
+        self._download("/other", cancellable)
+        cancellable.cancel()
+        # nothing is left in flight, so this gets sent again
+        result = self._download("/other")
+        self._wait(lambda: result)
+        self.assertEqual(result[0][1], b"hello /other")
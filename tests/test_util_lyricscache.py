@@ -0,0 +1,95 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import shutil
+
+from quodlibet.formats import AudioFile
+from quodlibet.library import SongLibrarian
+from quodlibet.util.lyricscache import LyricsCache, parse_lrc
+from tests import TestCase, mkdtemp
+
+AN_LRC = """
+[ti:Test Thing]
+[01:23.45] This is some text
+[01:01.00]Starting here?
+"""
+
+
+class TParseLrc(TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_lrc(""), [])
+        self.assertEqual(parse_lrc(AN_LRC), [
+            (61000, "Starting here?"), (83450, "This is some text")])
+
+
+class TLyricsCache(TestCase):
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        self.cache = LyricsCache()
+        self.song = AudioFile({
+            "~filename": os.path.join(self.temp, "song.mp3"),
+            "artist": "artist", "title": "title"})
+        self.lrc = os.path.join(self.temp, "song.lrc")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+
+    def _write(self, text, mtime):
+        with open(self.lrc, "w", encoding="utf-8") as h:
+            h.write(text)
+        os.utime(self.lrc, (mtime, mtime))
+
+    def test_embedded(self):
+        self.song["lyrics"] = "foo"
+        self.assertEqual(self.cache.get_lyrics(self.song), "foo")
+
+    def test_lrc_validated(self):
+        self._write(AN_LRC, 1000)
+        self.assertEqual(len(self.cache.get_lrc(self.song)), 2)
+
+        # same mtime and size: the cached result is used
+        self._write(AN_LRC.replace("Test", "Best"), 1000)
+        self.assertEqual(len(self.cache.get_lrc(self.song)), 2)
+
+        self._write("[00:01.00]changed", 2000)
+        self.assertEqual(self.cache.get_lrc(self.song), [(1000, "changed")])
+
+        os.unlink(self.lrc)
+        self.assertEqual(self.cache.get_lrc(self.song), [])
+
+    def test_missing(self):
+        self.assertEqual(self.cache.get_lrc(self.song), [])
+        self._write(AN_LRC, 1000)
+        self.assertEqual(self.cache.get_lrc(self.song), [])
+
+        self.cache.MISSING_TTL = 0
+        self.assertEqual(len(self.cache.get_lrc(self.song)), 2)
+
+    def test_invalidate(self):
+        self.assertEqual(self.cache.get_lrc(self.song), [])
+        self._write(AN_LRC, 1000)
+        self.cache.invalidate([self.song])
+        self.assertEqual(len(self.cache.get_lrc(self.song)), 2)
+
+    def test_watch(self):
+        librarian = SongLibrarian()
+        try:
+            self.cache.watch(librarian)
+            self.assertEqual(self.cache.get_lrc(self.song), [])
+            self._write(AN_LRC, 1000)
+            librarian.emit("changed", [self.song])
+            self.assertEqual(len(self.cache.get_lrc(self.song)), 2)
+        finally:
+            librarian.destroy()
+
+    def test_max_entries(self):
+        self.cache.MAX_ENTRIES = 2
+        for i in range(4):
+            song = AudioFile({"~filename": os.path.join(self.temp, str(i))})
+            self.cache.get_lrc(song)
+        self.assertEqual(len(self.cache._entries), 2)
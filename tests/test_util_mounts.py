@@ -0,0 +1,72 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import threading
+import time
+
+from quodlibet.util.mounts import MountProber, check_mounted
+from tests import TestCase, run_gtk_loop
+
+
+class TCheckMounted(TestCase):
+
+    def test_check(self):
+        self.assertTrue(check_mounted("/"))
+        self.assertFalse(check_mounted("/nope/nope"))
+
+        calls = []
+        self.assertFalse(check_mounted("/nope", lambda: calls.append(1)))
+        self.assertEqual(calls, [1])
+
+
+class TMountProber(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def _check(self, mountpoint, exists):
+        self.calls.append(mountpoint)
+        self.release.wait()
+        return mountpoint == "/ok"
+
+    def test_probe_many(self):
+        prober = MountProber(check=self._check)
+        self.assertEqual(prober.probe_many({"/ok": None, "/nope": None}),
+                         {"/ok": True, "/nope": False})
+
+    def test_cached(self):
+        prober = MountProber(check=self._check)
+        self.assertTrue(prober.probe("/ok"))
+        self.assertTrue(prober.probe("/ok"))
+        self.assertEqual(self.calls, ["/ok"])
+        prober.forget("/ok")
+        self.assertTrue(prober.probe("/ok"))
+        self.assertEqual(self.calls, ["/ok", "/ok"])
+
+    def test_unresponsive(self):
+        self.release.clear()
+        prober = MountProber(timeout=0.05, check=self._check)
+        start = time.time()
+        self.assertIs(prober.probe("/ok"), None)
+        self.assertTrue(time.time() - start < 1)
+
+        # no second check while the first one hangs
+        results = []
+        prober.start("/ok", callback=results.append)
+        self.assertEqual(self.calls, ["/ok"])
+
+        self.release.set()
+        while not results and time.time() - start < 5:
+            run_gtk_loop()
+        self.assertEqual(results, [True])
+        self.assertTrue(prober.probe("/ok", timeout=0))
+
+    def test_error(self):
+        def check(mountpoint, exists):
+            raise OSError
+
+        self.assertFalse(MountProber(check=check).probe("/ok"))
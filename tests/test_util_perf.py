@@ -0,0 +1,129 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import json
+import shutil
+
+from tests import TestCase, mkdtemp
+
+from quodlibet.util import perf
+
+
+class THistogram(TestCase):
+
+    def test_empty(self):
+        hist = perf.Histogram()
+        self.assertEqual(hist.mean, 0.0)
+        self.assertEqual(hist.percentile(50), 0.0)
+        self.assertEqual(hist.to_dict()["min"], 0.0)
+
+    def test_add(self):
+        hist = perf.Histogram()
+        for value in [0.0005, 0.003, 0.003, 0.2]:
+            hist.add(value)
+        self.assertEqual(hist.count, 4)
+        self.assertAlmostEqual(hist.total, 0.2065)
+        self.assertEqual(hist.min, 0.0005)
+        self.assertEqual(hist.max, 0.2)
+        self.assertEqual(hist.percentile(50), 0.004)
+        self.assertEqual(hist.percentile(100), 0.2)
+
+    def test_huge(self):
+        hist = perf.Histogram()
+        hist.add(10 ** 6)
+        self.assertEqual(hist.buckets[-1], 1)
+
+
+class TPerf(TestCase):
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        perf.reset()
+
+    def tearDown(self):
+        perf.disable()
+        perf.reset()
+        shutil.rmtree(self.temp)
+
+    def test_disabled(self):
+        self.assertFalse(perf.is_enabled())
+        with perf.span("foo"):
+            pass
+        perf.count("bar")
+        perf.record("baz", 1.0)
+        self.assertEqual(
+            perf.snapshot(), {"counters": {}, "histograms": {}})
+
+    def test_enabled(self):
+        perf.enable()
+        with perf.span("foo", extra=1):
+            pass
+        perf.count("bar")
+        perf.count("bar", 2)
+        perf.record("baz", 1.0)
+        snapshot = perf.snapshot()
+        self.assertEqual(snapshot["counters"], {"bar": 3})
+        self.assertEqual(snapshot["histograms"]["foo"]["count"], 1)
+        self.assertEqual(snapshot["histograms"]["baz"]["max"], 1.0)
+
+    def test_span_exception(self):
+        perf.enable()
+        with self.assertRaises(ValueError):
+            with perf.span("foo"):
+                raise ValueError
+        self.assertEqual(perf.snapshot()["histograms"]["foo"]["count"], 1)
+
+    def test_timed(self):
+        @perf.timed("func")
+        def func(a, b=0):
+            return a + b
+
+        self.assertEqual(func(1, b=2), 3)
+        perf.enable()
+        self.assertEqual(func(1), 1)
+        self.assertEqual(perf.snapshot()["histograms"]["func"]["count"], 1)
+        self.assertEqual(func.__name__, "func")
+
+    def test_log(self):
+        path = os.path.join(self.temp, "perf.jsonl")
+        perf.enable(path)
+        with perf.span("foo", songs=42):
+            pass
+        perf.disable()
+        with perf.span("bar"):
+            pass
+
+        with open(path, "r", encoding="utf-8") as h:
+            lines = [json.loads(line) for line in h]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["name"], "foo")
+        self.assertEqual(lines[0]["songs"], 42)
+        self.assertTrue(lines[0]["dur"] >= 0)
+        self.assertEqual(
+            lines[1]["snapshot"]["histograms"]["foo"]["count"], 1)
+
+    def test_log_pause(self):
+        path = os.path.join(self.temp, "perf.jsonl")
+        perf.enable(path)
+        perf.pause()
+        self.assertFalse(perf.is_enabled())
+        with perf.span("foo"):
+            pass
+        perf.enable()
+        with perf.span("bar"):
+            pass
+        perf.disable()
+
+        with open(path, "r", encoding="utf-8") as h:
+            lines = [json.loads(line) for line in h]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["name"], "bar")
+
+    def test_log_invalid_path(self):
+        perf.enable(os.path.join(self.temp, "nope", "perf.jsonl"))
+        self.assertTrue(perf.is_enabled())
+        with perf.span("foo"):
+            pass
@@ -0,0 +1,106 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import shutil
+
+from quodlibet.util.submitlog import SubmitLog, Backoff
+from tests import TestCase, mkdtemp
+
+
+class TSubmitLog(TestCase):
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        self.path = os.path.join(self.temp, "log")
+        self.log = SubmitLog(self.path)
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.temp)
+
+    def _reopen(self):
+        self.log.close()
+        self.log = SubmitLog(self.path)
+        return self.log
+
+    def test_empty(self):
+        self.assertEqual(len(self.log), 0)
+        self.assertEqual(self.log.peek(10), [])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_append_peek(self):
+        seqs = [self.log.append({"n": i}) for i in range(5)]
+        self.assertEqual(len(self.log), 5)
+        self.assertEqual(self.log.peek(2), [(seqs[0], {"n": 0}),
+                                            (seqs[1], {"n": 1})])
+        self.assertEqual(len(list(self.log)), 5)
+
+    def test_persisted(self):
+        self.log.extend([{"n": 0}, {"n": 1}, {"n": 2}])
+        seq = self.log.peek(1)[0][0]
+        self.log.ack([seq])
+        log = self._reopen()
+        self.assertEqual([e["n"] for s, e in log], [1, 2])
+        # sequence numbers keep increasing
+        self.assertTrue(log.append({"n": 3}) > max(s for s, e in log.peek(2)))
+
+    def test_ack_all_removes_file(self):
+        self.log.extend([{"n": 0}, {"n": 1}])
+        self.log.ack([s for s, e in self.log.peek(2)])
+        self.assertEqual(len(self.log), 0)
+        self.assertFalse(os.path.exists(self.path))
+        self.log.append({"n": 2})
+        self.assertEqual([e for s, e in self._reopen()], [{"n": 2}])
+
+    def test_ack_unknown(self):
+        self.log.append({})
+        self.log.ack([1234])
+        self.assertEqual(len(self.log), 1)
+
+    def test_compact(self):
+        self.log.COMPACT_AFTER = 10
+        for i in range(30):
+            self.log.append({"n": i})
+        for i in range(25):
+            self.log.ack([self.log.peek(1)[0][0]])
+        with open(self.path, "rb") as h:
+            lines = len(h.read().splitlines())
+        # at most COMPACT_AFTER acknowledged entries stay in the log
+        self.assertTrue(lines <= 5 + 10 + 10)
+        self.assertEqual(
+            [e["n"] for s, e in self._reopen()], list(range(25, 30)))
+
+    def test_truncated(self):
+        self.log.extend([{"n": 0}, {"n": 1}])
+        self.log.close()
+        with open(self.path, "ab") as h:
+            h.write(b'{"seq": 3, "ent')
+        log = self._reopen()
+        self.assertEqual([e["n"] for s, e in log], [0, 1])
+        log.append({"n": 2})
+        self.assertEqual([e["n"] for s, e in self._reopen()], [0, 1, 2])
+
+    def test_clear(self):
+        self.log.extend([{}, {}])
+        self.log.clear()
+        self.assertEqual(len(self._reopen()), 0)
+
+
+class TBackoff(TestCase):
+
+    def test_delays(self):
+        backoff = Backoff(1, 10)
+        for i in range(8):
+            delay = backoff.next_delay()
+            self.assertTrue(0 <= delay <= min(10, 2 ** i))
+        self.assertEqual(backoff.failures, 8)
+        backoff.reset()
+        self.assertTrue(backoff.next_delay() <= 1)
+
+    def test_many_failures(self):
+        backoff = Backoff(1, 5)
+        backoff.failures = 10000
+        self.assertTrue(backoff.next_delay() <= 5)
@@ -5,14 +5,17 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
 import threading
+import time
 
 from tests import TestCase, run_gtk_loop
 
 from gi.repository import Gtk
 
+from quodlibet.util.path import find_mount_point
 from quodlibet.util.thread import call_async, call_async_background, \
-    Cancellable, terminate_all
+    Cancellable, terminate_all, get_tasks, disk_lane, set_lane_limit
 
 
 class Tcall_async(TestCase):
@@ -58,3 +61,99 @@ class Tcall_async(TestCase):
 
     def test_terminate_all(self):
         terminate_all()
+
+    def test_coalesce(self):
+        cancel = Cancellable()
+        event = threading.Event()
+        calls = []
+        results = []
+
+        def func():
+            calls.append(None)
+            event.wait()
+            return 42
+
+        call_async(func, cancel, results.append, lane="test-coalesce",
+                   key="foo")
+        call_async(func, cancel, results.append, lane="test-coalesce",
+                   key="foo")
+        tasks = [t for t in get_tasks() if t["lane"] == "test-coalesce"]
+        self.assertEqual(len(tasks), 1)
+        self.assertEqual(tasks[0]["requests"], 2)
+
+        event.set()
+        while len(results) < 2:
+            Gtk.main_iteration()
+        self.assertEqual(results, [42, 42])
+        self.assertEqual(len(calls), 1)
+
+    def test_lane_limit_and_order(self):
+        set_lane_limit("test-order", 1)
+        cancel = Cancellable()
+        started = threading.Event()
+        event = threading.Event()
+        order = []
+
+        def block():
+            started.set()
+            event.wait()
+
+        def func(value):
+            order.append(value)
+            return value
+
+        results = []
+        call_async(block, cancel, results.append, lane="test-order")
+        started.wait()
+        for i in range(3):
+            call_async_background(func, cancel, results.append, (i,),
+                                  lane="test-order")
+        call_async(func, cancel, results.append, ("a",), lane="test-order")
+        call_async(func, cancel, results.append, ("b",), lane="test-order")
+
+        tasks = [t for t in get_tasks() if t["lane"] == "test-order"]
+        self.assertEqual([t["state"] for t in tasks],
+                         ["running"] + ["queued"] * 5)
+
+        event.set()
+        while len(results) < 6:
+            Gtk.main_iteration()
+        self.assertEqual(order, ["b", "a", 0, 1, 2])
+
+    def test_cancel_queued(self):
+        event = threading.Event()
+        cancel = Cancellable()
+        done = []
+
+        def func():
+            event.wait()
+            done.append(None)
+
+        for i in range(3):
+            call_async(func, cancel, lambda r: None, lane="test-cancel")
+        cancel.cancel()
+        event.set()
+        run_gtk_loop()
+        for i in range(100):
+            if not [t for t in get_tasks() if t["lane"] == "test-cancel"]:
+                break
+            event.wait(0.01)
+        self.assertTrue(len(done) <= 2)
+
+    def test_disk_lane(self):
+        self.assertTrue(disk_lane(os.getcwd()).startswith("disk:"))
+        self.assertEqual(disk_lane(os.path.join(os.getcwd(), "a")),
+                         disk_lane(os.path.join(os.getcwd(), "b")))
+        self.assertEqual(disk_lane("/foo/bar", "/foo"), "disk:/foo")
+
+    def test_disk_lane_resolved_in_thread(self):
+        path = os.path.join(os.getcwd(), "a")
+        mount_point = find_mount_point(path)
+        lane = disk_lane(path)
+        for i in range(100):
+            if lane != "disk:":
+                break
+            run_gtk_loop()
+            time.sleep(0.01)
+            lane = disk_lane(path)
+        self.assertEqual(lane, "disk:%s" % mount_point)